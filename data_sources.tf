@@ -40,6 +40,96 @@ locals {
     )
   )
 
+  # Normalize var.pre_runcmd / var.post_runcmd into bootstrap steps. A plain
+  # string is a single sequential command; an object with a `parallel` list
+  # is a group the bootstrap script runs concurrently via _ih_run_parallel.
+  pre_runcmd_steps = [
+    for cmd in var.pre_runcmd : can(tostring(cmd)) ? {
+      parallel = false
+      commands = tolist([tostring(cmd)])
+      } : {
+      parallel = true
+      commands = tolist([for c in try(cmd.parallel, []) : tostring(c)])
+    }
+  ]
+  post_runcmd_steps = [
+    for cmd in var.post_runcmd : can(tostring(cmd)) ? {
+      parallel = false
+      commands = tolist([tostring(cmd)])
+      } : {
+      parallel = true
+      commands = tolist([for c in try(cmd.parallel, []) : tostring(c)])
+    }
+  ]
+
+  # var.mounts entries the bootstrap mounts: all but swap and fs_file
+  # "none" entries, which are not mountable. cc_mounts still writes every
+  # entry to /etc/fstab, normalising device names and skipping devices that
+  # do not exist, but these get noauto, so its `mount -a`, which runs in the
+  # config stage, serially and without a timeout, leaves them alone and the
+  # bootstrap's bounded, concurrent mount is their first. The automount unit
+  # systemd makes of x-systemd.automount mounts them on later boots.
+  # Missing fields get cc_mounts' mount_default_fields first.
+  bootstrap_mountable = [
+    for m in local.mounts : length(m) >= 2 && !contains(["", "none"], m[1]) && try(m[2], "") != "swap"
+  ]
+  mount_default_fields = ["", "", "auto", "defaults,nofail,x-systemd.after=cloud-init.service", "0", "2"]
+  cc_mounts = [
+    for idx, m in local.mounts : local.bootstrap_mountable[idx] ? [
+      for i, field in length(m) >= 6 ? m : concat(m, slice(local.mount_default_fields, length(m), 6)) :
+      i == 3 ? join(",", compact([field, "noauto,x-systemd.automount"])) : field
+    ] : m
+  ]
+  bootstrap_mounts = [
+    for idx, m in local.cc_mounts : m if local.bootstrap_mountable[idx]
+  ]
+
+  # One _ih_mount call per bootstrap mount, run as a parallel group. An
+  # entry with nofail in fs_mntops is optional: its failure is logged but
+  # does not fail the bootstrap, as with fstab.
+  mount_commands = [
+    for m in local.bootstrap_mounts : format(
+      "_ih_mount %s '%s'",
+      contains(split(",", m[3]), "nofail") ? "optional" : "required",
+      replace(m[1], "'", "'\\''")
+    )
+  ]
+
+  instance_store_cmd = var.instance_store == null ? "" : join(" ", concat(
+    [
+      "/usr/local/bin/ih-instance-store",
+      "--mount-point", "'${replace(var.instance_store.mount_point, "'", "'\\''")}'",
+      "--filesystem", var.instance_store.filesystem,
+      "--mount-options", "'${replace(var.instance_store.mount_options, "'", "'\\''")}'",
+    ],
+    var.instance_store.required ? [] : ["--optional"]
+  ))
+
+  lifecycle_heartbeat_cmd = var.lifecycle_hook_name == null || var.lifecycle_heartbeat_interval == null ? "" : join(" ", [
+    "/usr/local/bin/ih-lifecycle-heartbeat",
+    "--hook", "\"${var.lifecycle_hook_name}\"",
+    "--interval", var.lifecycle_heartbeat_interval,
+  ])
+
+  # dpkg config for var.dpkg_unsafe_io; ih-bootstrap removes it when done.
+  dpkg_unsafe_io_conf = var.dpkg_unsafe_io ? "/etc/dpkg/dpkg.cfg.d/ih-unsafe-io" : ""
+
+  # var.readiness_gate as ready-to-run command lines. They belong to the
+  # script that signals the launch into service: ih-activate with a warm
+  # pool, ih-bootstrap otherwise.
+  readiness_gate_cmd = try(length(var.readiness_gate.checks), 0) == 0 ? "" : join(" ", concat(
+    [
+      "/usr/local/bin/ih-readiness-gate",
+      "--timeout", var.readiness_gate.timeout,
+      "--interval", var.readiness_gate.interval,
+    ],
+    [for c in var.readiness_gate.checks : "'${replace(c, "'", "'\\''")}'"]
+  ))
+  background_runcmd_cmd = try(length(var.readiness_gate.background_runcmd), 0) == 0 ? "" : join(" ", concat(
+    ["/usr/local/bin/ih-background-runcmd"],
+    [for c in var.readiness_gate.background_runcmd : "'${replace(c, "'", "'\\''")}'"]
+  ))
+
   # Bootstrap script rendered into /usr/local/bin/ih-bootstrap and invoked
   # from runcmd as a single entry. Running through a script with set -euo
   # pipefail (instead of cloud-init's fail-open runcmd list) means any
@@ -49,12 +139,346 @@ locals {
     "${path.module}/files/ih-bootstrap.sh.tpl",
     {
       lifecycle_hook_name = var.lifecycle_hook_name == null ? "" : var.lifecycle_hook_name
-      mount_volumes       = length(var.mounts) > 0
-      pre_runcmd          = var.pre_runcmd
-      post_runcmd         = var.post_runcmd
+      instance_store_cmd  = local.instance_store_cmd
+      mount_commands      = local.mount_commands
+      mount_timeout       = var.mount_timeout
+      mount_retries       = var.mount_retries
+      pre_runcmd          = local.pre_runcmd_steps
+      post_runcmd         = local.post_runcmd_steps
       puppet_cmd          = local.puppet_cmd
+      warm_pool           = var.warm_pool != null
+      heartbeat_cmd       = local.lifecycle_heartbeat_cmd
+      dpkg_unsafe_io_conf = local.dpkg_unsafe_io_conf
+      materialize_secrets = local.materialize_secrets
+      readiness_gate_cmd  = var.warm_pool == null ? local.readiness_gate_cmd : ""
+      background_cmd      = var.warm_pool == null ? local.background_runcmd_cmd : ""
+
+      puppet_profiling               = var.puppet_profiling
+      puppet_profiling_top_resources = var.puppet_profiling_top_resources
+    }
+  )
+
+  # Activate phase of the warm-pool bootstrap, see files/ih-activate.sh.tpl.
+  activate_script = var.warm_pool == null ? "" : templatefile(
+    "${path.module}/files/ih-activate.sh.tpl",
+    {
+      lifecycle_hook_name = var.lifecycle_hook_name == null ? "" : var.lifecycle_hook_name
+      activate_runcmd     = var.warm_pool.activate_runcmd
+      instance_store_cmd  = local.instance_store_cmd
+      heartbeat_cmd       = local.lifecycle_heartbeat_cmd
+      readiness_gate_cmd  = local.readiness_gate_cmd
+      background_cmd      = local.background_runcmd_cmd
+    }
+  )
+}
+
+locals {
+  # cloud-config sections, kept as locals so they can be hashed one by one
+  # in the userdata_section_hashes output.
+  bootcmd_helpers = {
+    "generate_apt_auth.py" : file("${path.module}/files/apt_auth/generate_apt_auth.py")
+    "generate_apt_auth.sh" : file("${path.module}/files/generate_apt_auth.sh")
+    "bootcmd.sh" : file("${path.module}/files/bootcmd.sh")
+    "materialize_secrets.py" : file("${path.module}/files/secret_files/materialize_secrets.py")
+  }
+
+  bootcmd = concat(
+    [
+      # Stop and mask apt-daily / unattended-upgrades before anything else
+      # touches apt. These timers race with cloud-init's package install and
+      # any apt-get run from bootcmd / pre_runcmd / Puppet for the dpkg lock;
+      # lost races on noble have been observed to ABANDON instances via the
+      # lifecycle_hook_name ERR trap (see issue #87).
+      #
+      # Puppet owns package state on InfraHouse-managed instances, so we don't
+      # need unattended-upgrades; security patches land via AMI rebuilds +
+      # ASG cycling, not ad-hoc 1 AM service restarts on live nodes.
+      #
+      # `mask` (not `disable`) is required: on noble these units are masked by
+      # default and `disable` is a no-op, so we must mask to keep them from
+      # coming back after a reboot on long-lived instances.
+      "systemctl stop ${join(" ", local.apt_daily_units)} 2>/dev/null || true",
+      "systemctl mask ${join(" ", local.apt_daily_units)}",
+
+      # Create auth inputs for APT repos
+      "echo '${base64encode(local.repo_pairs_json)}' > /var/tmp/apt-auth.json.b64",
+      "base64 -d /var/tmp/apt-auth.json.b64 > /var/tmp/apt-auth.json",
+      # Prepare secret resolver
+      "echo '${base64encode(local.bootcmd_helpers["generate_apt_auth.py"])}' > /var/tmp/generate_apt_auth.py.b64",
+      "base64 -d /var/tmp/generate_apt_auth.py.b64 > /usr/local/bin/generate_apt_auth.py",
+
+      # Probe for Python; log-and-skip if absent; otherwise run resolver
+      "echo '${base64encode(local.bootcmd_helpers["generate_apt_auth.sh"])}' > /var/tmp/generate_apt_auth.sh.b64",
+      "base64 -d /var/tmp/generate_apt_auth.sh.b64 > /usr/local/bin/generate_apt_auth.sh",
+      "chmod +x /usr/local/bin/generate_apt_auth.sh",
+
+      # Prepare InfraHouse repo installer
+      "echo '${base64encode(local.bootcmd_helpers["bootcmd.sh"])}' > /var/tmp/bootcmd.sh.b64",
+      "base64 -d /var/tmp/bootcmd.sh.b64 > /usr/local/bin/bootcmd",
+      "chmod +x /usr/local/bin/bootcmd",
+    ],
+    [
+      # var.nfs_mount_profile and var.tuning_profile, in place before
+      # cloud-init starts any service, the bootstrap mounts anything and
+      # Puppet starts the rest.
+      for f in local.bootcmd_files :
+      "mkdir -p ${dirname(f.path)} && echo '${base64encode(f.content)}' | base64 -d > ${f.path} && chmod ${f.permissions} ${f.path}"
+    ],
+    local.nfs_tuning_enabled ? concat(
+      length(local.nfs_profile.sysctl) > 0 ? ["sysctl -q -p ${local.nfs_sysctl_conf}"] : [],
+      # The slot table size is read when a transport is created.
+      length(local.nfs_profile.sunrpc) > 0 ? concat(
+        ["modprobe sunrpc"],
+        [for k, v in local.nfs_profile.sunrpc : "sysctl -q -w sunrpc.${k}=${v}"]
+      ) : [],
+    ) : [],
+    local.tuning_profile == null ? [] : [
+      "sysctl -q -p ${local.tuning_sysctl_conf}",
+      "systemd-tmpfiles --create ${local.tuning_tmpfiles_conf}",
+      "udevadm control --reload && udevadm trigger --action=change --subsystem-match=block",
+      # Re-reads system.conf.d, so services started from now on get the limits.
+      "systemctl daemon-reload",
+    ],
+    !local.materialize_secrets ? [] : [
+      # var.secret_files and var.puppet_secrets; they hold ARNs, not secrets.
+      "echo '${base64encode(local.secret_definitions_json)}' > /var/tmp/secret-files.json.b64",
+      "base64 -d /var/tmp/secret-files.json.b64 > /var/tmp/secret-files.json",
+      "echo '${base64encode(local.bootcmd_helpers["materialize_secrets.py"])}' > /var/tmp/materialize_secrets.py.b64",
+      "base64 -d /var/tmp/materialize_secrets.py.b64 > /usr/local/bin/materialize_secrets.py",
+    ],
+    [
+      # Secret resolution (Secrets Manager) and the InfraHouse GPG key
+      # download are both network-bound and independent, so run the
+      # resolver in the background while the repo installer runs.
+      # The subshell waits for both before package_update, and exits
+      # with the repo installer's status exactly as the sequential
+      # version did; resolver failures still only land in
+      # /var/log/generate_apt_auth.log. With var.secret_files or
+      # var.puppet_secrets, materialize_secrets.py resolves those and the
+      # APT auth entries together, logging to
+      # /var/log/materialize_secrets.log; ih-bootstrap checks the files
+      # were written.
+      "(${local.secret_resolver_cmd} /usr/local/bin/bootcmd; rc=$?; wait; exit $rc)"
+    ]
+  )
+
+  write_files = concat(
+    [
+      {
+        content : local.bootstrap_script,
+        path : local.bootstrap_script_path,
+        permissions : "0755"
+      },
+      {
+        content : "export AWS_DEFAULT_REGION=${data.aws_region.current.name}",
+        path : "/etc/profile.d/aws.sh",
+        permissions : "0644"
+      },
+      {
+        content : join(
+          "\n",
+          [
+            "[default]",
+            "region=${data.aws_region.current.name}"
+          ]
+        ),
+        path : "/root/.aws/config",
+        permissions : "0600"
+      },
+      {
+        content : yamlencode(
+          {
+            puppet_role : var.role
+            puppet_environment : var.environment
+          }
+        ),
+        path : join(
+          "/", [
+            local.external_facts_dir,
+            "puppet.yaml"
+          ]
+        ),
+        permissions : "0644"
+      },
+      {
+        content : jsonencode(
+          {
+            ih-puppet : {
+              "debug" : var.puppet_debug_logging
+              "root-directory" : var.puppet_root_directory
+              "hiera-config" : var.puppet_hiera_config_path
+              "environmentpath" : var.puppet_environmentpath
+              "module-path" : var.puppet_module_path
+              "cancel_instance_refresh_on_error" : var.cancel_instance_refresh_on_error
+              "manifest" : local.puppet_manifest
+            }
+          }
+        ),
+        path : join(
+          "/", [
+            local.external_facts_dir,
+            "ih-puppet.json"
+          ]
+        ),
+        permissions : "0644"
+      },
+      {
+        content : jsonencode(var.custom_facts),
+        path : join(
+          "/", [
+            local.external_facts_dir,
+            "custom.json"
+          ]
+        ),
+        permissions : "0644"
+      }
+    ],
+    # Distribution facter reads /etc/facter, Puppet's own /etc/puppetlabs.
+    # Both need external-dir to look up puppet_role; the ttls cache the
+    # slow fact groups between Puppet runs.
+    [
+      {
+        content : local.facter_conf,
+        path : "/etc/facter/facter.conf",
+        permissions : "0644"
+      },
+      {
+        content : local.facter_conf,
+        path : "/etc/puppetlabs/facter/facter.conf",
+        permissions : "0644"
+      }
+    ],
+    # write_files runs in cloud-init's init stage, before apt_configure and
+    # package_update, so the profile covers every apt run of the boot.
+    local.apt_acquire_conf != "" ? [
+      {
+        content : local.apt_acquire_conf,
+        path : "/etc/apt/apt.conf.d/80-ih-acquire",
+        permissions : "0644"
+      }
+    ] : [],
+    # Also in place before package_update, see above.
+    local.dpkg_unsafe_io_conf != "" ? [
+      {
+        content : "# Written by terraform-aws-cloud-init for the first boot, removed by ih-bootstrap.\nforce-unsafe-io\n",
+        path : local.dpkg_unsafe_io_conf,
+        permissions : "0644"
+      }
+    ] : [],
+    var.puppet_profiling ? [
+      {
+        content : file("${path.module}/files/puppet_profile/puppet_profile.py"),
+        path : "/usr/local/bin/ih-puppet-profile",
+        permissions : "0755"
+      }
+    ] : [],
+    var.instance_store != null ? [
+      {
+        content : file("${path.module}/files/instance_store/ih-instance-store.sh"),
+        path : "/usr/local/bin/ih-instance-store",
+        permissions : "0755"
+      }
+    ] : [],
+    var.warm_pool != null ? [
+      {
+        content : local.activate_script,
+        path : "/usr/local/bin/ih-activate",
+        permissions : "0755"
+      },
+      {
+        content : file("${path.module}/files/warm_pool/ih-lifecycle-state.sh"),
+        path : "/usr/local/bin/ih-lifecycle-state",
+        permissions : "0755"
+      },
+      {
+        # cloud-init runs per-boot scripts on every boot, before runcmd; on
+        # the first boot ih-activate exits because prewarm is not done yet.
+        # On later boots in a warm pool it starts ih-activate.service.
+        content : "#!/bin/sh\nexec /usr/local/bin/ih-activate\n",
+        path : "/var/lib/cloud/scripts/per-boot/ih-activate",
+        permissions : "0755"
+      },
+      {
+        # Started by ih-bootstrap, and by the per-boot hook after a reboot,
+        # for Warmed:Running and Warmed:Hibernated pools, which move into
+        # service without a boot.
+        content : file("${path.module}/files/warm_pool/ih-activate.service"),
+        path : "/etc/systemd/system/ih-activate.service",
+        permissions : "0644"
+      }
+    ] : [],
+    local.lifecycle_heartbeat_cmd != "" ? [
+      {
+        content : file("${path.module}/files/lifecycle_heartbeat/lifecycle_heartbeat.py"),
+        path : "/usr/local/bin/ih-lifecycle-heartbeat",
+        permissions : "0755"
+      }
+    ] : [],
+    var.readiness_gate != null ? [
+      {
+        content : file("${path.module}/files/readiness/ih-readiness-gate.sh"),
+        path : "/usr/local/bin/ih-readiness-gate",
+        permissions : "0755"
+      },
+      {
+        content : file("${path.module}/files/readiness/ih-background-runcmd.sh"),
+        path : "/usr/local/bin/ih-background-runcmd",
+        permissions : "0755"
+      }
+    ] : [],
+    var.extra_files,
+    local.repo_preferences,
+  )
+
+  apt_sources = merge(
+    {
+      # The InfraHouse APT repository is now installed via bootcmd.sh script
+      # (see lines 54-58 above). The script fetches the GPG key from the
+      # repository URL, verifies its fingerprint, and creates the apt
+      # sources list at /etc/apt/sources.list.d/50-infrahouse.list.
+      # This approach avoids embedding the full GPG key in userdata.
+      #
+      # Previously it was installed here inline (retained for illustration):
+      # infrahouse : {
+      #   source : "deb [signed-by=$KEY_FILE] https://release-${var.ubuntu_codename}.infrahouse.com/ $RELEASE main"
+      #   key : file("${path.module}/files/DEB-GPG-KEY-infrahouse-${var.ubuntu_codename}")
+      # }
+    },
+    {
+      for repo in keys(var.extra_repos) : repo => merge(
+        {
+          source : var.extra_repos[repo].source
+        },
+        # Include 'key' if provided (embedded GPG key)
+        var.extra_repos[repo].key != null ? {
+          key : var.extra_repos[repo].key
+        } : {},
+        # Include 'keyid' if provided (fetch from keyserver)
+        var.extra_repos[repo].keyid != null ? {
+          keyid : var.extra_repos[repo].keyid
+        } : {},
+        # Include 'keyserver' if provided (custom keyserver for keyid)
+        var.extra_repos[repo].keyserver != null ? {
+          keyserver : var.extra_repos[repo].keyserver
+        } : {}
+      )
     }
   )
+
+  packages = concat(
+    [
+      # json gem dependencies
+      "make",
+      "gcc",
+      # puppet
+      "puppet-code",
+      "infrahouse-toolkit"
+    ],
+    contains(["noble", "oracular"], var.ubuntu_codename) ? ["ruby-rubygems", "ruby-dev"] : [],
+    local.mount_packages,
+    var.instance_store != null ? ["mdadm", var.instance_store.filesystem == "xfs" ? "xfsprogs" : "e2fsprogs"] : [],
+    var.packages
+  )
 }
 
 data "cloudinit_config" "config" {
@@ -85,176 +509,17 @@ data "cloudinit_config" "config" {
                 }
               )
             } : {},
-            length(var.mounts) > 0 ? { mounts : var.mounts } : {},
+            length(local.cc_mounts) > 0 ? { mounts : local.cc_mounts } : {},
+            # Trimmed module lists replace the image's, see locals.tf.
+            local.cloud_init_modules,
             {
-              bootcmd : [
-                # Stop and mask apt-daily / unattended-upgrades before anything else
-                # touches apt. These timers race with cloud-init's package install and
-                # any apt-get run from bootcmd / pre_runcmd / Puppet for the dpkg lock;
-                # lost races on noble have been observed to ABANDON instances via the
-                # lifecycle_hook_name ERR trap (see issue #87).
-                #
-                # Puppet owns package state on InfraHouse-managed instances, so we don't
-                # need unattended-upgrades; security patches land via AMI rebuilds +
-                # ASG cycling, not ad-hoc 1 AM service restarts on live nodes.
-                #
-                # `mask` (not `disable`) is required: on noble these units are masked by
-                # default and `disable` is a no-op, so we must mask to keep them from
-                # coming back after a reboot on long-lived instances.
-                "systemctl stop ${join(" ", local.apt_daily_units)} 2>/dev/null || true",
-                "systemctl mask ${join(" ", local.apt_daily_units)}",
-
-                # Create auth inputs for APT repos
-                "echo '${base64encode(local.repo_pairs_json)}' > /var/tmp/apt-auth.json.b64",
-                "base64 -d /var/tmp/apt-auth.json.b64 > /var/tmp/apt-auth.json",
-                # Prepare and run secret resolver
-                "echo '${base64encode(file("${path.module}/files/apt_auth/generate_apt_auth.py"))}' > /var/tmp/generate_apt_auth.py.b64",
-                "base64 -d /var/tmp/generate_apt_auth.py.b64 > /usr/local/bin/generate_apt_auth.py",
-
-                # Probe for Python; log-and-skip if absent; otherwise run resolver
-                "echo '${base64encode(file("${path.module}/files/generate_apt_auth.sh"))}' > /var/tmp/generate_apt_auth.sh.b64",
-                "base64 -d /var/tmp/generate_apt_auth.sh.b64 > /usr/local/bin/generate_apt_auth.sh",
-                "chmod +x /usr/local/bin/generate_apt_auth.sh",
-                "AWS_DEFAULT_REGION=${data.aws_region.current.name} /usr/local/bin/generate_apt_auth.sh",
-
-                # Prepare and run InfraHouse repo installer
-                "echo '${base64encode(file("${path.module}/files/bootcmd.sh"))}' > /var/tmp/bootcmd.sh.b64",
-                "base64 -d /var/tmp/bootcmd.sh.b64 > /usr/local/bin/bootcmd",
-                "chmod +x /usr/local/bin/bootcmd",
-                "/usr/local/bin/bootcmd"
-              ]
-              write_files : concat(
-                [
-                  {
-                    content : local.bootstrap_script,
-                    path : local.bootstrap_script_path,
-                    permissions : "0755"
-                  },
-                  {
-                    content : "export AWS_DEFAULT_REGION=${data.aws_region.current.name}",
-                    path : "/etc/profile.d/aws.sh",
-                    permissions : "0644"
-                  },
-                  {
-                    content : join(
-                      "\n",
-                      [
-                        "[default]",
-                        "region=${data.aws_region.current.name}"
-                      ]
-                    ),
-                    path : "/root/.aws/config",
-                    permissions : "0600"
-                  },
-                  {
-                    content : yamlencode(
-                      {
-                        puppet_role : var.role
-                        puppet_environment : var.environment
-                      }
-                    ),
-                    path : join(
-                      "/", [
-                        local.external_facts_dir,
-                        "puppet.yaml"
-                      ]
-                    ),
-                    permissions : "0644"
-                  },
-                  {
-                    content : jsonencode(
-                      {
-                        ih-puppet : {
-                          "debug" : var.puppet_debug_logging
-                          "root-directory" : var.puppet_root_directory
-                          "hiera-config" : var.puppet_hiera_config_path
-                          "environmentpath" : var.puppet_environmentpath
-                          "module-path" : var.puppet_module_path
-                          "cancel_instance_refresh_on_error" : var.cancel_instance_refresh_on_error
-                          "manifest" : local.puppet_manifest
-                        }
-                      }
-                    ),
-                    path : join(
-                      "/", [
-                        local.external_facts_dir,
-                        "ih-puppet.json"
-                      ]
-                    ),
-                    permissions : "0644"
-                  },
-                  {
-                    content : jsonencode(var.custom_facts),
-                    path : join(
-                      "/", [
-                        local.external_facts_dir,
-                        "custom.json"
-                      ]
-                    ),
-                    permissions : "0644"
-                  }
-                ],
-                # oracular needs facter config to lookup puppet_role
-                contains(["oracular"], var.ubuntu_codename) ? [
-                  {
-                    content : file("${path.module}/files/facter.conf"),
-                    path : "/etc/facter/facter.conf",
-                    permissions : "0644"
-                  }
-                ] : [],
-                var.extra_files,
-                local.repo_preferences,
-              )
+              bootcmd : local.bootcmd
+              write_files : local.write_files
               package_update : true,
               apt : {
-                sources : merge(
-                  {
-                    # The InfraHouse APT repository is now installed via bootcmd.sh script
-                    # (see lines 54-58 above). The script fetches the GPG key from the
-                    # repository URL, verifies its fingerprint, and creates the apt
-                    # sources list at /etc/apt/sources.list.d/50-infrahouse.list.
-                    # This approach avoids embedding the full GPG key in userdata.
-                    #
-                    # Previously it was installed here inline (retained for illustration):
-                    # infrahouse : {
-                    #   source : "deb [signed-by=$KEY_FILE] https://release-${var.ubuntu_codename}.infrahouse.com/ $RELEASE main"
-                    #   key : file("${path.module}/files/DEB-GPG-KEY-infrahouse-${var.ubuntu_codename}")
-                    # }
-                  },
-                  {
-                    for repo in keys(var.extra_repos) : repo => merge(
-                      {
-                        source : var.extra_repos[repo].source
-                      },
-                      # Include 'key' if provided (embedded GPG key)
-                      var.extra_repos[repo].key != null ? {
-                        key : var.extra_repos[repo].key
-                      } : {},
-                      # Include 'keyid' if provided (fetch from keyserver)
-                      var.extra_repos[repo].keyid != null ? {
-                        keyid : var.extra_repos[repo].keyid
-                      } : {},
-                      # Include 'keyserver' if provided (custom keyserver for keyid)
-                      var.extra_repos[repo].keyserver != null ? {
-                        keyserver : var.extra_repos[repo].keyserver
-                      } : {}
-                    )
-                  }
-                )
+                sources : local.apt_sources
               }
-              packages : concat(
-                [
-                  # json gem dependencies
-                  "make",
-                  "gcc",
-                  # puppet
-                  "puppet-code",
-                  "infrahouse-toolkit"
-                ],
-                contains(["noble", "oracular"], var.ubuntu_codename) ? ["ruby-rubygems", "ruby-dev"] : [],
-                local.mount_packages,
-                var.packages
-              ),
+              packages : local.packages,
               runcmd : [
                 # Single entry so cloud-init's runcmd module cannot fail-open
                 # between steps. The script runs under `set -euo pipefail`
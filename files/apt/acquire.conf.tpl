@@ -0,0 +1,10 @@
+// apt acquire profile from terraform-aws-cloud-init (var.apt_acquire).
+// https:// sources fall back to the Acquire::http options.
+Acquire::Queue-Mode "${queue_mode}";
+Acquire::QueueHost::Limit "${host_queue_limit}";
+Acquire::Retries "${retries}";
+// apt's download queue stalls at 0, so it keeps one item in flight even
+// when HTTP pipelining is off.
+Acquire::Max-Pipeline-Depth "${max(pipeline_depth, 1)}";
+Acquire::http::Pipeline-Depth "${pipeline_depth}";
+Acquire::http::Timeout "${timeout}";
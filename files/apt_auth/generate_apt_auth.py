@@ -1,35 +1,395 @@
 """
-Generate APT authentication configuration from AWS Secrets Manager.
+Generate APT authentication configuration from AWS Secrets Manager or SSM.
 
-This script fetches credentials from AWS Secrets Manager and generates an APT
-auth.conf file for authenticating to private APT repositories during EC2 instance
-bootstrap.
+This script fetches credentials from AWS Secrets Manager secrets or SSM
+Parameter Store SecureString parameters and generates an APT auth.conf file
+for authenticating to private APT repositories during EC2 instance bootstrap.
+
+The backend is chosen by the service in the ``authFrom`` ARN. Each backend
+fetches its references in as few calls as it can, and backends run
+concurrently.
+
+With ``IH_CREDENTIAL_SOURCE=imds`` the AWS credentials are read from the
+instance role over IMDSv2 only, while the inputs are read, and shared by
+all clients; see credential_session().
 """
 
 import json
 import logging
 import os
 import sys
-from typing import Any, Dict
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple, Type
 
 import boto3
-from botocore.exceptions import ClientError
+from botocore.credentials import InstanceMetadataProvider
+from botocore.exceptions import ClientError, NoCredentialsError
+from botocore.utils import InstanceMetadataFetcher
 
 # Setup logging
 LOG = logging.getLogger(__name__)
 
+APT_AUTH_FILE = "/etc/apt/auth.conf.d/50user"
+
+# GetParameters takes at most 10 names per call, BatchGetSecretValue 20.
+SSM_BATCH_SIZE = 10
+SECRETS_MANAGER_BATCH_SIZE = 20
+
+# "chain" is botocore's default credential chain, "imds" the instance role
+# only. Set by bootcmd from the module's imds_credentials option.
+CREDENTIAL_SOURCE = os.environ.get("IH_CREDENTIAL_SOURCE", "chain")
+IMDS_ENDPOINT = os.environ.get("IH_IMDS_ENDPOINT", "http://169.254.169.254")
+# Per IMDS request. The metadata service can be slow to answer right after
+# launch, so retry a short timeout rather than wait on one long one.
+IMDS_TIMEOUT = 1
+IMDS_ATTEMPTS = 3
+
+
+class CredentialBackend(ABC):
+    """
+    Fetches secret strings from one AWS service.
+
+    Subclasses set ``service`` to the ARN service prefix they handle,
+    implement :meth:`fetch` and are registered in :data:`BACKENDS`.
+    """
+
+    service = ""
+
+    def __init__(self, session: Optional[boto3.session.Session] = None) -> None:
+        if session is None:
+            self.client = boto3.client(self.service)
+        else:
+            self.client = session.client(self.service)
+        self.calls = 0
+
+    @abstractmethod
+    def fetch(self, refs: List[str]) -> Dict[str, str]:
+        """
+        Fetch the secret strings.
+
+        :param refs: Distinct ``authFrom`` values handled by this backend.
+        :type refs: list
+        :return: Secret string per reference.
+        :rtype: dict
+        :raises ClientError: If the AWS call fails or a reference is missing.
+        """
+
+
+class SecretsManagerBackend(CredentialBackend):
+    """
+    Secrets Manager secrets, ``BatchGetSecretValue`` in batches of 20.
+
+    Without ``secretsmanager:BatchGetSecretValue`` in the instance profile,
+    or with a botocore that predates the operation (1.33), it falls back to
+    one ``GetSecretValue`` call per secret.
+    """
+
+    service = "secretsmanager"
+
+    def fetch(self, refs: List[str]) -> Dict[str, str]:
+        if not hasattr(self.client, "batch_get_secret_value"):
+            LOG.warning(
+                "botocore has no BatchGetSecretValue, fetching %d secrets one by one",
+                len(refs),
+            )
+            return self._fetch_each(refs)
+        result = {}
+        for start in range(0, len(refs), SECRETS_MANAGER_BATCH_SIZE):
+            batch = refs[start : start + SECRETS_MANAGER_BATCH_SIZE]
+            result.update(self._fetch_batch(batch))
+        return result
+
+    def _fetch_batch(self, batch: List[str]) -> Dict[str, str]:
+        result = {}
+        kwargs: Dict[str, Any] = {"SecretIdList": batch}
+        while True:
+            self.calls += 1
+            try:
+                response = self.client.batch_get_secret_value(**kwargs)
+            except ClientError as err:
+                if err.response["Error"]["Code"] != "AccessDeniedException":
+                    raise
+                LOG.warning(
+                    "BatchGetSecretValue denied, fetching %d secrets one by one",
+                    len(batch),
+                )
+                return self._fetch_each(batch)
+            if response.get("Errors"):
+                error = response["Errors"][0]
+                raise ClientError(
+                    {
+                        "Error": {
+                            "Code": error["ErrorCode"],
+                            "Message": f"{error['SecretId']}: {error['Message']}",
+                        }
+                    },
+                    "BatchGetSecretValue",
+                )
+            for value in response["SecretValues"]:
+                # A secret may be given by name, ARN or partial ARN, which
+                # lacks the "-" and six random characters the full ARN ends
+                # with; the response has the name and the full ARN.
+                ids = (value["Name"], value["ARN"], value["ARN"][:-7])
+                for ref in batch:
+                    if ref in ids:
+                        result[ref] = value["SecretString"]
+            if not response.get("NextToken"):
+                break
+            kwargs["NextToken"] = response["NextToken"]
+        missing = [ref for ref in batch if ref not in result]
+        if missing:
+            raise ClientError(
+                {
+                    "Error": {
+                        "Code": "ResourceNotFoundException",
+                        "Message": f"Secrets not found: {', '.join(missing)}",
+                    }
+                },
+                "BatchGetSecretValue",
+            )
+        return result
+
+    def _fetch_each(self, batch: List[str]) -> Dict[str, str]:
+        result = {}
+        for ref in batch:
+            self.calls += 1
+            result[ref] = self.client.get_secret_value(SecretId=ref)["SecretString"]
+        return result
+
+
+class SSMParameterBackend(CredentialBackend):
+    """SSM SecureString parameters, ``GetParameters`` in batches of 10."""
+
+    service = "ssm"
+
+    def fetch(self, refs: List[str]) -> Dict[str, str]:
+        result = {}
+        for start in range(0, len(refs), SSM_BATCH_SIZE):
+            batch = refs[start : start + SSM_BATCH_SIZE]
+            self.calls += 1
+            response = self.client.get_parameters(Names=batch, WithDecryption=True)
+            for parameter in response["Parameters"]:
+                # Names may be given as ARNs; the response has both.
+                ref = parameter["Name"]
+                if parameter["ARN"] in batch:
+                    ref = parameter["ARN"]
+                result[ref] = parameter["Value"]
+            missing = [ref for ref in batch if ref not in result]
+            if missing:
+                raise ClientError(
+                    {
+                        "Error": {
+                            "Code": "ParameterNotFound",
+                            "Message": f"Parameters not found: {', '.join(missing)}",
+                        }
+                    },
+                    "GetParameters",
+                )
+        return result
+
+
+BACKENDS: Dict[str, Type[CredentialBackend]] = {
+    backend.service: backend for backend in (SecretsManagerBackend, SSMParameterBackend)
+}
+
+
+def backend_for(ref: str) -> Type[CredentialBackend]:
+    """
+    Choose the backend by the service in an ``authFrom`` ARN.
+
+    Anything else, including plain secret names, goes to Secrets Manager as
+    it always has.
+
+    :param ref: ``authFrom`` value.
+    :type ref: str
+    :return: Backend class.
+    :rtype: type
+    """
+    parts = ref.split(":")
+    service = parts[2] if parts[0] == "arn" and len(parts) > 2 else ""
+    return BACKENDS.get(service, SecretsManagerBackend)
+
+
+def credential_session(
+    source: str = CREDENTIAL_SOURCE,
+) -> Optional[boto3.session.Session]:
+    """
+    Resolve the AWS credentials for the clients up front.
+
+    With ``imds``, the instance role's credentials are read from IMDSv2:
+    one token request, then the role name and its credentials, each with
+    :data:`IMDS_TIMEOUT` and :data:`IMDS_ATTEMPTS`. The environment, the
+    shared config and credentials files and the container provider are not
+    consulted. The credentials are not refreshed, which is fine for a
+    process that runs for seconds.
+
+    :param source: ``imds``, or ``chain`` for botocore's default chain.
+    :type source: str
+    :return: Session holding the instance role's credentials, or None to
+             create clients from the default session.
+    :rtype: boto3.session.Session
+    :raises NoCredentialsError: If IMDS has no role credentials
+    """
+    if source != "imds":
+        return None
+    start = time.monotonic()
+    fetcher = InstanceMetadataFetcher(
+        timeout=IMDS_TIMEOUT, num_attempts=IMDS_ATTEMPTS, base_url=IMDS_ENDPOINT
+    )
+    credentials = InstanceMetadataProvider(iam_role_fetcher=fetcher).load()
+    if credentials is None:
+        raise NoCredentialsError()
+    frozen = credentials.get_frozen_credentials()
+    LOG.info(
+        "Fetched instance role credentials from IMDSv2 in %.3fs",
+        time.monotonic() - start,
+    )
+    return boto3.session.Session(
+        aws_access_key_id=frozen.access_key,
+        aws_secret_access_key=frozen.secret_key,
+        aws_session_token=frozen.token,
+    )
+
+
+def prefetch_session(
+    source: str = CREDENTIAL_SOURCE,
+) -> "Future[Optional[boto3.session.Session]]":
+    """
+    Start credential_session() in the background.
+
+    The caller reads its inputs meanwhile and only waits for the result if
+    it has secrets to fetch, so an instance without a role is no worse off
+    when there is nothing to resolve.
+
+    :param source: See credential_session().
+    :type source: str
+    :return: Future of credential_session()'s result.
+    :rtype: concurrent.futures.Future
+    """
+    pool = ThreadPoolExecutor(max_workers=1)
+    future = pool.submit(credential_session, source)
+    pool.shutdown(wait=False)
+    return future
+
+
+def resolve_secrets(
+    refs: List[str], session: Optional[boto3.session.Session] = None
+) -> Dict[str, str]:
+    """
+    Fetch the secret strings of all references, each once.
+
+    References are grouped by backend and the backends run concurrently.
+    The first failing backend's exception is raised.
+
+    :param refs: ``authFrom`` values, possibly repeated.
+    :type refs: list
+    :param session: Session to create the clients from, see
+                    credential_session(). None for the default session.
+    :type session: boto3.session.Session
+    :return: Secret string per reference.
+    :rtype: dict
+    :raises ClientError: If an AWS call fails or a reference is missing.
+    """
+    groups: Dict[Type[CredentialBackend], List[str]] = {}
+    for ref in dict.fromkeys(refs):
+        groups.setdefault(backend_for(ref), []).append(ref)
+    if not groups:
+        return {}
+
+    # boto3 clients are created here, not in the threads: creating them
+    # from a session is not thread-safe. Without a prefetched session, the
+    # first client walks botocore's credential chain, so this is where the
+    # chain's cost shows.
+    start = time.monotonic()
+    backends = {backend(session): group for backend, group in groups.items()}
+    LOG.info(
+        "Created %d clients in %.3fs (credentials: %s)",
+        len(backends),
+        time.monotonic() - start,
+        "default chain" if session is None else "IMDSv2, prefetched",
+    )
+    start = time.monotonic()
+    secrets: Dict[str, str] = {}
+    with ThreadPoolExecutor(max_workers=len(backends)) as pool:
+        futures = [pool.submit(b.fetch, group) for b, group in backends.items()]
+        for future in futures:
+            secrets.update(future.result())
+    for backend, group in backends.items():
+        LOG.info(
+            "Fetched %d credentials from %s in %d calls",
+            len(group),
+            backend.service,
+            backend.calls,
+        )
+    LOG.info("Resolved %d references in %.3fs", len(secrets), time.monotonic() - start)
+    return secrets
+
+
+def read_auth_pairs(auth_inputs: str) -> List[Tuple[str, str]]:
+    """
+    Read the repositories to authenticate to.
+
+    :param auth_inputs: Path of the JSON file, see generate_apt_auth().
+    :type auth_inputs: str
+    :return: ``(machine, authFrom)`` per repository.
+    :rtype: list
+    :raises FileNotFoundError: If auth_inputs does not exist
+    :raises json.JSONDecodeError: If auth_inputs is not JSON
+    :raises KeyError: If 'machine' or 'authFrom' is missing
+    """
+    with open(auth_inputs, "r", encoding="utf-8") as f:
+        auth_configs = json.load(f)
+    LOG.info("Processing %d repository configurations", len(auth_configs))
+    return [(pair["machine"], pair["authFrom"]) for pair in auth_configs]
+
+
+def apt_auth_lines(pairs: List[Tuple[str, str]], secrets: Dict[str, str]) -> List[str]:
+    """
+    Format the APT auth.conf entries.
+
+    :param pairs: ``(machine, authFrom)`` per repository.
+    :type pairs: list
+    :param secrets: Secret string per ``authFrom``, see resolve_secrets().
+    :type secrets: dict
+    :return: One ``machine ... login ... password ...`` line per repository.
+    :rtype: list
+    :raises json.JSONDecodeError: If a secret value is not JSON
+    :raises IndexError: If a secret value is an empty object
+    """
+    lines = []
+    for idx, (machine, auth_from) in enumerate(pairs, 1):
+        LOG.debug(
+            "Processing repository %d/%d: %s (secret: %s)",
+            idx,
+            len(pairs),
+            machine,
+            auth_from,
+        )
+
+        auth: Dict[str, Any] = json.loads(secrets[auth_from])
+
+        # Extract username and password (first key-value pair)
+        login = list(auth.keys())[0]
+        password = auth[login]
+
+        lines.append(f"machine {machine} login {login} password {password}\n")
+    return lines
+
 
 def generate_apt_auth(auth_inputs: str) -> None:
     """
-    Generate APT authentication configuration from AWS Secrets Manager.
+    Generate APT authentication configuration from AWS Secrets Manager or SSM.
 
     Reads a JSON file containing repository authentication configurations,
-    fetches credentials from AWS Secrets Manager, and writes them to
-    /etc/apt/auth.conf.d/50user in APT auth.conf format.
+    fetches credentials from AWS Secrets Manager or SSM Parameter Store, and
+    writes them to /etc/apt/auth.conf.d/50user in APT auth.conf format.
 
     The function processes each repository configuration:
-    1. Reads auth_inputs JSON file
-    2. For each repository, fetches credentials from AWS Secrets Manager
+    1. Reads auth_inputs JSON file, while the AWS credentials are
+       prefetched, see prefetch_session()
+    2. Fetches the credentials of all repositories, see resolve_secrets()
     3. Writes credentials to /etc/apt/auth.conf.d/50user
     4. Sets file permissions to 0600 for security
 
@@ -37,59 +397,40 @@ def generate_apt_auth(auth_inputs: str) -> None:
                         configuration. Expected format:
                         [{"machine": "repo.example.com",
                           "authFrom": "arn:aws:secretsmanager:..."}]
+                        authFrom may also be an SSM parameter ARN,
+                        "arn:aws:ssm:...:parameter/...".
     :type auth_inputs: str
     :return: None
     :rtype: None
     :raises FileNotFoundError: If auth_inputs file does not exist
     :raises json.JSONDecodeError: If auth_inputs contains invalid JSON or if
-                                  secret value from Secrets Manager contains
-                                  invalid JSON
+                                  secret value contains invalid JSON
     :raises KeyError: If required keys ('machine' or 'authFrom') are missing
                       from auth inputs
     :raises IndexError: If secret value is empty dict (no username/password)
     :raises PermissionError: If cannot write to /etc/apt/auth.conf.d/ or
                             set file permissions
-    :raises ClientError: If AWS Secrets Manager operations fail (secret not
-                         found, access denied, throttling, network errors, etc.)
+    :raises ClientError: If AWS Secrets Manager or SSM operations fail (secret
+                         or parameter not found, access denied, throttling,
+                         network errors, etc.)
+    :raises NoCredentialsError: If credentials are pinned to IMDS and the
+                                instance has no role
     """
     LOG.info("Starting APT authentication configuration generation")
+    session = prefetch_session()
     LOG.debug("Reading auth inputs from: %s", auth_inputs)
 
-    client = boto3.client("secretsmanager")
-    auth_file = "/etc/apt/auth.conf.d/50user"
+    auth_file = APT_AUTH_FILE
 
     LOG.debug("Opening output file: %s", auth_file)
     with open(auth_file, "w", encoding="utf-8") as auth_fp:
-        with open(auth_inputs, "r", encoding="utf-8") as f:
-            auth_configs = json.load(f)
-            LOG.info("Processing %d repository configurations", len(auth_configs))
-
-            for idx, pair in enumerate(auth_configs, 1):
-                machine = pair["machine"]
-                auth_from = pair["authFrom"]
-
-                LOG.debug(
-                    "Processing repository %d/%d: %s (secret: %s)",
-                    idx,
-                    len(auth_configs),
-                    machine,
-                    auth_from,
-                )
-
-                # Fetch secret from AWS Secrets Manager
-                secret_response = client.get_secret_value(SecretId=auth_from)
-                auth: Dict[str, Any] = json.loads(secret_response["SecretString"])
-
-                # Extract username and password (first key-value pair)
-                login = list(auth.keys())[0]
-                password = auth[login]
-
-                # Write APT auth.conf entry
-                auth_line = (
-                    f"machine {machine} login {login} password {password}\n"
-                )
-                auth_fp.write(auth_line)
-                LOG.debug("Written auth entry for machine: %s", machine)
+        pairs = read_auth_pairs(auth_inputs)
+        secrets = resolve_secrets(
+            [auth_from for _, auth_from in pairs],
+            session.result() if pairs else None,
+        )
+        for line in apt_auth_lines(pairs, secrets):
+            auth_fp.write(line)
 
     # Set permissions to 600 (rw-------) to protect passwords
     LOG.debug("Setting file permissions to 0600 on %s", auth_file)
@@ -97,14 +438,18 @@ def generate_apt_auth(auth_inputs: str) -> None:
 
     LOG.info(
         "Successfully generated APT auth configuration with %d repositories",
-        len(auth_configs),
+        len(pairs),
     )
 
 
 if __name__ == "__main__":
     logging.basicConfig(
-        level=logging.DEBUG if os.environ.get("DEBUG") in ("1", "true", "True") else logging.INFO,
-        format="%(levelname)s %(name)s:%(filename)s:%(lineno)d %(message)s",
+        level=(
+            logging.DEBUG
+            if os.environ.get("DEBUG") in ("1", "true", "True")
+            else logging.INFO
+        ),
+        format="%(asctime)s %(levelname)s %(name)s:%(filename)s:%(lineno)d %(message)s",
     )
 
     if len(sys.argv) != 2:
@@ -133,3 +478,6 @@ if __name__ == "__main__":
         error_message = e.response["Error"]["Message"]
         LOG.error("AWS error (%s): %s", error_code, error_message)
         sys.exit(1)
+    except NoCredentialsError as e:
+        LOG.error("No AWS credentials: %s", e)
+        sys.exit(1)
@@ -0,0 +1,12 @@
+global : {
+        external-dir : "${external_dir}/",
+}
+%{ if length(ttls) > 0 ~}
+facts : {
+        ttls : [
+        %{~ for group, ttl in ttls }
+                { "${group}" : ${ttl} },
+        %{~ endfor }
+        ]
+}
+%{ endif ~}
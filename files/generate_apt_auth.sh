@@ -9,4 +9,9 @@ else
     | tee /var/log/generate_apt_auth.log >/dev/null
     exit 0
 fi
+# Given the secret definitions, materialize_secrets.py resolves them and the
+# APT auth entries together; it logs APT auth errors here as well.
+if [[ $# -gt 0 ]]; then
+  exec $py /usr/local/bin/materialize_secrets.py "$1" /var/tmp/apt-auth.json >>/var/log/materialize_secrets.log 2>&1
+fi
 $py /usr/local/bin/generate_apt_auth.py /var/tmp/apt-auth.json >>/var/log/generate_apt_auth.log 2>&1
@@ -0,0 +1,89 @@
+#!/bin/bash
+#
+# InfraHouse warm-pool activate phase.
+#
+# ih-bootstrap runs the heavy prewarm phase on the first boot and writes
+# /var/lib/ih-bootstrap/prewarm-done. This script runs the light activate
+# phase once the instance is launched into service: from ih-bootstrap when
+# the instance goes straight into service, from cloud-init's per-boot hook
+# when it starts from a Warmed:Stopped pool, and from ih-activate.service
+# (with --wait) when it moves from a Warmed:Running or Warmed:Hibernated
+# pool without a boot. It does nothing before prewarm is done, after
+# activation, or while the target state is Warmed:*, except start
+# ih-activate.service again after a reboot in those pools.
+#
+# This file is generated by terraform-aws-cloud-init via templatefile().
+#
+set -euo pipefail
+
+if [[ ! -f /var/lib/ih-bootstrap/prewarm-done || -f /var/lib/ih-bootstrap/activate-done ]]; then
+    exit 0
+fi
+if [[ "$${1:-}" == --wait ]]; then
+    _ih_target_state="$(/usr/local/bin/ih-lifecycle-state --wait)"
+else
+    _ih_target_state="$(/usr/local/bin/ih-lifecycle-state)"
+fi
+if [[ "$_ih_target_state" == Warmed:* ]]; then
+    # A Warmed:Running instance that reboots, e.g. for host maintenance, has
+    # lost the ih-activate.service started by ih-bootstrap: the per-boot
+    # hook starts it again, so the move into service is still caught.
+    if [[ "$_ih_target_state" != Warmed:Stopped && "$${1:-}" != --wait ]]; then
+        systemctl start --no-block ih-activate.service
+    fi
+    echo "ih-activate: target lifecycle state is $_ih_target_state, not activating"
+    exit 0
+fi
+
+%{ if lifecycle_hook_name != "" ~}
+_ih_signal_abandon() {
+    set +e
+    ih-aws --verbose autoscaling complete "${lifecycle_hook_name}" --result ABANDON
+    exit 1
+}
+trap _ih_signal_abandon ERR
+%{ endif ~}
+%{ if heartbeat_cmd != "" ~}
+# Started from the per-boot hook or ih-activate.service, not exec'd from
+# ih-bootstrap: record our own lifecycle heartbeats for the launch into
+# service.
+if [[ -z "$${IH_HEARTBEAT_PID:-}" ]]; then
+    ${heartbeat_cmd} --parent-pid $$ &
+    export IH_HEARTBEAT_PID=$!
+fi
+trap 'kill "$IH_HEARTBEAT_PID" 2>/dev/null || true' EXIT
+%{ endif ~}
+
+_ih_stage() {
+    echo "ih-bootstrap: stage $1 at $EPOCHREALTIME"
+}
+
+%{ if instance_store_cmd != "" ~}
+# A stop/start wipes instance store, and its nofail fstab entry lets the
+# boot go on without it: build and mount it again. After a Warmed:Running
+# or Warmed:Hibernated pool it is still mounted and this does nothing.
+_ih_stage instance_store
+${instance_store_cmd}
+%{ endif ~}
+_ih_stage activate
+%{ for cmd in activate_runcmd ~}
+${cmd}
+%{ endfor ~}
+
+%{ if background_cmd != "" ~}
+_ih_stage background
+setsid ${background_cmd} </dev/null &
+%{ endif ~}
+%{ if readiness_gate_cmd != "" ~}
+_ih_stage readiness
+${readiness_gate_cmd}
+%{ endif ~}
+
+touch /var/lib/ih-bootstrap/activate-done
+touch /var/run/puppet-done
+
+%{ if lifecycle_hook_name != "" ~}
+_ih_stage lifecycle
+ih-aws --verbose autoscaling complete "${lifecycle_hook_name}" --result CONTINUE
+%{ endif ~}
+_ih_stage complete
@@ -19,27 +19,242 @@ _ih_signal_abandon() {
 }
 trap _ih_signal_abandon ERR
 %{ endif ~}
+%{ if heartbeat_cmd != "" ~}
+# Record lifecycle heartbeats while this script runs, so the hook's heartbeat
+# timeout only has to cover a stall, not the whole bootstrap. ih-activate,
+# exec'd below with a warm pool, keeps this PID and so the heartbeats.
+${heartbeat_cmd} --parent-pid $$ &
+export IH_HEARTBEAT_PID=$!
+%{ endif ~}
+%{ if puppet_profiling ~}
+# puppet_profiling sets evaltrace and profile in puppet.conf for the
+# bootstrap run only; later agent runs must not keep paying for them.
+_ih_puppet_profiling_off() {
+    PATH=/opt/puppetlabs/puppet/bin:$PATH puppet config delete --section main evaltrace >/dev/null 2>&1 || true
+    PATH=/opt/puppetlabs/puppet/bin:$PATH puppet config delete --section main profile >/dev/null 2>&1 || true
+}
+%{ endif ~}
+%{ if heartbeat_cmd != "" || dpkg_unsafe_io_conf != "" || puppet_profiling ~}
+_ih_on_exit() {
+%{~ if heartbeat_cmd != "" }
+    kill "$IH_HEARTBEAT_PID" 2>/dev/null || true
+%{~ endif }
+%{~ if dpkg_unsafe_io_conf != "" }
+    # Never leave dpkg in unsafe-io mode, even after a failed bootstrap.
+    rm -f ${dpkg_unsafe_io_conf}
+%{~ endif }
+%{~ if puppet_profiling }
+    _ih_puppet_profiling_off
+%{~ endif }
+}
+trap _ih_on_exit EXIT
+%{ endif ~}
+
+# Timestamped stage marker. tools/boot_report.py derives per-stage durations
+# from these lines in /var/log/cloud-init-output.log.
+_ih_stage() {
+    echo "ih-bootstrap: stage $1 at $EPOCHREALTIME"
+}
+
+# Run one command of a parallel group and log its exit code and duration.
+# Called as a background job, so `set +e` only affects this subshell; the
+# command itself still runs under `set -e` in its own nested subshell.
+_ih_timed() {
+    local label="$1" cmd="$2" start rc elapsed
+    start=$${EPOCHREALTIME/./}
+    set +e
+    (set -e; eval "$cmd")
+    rc=$?
+    elapsed=$(( $${EPOCHREALTIME/./} - start ))
+    printf 'ih-bootstrap: %s: exit %d in %d.%03ds: %s\n' \
+        "$label" "$rc" $((elapsed / 1000000)) $((elapsed / 1000 % 1000)) "$cmd"
+    return "$rc"
+}
+
+# Run the given commands concurrently and wait for all of them. The first
+# non-zero exit terminates the rest of the group and is returned to the
+# caller, so `set -e` and the ERR trap treat a failed group exactly like a
+# failed sequential command. Each command is started in its own process
+# group (set -m) so terminating it also takes down whatever it spawned.
+_ih_run_parallel() {
+    local label="$1"
+    shift
+    local -A running=()
+    local cmd pid rc
+    set -m
+    for cmd in "$@"; do
+        _ih_timed "$label" "$cmd" &
+        running[$!]="$cmd"
+    done
+    set +m
+    while (( $${#running[@]} > 0 )); do
+        rc=0
+        wait -n -p pid "$${!running[@]}" || rc=$?
+        unset "running[$pid]"
+        if (( rc != 0 )); then
+            echo "ih-bootstrap: $label: terminating $${#running[@]} remaining command(s) after exit $rc" >&2
+            for pid in "$${!running[@]}"; do
+                kill -- "-$pid" 2>/dev/null || true
+            done
+            wait 2>/dev/null || true
+            return "$rc"
+        fi
+    done
+}
+
+%{ if materialize_secrets ~}
+# secret_files and puppet_secrets are resolved by materialize_secrets.py in
+# bootcmd. Without them services would come up half configured, so fail
+# here instead.
+if [[ ! -e /var/run/ih-secret-files-done ]]; then
+    echo "ih-bootstrap: secrets were not materialized, see /var/log/materialize_secrets.log" >&2
+    false
+fi
+%{ endif ~}
+%{ if instance_store_cmd != "" ~}
+_ih_stage instance_store
+${instance_store_cmd}
+%{ endif ~}
+%{ if length(mount_commands) > 0 ~}
+# Mount one var.mounts entry from /etc/fstab, where cc_mounts put it with
+# noauto. Every attempt is bounded by timeout(1) so a hung NFS/EFS target
+# cannot stall the bootstrap; failed attempts are retried with a growing
+# pause. A required mount that never comes up fails the group and so the
+# bootstrap; an optional (nofail) one is only logged. An entry cc_mounts
+# skipped, e.g. because its device does not exist, is skipped here too.
+# _ih_timed records the latency.
+_ih_mount() {
+    local kind="$1" dir="$2" attempt rc=0
+    if ! findmnt --fstab --mountpoint "$dir" >/dev/null; then
+        echo "ih-bootstrap: mount $dir: not in /etc/fstab, skipped by cc_mounts" >&2
+        return 0
+    fi
+    mkdir -p "$dir"
+    for (( attempt = 1; attempt <= ${mount_retries + 1}; attempt++ )); do
+        if mountpoint -q "$dir"; then
+            rc=0
+            break
+        fi
+        rc=0
+        timeout --kill-after=5 ${mount_timeout} mount "$dir" || rc=$?
+        if (( rc == 0 )); then
+            break
+        fi
+        echo "ih-bootstrap: mount $dir: attempt $attempt of ${mount_retries + 1} failed with exit $rc" >&2
+        if (( attempt <= ${mount_retries} )); then
+            sleep "$attempt"
+        fi
+    done
+    if (( rc != 0 )) && [[ "$kind" == optional ]]; then
+        echo "ih-bootstrap: mount $dir: optional (nofail), continuing without it" >&2
+        return 0
+    fi
+    return "$rc"
+}
 
-%{ if mount_volumes ~}
-mount -a
+_ih_stage mounts
+_ih_group=(
+%{ for cmd in mount_commands ~}
+'${replace(cmd, "'", "'\\''")}'
+%{ endfor ~}
+)
+_ih_run_parallel mounts "$${_ih_group[@]}"
 %{ endif ~}
 
+_ih_stage gems
 PATH=/opt/puppetlabs/puppet/bin:$PATH gem install json
 PATH=/opt/puppetlabs/puppet/bin:$PATH gem install aws-sdk-core
 PATH=/opt/puppetlabs/puppet/bin:$PATH gem install aws-sdk-secretsmanager
 
-%{ for cmd in pre_runcmd ~}
-${cmd}
+_ih_stage pre_runcmd
+%{ for idx, step in pre_runcmd ~}
+%{ if step.parallel ~}
+_ih_group=(
+%{ for cmd in step.commands ~}
+'${replace(cmd, "'", "'\\''")}'
+%{ endfor ~}
+)
+_ih_run_parallel "pre_runcmd[${idx}]" "$${_ih_group[@]}"
+%{ else ~}
+${step.commands[0]}
+%{ endif ~}
 %{ endfor ~}
 
+_ih_stage puppet
+%{ if puppet_profiling ~}
+PATH=/opt/puppetlabs/puppet/bin:$PATH puppet config set --section main evaltrace true
+PATH=/opt/puppetlabs/puppet/bin:$PATH puppet config set --section main profile true
+%{ endif ~}
 ${puppet_cmd}
+%{ if puppet_profiling ~}
+# The profile is diagnostics only; failing to write it must not abandon
+# an instance whose Puppet run succeeded.
+/usr/local/bin/ih-puppet-profile --top ${puppet_profiling_top_resources} \
+    "$(PATH=/opt/puppetlabs/puppet/bin:$PATH puppet config print lastrunfile)" \
+    "$(PATH=/opt/puppetlabs/puppet/bin:$PATH puppet config print lastrunreport)" \
+    || echo "ih-bootstrap: could not write /var/log/puppet-profile.log" >&2
+# Also done on exit, but the warm-pool path exec's ih-activate, which
+# skips the EXIT trap.
+_ih_puppet_profiling_off
+%{ endif ~}
 
-%{ for cmd in post_runcmd ~}
-${cmd}
+_ih_stage post_runcmd
+%{ for idx, step in post_runcmd ~}
+%{ if step.parallel ~}
+_ih_group=(
+%{ for cmd in step.commands ~}
+'${replace(cmd, "'", "'\\''")}'
+%{ endfor ~}
+)
+_ih_run_parallel "post_runcmd[${idx}]" "$${_ih_group[@]}"
+%{ else ~}
+${step.commands[0]}
+%{ endif ~}
 %{ endfor ~}
 
+%{ if dpkg_unsafe_io_conf != "" ~}
+# First-boot installs are done: back to safe dpkg writes, and flush what
+# unsafe-io left in the page cache before anything reports ready.
+_ih_stage dpkg_sync
+rm -f ${dpkg_unsafe_io_conf}
+sync
+%{ endif ~}
+%{ if background_cmd != "" ~}
+# Non-critical steps run alongside the readiness gate and past CONTINUE;
+# ih-background-runcmd reports their failures without abandoning. setsid
+# detaches them, so this script, runcmd and cloud-init finish without them
+# and a timeout around the bootstrap does not kill them.
+_ih_stage background
+setsid ${background_cmd} </dev/null &
+%{ endif ~}
+%{ if readiness_gate_cmd != "" ~}
+_ih_stage readiness
+${readiness_gate_cmd}
+%{ endif ~}
+
+%{ if warm_pool ~}
+# Warm pool: everything above is the prewarm phase. An instance headed for
+# the warm pool reports it done. A Warmed:Stopped one is stopped by the ASG
+# and activated from cloud-init's per-boot hook when it later starts into
+# service. Warmed:Running and Warmed:Hibernated ones move into service
+# without a boot, so ih-activate.service waits for that. An instance
+# launched straight into service activates now.
+install -d -m 0755 /var/lib/ih-bootstrap
+touch /var/lib/ih-bootstrap/prewarm-done
+_ih_target_state="$(/usr/local/bin/ih-lifecycle-state)"
+if [[ "$_ih_target_state" != Warmed:* ]]; then
+    exec /usr/local/bin/ih-activate
+fi
+if [[ "$_ih_target_state" != Warmed:Stopped ]]; then
+    systemctl start --no-block ih-activate.service
+fi
+echo "ih-bootstrap: prewarmed for target lifecycle state $_ih_target_state"
+%{ else ~}
 touch /var/run/puppet-done
+%{ endif ~}
 
 %{ if lifecycle_hook_name != "" ~}
+_ih_stage lifecycle
 ih-aws --verbose autoscaling complete "${lifecycle_hook_name}" --result CONTINUE
 %{ endif ~}
+_ih_stage complete
@@ -0,0 +1,139 @@
+#!/usr/bin/env bash
+#
+# Assemble and mount EC2 instance-store NVMe disks.
+#
+# Discovers the instance-store devices (model "Amazon EC2 NVMe Instance
+# Storage"), stripes them into a RAID0 array when there is more than one,
+# creates a filesystem tuned for fresh NVMe (no discard pass, stripe-aligned
+# to the array), mounts it and adds it to fstab with nofail so a stop/start,
+# which wipes instance store, does not hang the next boot. Run again after
+# a stop/start, it builds a new filesystem and replaces the stale fstab
+# entry of the mount point.
+#
+# Every step is logged with its duration:
+#   ih-instance-store: <step> took <seconds>s
+#
+# Usage:
+#   ih-instance-store --mount-point /mnt/nvme [--filesystem xfs|ext4]
+#       [--mount-options OPTS] [--raid-device /dev/md0] [--fstab /etc/fstab]
+#       [--optional] [DEVICE...]
+#
+# DEVICE overrides discovery, e.g. loop devices when testing on a plain
+# Linux box.
+#
+set -euo pipefail
+
+MOUNT_POINT=""
+FILESYSTEM="xfs"
+MOUNT_OPTIONS="defaults,noatime"
+RAID_DEVICE="/dev/md0"
+FSTAB="/etc/fstab"
+OPTIONAL=false
+CHUNK_KB=256
+MODEL="Amazon EC2 NVMe Instance Storage"
+devices=()
+
+while (( $# > 0 )); do
+    case "$1" in
+        --mount-point) MOUNT_POINT="$2"; shift 2;;
+        --filesystem) FILESYSTEM="$2"; shift 2;;
+        --mount-options) MOUNT_OPTIONS="$2"; shift 2;;
+        --raid-device) RAID_DEVICE="$2"; shift 2;;
+        --fstab) FSTAB="$2"; shift 2;;
+        --optional) OPTIONAL=true; shift;;
+        -*) echo "ih-instance-store: unknown option $1" >&2; exit 2;;
+        *) devices+=("$1"); shift;;
+    esac
+done
+
+if [[ -z "$MOUNT_POINT" ]]; then
+    echo "ih-instance-store: --mount-point is required" >&2
+    exit 2
+fi
+
+_step_start=0
+_step() {
+    _step_start=${EPOCHREALTIME/./}
+}
+_took() {
+    local elapsed=$(( ${EPOCHREALTIME/./} - _step_start ))
+    printf 'ih-instance-store: %s took %d.%03ds\n' \
+        "$1" $((elapsed / 1000000)) $((elapsed / 1000 % 1000))
+}
+
+if mountpoint -q "$MOUNT_POINT"; then
+    echo "ih-instance-store: $MOUNT_POINT is already mounted"
+    exit 0
+fi
+
+_step
+if (( ${#devices[@]} == 0 )); then
+    while read -r name model; do
+        if [[ "$model" == "$MODEL" ]]; then
+            devices+=("$name")
+        fi
+    done < <(lsblk --nodeps --noheadings --paths --output NAME,MODEL)
+fi
+_took discover
+echo "ih-instance-store: devices: ${devices[*]:-none}"
+
+if (( ${#devices[@]} == 0 )); then
+    if [[ "$OPTIONAL" == true ]]; then
+        echo "ih-instance-store: no instance-store devices, skipping"
+        exit 0
+    fi
+    echo "ih-instance-store: no instance-store devices found" >&2
+    exit 1
+fi
+
+if (( ${#devices[@]} > 1 )); then
+    _step
+    mdadm --create "$RAID_DEVICE" --run --force --level=0 --chunk="$CHUNK_KB" \
+        --raid-devices="${#devices[@]}" "${devices[@]}"
+    _took assemble
+    target="$RAID_DEVICE"
+else
+    target="${devices[0]}"
+fi
+
+# Instance store comes zeroed/trimmed, so skip the discard pass; it is the
+# slowest part of mkfs on large NVMe disks. Align to the RAID0 stripe.
+_step
+case "$FILESYSTEM" in
+    xfs)
+        mkfs_args=(-f -K)
+        if (( ${#devices[@]} > 1 )); then
+            mkfs_args+=(-d "su=${CHUNK_KB}k,sw=${#devices[@]}")
+        fi
+        mkfs.xfs "${mkfs_args[@]}" "$target"
+        ;;
+    ext4)
+        # stride and stripe_width are in 4 KiB blocks.
+        extended="nodiscard,lazy_itable_init=1,lazy_journal_init=1"
+        if (( ${#devices[@]} > 1 )); then
+            extended+=",stride=$((CHUNK_KB / 4)),stripe_width=$((CHUNK_KB / 4 * ${#devices[@]}))"
+        fi
+        mkfs.ext4 -F -q -m 0 -E "$extended" "$target"
+        ;;
+    *)
+        echo "ih-instance-store: unsupported filesystem $FILESYSTEM" >&2
+        exit 2
+        ;;
+esac
+_took mkfs
+
+_step
+mkdir -p "$MOUNT_POINT"
+mount -t "$FILESYSTEM" -o "$MOUNT_OPTIONS" "$target" "$MOUNT_POINT"
+_took mount
+
+uuid="$(blkid -s UUID -o value "$target")"
+entries="$(awk -v mount_point="$MOUNT_POINT" '$2 != mount_point' "$FSTAB" 2>/dev/null || true)"
+{
+    if [[ -n "$entries" ]]; then
+        printf '%s\n' "$entries"
+    fi
+    printf 'UUID=%s %s %s %s,nofail,x-systemd.device-timeout=10s 0 2\n' \
+        "$uuid" "$MOUNT_POINT" "$FILESYSTEM" "$MOUNT_OPTIONS"
+} > "$FSTAB"
+echo "ih-instance-store: mounted $target at $MOUNT_POINT"
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Keep an ASG lifecycle action alive while the bootstrap runs.
+
+Records a lifecycle action heartbeat for this instance every ``--interval``
+seconds until the process given by ``--parent-pid`` exits. This lets the
+lifecycle hook use a short heartbeat timeout: a bootstrap that is merely
+slow keeps extending it, while a wedged instance, whose bootstrap died
+without signalling, is replaced after one timeout. Started in the
+background by /usr/local/bin/ih-bootstrap when the module's
+``lifecycle_heartbeat_interval`` option is set.
+
+Heartbeats are best effort and never fail the bootstrap. The loop ends
+quietly once the lifecycle action is completed, or right away when the
+instance is not in an Auto Scaling group.
+
+Only needs boto3, like generate_apt_auth.py.
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+import urllib.request
+from typing import Callable, Optional
+
+import boto3
+from botocore.exceptions import BotoCoreError, ClientError
+
+# Setup logging
+LOG = logging.getLogger(__name__)
+
+IMDS_ENDPOINT = os.environ.get("IH_IMDS_ENDPOINT", "http://169.254.169.254")
+
+
+def instance_id(endpoint: str = IMDS_ENDPOINT) -> str:
+    """
+    Read this instance's ID from the instance metadata service (IMDSv2).
+
+    :param endpoint: Metadata service base URL.
+    :type endpoint: str
+    :return: Instance ID, e.g. ``i-0123456789abcdef0``.
+    :rtype: str
+    :raises OSError: If the metadata service cannot be reached
+    """
+    token_request = urllib.request.Request(
+        f"{endpoint}/latest/api/token",
+        method="PUT",
+        headers={"X-aws-ec2-metadata-token-ttl-seconds": "60"},
+    )
+    with urllib.request.urlopen(token_request, timeout=2) as response:
+        token = response.read().decode()
+    id_request = urllib.request.Request(
+        f"{endpoint}/latest/meta-data/instance-id",
+        headers={"X-aws-ec2-metadata-token": token},
+    )
+    with urllib.request.urlopen(id_request, timeout=2) as response:
+        return response.read().decode().strip()
+
+
+def auto_scaling_group(client, instance: str) -> Optional[str]:
+    """
+    Find the Auto Scaling group an instance belongs to.
+
+    :param client: boto3 ``autoscaling`` client.
+    :param instance: Instance ID.
+    :type instance: str
+    :return: Group name, or None if the instance is not in a group.
+    :rtype: str
+    :raises ClientError: If the API call fails
+    """
+    response = client.describe_auto_scaling_instances(InstanceIds=[instance])
+    instances = response.get("AutoScalingInstances", [])
+    return instances[0]["AutoScalingGroupName"] if instances else None
+
+
+def _alive(pid: Optional[int]) -> bool:
+    if pid is None:
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def heartbeat_loop(
+    client,
+    hook: str,
+    group: str,
+    instance: str,
+    interval: int,
+    parent_pid: Optional[int] = None,
+    sleep: Callable[[float], None] = time.sleep,
+) -> int:
+    """
+    Record heartbeats until the parent exits or the lifecycle action ends.
+
+    :param client: boto3 ``autoscaling`` client.
+    :param hook: Lifecycle hook name.
+    :type hook: str
+    :param group: Auto Scaling group name.
+    :type group: str
+    :param instance: Instance ID.
+    :type instance: str
+    :param interval: Seconds between heartbeats.
+    :type interval: int
+    :param parent_pid: Stop once this process is gone. None runs until the
+                       lifecycle action ends.
+    :type parent_pid: int
+    :param sleep: Sleep function, replaced in tests.
+    :return: Number of heartbeats recorded.
+    :rtype: int
+    """
+    recorded = 0
+    while _alive(parent_pid):
+        try:
+            client.record_lifecycle_action_heartbeat(
+                LifecycleHookName=hook,
+                AutoScalingGroupName=group,
+                InstanceId=instance,
+            )
+            recorded += 1
+            LOG.info("Recorded lifecycle heartbeat %d for %s", recorded, hook)
+        except ClientError as e:
+            if "No active Lifecycle Action" in e.response["Error"]["Message"]:
+                LOG.info("Lifecycle action for %s is complete, stopping", hook)
+                break
+            LOG.warning(
+                "Heartbeat failed (%s): %s",
+                e.response["Error"]["Code"],
+                e.response["Error"]["Message"],
+            )
+        except BotoCoreError as e:
+            LOG.warning("Heartbeat failed: %s", e)
+        for _ in range(interval):
+            if not _alive(parent_pid):
+                break
+            sleep(1)
+    return recorded
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=(
+            logging.DEBUG
+            if os.environ.get("DEBUG") in ("1", "true", "True")
+            else logging.INFO
+        ),
+        format="%(asctime)s %(levelname)s %(name)s:%(filename)s:%(lineno)d %(message)s",
+    )
+
+    parser = argparse.ArgumentParser(
+        description="Record ASG lifecycle action heartbeats while a process runs."
+    )
+    parser.add_argument("--hook", required=True, help="Lifecycle hook name")
+    parser.add_argument("--interval", type=int, default=60)
+    parser.add_argument(
+        "--parent-pid", type=int, help="Stop once this process has exited"
+    )
+    args = parser.parse_args()
+
+    try:
+        asg_client = boto3.client("autoscaling")
+        this_instance = instance_id()
+        asg = auto_scaling_group(asg_client, this_instance)
+    except OSError as e:
+        LOG.warning("Instance metadata not available: %s", e)
+        sys.exit(0)
+    except (ClientError, BotoCoreError) as e:
+        LOG.warning("Cannot look up the Auto Scaling group: %s", e)
+        sys.exit(0)
+    if asg is None:
+        LOG.info("%s is not in an Auto Scaling group, no heartbeats", this_instance)
+        sys.exit(0)
+
+    heartbeat_loop(
+        asg_client, args.hook, asg, this_instance, args.interval, args.parent_pid
+    )
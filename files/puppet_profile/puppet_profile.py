@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+Condense a Puppet run into a short timing profile.
+
+Reads ``last_run_summary.yaml`` and ``last_run_report.yaml`` written by
+``ih-puppet apply`` and writes the catalog compile/apply times, the time
+spent per resource type and the N slowest resources to a plain-text file.
+Run by /usr/local/bin/ih-bootstrap right after Puppet when the module's
+``puppet_profiling`` option is enabled.
+
+Only needs PyYAML, which cloud-init itself depends on.
+"""
+
+import argparse
+import logging
+import os
+import sys
+from typing import Any, Dict, List
+
+import yaml
+
+# Setup logging
+LOG = logging.getLogger(__name__)
+
+
+class _RubyObjectLoader(yaml.SafeLoader):
+    """
+    SafeLoader that reads Puppet's ``!ruby/object:...`` and ``!ruby/sym``
+    tags as plain mappings and strings instead of refusing them.
+    """
+
+
+def _construct_ruby(loader: yaml.SafeLoader, suffix: str, node: yaml.Node) -> Any:
+    if isinstance(node, yaml.MappingNode):
+        return loader.construct_mapping(node, deep=True)
+    if isinstance(node, yaml.SequenceNode):
+        return loader.construct_sequence(node, deep=True)
+    return loader.construct_scalar(node)
+
+
+_RubyObjectLoader.add_multi_constructor("!ruby/", _construct_ruby)
+
+
+def load_yaml(path: str) -> Dict[str, Any]:
+    """
+    Load a Puppet-generated YAML file.
+
+    :param path: Path to the YAML file.
+    :type path: str
+    :return: Parsed document; Ruby objects become dictionaries.
+    :rtype: dict
+    :raises FileNotFoundError: If the file does not exist
+    :raises yaml.YAMLError: If the file is not valid YAML
+    """
+    with open(path, "r", encoding="utf-8") as fp:
+        return yaml.load(fp, Loader=_RubyObjectLoader) or {}
+
+
+def slowest_resources(report: Dict[str, Any], top: int) -> List[Dict[str, Any]]:
+    """
+    Return the ``top`` resources with the longest evaluation time.
+
+    :param report: Parsed ``last_run_report.yaml``.
+    :type report: dict
+    :param top: How many resources to return.
+    :type top: int
+    :return: Dictionaries with ``resource``, ``evaluation_time``, ``file``,
+             ``line``, ``changed`` and ``failed``, slowest first.
+    :rtype: list
+    """
+    resources = []
+    for name, status in (report.get("resource_statuses") or {}).items():
+        resources.append(
+            {
+                "resource": status.get("resource", name),
+                "evaluation_time": float(status.get("evaluation_time") or 0.0),
+                "file": status.get("file"),
+                "line": status.get("line"),
+                "changed": bool(status.get("changed")),
+                "failed": bool(status.get("failed")),
+            }
+        )
+    resources.sort(key=lambda r: r["evaluation_time"], reverse=True)
+    return resources[:top]
+
+
+def format_profile(summary: Dict[str, Any], report: Dict[str, Any], top: int) -> str:
+    """
+    Render the profile text.
+
+    :param summary: Parsed ``last_run_summary.yaml``.
+    :type summary: dict
+    :param report: Parsed ``last_run_report.yaml``.
+    :type report: dict
+    :param top: How many of the slowest resources to list.
+    :type top: int
+    :return: Profile text.
+    :rtype: str
+    """
+    times = summary.get("time") or {}
+    counts = summary.get("resources") or {}
+    lines = [
+        "Puppet run profile",
+        f"Puppet version: {(summary.get('version') or {}).get('puppet', 'unknown')}",
+        f"Environment: {report.get('environment', 'unknown')}",
+        "",
+        f"Catalog compile (config_retrieval): {float(times.get('config_retrieval', 0.0)):.2f}s",
+        f"Catalog application: {float(times.get('catalog_application', 0.0)):.2f}s",
+        f"Fact generation: {float(times.get('fact_generation', 0.0)):.2f}s",
+        f"Total: {float(times.get('total', 0.0)):.2f}s",
+        f"Resources: {counts.get('total', 0)} total, {counts.get('changed', 0)} changed,"
+        f" {counts.get('failed', 0)} failed",
+        "",
+        "Time by resource type:",
+    ]
+    # Per-type totals are the lowercase keys that are not run phases.
+    phases = {
+        "catalog_application",
+        "config_retrieval",
+        "convert_catalog",
+        "fact_generation",
+        "last_run",
+        "node_retrieval",
+        "plugin_sync",
+        "total",
+        "transaction_evaluation",
+        "startup_time",
+    }
+    per_type = sorted(
+        ((k, float(v)) for k, v in times.items() if k not in phases),
+        key=lambda item: item[1],
+        reverse=True,
+    )
+    for rtype, seconds in per_type:
+        lines.append(f"  {seconds:9.3f}s  {rtype}")
+
+    lines += ["", f"Top {top} slowest resources:"]
+    for res in slowest_resources(report, top):
+        where = f"  ({res['file']}:{res['line']})" if res["file"] else ""
+        flags = "".join(
+            [" changed" if res["changed"] else "", " FAILED" if res["failed"] else ""]
+        )
+        lines.append(
+            f"  {res['evaluation_time']:9.3f}s  {res['resource']}{flags}{where}"
+        )
+    return "\n".join(lines) + "\n"
+
+
+def write_profile(summary_file: str, report_file: str, output: str, top: int) -> None:
+    """
+    Write the profile of the last Puppet run to ``output``.
+
+    :param summary_file: Path to ``last_run_summary.yaml``.
+    :type summary_file: str
+    :param report_file: Path to ``last_run_report.yaml``.
+    :type report_file: str
+    :param output: Path of the profile file to write.
+    :type output: str
+    :param top: How many of the slowest resources to list.
+    :type top: int
+    :return: None
+    :rtype: None
+    :raises FileNotFoundError: If either input file does not exist
+    :raises yaml.YAMLError: If either input file is not valid YAML
+    :raises PermissionError: If ``output`` cannot be written
+    """
+    LOG.debug("Reading %s and %s", summary_file, report_file)
+    profile = format_profile(load_yaml(summary_file), load_yaml(report_file), top)
+    tmp = f"{output}.tmp"
+    with open(tmp, "w", encoding="utf-8") as fp:
+        fp.write(profile)
+    os.replace(tmp, output)
+    LOG.info("Puppet run profile written to %s", output)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=(
+            logging.DEBUG
+            if os.environ.get("DEBUG") in ("1", "true", "True")
+            else logging.INFO
+        ),
+        format="%(asctime)s %(levelname)s %(name)s:%(filename)s:%(lineno)d %(message)s",
+    )
+
+    parser = argparse.ArgumentParser(
+        description="Condense a Puppet run into a timing profile."
+    )
+    parser.add_argument("summary", help="Path to last_run_summary.yaml")
+    parser.add_argument("report", help="Path to last_run_report.yaml")
+    parser.add_argument("--output", default="/var/log/puppet-profile.log")
+    parser.add_argument("--top", type=int, default=20)
+    args = parser.parse_args()
+
+    try:
+        write_profile(args.summary, args.report, args.output, args.top)
+    except FileNotFoundError as e:
+        LOG.error("Puppet run file not found: %s", e)
+        sys.exit(1)
+    except yaml.YAMLError as e:
+        LOG.error("Invalid YAML: %s", e)
+        sys.exit(1)
+    except PermissionError as e:
+        LOG.error("Permission denied: %s", e)
+        sys.exit(1)
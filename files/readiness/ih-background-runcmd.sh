@@ -0,0 +1,43 @@
+#!/usr/bin/env bash
+#
+# Run non-critical bootstrap steps in order, without failing on them.
+#
+# The bootstrap starts this in the background next to the readiness gate,
+# so the steps do not hold back the lifecycle CONTINUE. A failing step is
+# logged and the next one runs; nothing here abandons the instance. When
+# all steps are done, the status directory (default /var/run, override
+# with IH_BACKGROUND_STATUS_DIR) holds:
+#
+#   ih-background-done    - always, once every step has run
+#   ih-background-failed  - the failed commands, one per line, if any
+#
+# The exit code is the number of failed steps (capped at 255).
+#
+# Usage:
+#   ih-background-runcmd CMD...
+#
+set -uo pipefail
+
+STATUS_DIR="${IH_BACKGROUND_STATUS_DIR:-/var/run}"
+failed=0
+
+rm -f "$STATUS_DIR/ih-background-done" "$STATUS_DIR/ih-background-failed"
+
+for cmd in "$@"; do
+    start=${EPOCHREALTIME/./}
+    (set -e; eval "$cmd")
+    rc=$?
+    elapsed=$(( ${EPOCHREALTIME/./} - start ))
+    printf 'ih-background: exit %d in %d.%03ds: %s\n' \
+        "$rc" $((elapsed / 1000000)) $((elapsed / 1000 % 1000)) "$cmd"
+    if (( rc != 0 )); then
+        failed=$((failed + 1))
+        printf '%s\n' "$cmd" >> "$STATUS_DIR/ih-background-failed"
+    fi
+done
+
+touch "$STATUS_DIR/ih-background-done"
+if (( failed > 0 )); then
+    echo "ih-background: $failed of $# step(s) failed, see $STATUS_DIR/ih-background-failed" >&2
+fi
+exit $(( failed > 255 ? 255 : failed ))
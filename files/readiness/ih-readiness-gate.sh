@@ -0,0 +1,75 @@
+#!/usr/bin/env bash
+#
+# Wait until every readiness check passes.
+#
+# Each CHECK is a shell command that exits 0 once the instance can take
+# traffic, e.g. `curl -fsS http://localhost:8080/health`. Checks are polled
+# concurrently every --interval seconds; every attempt is bounded by the
+# time left, so a hanging check cannot outlive --timeout. Exits 0 once all
+# checks passed, 1 if any is still failing at the deadline (its last output
+# is logged), so the bootstrap's ERR trap abandons the instance.
+#
+# Usage:
+#   ih-readiness-gate [--timeout 300] [--interval 5] CHECK...
+#
+set -uo pipefail
+
+TIMEOUT=300
+INTERVAL=5
+checks=()
+
+while (( $# > 0 )); do
+    case "$1" in
+        --timeout) TIMEOUT="$2"; shift 2;;
+        --interval) INTERVAL="$2"; shift 2;;
+        -*) echo "ih-readiness-gate: unknown option $1" >&2; exit 2;;
+        *) checks+=("$1"); shift;;
+    esac
+done
+
+if (( ${#checks[@]} == 0 )); then
+    echo "ih-readiness-gate: no checks given" >&2
+    exit 2
+fi
+
+_poll() {
+    local cmd="$1" attempt=0 remaining out rc
+    while :; do
+        attempt=$((attempt + 1))
+        remaining=$((TIMEOUT - SECONDS))
+        if (( remaining <= 0 )); then
+            echo "ih-readiness-gate: not ready after ${TIMEOUT}s ($((attempt - 1)) attempts): $cmd" >&2
+            if [[ -n "${out:-}" ]]; then
+                printf '%s\n' "$out" | tail -n 20 | sed 's/^/    /' >&2
+            fi
+            return 1
+        fi
+        rc=0
+        out="$(timeout --kill-after=5 "$remaining" bash -c "$cmd" 2>&1)" || rc=$?
+        if (( rc == 0 )); then
+            echo "ih-readiness-gate: passed after ${SECONDS}s ($attempt attempts): $cmd"
+            return 0
+        fi
+        remaining=$((TIMEOUT - SECONDS))
+        if (( remaining > 0 )); then
+            sleep $(( INTERVAL < remaining ? INTERVAL : remaining ))
+        fi
+    done
+}
+
+pids=()
+for cmd in "${checks[@]}"; do
+    _poll "$cmd" &
+    pids+=("$!")
+done
+
+failed=0
+for pid in "${pids[@]}"; do
+    wait "$pid" || failed=$((failed + 1))
+done
+
+if (( failed > 0 )); then
+    echo "ih-readiness-gate: $failed of ${#checks[@]} check(s) failed" >&2
+    exit 1
+fi
+echo "ih-readiness-gate: ready after ${SECONDS}s"
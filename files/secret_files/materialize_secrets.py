@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+"""
+Render the module's ``secret_files`` and publish its ``puppet_secrets``.
+
+Reads a JSON object with two keys:
+
+- ``files``: a list of ``{"path", "content", "permissions"}`` objects. The
+  content may hold ``{{secret:ARN}}`` references, which are replaced by the
+  secret's value, and ``{{secret:ARN#key}}`` references, which are replaced
+  by one field of a JSON secret.
+- ``store``: a map of hiera key to ``ARN`` or ``ARN#key``. The values are
+  written to /run/ih-secrets/secrets.json, a root-only file on tmpfs that
+  Puppet reads with hiera's ``json_data`` backend instead of fetching the
+  secrets again.
+
+Given the APT auth inputs of generate_apt_auth.py as well, it writes the
+APT auth.conf entries too, so an ARN that is both an ``authFrom`` and a
+secret reference is fetched once. As in generate_apt_auth.py, APT auth
+is best effort: if it cannot be resolved, the error is logged to
+/var/log/generate_apt_auth.log, no entries are written and the secret
+files are resolved on their own.
+
+ARNs are Secrets Manager secrets or SSM Parameter Store parameters. All
+references are resolved in one pass with generate_apt_auth.resolve_secrets():
+every distinct ARN is fetched once, both backends in batches, and the
+backends are queried concurrently. AWS credentials are prefetched while the
+definitions are read, see generate_apt_auth.prefetch_session().
+
+Nothing is written unless every reference resolves. The APT auth file goes
+first, package_update needs it. Each file is then written to a temporary
+file next to it, with its permissions set before any secret is written, and
+renamed into place. Last, the marker /var/run/ih-secret-files-done tells
+ih-bootstrap the files are there.
+
+Written to /usr/local/bin next to generate_apt_auth.py and run from bootcmd.
+"""
+
+import json
+import logging
+import os
+import re
+import sys
+import tempfile
+from typing import Any, Dict, List, Optional, Tuple
+
+from botocore.exceptions import ClientError, NoCredentialsError
+
+from generate_apt_auth import (
+    APT_AUTH_FILE,
+    apt_auth_lines,
+    prefetch_session,
+    read_auth_pairs,
+    resolve_secrets,
+)
+
+# Setup logging
+LOG = logging.getLogger(__name__)
+# APT auth messages also go to generate_apt_auth.py's log, see __main__.
+APT_LOG = logging.getLogger("generate_apt_auth")
+APT_AUTH_LOG = "/var/log/generate_apt_auth.log"
+
+DONE_MARKER = "/var/run/ih-secret-files-done"
+# /run is a tmpfs: published secrets never reach the disk.
+STORE_PATH = "/run/ih-secrets/secrets.json"
+
+REFERENCE_RE = re.compile(r"\{\{\s*secret:([^\s#}]+)(?:#([^\s}]+))?\s*\}\}")
+
+
+def split_reference(ref: str) -> Tuple[str, Optional[str]]:
+    """
+    Split a store reference into ARN and JSON field.
+
+    :param ref: ``ARN`` or ``ARN#key``.
+    :type ref: str
+    :return: ARN and key, None without ``#key``.
+    :rtype: tuple
+    """
+    arn, _, key = ref.partition("#")
+    return arn, key or None
+
+
+def references(inputs: Dict[str, Any]) -> List[str]:
+    """
+    List the ARNs the files and the store reference.
+
+    :param inputs: ``{"files": [...], "store": {...}}``.
+    :type inputs: dict
+    :return: ARNs, in order of appearance, each once.
+    :rtype: list
+    """
+    refs = [
+        m.group(1) for f in inputs["files"] for m in REFERENCE_RE.finditer(f["content"])
+    ]
+    refs += [split_reference(ref)[0] for ref in inputs["store"].values()]
+    return list(dict.fromkeys(refs))
+
+
+def lookup(secrets: Dict[str, str], arn: str, key: Optional[str] = None) -> str:
+    """
+    Get a secret, or one field of a JSON secret.
+
+    :param secrets: Secret string per ARN.
+    :type secrets: dict
+    :param arn: ARN of the secret.
+    :type arn: str
+    :param key: Field of the JSON secret, or None for the whole secret.
+    :type key: str
+    :return: Secret value.
+    :rtype: str
+    :raises json.JSONDecodeError: If key is given and the secret is not JSON
+    :raises KeyError: If the JSON secret has no such key
+    """
+    if key is None:
+        return secrets[arn]
+    return str(json.loads(secrets[arn])[key])
+
+
+def render(content: str, secrets: Dict[str, str]) -> str:
+    """
+    Replace the secret references in a file's content.
+
+    :param content: Content with references.
+    :type content: str
+    :param secrets: Secret string per ARN.
+    :type secrets: dict
+    :return: Content with secret values.
+    :rtype: str
+    :raises json.JSONDecodeError: If a ``#key`` reference's secret is not JSON
+    :raises KeyError: If a JSON secret has no such key
+    """
+    return REFERENCE_RE.sub(
+        lambda match: lookup(secrets, match.group(1), match.group(2)), content
+    )
+
+
+def write_atomic(path: str, content: str, permissions: str) -> None:
+    """
+    Replace a file in one rename, with its final permissions from the start.
+
+    :param path: Absolute path of the file.
+    :type path: str
+    :param content: File content.
+    :type content: str
+    :param permissions: Octal mode, e.g. ``"0600"``.
+    :type permissions: str
+    :raises OSError: If the file cannot be written
+    """
+    directory = os.path.dirname(path)
+    os.makedirs(directory, mode=0o755, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as fp:
+            os.fchmod(fp.fileno(), int(permissions, 8))
+            fp.write(content)
+            fp.flush()
+            os.fsync(fp.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def _auth_pairs(apt_auth: str) -> List[Tuple[str, str]]:
+    try:
+        return read_auth_pairs(apt_auth)
+    except (OSError, ValueError, KeyError, TypeError) as err:
+        APT_LOG.error("Cannot read APT auth inputs %s: %s", apt_auth, err)
+        return []
+
+
+def _auth_lines(pairs: List[Tuple[str, str]], secrets: Dict[str, str]) -> List[str]:
+    try:
+        return apt_auth_lines(pairs, secrets)
+    except (ValueError, IndexError, AttributeError) as err:
+        APT_LOG.error("Empty or invalid APT auth secret value: %s", err)
+        return []
+
+
+def materialize_secrets(
+    inputs: str,
+    marker: str = DONE_MARKER,
+    store_path: str = STORE_PATH,
+    apt_auth: Optional[str] = None,
+    apt_auth_file: str = APT_AUTH_FILE,
+) -> None:
+    """
+    Render all files and publish the store from a JSON file of definitions.
+
+    :param inputs: Path of the JSON file.
+    :type inputs: str
+    :param marker: File to create when all files are written.
+    :type marker: str
+    :param store_path: Where to publish the store, if it is not empty.
+    :type store_path: str
+    :param apt_auth: Path of generate_apt_auth.py's JSON file of APT auth
+                     inputs, or None to leave APT auth to it. APT auth
+                     errors are logged, not raised.
+    :type apt_auth: str
+    :param apt_auth_file: Where to write the APT auth.conf entries.
+    :type apt_auth_file: str
+    :return: None
+    :raises FileNotFoundError: If inputs does not exist
+    :raises json.JSONDecodeError: If inputs is not JSON, or a ``#key``
+                                  reference's secret is not JSON
+    :raises KeyError: If a definition or a JSON secret lacks a key
+    :raises ClientError: If an AWS call fails or a secret does not exist
+    :raises NoCredentialsError: If credentials are pinned to IMDS and the
+                                instance has no role
+    :raises OSError: If a file cannot be written
+    """
+    session = prefetch_session()
+    LOG.info("Reading secret definitions from %s", inputs)
+    with open(inputs, "r", encoding="utf-8") as f:
+        definitions = json.load(f)
+    files = definitions["files"]
+    store = definitions["store"]
+    pairs = [] if apt_auth is None else _auth_pairs(apt_auth)
+
+    file_refs = references(definitions)
+    refs = list(dict.fromkeys([auth_from for _, auth_from in pairs] + file_refs))
+    LOG.info(
+        "Resolving %d secrets for %d files, %d store keys and %d APT repositories",
+        len(refs),
+        len(files),
+        len(store),
+        len(pairs),
+    )
+    try:
+        secrets = resolve_secrets(refs, session.result() if refs else None)
+    except (ClientError, NoCredentialsError) as err:
+        if not pairs:
+            raise
+        # Maybe only an authFrom failed; the secret files must not wait
+        # for APT auth.
+        APT_LOG.error("Cannot resolve APT auth secrets: %s", err)
+        pairs = []
+        secrets = resolve_secrets(file_refs, session.result() if file_refs else None)
+
+    # Render everything first: a bad reference must not leave some files
+    # written and others not.
+    auth_lines = _auth_lines(pairs, secrets)
+    rendered = [
+        (f["path"], render(f["content"], secrets), f["permissions"]) for f in files
+    ]
+    values = {
+        name: lookup(secrets, *split_reference(ref)) for name, ref in store.items()
+    }
+    if auth_lines:
+        write_atomic(apt_auth_file, "".join(auth_lines), "0600")
+        APT_LOG.info("Wrote %d APT auth entries to %s", len(auth_lines), apt_auth_file)
+    for path, content, permissions in rendered:
+        write_atomic(path, content, permissions)
+        LOG.info("Wrote %s (%s)", path, permissions)
+    if store:
+        # Only root may list the store directory, whatever the umask.
+        os.makedirs(os.path.dirname(store_path), mode=0o700, exist_ok=True)
+        os.chmod(os.path.dirname(store_path), 0o700)
+        write_atomic(store_path, json.dumps(values, indent=2) + "\n", "0600")
+        LOG.info("Published %d secrets to %s", len(values), store_path)
+
+    with open(marker, "w", encoding="utf-8"):
+        pass
+    LOG.info("Successfully rendered %d secret files", len(files))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=(
+            logging.DEBUG
+            if os.environ.get("DEBUG") in ("1", "true", "True")
+            else logging.INFO
+        ),
+        format="%(asctime)s %(levelname)s %(name)s:%(filename)s:%(lineno)d %(message)s",
+    )
+    try:
+        apt_log_handler = logging.FileHandler(APT_AUTH_LOG)
+    except OSError as e:
+        LOG.warning("Cannot log APT auth to %s: %s", APT_AUTH_LOG, e)
+    else:
+        apt_log_handler.setFormatter(logging.root.handlers[0].formatter)
+        APT_LOG.addHandler(apt_log_handler)
+
+    if len(sys.argv) not in (2, 3):
+        LOG.error(
+            "Usage: %s <secret_definitions_json_file> [<auth_inputs_json_file>]",
+            sys.argv[0],
+        )
+        sys.exit(1)
+
+    try:
+        materialize_secrets(
+            sys.argv[1], apt_auth=sys.argv[2] if len(sys.argv) == 3 else None
+        )
+    except FileNotFoundError as e:
+        LOG.error("Secret definitions not found: %s", e)
+        sys.exit(1)
+    except json.JSONDecodeError as e:
+        LOG.error("Invalid JSON: %s", e)
+        sys.exit(1)
+    except KeyError as e:
+        LOG.error("Missing key: %s", e)
+        sys.exit(1)
+    except ClientError as e:
+        error_code = e.response["Error"]["Code"]
+        error_message = e.response["Error"]["Message"]
+        LOG.error("AWS error (%s): %s", error_code, error_message)
+        sys.exit(1)
+    except NoCredentialsError as e:
+        LOG.error("No AWS credentials: %s", e)
+        sys.exit(1)
+    except OSError as e:
+        LOG.error("Cannot write secret file: %s", e)
+        sys.exit(1)
@@ -0,0 +1,58 @@
+#!/usr/bin/env bash
+#
+# Print the Auto Scaling target lifecycle state of this instance, e.g.
+# "InService" or "Warmed:Stopped", from the instance metadata service
+# (IMDSv2). The item appears shortly after launch, so it is polled.
+#
+# With --wait, keep polling while the state is Warmed:* and print the first
+# other state. A Warmed:Running or Warmed:Hibernated instance moves into
+# service without a boot, so this is how ih-activate learns about it.
+#
+# IH_IMDS_ENDPOINT overrides the metadata endpoint (for tests),
+# IH_LIFECYCLE_STATE_ATTEMPTS the number of one-second polls and
+# IH_LIFECYCLE_STATE_INTERVAL the seconds between --wait polls.
+#
+set -euo pipefail
+
+IMDS="${IH_IMDS_ENDPOINT:-http://169.254.169.254}"
+ATTEMPTS="${IH_LIFECYCLE_STATE_ATTEMPTS:-60}"
+INTERVAL="${IH_LIFECYCLE_STATE_INTERVAL:-5}"
+WAIT=false
+
+if [[ "${1:-}" == --wait ]]; then
+    WAIT=true
+fi
+
+_read_state() {
+    local attempt token state
+    for (( attempt = 1; attempt <= ATTEMPTS; attempt++ )); do
+        token="$(curl --silent --fail --connect-timeout 1 --max-time 2 -X PUT \
+            -H "X-aws-ec2-metadata-token-ttl-seconds: 60" \
+            "$IMDS/latest/api/token")" || token=""
+        state="$(curl --silent --fail --connect-timeout 1 --max-time 2 \
+            -H "X-aws-ec2-metadata-token: $token" \
+            "$IMDS/latest/meta-data/autoscaling/target-lifecycle-state")" || state=""
+        if [[ -n "$state" ]]; then
+            echo "$state"
+            return 0
+        fi
+        sleep 1
+    done
+    echo "ih-lifecycle-state: no target lifecycle state after $ATTEMPTS attempts" >&2
+    return 1
+}
+
+if [[ "$WAIT" != true ]]; then
+    _read_state
+    exit
+fi
+
+# A metadata hiccup while waiting is not a reason to give up on activation.
+while true; do
+    state="$(_read_state)" || state=""
+    if [[ -n "$state" && "$state" != Warmed:* ]]; then
+        echo "$state"
+        exit 0
+    fi
+    sleep "$INTERVAL"
+done
@@ -12,6 +12,32 @@ locals {
 
   repo_pairs_json = jsonencode(local.repo_pairs)
 
+  # var.secret_files are rendered and var.puppet_secrets published in
+  # bootcmd by materialize_secrets.py, which imports the secret backends
+  # of generate_apt_auth.py. It then writes the APT auth entries as well,
+  # so an ARN used in both places is fetched once, by one process.
+  materialize_secrets = length(var.secret_files) > 0 || length(var.puppet_secrets) > 0
+
+  secret_definitions_json = jsonencode({
+    files = var.secret_files
+    store = var.puppet_secrets
+  })
+
+  # Environment of the bootcmd secret resolvers.
+  resolver_env = join(" ", concat(
+    ["AWS_DEFAULT_REGION=${data.aws_region.current.name}"],
+    var.imds_credentials ? ["IH_CREDENTIAL_SOURCE=imds"] : [],
+  ))
+
+  # Runs in the background of the bootcmd repo installer. Given the secret
+  # definitions, generate_apt_auth.sh hands them and the APT auth inputs
+  # to materialize_secrets.py.
+  secret_resolver_cmd = join(" ", concat(
+    [local.resolver_env, "/usr/local/bin/generate_apt_auth.sh"],
+    local.materialize_secrets ? ["/var/tmp/secret-files.json"] : [],
+    ["&"],
+  ))
+
   # Generate APT preference files for repos with custom priority
   repo_preferences = [
     for name, repo in var.extra_repos : {
@@ -27,7 +53,7 @@ locals {
 
   # Client packages needed for remote filesystem mounts. Index 2 of each
   # var.mounts entry is fs_vfstype (see cc_mounts documentation). We
-  # inject the client package so `mount -a` does not fail on a base image
+  # inject the client package so the mounts do not fail on a base image
   # that does not ship nfs-common / cifs-utils.
   mount_client_packages = {
     nfs   = "nfs-common"
@@ -37,6 +63,167 @@ locals {
   }
 
   mount_packages = distinct(compact([
-    for m in var.mounts : lookup(local.mount_client_packages, length(m) >= 3 ? m[2] : "", "")
+    for m in local.mounts : lookup(local.mount_client_packages, length(m) >= 3 ? m[2] : "", "")
   ]))
+
+  facter_conf = templatefile(
+    "${path.module}/files/facter/facter.conf.tpl",
+    {
+      external_dir = local.external_facts_dir
+      ttls         = var.facter_fact_ttls
+    }
+  )
+
+  # apt download tuning, with defaults shared with tools/apt_benchmark.py.
+  apt_acquire_conf = var.apt_acquire == null ? "" : templatefile(
+    "${path.module}/files/apt/acquire.conf.tpl",
+    merge(
+      jsondecode(file("${path.module}/files/apt/acquire.json")),
+      { for k, v in var.apt_acquire : k => v if v != null }
+    )
+  )
+
+  # Explicit cloud-init module lists for var.cloud_init_module_allowlist:
+  # the modules this module needs plus the allowlist, in Ubuntu's default
+  # order, with unknown allowlisted modules at the end of their stage.
+  cloud_init_module_lists = jsondecode(file("${path.module}/files/cloud_init/modules.json"))
+  cloud_init_modules = var.cloud_init_module_allowlist == null ? {} : {
+    for stage, modules in local.cloud_init_module_lists : stage => distinct(concat(
+      [
+        for m in modules.default : m
+        if contains(concat(modules.keep, var.cloud_init_module_allowlist[stage]), m)
+      ],
+      [
+        for m in var.cloud_init_module_allowlist[stage] : m
+        if !contains(modules.default, m)
+      ]
+    ))
+  }
+
+  # Tuned NFS/EFS mount profiles, shared with tools/nfs_benchmark.py.
+  nfs_profiles = jsondecode(file("${path.module}/files/nfs_profile/profiles.json"))
+  nfs_profile  = var.nfs_mount_profile == null ? null : local.nfs_profiles[var.nfs_mount_profile]
+
+  # A profile option is dropped when the caller set a conflicting one, so
+  # an explicit `soft`, `resvport` or `vers=3` still wins over the profile.
+  # vers is an alias of nfsvers and the kernel takes v3, v4.1, ... too.
+  nfs_version_options = ["nfsvers", "vers", "v2", "v3", "v4", "v4.0", "v4.1", "v4.2"]
+  nfs_option_conflicts = merge(
+    {
+      hard       = ["soft"]
+      soft       = ["hard"]
+      noresvport = ["resvport"]
+      resvport   = ["noresvport"]
+    },
+    {
+      for o in local.nfs_version_options : o => [
+        for v in local.nfs_version_options : v if v != o
+      ]
+    },
+  )
+
+  # var.mounts with the NFS profile applied: profile options fill in
+  # fs_mntops of nfs/nfs4 entries, options the caller set keep their value,
+  # and a bare `defaults` is replaced. Other entries are passed through.
+  mounts = [
+    for m in var.mounts : local.nfs_profile != null && contains(["nfs", "nfs4"], try(m[2], "")) ? concat(
+      slice(m, 0, 3),
+      [
+        join(",", values({
+          for key, opt in merge(
+            {
+              for k, v in local.nfs_profile.options : k => v == null ? k : "${k}=${v}"
+              if !anytrue([
+                for c in try(local.nfs_option_conflicts[k], []) : contains(
+                  [for o in compact(split(",", try(m[3], ""))) : split("=", o)[0]], c
+                )
+              ])
+            },
+            { for o in compact(split(",", try(m[3], ""))) : split("=", o)[0] => o }
+          ) : key => opt if key != "defaults"
+        }))
+      ],
+      length(m) > 4 ? slice(m, 4, length(m)) : ["0", "0"]
+    ) : m
+  ]
+
+  # Files the NFS profile needs: network buffer sysctls and sunrpc module
+  # options. bootcmd writes them and applies them at runtime, before
+  # anything is mounted; they persist across reboots.
+  nfs_tuning_enabled = local.nfs_profile != null && anytrue([
+    for m in var.mounts : contains(["nfs", "nfs4"], try(m[2], ""))
+  ])
+  nfs_sysctl_conf = "/etc/sysctl.d/60-ih-nfs.conf"
+  nfs_tuning_files = local.nfs_tuning_enabled ? concat(
+    length(local.nfs_profile.sysctl) > 0 ? [
+      {
+        content     = join("\n", [for k, v in local.nfs_profile.sysctl : "${k} = ${v}"])
+        path        = local.nfs_sysctl_conf
+        permissions = "0644"
+      }
+    ] : [],
+    length(local.nfs_profile.sunrpc) > 0 ? [
+      {
+        content     = "options sunrpc ${join(" ", [for k, v in local.nfs_profile.sunrpc : "${k}=${v}"])}"
+        path        = "/etc/modprobe.d/ih-nfs-sunrpc.conf"
+        permissions = "0644"
+      }
+    ] : [],
+  ) : []
+
+  # Kernel tuning profiles, see files/tuning_profile/profiles.json.
+  tuning_profiles = jsondecode(file("${path.module}/files/tuning_profile/profiles.json"))
+  tuning_profile  = var.tuning_profile == null ? null : local.tuning_profiles[var.tuning_profile]
+
+  # Files the tuning profile needs, in write_files form. systemd-sysctl,
+  # pam_limits, systemd, systemd-tmpfiles and udev read them on every boot;
+  # on the first boot bootcmd writes and applies them, because cloud-init's
+  # write_files only runs after bootcmd. Limits go to pam_limits for login
+  # sessions and to systemd's defaults for services; wildcard pam_limits
+  # entries do not cover root.
+  tuning_sysctl_conf   = "/etc/sysctl.d/60-ih-tuning.conf"
+  tuning_tmpfiles_conf = "/etc/tmpfiles.d/60-ih-tuning.conf"
+  tuning_files = local.tuning_profile == null ? [] : [
+    {
+      content     = join("\n", [for k, v in local.tuning_profile.sysctl : "${k} = ${v}"])
+      path        = local.tuning_sysctl_conf
+      permissions = "0644"
+    },
+    {
+      content = join("\n", flatten([
+        for k, v in local.tuning_profile.limits : [
+          for domain in ["*", "root"] : "${domain} - ${k} ${v}"
+        ]
+      ]))
+      path        = "/etc/security/limits.d/60-ih-tuning.conf"
+      permissions = "0644"
+    },
+    {
+      content = join("\n", concat(
+        ["[Manager]"],
+        [for k, v in local.tuning_profile.limits : "DefaultLimit${upper(k)}=${v}"]
+      ))
+      path        = "/etc/systemd/system.conf.d/60-ih-tuning.conf"
+      permissions = "0644"
+    },
+    {
+      content = join("\n", [
+        for k, v in local.tuning_profile.transparent_hugepage :
+        "w /sys/kernel/mm/transparent_hugepage/${k} - - - - ${v}"
+      ])
+      path        = local.tuning_tmpfiles_conf
+      permissions = "0644"
+    },
+    {
+      content     = "ACTION==\"add|change\", SUBSYSTEM==\"block\", ENV{DEVTYPE}==\"disk\", KERNEL==\"nvme*|xvd*\", ATTR{queue/scheduler}=\"${local.tuning_profile.io_scheduler}\""
+      path        = "/etc/udev/rules.d/60-ih-io-scheduler.rules"
+      permissions = "0644"
+    },
+  ]
+
+  # Kernel settings files written by bootcmd rather than write_files, which
+  # cloud-init only runs after bootcmd. 60-ih-nfs.conf sorts before
+  # 60-ih-tuning.conf, so the tuning profile wins on a conflicting sysctl,
+  # on the first boot as on later ones.
+  bootcmd_files = concat(local.nfs_tuning_files, local.tuning_files)
 }
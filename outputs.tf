@@ -3,3 +3,25 @@ output "userdata" {
   value       = data.cloudinit_config.config.rendered
   sensitive   = true
 }
+
+output "userdata_section_hashes" {
+  description = <<-EOT
+    SHA-256 of each section of the rendered cloud-config: bootcmd (including
+    the embedded helper scripts), each bootcmd helper script on its own,
+    write_files, apt_sources, packages, mounts, the ih-bootstrap script and
+    the warm-pool ih-activate script (the hash of "" without warm_pool).
+    Compare them between plans to see which part of userdata a change
+    touches; tools/userdata_diff.py tells cosmetic changes from
+    behavior-affecting ones.
+  EOT
+  value = {
+    bootcmd          = sha256(jsonencode(local.bootcmd))
+    bootcmd_helpers  = { for name, content in local.bootcmd_helpers : name => sha256(content) }
+    write_files      = sha256(jsonencode(local.write_files))
+    apt_sources      = sha256(jsonencode(local.apt_sources))
+    packages         = sha256(jsonencode(local.packages))
+    mounts           = sha256(jsonencode(local.mounts))
+    bootstrap_script = sha256(local.bootstrap_script)
+    activate_script  = sha256(local.activate_script)
+  }
+}
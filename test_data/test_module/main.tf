@@ -37,4 +37,21 @@ module "test" {
   ]
   puppet_manifest     = var.puppet_manifest
   lifecycle_hook_name = var.lifecycle_hook_name
+  pre_runcmd          = var.pre_runcmd
+  post_runcmd         = var.post_runcmd
+  puppet_profiling    = var.puppet_profiling
+  nfs_mount_profile   = var.nfs_mount_profile
+  instance_store      = var.instance_store
+  warm_pool           = var.warm_pool
+  readiness_gate      = var.readiness_gate
+
+  lifecycle_heartbeat_interval = var.lifecycle_heartbeat_interval
+  facter_fact_ttls             = var.facter_fact_ttls
+  apt_acquire                  = var.apt_acquire
+  dpkg_unsafe_io               = var.dpkg_unsafe_io
+  cloud_init_module_allowlist  = var.cloud_init_module_allowlist
+  secret_files                 = var.secret_files
+  puppet_secrets               = var.puppet_secrets
+  imds_credentials             = var.imds_credentials
+  tuning_profile               = var.tuning_profile
 }
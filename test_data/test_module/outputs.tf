@@ -2,3 +2,7 @@ output "userdata" {
   value     = module.test.userdata
   sensitive = true
 }
+
+output "userdata_section_hashes" {
+  value = module.test.userdata_section_hashes
+}
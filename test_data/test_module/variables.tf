@@ -12,3 +12,83 @@ variable "lifecycle_hook_name" {
   default = null
   type    = string
 }
+
+variable "pre_runcmd" {
+  default = []
+  type    = any
+}
+
+variable "post_runcmd" {
+  default = []
+  type    = any
+}
+
+variable "puppet_profiling" {
+  default = false
+  type    = bool
+}
+
+variable "nfs_mount_profile" {
+  default = null
+  type    = string
+}
+
+variable "instance_store" {
+  default = null
+  type    = any
+}
+
+variable "warm_pool" {
+  default = null
+  type    = any
+}
+
+variable "readiness_gate" {
+  default = null
+  type    = any
+}
+
+variable "lifecycle_heartbeat_interval" {
+  default = null
+  type    = number
+}
+
+variable "facter_fact_ttls" {
+  default = null
+  type    = map(string)
+}
+
+variable "apt_acquire" {
+  default = null
+  type    = any
+}
+
+variable "dpkg_unsafe_io" {
+  default = false
+  type    = bool
+}
+
+variable "cloud_init_module_allowlist" {
+  default = null
+  type    = any
+}
+
+variable "secret_files" {
+  default = []
+  type    = any
+}
+
+variable "puppet_secrets" {
+  default = {}
+  type    = map(string)
+}
+
+variable "imds_credentials" {
+  default = false
+  type    = bool
+}
+
+variable "tuning_profile" {
+  default = null
+  type    = string
+}
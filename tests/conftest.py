@@ -1,8 +1,357 @@
+import fcntl
+import gzip
+import hashlib
+import json
 import logging
+import os
+import re
+import shutil
+import subprocess
+import sys
+from base64 import b64encode
+from contextlib import contextmanager
+from pathlib import Path
+from textwrap import dedent
 
+import pytest
+import yaml
 from infrahouse_core.logging import setup_logging
+from pytest_infrahouse import terraform_apply
+
+# Offline checks in tools/ are shared with the terraform tests.
+sys.path.insert(0, str(Path(__file__).parent.parent / "tools"))
+
+from validate_userdata import decode_userdata, find_schema, validate_userdata
 
 LOG = logging.getLogger()
 TERRAFORM_ROOT_DIR = "test_data"
+MODULE_ROOT = Path(__file__).parent.parent
+
+# Per-test copies of the test_data fixtures. Paths are stable per test case,
+# so state left behind by --keep-after is found again by the next run.
+WORKDIR_ROOT = MODULE_ROOT / ".pytest-terraform"
+
+# Files that belong to a workdir and survive refreshing it from test_data.
+WORKDIR_KEEP = {".terraform", "terraform.tfstate", "terraform.tfstate.backup"}
+
+# Rendered terraform outputs keyed by content hash; bump the version to
+# invalidate every entry when the key or the stored format changes.
+USERDATA_CACHE_DIR = WORKDIR_ROOT / "userdata-cache"
+USERDATA_CACHE_VERSION = 1
+
+LOCAL_SOURCE_RE = re.compile(r'(\bsource\s*=\s*")(\.{1,2}/[^"]*)(")')
 
 setup_logging(LOG, debug=False)
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--no-userdata-cache",
+        action="store_true",
+        default=False,
+        help="Always run terraform, even if the rendered userdata is cached.",
+    )
+
+
+def pytest_configure(config):
+    # Registered here so the marker is known with or without pytest-xdist.
+    config.addinivalue_line(
+        "markers",
+        "xdist_group(name): run all tests of the group on one pytest-xdist worker",
+    )
+
+
+def write_terraform_tf(module_dir: str, aws_provider_version: str) -> None:
+    """Write terraform.tf with the specified AWS provider version."""
+    with open(f"{module_dir}/terraform.tf", "w") as fp:
+        fp.write(dedent(f"""
+            terraform {{
+              required_version = "~> 1.0"
+              required_providers {{
+                aws = {{
+                  source  = "hashicorp/aws"
+                  version = "{aws_provider_version}"
+                }}
+                cloudinit = {{
+                  source  = "hashicorp/cloudinit"
+                  version = "~> 2.3"
+                }}
+              }}
+            }}
+            """))
+
+
+def prepare_terraform_workdir(fixture_dir: str, workdir: str) -> str:
+    """
+    Refresh ``workdir`` from a test_data fixture directory.
+
+    Everything but Terraform state and ``.terraform`` is replaced by a copy
+    of ``fixture_dir``. Local module sources (``../../``) are rewritten to
+    point at the same directories from the new location, and the dependency
+    lock file is dropped so a different provider version can be selected.
+
+    :param fixture_dir: Directory under test_data to copy.
+    :type fixture_dir: str
+    :param workdir: Directory to run terraform in.
+    :type workdir: str
+    :return: ``workdir``
+    :rtype: str
+    """
+    os.makedirs(workdir, exist_ok=True)
+    for entry in os.scandir(workdir):
+        if entry.name in WORKDIR_KEEP:
+            continue
+        if entry.is_dir(follow_symlinks=False):
+            shutil.rmtree(entry.path)
+        else:
+            os.remove(entry.path)
+
+    shutil.copytree(
+        fixture_dir,
+        workdir,
+        dirs_exist_ok=True,
+        ignore=shutil.ignore_patterns(
+            *WORKDIR_KEEP,
+            ".terraform.lock.hcl",
+            ".terraform.tfstate.lock.info",
+            "__pycache__",
+        ),
+    )
+
+    def _rebase(match: re.Match) -> str:
+        target = os.path.abspath(os.path.join(fixture_dir, match.group(2)))
+        source = os.path.relpath(target, workdir).replace(os.sep, "/")
+        if not source.startswith("."):
+            source = f"./{source}"
+        return f"{match.group(1)}{source}{match.group(3)}"
+
+    for tf_file in Path(workdir).glob("*.tf"):
+        text = tf_file.read_text()
+        rebased = LOCAL_SOURCE_RE.sub(_rebase, text)
+        if rebased != text:
+            tf_file.write_text(rebased)
+    return workdir
+
+
+@pytest.fixture(scope="session")
+def terraform_plugin_cache():
+    """
+    Provider plugin cache shared by every test and pytest-xdist worker.
+
+    Honours an existing ``TF_PLUGIN_CACHE_DIR``; otherwise uses
+    ``~/.terraform.d/plugin-cache``. The test workdirs drop their lock files,
+    so Terraform is allowed to link cached providers without a recorded
+    checksum.
+    """
+    cache_dir = os.environ.get(
+        "TF_PLUGIN_CACHE_DIR",
+        os.path.join(os.path.expanduser("~"), ".terraform.d", "plugin-cache"),
+    )
+    os.makedirs(cache_dir, exist_ok=True)
+    os.environ["TF_PLUGIN_CACHE_DIR"] = cache_dir
+    os.environ["TF_PLUGIN_CACHE_MAY_BREAK_DEPENDENCY_LOCK_FILE"] = "true"
+    return cache_dir
+
+
+@pytest.fixture
+def terraform_workdir(request, terraform_plugin_cache):
+    """
+    Return a factory that gives the test its own copy of a test_data fixture.
+
+    ``terraform_workdir("test_module", aws_provider_version)`` copies
+    ``test_data/test_module`` to
+    ``.pytest-terraform/<test name>-<hash of test id>/test_module`` and
+    writes terraform.tf for the provider version there.
+    """
+    nodeid = request.node.nodeid
+    case = "{}-{}".format(
+        re.sub(r"[^A-Za-z0-9_.-]+", "_", request.node.name)[:60],
+        hashlib.sha1(nodeid.encode()).hexdigest()[:8],
+    )
+
+    def _workdir(fixture_name: str, aws_provider_version: str) -> str:
+        workdir = prepare_terraform_workdir(
+            os.path.join(TERRAFORM_ROOT_DIR, fixture_name),
+            str(WORKDIR_ROOT / case / fixture_name),
+        )
+        write_terraform_tf(workdir, aws_provider_version)
+        return workdir
+
+    return _workdir
+
+
+def terraform_init(workdir: str) -> None:
+    """
+    Run ``terraform init`` in a workdir while holding the plugin cache lock.
+
+    Installs into the plugin cache are serialized across pytest-xdist
+    workers, since Terraform does not guard concurrent writers; the
+    ``terraform init`` in terraform_apply then only links providers.
+
+    :param workdir: Directory prepared by terraform_workdir.
+    :type workdir: str
+    """
+    if shutil.which("terraform") is None:
+        pytest.fail("terraform is not on PATH; the userdata tests render the module")
+    cache_dir = os.environ["TF_PLUGIN_CACHE_DIR"]
+    with open(os.path.join(cache_dir, ".lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        subprocess.run(
+            ["terraform", "init", "-backend=false", "-input=false", "-no-color"],
+            cwd=workdir,
+            check=True,
+        )
+
+
+def _hash_tree(digest, root: Path, paths) -> None:
+    for path in sorted(paths):
+        if path.is_file():
+            digest.update(str(path.relative_to(root)).encode() + b"\0")
+            digest.update(path.read_bytes() + b"\0")
+
+
+def userdata_cache_key(module_dir: str) -> str:
+    """
+    Content hash of everything that decides what a test module renders.
+
+    Covers the module (``*.tf`` and ``files/**``), the test workdir
+    (fixture files, the generated terraform.tf and terraform.tfvars) and the
+    AWS region taken from the environment.
+
+    :param module_dir: Directory prepared by terraform_workdir.
+    :type module_dir: str
+    :return: Hex SHA-256 digest.
+    :rtype: str
+    """
+    digest = hashlib.sha256(f"v{USERDATA_CACHE_VERSION}\0".encode())
+    _hash_tree(digest, MODULE_ROOT, MODULE_ROOT.glob("*.tf"))
+    _hash_tree(
+        digest,
+        MODULE_ROOT,
+        (p for p in (MODULE_ROOT / "files").rglob("*") if "__pycache__" not in p.parts),
+    )
+    workdir = Path(module_dir)
+    skip = WORKDIR_KEEP | {".terraform.lock.hcl", ".terraform.tfstate.lock.info"}
+    _hash_tree(
+        digest,
+        workdir,
+        (p for p in workdir.rglob("*") if not skip & set(p.relative_to(workdir).parts)),
+    )
+    for name in ("AWS_REGION", "AWS_DEFAULT_REGION"):
+        digest.update(f"{name}={os.environ.get(name, '')}\0".encode())
+    return digest.hexdigest()
+
+
+@pytest.fixture
+def cached_terraform_apply(request):
+    """
+    Drop-in for terraform_apply for test modules that only render userdata.
+
+    The terraform output of a test module is stored under
+    ``.pytest-terraform/userdata-cache`` keyed by userdata_cache_key(). On a
+    hit the stored output is yielded and terraform does not run at all; on
+    a miss the module is initialized and applied as usual and its output
+    stored. ``--no-userdata-cache`` always runs terraform.
+    """
+    use_cache = not request.config.getoption("--no-userdata-cache")
+
+    @contextmanager
+    def _apply(module_dir: str, destroy_after: bool = True):
+        key = userdata_cache_key(module_dir)
+        cache_file = USERDATA_CACHE_DIR / f"{key}.json"
+        if use_cache and cache_file.exists():
+            LOG.info("Using cached terraform output %s for %s", cache_file, module_dir)
+            yield json.loads(cache_file.read_text())
+            return
+
+        terraform_init(module_dir)
+        with terraform_apply(
+            module_dir, destroy_after=destroy_after, json_output=True
+        ) as tf_output:
+            USERDATA_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+            tmp_file = cache_file.with_suffix(f".{os.getpid()}.tmp")
+            tmp_file.write_text(json.dumps(tf_output))
+            os.replace(tmp_file, cache_file)
+            yield tf_output
+
+    return _apply
+
+
+def make_userdata(cloud_config: dict, compress: bool = False) -> str:
+    """
+    Render a cloud-config the way the cloudinit provider does: a MIME
+    multipart message with one text/cloud-config part, optionally gzipped,
+    base64 encoded.
+
+    :param cloud_config: Cloud-config mapping
+    :param compress: Whether to gzip the message (gzip_userdata)
+    :return: Base64 encoded userdata
+    """
+    body = "#cloud-config\n" + yaml.safe_dump(cloud_config)
+    mime = (
+        'Content-Type: multipart/mixed; boundary="MIMEBOUNDARY"\n'
+        "MIME-Version: 1.0\r\n\r\n"
+        "--MIMEBOUNDARY\r\n"
+        "Content-Transfer-Encoding: 7bit\r\n"
+        "Content-Type: text/cloud-config\r\n"
+        "Mime-Version: 1.0\r\n\r\n"
+        f"{body}\r\n"
+        "--MIMEBOUNDARY--\r\n"
+    ).encode()
+    return b64encode(gzip.compress(mime) if compress else mime).decode()
+
+
+@pytest.fixture(scope="session")
+def cloud_config_schema():
+    """
+    cloud-init's cloud-config JSON schema, or None if cloud-init is not
+    installed locally and $CLOUD_INIT_SCHEMA is not set. Without the schema
+    only the module rules run; ``test_cloud_config_schema_available`` is
+    then reported as skipped so the gap shows in the test summary.
+    """
+    return find_schema()
+
+
+@pytest.fixture
+def valid_userdata(cloud_config_schema):
+    """
+    Validate a rendered ``userdata`` output offline and return the decoded
+    cloud-config. Fails the test on any schema or module rule violation.
+    """
+
+    def _validate(value: str) -> dict:
+        errors = validate_userdata(value, cloud_config_schema)
+        assert not errors, "userdata failed validation:\n" + "\n".join(errors)
+        return decode_userdata(value)
+
+    return _validate
+
+
+@pytest.fixture
+def fake_commands(tmp_path, monkeypatch):
+    """
+    Return a factory that puts command stand-ins first on PATH.
+
+    ``fake_commands({"mount": "", "sysctl": "echo 42"})`` writes a shell
+    script per command to ``tmp_path/bin`` and returns the call log,
+    ``tmp_path/calls.log``. A body is appended to a line that logs the
+    command name and arguments; a body that starts with ``#!`` is the whole
+    script and logs what it wants. ``{calls}`` and the keyword arguments of
+    the factory are substituted into every script with ``str.format``.
+    """
+    bin_dir = tmp_path / "bin"
+    calls = tmp_path / "calls.log"
+
+    def _fake(scripts: dict, **values) -> Path:
+        if not bin_dir.is_dir():
+            bin_dir.mkdir()
+            monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+        for name, body in scripts.items():
+            if not body.startswith("#!"):
+                body = f'#!/bin/sh\necho "{name} $*" >> {{calls}}\n{body}\n'
+            script = bin_dir / name
+            script.write_text(body.format(calls=calls, **values))
+            script.chmod(0o755)
+        return calls
+
+    return _fake
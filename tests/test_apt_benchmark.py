@@ -0,0 +1,234 @@
+"""
+Unit tests for tools/apt_benchmark.py.
+
+apt-get and dpkg-scanpackages are replaced by shell scripts on PATH; the
+apt-get stand-in fetches the Release file of every source, so the test
+goes through the delayed repository servers.
+"""
+
+import json
+import time
+import urllib.request
+from pathlib import Path
+
+import pytest
+
+from apt_benchmark import (
+    format_results,
+    index_repository,
+    load_defaults,
+    main,
+    render_apt_conf,
+    run_benchmark,
+    serve,
+)
+
+FAKE_APT_GET = """#!/bin/sh
+echo "$*" >> {calls}
+root=$(dirname "$APT_CONFIG")
+grep -q "Dir::Etc::Parts \\"$root/apt.conf.d\\";" "$APT_CONFIG" || exit 1
+cat "$root/apt.conf.d/80-ih-acquire" >> {calls}
+if [ "$1" = update ]; then
+    for url in $(awk '{{print $3}}' "$root/sources.list"); do
+        python3 -c "import sys, urllib.request; urllib.request.urlopen(sys.argv[1])" \\
+            "${{url}}Release"
+    done
+fi
+"""
+
+FAKE_SCANPACKAGES = """#!/bin/sh
+for deb in *.deb; do
+    echo "Package: ${{deb%%_*}}"
+    echo "Filename: ./$deb"
+    echo
+done
+"""
+
+
+@pytest.fixture
+def fake_apt(fake_commands) -> Path:
+    """
+    Put apt-get and dpkg-scanpackages stand-ins first on PATH.
+
+    :param fake_commands: Command stand-in factory
+    :return: Path of the log the apt-get stand-in writes
+    """
+    return fake_commands(
+        {"apt-get": FAKE_APT_GET, "dpkg-scanpackages": FAKE_SCANPACKAGES}
+    )
+
+
+@pytest.fixture
+def mirror(tmp_path: Path) -> Path:
+    """
+    A directory with a few placeholder .deb files.
+
+    :param tmp_path: Pytest temporary directory fixture
+    :return: Mirror directory
+    """
+    directory = tmp_path / "mirror"
+    directory.mkdir()
+    for name in ("make", "gcc", "cpp", "libc6-dev"):
+        (directory / f"{name}_1.0_amd64.deb").write_text(name)
+    return directory
+
+
+def test_render_apt_conf() -> None:
+    """
+    The module template renders with the module defaults; with pipelining
+    off apt's queue still gets one item at a time.
+
+    :return: None
+    """
+
+    def settings(conf: str) -> list:
+        return [line for line in conf.splitlines() if not line.startswith("//")]
+
+    assert settings(render_apt_conf(load_defaults())) == [
+        'Acquire::Queue-Mode "host";',
+        'Acquire::QueueHost::Limit "16";',
+        'Acquire::Retries "5";',
+        'Acquire::Max-Pipeline-Depth "10";',
+        'Acquire::http::Pipeline-Depth "10";',
+        'Acquire::http::Timeout "15";',
+    ]
+    no_pipelining = settings(render_apt_conf({**load_defaults(), "pipeline_depth": 0}))
+    assert 'Acquire::Max-Pipeline-Depth "1";' in no_pipelining
+    assert 'Acquire::http::Pipeline-Depth "0";' in no_pipelining
+
+
+def test_serve_delays_requests(tmp_path: Path) -> None:
+    """
+    Every request is answered after the delay.
+
+    :param tmp_path: Pytest temporary directory fixture
+    :return: None
+    """
+    (tmp_path / "Release").write_text("Origin: test\n")
+
+    with serve(str(tmp_path), "127.0.0.1", 200) as url:
+        start = time.monotonic()
+        with urllib.request.urlopen(f"{url}/Release") as response:
+            assert response.read() == b"Origin: test\n"
+        assert time.monotonic() - start >= 0.2
+
+
+def test_index_repository(tmp_path: Path, mirror: Path, fake_apt: Path) -> None:
+    """
+    The repository gets the .deb files, Packages indexes and a Release file
+    with their checksums.
+
+    :param tmp_path: Pytest temporary directory fixture
+    :param mirror: Mirror directory
+    :param fake_apt: apt stand-ins
+    :return: None
+    """
+    repo = tmp_path / "repo"
+    index_repository(str(repo), [str(mirror / "make_1.0_amd64.deb")])
+
+    assert (repo / "make_1.0_amd64.deb").read_text() == "make"
+    assert "Package: make" in (repo / "Packages").read_text()
+    release = (repo / "Release").read_text().splitlines()
+    assert release[2] == "SHA256:"
+    assert [line.split()[2] for line in release[3:]] == ["Packages", "Packages.gz"]
+    assert int(release[3].split()[1]) == (repo / "Packages").stat().st_size
+
+
+def test_run_benchmark(mirror: Path, fake_apt: Path) -> None:
+    """
+    Each profile runs update and the download in its own APT root, with
+    its own apt.conf.d profile, against every repository host.
+
+    :param mirror: Mirror directory
+    :param fake_apt: apt stand-ins
+    :return: None
+    """
+    results = run_benchmark(
+        {"stock": "", "tuned": 'Acquire::Retries "7";\n'},
+        ["make", "gcc"],
+        str(mirror),
+        hosts=2,
+        delay_ms=100,
+        runs=2,
+    )
+
+    assert [(r.profile, r.runs) for r in results] == [("stock", 2), ("tuned", 2)]
+    assert all(r.update_s >= 0.2 for r in results)
+    assert all(r.total_s == r.update_s + r.download_s for r in results)
+    calls = fake_apt.read_text()
+    assert calls.count('Acquire::Retries "7";') == 4
+    assert calls.count("update\n") == 4
+    assert calls.count("install --download-only --yes --no-install-recommends") == 4
+
+
+def test_format_results() -> None:
+    """
+    The table compares every profile with the first one.
+
+    :return: None
+    """
+    results = [
+        {"profile": "stock", "runs": 3, "update_s": 4, "download_s": 16, "total_s": 20},
+        {
+            "profile": "apt_acquire",
+            "runs": 3,
+            "update_s": 3,
+            "download_s": 12,
+            "total_s": 15,
+        },
+    ]
+
+    lines = format_results(results).splitlines()
+
+    assert lines[0].split() == [
+        "profile",
+        "runs",
+        "update",
+        "download",
+        "total",
+        "vs",
+        "stock",
+    ]
+    assert lines[2].split()[-1] == "-25%"
+
+
+def test_main_json(mirror: Path, fake_apt: Path, capsys) -> None:
+    """
+    --set overrides a default in the profile; --json prints both profiles.
+
+    :param mirror: Mirror directory
+    :param fake_apt: apt stand-ins
+    :param capsys: Pytest output capture fixture
+    :return: None
+    """
+    rc = main(
+        [
+            "--mirror",
+            str(mirror),
+            "--set",
+            "pipeline_depth=0",
+            "--delay-ms",
+            "0",
+            "--runs",
+            "1",
+            "--json",
+        ]
+    )
+
+    assert rc == 0
+    assert [r["profile"] for r in json.loads(capsys.readouterr().out)] == [
+        "stock",
+        "apt_acquire",
+    ]
+    assert 'Acquire::http::Pipeline-Depth "0";' in fake_apt.read_text()
+
+
+def test_main_empty_mirror(tmp_path: Path, fake_apt: Path) -> None:
+    """
+    A mirror without packages is an error.
+
+    :param tmp_path: Pytest temporary directory fixture
+    :param fake_apt: apt stand-ins
+    :return: None
+    """
+    assert main(["--mirror", str(tmp_path)]) == 1
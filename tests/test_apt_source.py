@@ -1,73 +1,39 @@
 import json
 from base64 import b64decode
-from os import path as osp, remove
+from os import path as osp
 from textwrap import dedent
 from typing import Any
 
 import pytest
-from mimeparse import parse_mime_type
-from pytest_infrahouse import terraform_apply
-from yaml import load, Loader
-
-from tests.conftest import TERRAFORM_ROOT_DIR
-
-
-def write_terraform_tf(module_dir: str, aws_provider_version: str) -> None:
-    """Write terraform.tf with the specified AWS provider version."""
-    with open(f"{module_dir}/terraform.tf", "w") as fp:
-        fp.write(f"""
-            terraform {{
-                required_version = "~> 1.0"
-                required_providers {{
-                    aws = {{
-                      source  = "hashicorp/aws"
-                      version = "{aws_provider_version}"
-                    }}
-                    cloudinit = {{
-                      source  = "hashicorp/cloudinit"
-                        version = "~> 2.3"
-                    }}
-                  }}
-                }}
-            """)
+
+from tests.conftest import MODULE_ROOT
+from validate_userdata import decode_userdata
 
 
 def parse_userdata(tf_output: dict[str, Any]) -> dict[str, Any]:
     """Decode and parse userdata from terraform output."""
-    userdata = b64decode(tf_output["userdata"]["value"]).decode()
-    yaml_userdata = (
-        parse_mime_type(userdata)[2]["boundary"]
-        .split("#cloud-config")[1]
-        .replace("--MIMEBOUNDARY--", "")
-    )
-    return load(yaml_userdata, Loader=Loader)
+    return decode_userdata(tf_output["userdata"]["value"])
 
 
 @pytest.mark.parametrize("aws_provider_version", ["~> 6.0"], ids=["aws-6"])
-def test_module(aws_provider_version, keep_after):
-    module_dir = osp.join(TERRAFORM_ROOT_DIR, "apt_source")
-
-    # Delete .terraform.lock.hcl to allow provider version changes
-    lock_file_path = osp.join(module_dir, ".terraform.lock.hcl")
-    try:
-        remove(lock_file_path)
-    except FileNotFoundError:
-        pass
-
-    write_terraform_tf(module_dir, aws_provider_version)
+def test_module(
+    aws_provider_version,
+    keep_after,
+    valid_userdata,
+    terraform_workdir,
+    cached_terraform_apply,
+):
+    module_dir = terraform_workdir("apt_source", aws_provider_version)
 
     with open(osp.join(module_dir, "terraform.tfvars"), "w") as fp:
         fp.write("")
 
-    with terraform_apply(
-        module_dir,
-        destroy_after=not keep_after,
-        json_output=True,
-    ) as tf_output:
+    with cached_terraform_apply(module_dir, destroy_after=not keep_after) as tf_output:
         userdata = b64decode(tf_output["userdata"]["value"]).decode()
         assert userdata
         print(userdata)
         ud_obj = parse_userdata(tf_output)
+        assert valid_userdata(tf_output["userdata"]["value"]) == ud_obj
         print(json.dumps(ud_obj, indent=4))
         # Find the apt-auth.json.b64 echo line (its position in bootcmd is not
         # fixed — other bootcmd entries like the apt-daily mask run first).
@@ -114,19 +80,12 @@ def test_extra_repos_key_types(
     key_config: dict[str, str],
     expected_fields: set[str],
     keep_after: bool,
+    valid_userdata,
+    terraform_workdir,
+    cached_terraform_apply,
 ) -> None:
     """Test that extra_repos correctly handles key, keyid, and keyserver options."""
-    # Use separate test_keyid directory to avoid modifying apt_source/main.tf
-    module_dir = osp.join(TERRAFORM_ROOT_DIR, "test_keyid")
-
-    # Delete .terraform.lock.hcl to allow provider version changes
-    lock_file_path = osp.join(module_dir, ".terraform.lock.hcl")
-    try:
-        remove(lock_file_path)
-    except FileNotFoundError:
-        pass
-
-    write_terraform_tf(module_dir, aws_provider_version)
+    module_dir = terraform_workdir("test_keyid", aws_provider_version)
 
     # Build the key configuration string for HCL
     key_hcl_parts = []
@@ -137,7 +96,7 @@ def test_extra_repos_key_types(
     # Write main.tf with the test configuration
     main_tf = dedent(f"""\
         module "test" {{
-          source      = "../../"
+          source      = "{osp.relpath(MODULE_ROOT, module_dir)}/"
           environment = "dev"
           role        = "foo"
           extra_repos = {{
@@ -154,12 +113,9 @@ def test_extra_repos_key_types(
     with open(osp.join(module_dir, "terraform.tfvars"), "w") as fp:
         fp.write("")
 
-    with terraform_apply(
-        module_dir,
-        destroy_after=not keep_after,
-        json_output=True,
-    ) as tf_output:
+    with cached_terraform_apply(module_dir, destroy_after=not keep_after) as tf_output:
         ud_obj = parse_userdata(tf_output)
+        assert valid_userdata(tf_output["userdata"]["value"]) == ud_obj
         print(json.dumps(ud_obj, indent=4))
 
         # Verify apt.sources contains the test-repo with expected fields
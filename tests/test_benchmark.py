@@ -0,0 +1,113 @@
+"""
+Unit tests for tools/benchmark.py, the scaffolding of the benchmarks.
+"""
+
+import json
+import logging
+import subprocess
+
+import pytest
+
+from benchmark import (
+    Column,
+    argument_parser,
+    format_table,
+    run_cli,
+    saving,
+    seconds,
+    text,
+)
+
+RESULTS = [
+    {"mode": "safe", "runs": 3, "total_s": 20.0},
+    {"mode": "unsafe-io", "runs": 3, "total_s": 15.0},
+]
+
+
+def test_format_table() -> None:
+    """
+    Columns are as wide as their widest cell and aligned as asked.
+
+    :return: None
+    """
+    table = format_table(
+        RESULTS,
+        [
+            Column("mode", text("mode"), "<"),
+            Column("runs", text("runs")),
+            Column("total", seconds("total_s")),
+        ],
+    )
+    assert table.splitlines() == [
+        "mode       runs    total",
+        "safe          3  20.000s",
+        "unsafe-io     3  15.000s",
+    ]
+
+
+@pytest.mark.parametrize(
+    "baseline, candidate, expected",
+    [
+        ("safe", "unsafe-io", (5.0, 0.25)),
+        ("safe", "missing", None),
+        ("missing", "safe", None),
+    ],
+)
+def test_saving(baseline: str, candidate: str, expected) -> None:
+    """
+    The saving is absolute and relative to the baseline, None without both.
+
+    :param baseline: Name of the result to compare to
+    :param candidate: Name of the result that saves
+    :param expected: Expected saving
+    :return: None
+    """
+    assert saving(RESULTS, "mode", "total_s", baseline, candidate) == expected
+
+
+def _table(results):
+    return format_table(results, [Column("mode", text("mode"), "<")])
+
+
+def test_run_cli_prints_json_or_table(capsys) -> None:
+    """
+    Results are printed as JSON with --json and as the table otherwise.
+
+    :param capsys: Pytest output capture fixture
+    :return: None
+    """
+    parser = argument_parser(__doc__)
+    assert run_cli(parser, ["--json"], lambda args: RESULTS, _table) == 0
+    assert json.loads(capsys.readouterr().out) == RESULTS
+    assert run_cli(parser, [], lambda args: RESULTS, _table) == 0
+    assert capsys.readouterr().out.split() == ["mode", "safe", "unsafe-io"]
+
+
+@pytest.mark.parametrize(
+    "error, message",
+    [
+        (
+            subprocess.CalledProcessError(1, ["dpkg"] + ["x.deb"] * 10, stderr=b"boom"),
+            "dpkg x.deb x.deb x.deb x.deb x.deb x.deb x.deb ... failed:\nboom",
+        ),
+        (OSError("no such file"), "no such file"),
+        (KeyError("bogus"), "Unknown profile 'bogus'"),
+    ],
+)
+def test_run_cli_errors(error: Exception, message: str, caplog) -> None:
+    """
+    Expected failures are logged and exit 1; long commands are cut short.
+
+    :param error: Exception the benchmark raises
+    :param message: Expected log message
+    :param caplog: Pytest log capture fixture
+    :return: None
+    """
+
+    def _fail(args):
+        raise error
+
+    caplog.set_level(logging.ERROR)
+    errors = {KeyError: lambda err: f"Unknown profile {err}"}
+    assert run_cli(argument_parser(__doc__), [], _fail, _table, errors) == 1
+    assert caplog.messages == [message]
@@ -0,0 +1,240 @@
+"""
+Unit tests for tools/boot_benchmark.py.
+
+The container is not started; these tests cover the stand-ins it boots
+against. The AWS and IMDS stand-ins are exercised with the module's own
+secret resolver, so they answer what botocore asks.
+"""
+
+import base64
+import hashlib
+import io
+import json
+import logging
+import sys
+import tarfile
+import urllib.error
+import urllib.request
+from dataclasses import asdict
+from pathlib import Path
+
+import pytest
+
+from boot_benchmark import (
+    _AWSHandler,
+    _IMDSHandler,
+    build_repository,
+    format_results,
+    imds_paths,
+    main,
+    read_userdata,
+    serve_handler,
+    summarize,
+    system_conf,
+)
+from boot_report import build_report
+from validate_userdata import UserdataError
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "files" / "apt_auth"))
+
+import generate_apt_auth
+
+RUN_A = Path(__file__).parent.parent / "test_data" / "boot_logs" / "run_a"
+
+USERDATA = """\
+Content-Type: multipart/mixed; boundary="MIMEBOUNDARY"
+MIME-Version: 1.0
+
+--MIMEBOUNDARY
+Content-Transfer-Encoding: 7bit
+Content-Type: text/cloud-config
+Mime-Version: 1.0
+
+#cloud-config
+apt:
+  sources:
+    docker:
+      source: deb https://download.docker.com/linux/ubuntu noble stable
+packages:
+- make
+
+--MIMEBOUNDARY--
+"""
+
+
+def ar_members(data: bytes) -> dict:
+    """
+    Split an ar archive into its members.
+
+    :param data: Archive content
+    :return: Member content by name
+    """
+    assert data.startswith(b"!<arch>\n")
+    members = {}
+    pos = 8
+    while pos < len(data):
+        header = data[pos : pos + 60]
+        size = int(header[48:58])
+        members[header[:16].decode().strip()] = data[pos + 60 : pos + 60 + size]
+        pos += 60 + size + size % 2
+    return members
+
+
+def test_standin_repository(tmp_path: Path) -> None:
+    """
+    Test that the stand-in packages are indexed with their checksums and
+    carry executable stand-in commands.
+
+    :param tmp_path: Pytest temporary directory fixture
+    :return: None
+    """
+    build_repository(str(tmp_path), puppet_seconds=2.5)
+
+    stanzas = {
+        stanza.split("\n")[0]: stanza
+        for stanza in (tmp_path / "Packages").read_text().split("\n\n")
+    }
+    assert sorted(stanzas) == [
+        "Package: infrahouse-toolkit",
+        "Package: puppet-agent",
+        "Package: puppet-code",
+    ]
+    assert "Depends: puppet-agent\n" in stanzas["Package: puppet-code"]
+    deb = (tmp_path / "infrahouse-toolkit_0.0.0_all.deb").read_bytes()
+    assert (
+        f"SHA256: {hashlib.sha256(deb).hexdigest()}"
+        in stanzas["Package: infrahouse-toolkit"]
+    )
+
+    members = ar_members(deb)
+    assert list(members) == ["debian-binary", "control.tar.gz", "data.tar.gz"]
+    with tarfile.open(fileobj=io.BytesIO(members["data.tar.gz"])) as tar:
+        ih_puppet = tar.getmember("./usr/bin/ih-puppet")
+        script = tar.extractfile(ih_puppet).read().decode()
+    assert ih_puppet.mode == 0o755
+    assert "sleep 2.5\n" in script
+    assert "Applied catalog in 2.50 seconds" in script
+
+
+def test_stand_ins_serve_the_resolver(monkeypatch) -> None:
+    """
+    Test that the resolver gets IMDSv2 credentials and its secrets from the
+    stand-ins, and a missing secret is reported as AWS would.
+
+    :param monkeypatch: Pytest monkeypatch fixture
+    :return: None
+    """
+    secret = "arn:aws:secretsmanager:us-west-2:123456789012:secret:repo"
+    parameter = "arn:aws:ssm:us-west-2:123456789012:parameter/apt/repo"
+    secrets = {secret: '{"user": "pass"}', parameter: "tok-123"}
+    calls = {}
+
+    with serve_handler(
+        _AWSHandler, secrets=secrets, region="us-west-2", calls=calls
+    ) as aws_url, serve_handler(
+        _IMDSHandler, paths=imds_paths("us-west-2")
+    ) as imds_url:
+        monkeypatch.setenv("AWS_ENDPOINT_URL", aws_url)
+        monkeypatch.setenv("AWS_DEFAULT_REGION", "us-west-2")
+        monkeypatch.setattr(generate_apt_auth, "IMDS_ENDPOINT", imds_url)
+
+        session = generate_apt_auth.credential_session("imds")
+        assert session.get_credentials().access_key == "ASIAIHBOOTBENCHMARK0"
+        assert generate_apt_auth.resolve_secrets([secret, parameter], session) == {
+            secret: '{"user": "pass"}',
+            parameter: "tok-123",
+        }
+        with pytest.raises(generate_apt_auth.ClientError) as exc_info:
+            generate_apt_auth.resolve_secrets([secret + "-missing"], session)
+
+    assert exc_info.value.response["Error"]["Code"] == "ResourceNotFoundException"
+    assert calls == {
+        "secretsmanager.BatchGetSecretValue": 2,
+        "AmazonSSM.GetParameters": 1,
+    }
+
+
+def test_imds_requires_token() -> None:
+    """
+    Test that the IMDS stand-in refuses IMDSv1 reads.
+
+    :return: None
+    """
+    with serve_handler(_IMDSHandler, paths=imds_paths("us-west-2")) as imds_url:
+        with pytest.raises(urllib.error.HTTPError) as exc_info:
+            urllib.request.urlopen(f"{imds_url}/latest/meta-data/instance-id")
+
+    assert exc_info.value.code == 401
+
+
+def test_read_userdata(tmp_path: Path, caplog) -> None:
+    """
+    Test that userdata is decoded for the seed, and sources that need the
+    network are pointed out.
+
+    :param tmp_path: Pytest temporary directory fixture
+    :param caplog: Pytest log capture fixture
+    :return: None
+    """
+    path = tmp_path / "userdata.b64"
+    path.write_text(base64.b64encode(USERDATA.encode()).decode() + "\n")
+
+    with caplog.at_level(logging.WARNING):
+        assert read_userdata(str(path)) == USERDATA.encode()
+    assert "userdata adds APT sources docker" in caplog.text
+
+    path.write_text(USERDATA)
+    with pytest.raises(UserdataError):
+        read_userdata(str(path))
+
+
+def test_system_conf() -> None:
+    """
+    Test that every service of the container is pointed at the stand-ins.
+
+    :return: None
+    """
+    assert system_conf("http://127.0.0.1:1", "http://127.0.0.1:2") == (
+        "[Manager]\n"
+        'DefaultEnvironment="AWS_ENDPOINT_URL=http://127.0.0.1:1"'
+        ' "AWS_EC2_METADATA_SERVICE_ENDPOINT=http://127.0.0.1:2"'
+        ' "IH_IMDS_ENDPOINT=http://127.0.0.1:2"\n'
+    )
+
+
+def test_summarize() -> None:
+    """
+    Test that stages are summarized over runs in boot order, with the
+    milestones and the total last.
+
+    :return: None
+    """
+    # cloud-init's first event, 2026-04-22 18:04:00.002 plus the kernel.
+    first_event = 1776881040.002 + build_report(str(RUN_A)).spans[0].duration
+    fast = build_report(str(RUN_A), boot_epoch=first_event - 1.0).to_dict()
+    slow = build_report(str(RUN_A), boot_epoch=first_event - 3.0).to_dict()
+
+    results = {r.stage: r for r in summarize([fast, slow])}
+    stages = list(results)
+
+    assert stages[0] == "container"
+    assert results["container"].median_s == pytest.approx(2.0)
+    assert results["container"].min_s == pytest.approx(1.0)
+    assert results["container"].max_s == pytest.approx(3.0)
+    assert stages[-1] == "total"
+    assert results["total"].runs == 2
+    assert "until cloud-init-finished" in stages
+    table = format_results([asdict(r) for r in results.values()])
+    assert table.splitlines()[0].split() == ["stage", "runs", "median", "min", "max"]
+
+
+def test_cli_bad_userdata(tmp_path: Path) -> None:
+    """
+    Test that unreadable userdata fails before any container is started.
+
+    :param tmp_path: Pytest temporary directory fixture
+    :return: None
+    """
+    assert main([str(tmp_path / "missing.b64")]) == 1
+    (tmp_path / "userdata.b64").write_text(json.dumps({"not": "userdata"}))
+    assert main([str(tmp_path / "userdata.b64")]) == 1
@@ -0,0 +1,237 @@
+"""
+Unit tests for tools/boot_report.py.
+
+The fixture logs in test_data/boot_logs are trimmed copies of the logs an
+instance bootstrapped by this module leaves behind: run_a with the
+sequential bootcmd and pre_runcmd, run_b with the concurrent versions.
+"""
+
+import json
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pytest
+
+# Add the tools directory to the path so we can import it
+TOOLS_DIR = Path(__file__).parent.parent / "tools"
+sys.path.insert(0, str(TOOLS_DIR))
+
+from boot_report import (
+    build_report,
+    compare_reports,
+    format_report,
+    main,
+    parse_apt_auth_log,
+)
+
+LOGS_DIR = Path(__file__).parent.parent / "test_data" / "boot_logs"
+RUN_A = LOGS_DIR / "run_a"
+RUN_B = LOGS_DIR / "run_b"
+
+
+def durations(report) -> dict:
+    return {span.name: span.duration for span in report.spans}
+
+
+def test_stage_durations() -> None:
+    """
+    Module and bootstrap stage durations come from cloud-init.log events and
+    ih-bootstrap stage markers respectively.
+
+    :return: None
+    """
+    report = build_report(str(RUN_A))
+    spans = durations(report)
+
+    assert spans["init-network/config-bootcmd"] == pytest.approx(3.241)
+    assert spans["init-network/config-write_files"] == pytest.approx(0.030)
+    assert spans["modules-config/config-apt_configure"] == pytest.approx(1.100)
+    assert spans[
+        "modules-final/config-package_update_upgrade_install"
+    ] == pytest.approx(62.300)
+    assert spans[
+        "modules-final/config-scripts_user/ih-bootstrap/puppet"
+    ] == pytest.approx(84.450)
+    assert spans[
+        "modules-final/config-scripts_user/ih-bootstrap/lifecycle"
+    ] == pytest.approx(0.900)
+    assert report.puppet_catalog == pytest.approx(78.45)
+    assert report.boot_time == "2026-04-22T18:04:00.002000+00:00"
+
+
+def test_apt_auth_is_concurrent() -> None:
+    """
+    Secret resolution overlaps the repo installer inside bootcmd, so it is
+    reported but kept off the critical path.
+
+    :return: None
+    """
+    report = build_report(str(RUN_A))
+    apt_auth = next(s for s in report.spans if s.name.endswith("generate_apt_auth"))
+
+    assert apt_auth.name == "init-network/config-bootcmd/generate_apt_auth"
+    assert apt_auth.concurrent
+    assert apt_auth.duration == pytest.approx(1.812)
+    assert apt_auth not in report.critical_path()
+    assert any(s.name == "init-network/config-bootcmd" for s in report.critical_path())
+
+
+def test_critical_path_covers_boot() -> None:
+    """
+    The critical path is contiguous from kernel start to the last milestone.
+
+    :return: None
+    """
+    report = build_report(str(RUN_A))
+    path = report.critical_path()
+
+    assert path[0].name == "kernel"
+    assert path[0].start == 0.0
+    for prev, cur in zip(path, path[1:]):
+        assert cur.start == pytest.approx(prev.end, abs=0.002)
+    assert path[-1].end == pytest.approx(report.total, abs=0.002)
+    assert sum(s.duration for s in path) == pytest.approx(report.total, abs=0.01)
+
+
+def test_milestones() -> None:
+    """
+    Bootstrap completion, cloud-init completion and the puppet-done marker
+    are reported relative to kernel start.
+
+    :return: None
+    """
+    boot_epoch = datetime(2026, 4, 22, 18, 4, 0, 2000, tzinfo=timezone.utc).timestamp()
+    report = build_report(str(RUN_A), puppet_done_time=boot_epoch + 188.5)
+
+    assert report.milestones["puppet-done"] == pytest.approx(188.5)
+    assert report.milestones["bootstrap-complete"] == pytest.approx(189.399)
+    assert report.milestones["cloud-init-finished"] == pytest.approx(189.70)
+    assert report.total == pytest.approx(189.70)
+
+
+def test_container_start() -> None:
+    """
+    With an explicit start time, e.g. a container's, the report counts from
+    it instead of the kernel start the host's uptime implies.
+
+    :return: None
+    """
+    boot_epoch = datetime(2026, 4, 22, 18, 4, 0, 2000, tzinfo=timezone.utc).timestamp()
+    kernel = build_report(str(RUN_A))
+    report = build_report(str(RUN_A), boot_epoch=boot_epoch + 5.0)
+
+    assert report.spans[0].name == "container"
+    assert report.spans[0].duration == pytest.approx(
+        kernel.spans[0].duration - 5.0, abs=0.002
+    )
+    assert durations(report)["init-network/config-bootcmd"] == pytest.approx(3.241)
+    assert report.milestones["cloud-init-finished"] == pytest.approx(184.70)
+    assert report.critical_path()[0].name == "container"
+
+
+def test_parallel_commands() -> None:
+    """
+    Per-command timings of parallel pre_runcmd groups are collected.
+
+    :return: None
+    """
+    report = build_report(str(RUN_B))
+
+    assert report.commands == [
+        {
+            "group": "pre_runcmd[0]",
+            "command": "/usr/local/bin/warm-cache",
+            "exit_code": 0,
+            "duration": 1.204,
+        },
+        {
+            "group": "pre_runcmd[0]",
+            "command": "docker pull myapp:latest",
+            "exit_code": 0,
+            "duration": 3.011,
+        },
+    ]
+    assert "docker pull myapp:latest" in format_report(report.to_dict())
+
+
+def test_boot_selection(tmp_path: Path) -> None:
+    """
+    A cloud-init.log that spans a reboot reports the first boot by default.
+
+    :param tmp_path: Pytest temporary directory fixture
+    :return: None
+    """
+    (tmp_path / "cloud-init.log").write_text(
+        (RUN_A / "cloud-init.log").read_text() + (RUN_B / "cloud-init.log").read_text()
+    )
+
+    first = build_report(str(tmp_path))
+    last = build_report(str(tmp_path), boot=-1)
+
+    assert durations(first)["init-network/config-bootcmd"] == pytest.approx(3.241)
+    assert durations(last)["init-network/config-bootcmd"] == pytest.approx(1.873)
+
+
+def test_compare() -> None:
+    """
+    Comparing two runs reports per-stage deltas, largest change first.
+
+    :return: None
+    """
+    before = build_report(str(RUN_A)).to_dict()
+    after = build_report(str(RUN_B)).to_dict()
+    comparison = compare_reports(before, after)
+    stages = {s["name"]: s for s in comparison["stages"]}
+
+    assert comparison["total"]["delta"] == pytest.approx(
+        after["total"] - before["total"]
+    )
+    assert stages["init-network/config-bootcmd"]["delta"] == pytest.approx(-1.368)
+    deltas = [abs(s["delta"]) for s in comparison["stages"]]
+    assert deltas == sorted(deltas, reverse=True)
+
+
+def test_apt_auth_log_without_timestamps(tmp_path: Path) -> None:
+    """
+    Resolver logs from before timestamps were added yield no span.
+
+    :param tmp_path: Pytest temporary directory fixture
+    :return: None
+    """
+    log = tmp_path / "generate_apt_auth.log"
+    log.write_text(
+        "INFO __main__:generate_apt_auth.py:52 Starting APT authentication"
+        " configuration generation\n"
+    )
+
+    assert parse_apt_auth_log(str(log)) is None
+
+
+def test_cli_json_and_compare(tmp_path: Path, capsys) -> None:
+    """
+    analyze --json output can be fed back into compare.
+
+    :param tmp_path: Pytest temporary directory fixture
+    :param capsys: Pytest output capture fixture
+    :return: None
+    """
+    assert main(["analyze", str(RUN_A), "--json"]) == 0
+    report_file = tmp_path / "run_a.json"
+    report_file.write_text(capsys.readouterr().out)
+    assert json.loads(report_file.read_text())["critical_path"]
+
+    assert main(["compare", str(report_file), str(RUN_B)]) == 0
+    out = capsys.readouterr().out
+    assert out.startswith("Total: 189.700s -> 182.381s")
+    assert "init-network/config-bootcmd" in out
+
+
+def test_cli_missing_logs(tmp_path: Path) -> None:
+    """
+    A directory without cloud-init.log is an error, not a traceback.
+
+    :param tmp_path: Pytest temporary directory fixture
+    :return: None
+    """
+    assert main(["analyze", str(tmp_path)]) == 1
@@ -0,0 +1,141 @@
+"""
+Unit tests for tools/cloud_init_trim.py.
+"""
+
+import json
+from pathlib import Path
+
+import pytest
+
+from cloud_init_trim import (
+    format_results,
+    load_module_lists,
+    main,
+    module_times,
+    trimmed_lists,
+)
+
+LOG_LINE = "2026-04-22 18:04:{:06.3f} - handlers.py[DEBUG]: {}: {}: x"
+
+# (second, event, span) of a default boot.
+EVENTS = [
+    (0.0, "start", "init-network"),
+    (1.0, "start", "init-network/config-bootcmd"),
+    (2.0, "finish", "init-network/config-bootcmd"),
+    (2.0, "start", "init-network/config-ca-certs"),
+    (2.5, "finish", "init-network/config-ca-certs"),
+    (3.0, "finish", "init-network"),
+    (4.0, "start", "modules-config"),
+    (4.0, "start", "modules-config/config-snap"),
+    (6.0, "finish", "modules-config/config-snap"),
+    (6.0, "start", "modules-config/config-ntp"),
+    (6.25, "finish", "modules-config/config-ntp"),
+    (7.0, "finish", "modules-config"),
+    (8.0, "start", "modules-final"),
+    (8.0, "start", "modules-final/config-landscape"),
+    (9.0, "finish", "modules-final/config-landscape"),
+    (9.0, "start", "modules-final/config-scripts_user"),
+    (12.0, "finish", "modules-final/config-scripts_user"),
+    (12.0, "finish", "modules-final"),
+]
+
+
+@pytest.fixture
+def cloud_init_log(tmp_path: Path) -> Path:
+    """
+    A cloud-init.log with kept and dropped modules.
+
+    :param tmp_path: Pytest temporary directory fixture
+    :return: Log directory
+    """
+    lines = [
+        "2026-04-22 18:04:00,000 - util.py[DEBUG]: Cloud-init v. 24.4.1"
+        " running 'init-local' at Wed, 22 Apr 2026 18:04:00 +0000. Up 6.00 seconds."
+    ]
+    for second, event, span in EVENTS:
+        lines.append(LOG_LINE.format(second, event, span).replace(".", ",", 1))
+    (tmp_path / "cloud-init.log").write_text("\n".join(lines) + "\n")
+    return tmp_path
+
+
+def test_trimmed_lists() -> None:
+    """
+    Allowlisted modules join the kept ones in the image's order; unknown
+    ones go last.
+
+    :return: None
+    """
+    lists = trimmed_lists(
+        load_module_lists(),
+        {"cloud_config_modules": ["my_module", "ntp"]},
+    )
+
+    assert lists["cloud_config_modules"] == [
+        "grub_dpkg",
+        "apt_configure",
+        "ntp",
+        "runcmd",
+        "my_module",
+    ]
+    assert "landscape" not in lists["cloud_final_modules"]
+    assert "scripts_user" in lists["cloud_final_modules"]
+
+
+def test_module_times(cloud_init_log: Path) -> None:
+    """
+    Module spans are summed per list; stage spans are not modules.
+
+    :param cloud_init_log: Log directory
+    :return: None
+    """
+    times = module_times(str(cloud_init_log / "cloud-init.log"))
+
+    assert times == {
+        "cloud_init_modules": {"bootcmd": 1.0, "ca_certs": 0.5},
+        "cloud_config_modules": {"snap": 2.0, "ntp": 0.25},
+        "cloud_final_modules": {"landscape": 1.0, "scripts_user": 3.0},
+    }
+
+
+def test_main_json(cloud_init_log: Path, capsys) -> None:
+    """
+    Dropped modules are reported slowest first; --allow keeps one.
+
+    :param cloud_init_log: Log directory
+    :param capsys: Pytest output capture fixture
+    :return: None
+    """
+    rc = main([str(cloud_init_log), "--allow", "cloud_config_modules=ntp", "--json"])
+
+    assert rc == 0
+    assert json.loads(capsys.readouterr().out) == [
+        {"stage": "cloud_config_modules", "module": "snap", "seconds": 2.0},
+        {"stage": "cloud_final_modules", "module": "landscape", "seconds": 1.0},
+        {"stage": "cloud_init_modules", "module": "ca_certs", "seconds": 0.5},
+    ]
+
+
+def test_main_bad_allow(cloud_init_log: Path) -> None:
+    """
+    --allow needs one of the three list names.
+
+    :param cloud_init_log: Log directory
+    :return: None
+    """
+    assert main([str(cloud_init_log), "--allow", "ntp"]) == 1
+
+
+def test_format_results() -> None:
+    """
+    The table ends with the total time skipped.
+
+    :return: None
+    """
+    text = format_results(
+        [
+            {"stage": "cloud_config_modules", "module": "snap", "seconds": 2.0},
+            {"stage": "cloud_final_modules", "module": "landscape", "seconds": 1.0},
+        ]
+    )
+
+    assert text.endswith("trimming skips 2 module(s), 3.000s per boot")
@@ -0,0 +1,159 @@
+"""
+Unit tests for tools/dpkg_io_benchmark.py.
+
+dpkg, dpkg-deb and sync are replaced by shell scripts on PATH that log
+their calls. The dpkg-deb stand-in extracts every package to a tree with
+maintainer scripts and builds a "package" that lists its DEBIAN files.
+"""
+
+import json
+from pathlib import Path
+
+import pytest
+
+from dpkg_io_benchmark import (
+    format_results,
+    main,
+    run_benchmark,
+    strip_maintainer_scripts,
+)
+
+FAKE_DPKG_DEB = """#!/bin/sh
+echo "dpkg-deb $*" >> {calls}
+case "$1" in
+    -R)
+        mkdir -p "$3/DEBIAN" "$3/usr/share/doc"
+        touch "$3/DEBIAN/control" "$3/DEBIAN/preinst" "$3/DEBIAN/postinst"
+        ;;
+    *)
+        ls "$4/DEBIAN" > "$5"
+        ;;
+esac
+"""
+
+
+@pytest.fixture
+def fake_dpkg(fake_commands) -> Path:
+    """
+    Put dpkg, dpkg-deb and sync stand-ins first on PATH.
+
+    :param fake_commands: Command stand-in factory
+    :return: Path of the log the stand-ins write
+    """
+    return fake_commands({"dpkg-deb": FAKE_DPKG_DEB, "dpkg": "", "sync": ""})
+
+
+def test_strip_maintainer_scripts(tmp_path: Path, fake_dpkg: Path) -> None:
+    """
+    The copy keeps the control file and drops the maintainer scripts.
+
+    :param tmp_path: Pytest temporary directory fixture
+    :param fake_dpkg: dpkg stand-ins
+    :return: None
+    """
+    copy = strip_maintainer_scripts(
+        "/var/cache/apt/archives/make_4.3_amd64.deb", str(tmp_path)
+    )
+
+    assert copy == str(tmp_path / "make_4.3_amd64.deb")
+    assert Path(copy).read_text().split() == ["control"]
+
+
+def test_run_benchmark(tmp_path: Path, fake_dpkg: Path) -> None:
+    """
+    Both modes unpack into their own empty dpkg database; only unsafe-io
+    passes --force-unsafe-io and is charged for a sync.
+
+    :param tmp_path: Pytest temporary directory fixture
+    :param fake_dpkg: dpkg stand-ins
+    :return: None
+    """
+    results = run_benchmark(
+        ["/debs/make_4.3_amd64.deb", "/debs/gcc.deb"], str(tmp_path), runs=2
+    )
+
+    assert [(r.mode, r.runs) for r in results] == [("safe", 2), ("unsafe-io", 2)]
+    assert results[0].sync_s == 0
+    assert results[1].sync_s > 0
+    dpkg_calls = [
+        c for c in fake_dpkg.read_text().splitlines() if c.startswith("dpkg --")
+    ]
+    assert len(dpkg_calls) == 4
+    assert ["--force-unsafe-io" in c for c in dpkg_calls] == [False, True, False, True]
+    # The stripped copies are unpacked, not the originals.
+    for call in dpkg_calls:
+        make, gcc = call.split()[-2:]
+        assert make.endswith("/packages/make_4.3_amd64.deb")
+        assert gcc.endswith("/packages/gcc.deb")
+    assert all("--no-triggers" in c and "--admindir=" in c for c in dpkg_calls)
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["bin", "calls.log"]
+
+
+def test_format_results() -> None:
+    """
+    The table ends with the net saving, sync included.
+
+    :return: None
+    """
+    results = [
+        {"mode": "safe", "runs": 3, "unpack_s": 20.0, "sync_s": 0.0, "total_s": 20.0},
+        {
+            "mode": "unsafe-io",
+            "runs": 3,
+            "unpack_s": 8.0,
+            "sync_s": 2.0,
+            "total_s": 10.0,
+        },
+    ]
+
+    text = format_results(results)
+
+    assert text.splitlines()[0].split() == ["mode", "runs", "unpack", "sync", "total"]
+    assert text.endswith(
+        "unsafe-io saves 10.000s including the final sync (50% of safe)"
+    )
+
+
+def test_main_json(tmp_path: Path, fake_dpkg: Path, capsys) -> None:
+    """
+    --mirror unpacks the .deb files found there; --json prints both modes.
+
+    :param tmp_path: Pytest temporary directory fixture
+    :param fake_dpkg: dpkg stand-ins
+    :param capsys: Pytest output capture fixture
+    :return: None
+    """
+    mirror = tmp_path / "mirror"
+    mirror.mkdir()
+    (mirror / "make_4.3_amd64.deb").write_text("")
+    (mirror / "Packages").write_text("")
+
+    rc = main(
+        [
+            "--mirror",
+            str(mirror),
+            "--target-dir",
+            str(tmp_path),
+            "--runs",
+            "1",
+            "--json",
+        ]
+    )
+
+    assert rc == 0
+    assert [r["mode"] for r in json.loads(capsys.readouterr().out)] == [
+        "safe",
+        "unsafe-io",
+    ]
+    assert "Packages" not in fake_dpkg.read_text()
+
+
+def test_main_empty_mirror(tmp_path: Path, fake_dpkg: Path) -> None:
+    """
+    A mirror without packages is an error.
+
+    :param tmp_path: Pytest temporary directory fixture
+    :param fake_dpkg: dpkg stand-ins
+    :return: None
+    """
+    assert main(["--mirror", str(tmp_path), "--target-dir", str(tmp_path)]) == 1
@@ -0,0 +1,179 @@
+"""
+Unit tests for tools/facter_cache_benchmark.py.
+
+facter is replaced by a shell script that is slow unless its config has
+ttls and its cache directory is populated, as Facter behaves for the
+expensive fact groups.
+"""
+
+import json
+from pathlib import Path
+
+import pytest
+
+from facter_cache_benchmark import (
+    format_results,
+    load_ttls,
+    main,
+    render_facter_conf,
+    run_benchmark,
+)
+from tests.conftest import MODULE_ROOT
+
+FAKE_FACTER = """#!/bin/sh
+echo "$*" >> {calls}
+if grep -q ttls "$2"; then
+    if [ -n "$(ls {cache})" ]; then
+        echo '{{}}'
+        exit 0
+    fi
+    touch {cache}/networking
+fi
+sleep 0.2
+echo '{{}}'
+"""
+
+
+@pytest.fixture
+def fake_facter(tmp_path: Path, fake_commands) -> Path:
+    """
+    Put a facter stand-in that caches into tmp_path/cache on PATH.
+
+    :param tmp_path: Pytest temporary directory fixture
+    :param fake_commands: Command stand-in factory
+    :return: Path of the facter stand-in
+    """
+    cache = tmp_path / "cache"
+    cache.mkdir()
+    fake_commands({"facter": FAKE_FACTER}, cache=cache)
+    return tmp_path / "bin" / "facter"
+
+
+def test_render_matches_module_template() -> None:
+    """
+    The harness config matches files/facter/facter.conf.tpl rendered with
+    the suggested TTLs.
+
+    :return: None
+    """
+    assert render_facter_conf(load_ttls()) == (
+        "global : {\n"
+        '        external-dir : "/etc/puppetlabs/facter/facts.d/",\n'
+        "}\n"
+        "facts : {\n"
+        "        ttls : [\n"
+        '                { "EC2" : 1 hour },\n'
+        '                { "dmi" : 1 day },\n'
+        "        ]\n"
+        "}\n"
+    )
+    assert render_facter_conf({}) == (
+        'global : {\n        external-dir : "/etc/puppetlabs/facter/facts.d/",\n}\n'
+    )
+    template = (
+        (MODULE_ROOT / "files" / "facter" / "facter.conf.tpl").read_text().splitlines()
+    )
+    assert '        external-dir : "${external_dir}/",' in template
+    assert '                { "${group}" : ${ttl} },' in template
+
+
+def test_run_benchmark(tmp_path: Path, fake_facter: Path) -> None:
+    """
+    The cache is cleared before the cold run, so only warm runs are fast,
+    and cleared again afterwards.
+
+    :param tmp_path: Pytest temporary directory fixture
+    :param fake_facter: facter stand-in
+    :return: None
+    """
+    cache = tmp_path / "cache"
+    (cache / "stale").write_text("")
+
+    results = run_benchmark(
+        {"networking": "30 minutes"},
+        runs=2,
+        facter=str(fake_facter),
+        cache_dir=str(cache),
+    )
+
+    modes = {r.mode: r for r in results}
+    assert list(modes) == ["no-cache", "cache-cold", "cache-warm"]
+    assert [r.runs for r in results] == [2, 1, 2]
+    assert modes["cache-cold"].median_s >= 0.2
+    assert modes["cache-warm"].max_s < modes["no-cache"].min_s
+    assert list(cache.iterdir()) == []
+    calls = (tmp_path / "calls.log").read_text().splitlines()
+    assert all(c.startswith("--config ") and c.endswith(" --json") for c in calls)
+
+
+def test_format_results() -> None:
+    """
+    The table ends with the warm cache saving.
+
+    :return: None
+    """
+    results = [
+        {"mode": "no-cache", "runs": 5, "min_s": 2.0, "median_s": 2.0, "max_s": 2.5},
+        {"mode": "cache-cold", "runs": 1, "min_s": 2.1, "median_s": 2.1, "max_s": 2.1},
+        {"mode": "cache-warm", "runs": 5, "min_s": 0.5, "median_s": 0.5, "max_s": 0.6},
+    ]
+
+    text = format_results(results)
+
+    assert text.splitlines()[0].split() == ["mode", "runs", "min", "median", "max"]
+    assert text.endswith("cache-warm saves 1.500s per run (75% of no-cache)")
+
+
+def test_main_json(tmp_path: Path, fake_facter: Path, capsys) -> None:
+    """
+    --json prints one result per mode; --ttls reads another TTL map.
+
+    :param tmp_path: Pytest temporary directory fixture
+    :param fake_facter: facter stand-in
+    :param capsys: Pytest output capture fixture
+    :return: None
+    """
+    ttls = tmp_path / "ttls.json"
+    ttls.write_text(json.dumps({"networking": "1 hour"}))
+
+    rc = main(
+        [
+            "--facter",
+            str(fake_facter),
+            "--cache-dir",
+            str(tmp_path / "cache"),
+            "--ttls",
+            str(ttls),
+            "--runs",
+            "1",
+            "--json",
+            "networking",
+        ]
+    )
+
+    assert rc == 0
+    assert [r["mode"] for r in json.loads(capsys.readouterr().out)] == [
+        "no-cache",
+        "cache-cold",
+        "cache-warm",
+    ]
+    assert (
+        (tmp_path / "calls.log")
+        .read_text()
+        .splitlines()[0]
+        .endswith("--json networking")
+    )
+
+
+def test_main_empty_ttls(tmp_path: Path, fake_facter: Path) -> None:
+    """
+    Without fact groups to cache there is nothing to compare.
+
+    :param tmp_path: Pytest temporary directory fixture
+    :param fake_facter: facter stand-in
+    :return: None
+    """
+    ttls = tmp_path / "ttls.json"
+    ttls.write_text("{}")
+
+    assert main(["--facter", str(fake_facter), "--ttls", str(ttls)]) == 1
@@ -7,16 +7,60 @@ Tests cover both happy and unhappy paths for APT authentication file generation.
 import json
 import sys
 from pathlib import Path
+from typing import Any, Callable, Dict, List, Union
 from unittest.mock import Mock, mock_open, patch, call
 
 import pytest
-from botocore.exceptions import ClientError
+from botocore.exceptions import ClientError, NoCredentialsError
 
 # Add the script directory to the path so we can import it
 SCRIPT_DIR = Path(__file__).parent.parent / "files" / "apt_auth"
 sys.path.insert(0, str(SCRIPT_DIR))
 
-from generate_apt_auth import generate_apt_auth
+from generate_apt_auth import (
+    IMDS_ATTEMPTS,
+    IMDS_ENDPOINT,
+    IMDS_TIMEOUT,
+    CredentialBackend,
+    SecretsManagerBackend,
+    SSMParameterBackend,
+    backend_for,
+    credential_session,
+    generate_apt_auth,
+    resolve_secrets,
+)
+
+
+def batch_get(secrets: Union[str, Dict[str, str]]) -> Callable[..., Dict[str, Any]]:
+    """
+    Stand in for ``batch_get_secret_value``.
+
+    :param secrets: Secret string by reference, or one string for any
+                    reference.
+    :return: Function answering from ``secrets`` as Secrets Manager does,
+             with unknown references in ``Errors``.
+    """
+
+    def answer(SecretIdList: List[str], **kwargs: Any) -> Dict[str, Any]:
+        values, errors = [], []
+        for ref in SecretIdList:
+            value = secrets if isinstance(secrets, str) else secrets.get(ref)
+            if value is None:
+                errors.append(
+                    {
+                        "SecretId": ref,
+                        "ErrorCode": "ResourceNotFoundException",
+                        "Message": "Secrets Manager can't find the specified secret.",
+                    }
+                )
+            else:
+                values.append(
+                    {"ARN": ref, "Name": ref.split(":")[-1], "SecretString": value}
+                )
+        return {"SecretValues": values, "Errors": errors}
+
+    return answer
+
 
 # Happy Path Tests
 
@@ -43,9 +87,7 @@ def test_generate_auth_single_repository(tmp_path: Path) -> None:
     # Mock AWS Secrets Manager response
     mock_secret = {"username": "mypassword123"}
     mock_client = Mock()
-    mock_client.get_secret_value.return_value = {
-        "SecretString": json.dumps(mock_secret)
-    }
+    mock_client.batch_get_secret_value.side_effect = batch_get(json.dumps(mock_secret))
 
     # Mock only the write to /etc/apt/auth.conf.d/50user
     m = mock_open()
@@ -63,8 +105,10 @@ def test_generate_auth_single_repository(tmp_path: Path) -> None:
         generate_apt_auth(str(auth_inputs_file))
 
         # Verify boto3 was called correctly
-        mock_client.get_secret_value.assert_called_once_with(
-            SecretId="arn:aws:secretsmanager:us-west-2:123456789012:secret:repo-creds"
+        mock_client.batch_get_secret_value.assert_called_once_with(
+            SecretIdList=[
+                "arn:aws:secretsmanager:us-west-2:123456789012:secret:repo-creds"
+            ]
         )
 
         # Verify chmod was called with 0o600
@@ -102,10 +146,16 @@ def test_generate_auth_multiple_repositories(tmp_path: Path) -> None:
 
     # Mock AWS Secrets Manager responses
     mock_client = Mock()
-    mock_client.get_secret_value.side_effect = [
-        {"SecretString": json.dumps({"user1": "pass1"})},
-        {"SecretString": json.dumps({"user2": "pass2"})},
-    ]
+    mock_client.batch_get_secret_value.side_effect = batch_get(
+        {
+            "arn:aws:secretsmanager:us-west-2:123456789012:secret:repo1": json.dumps(
+                {"user1": "pass1"}
+            ),
+            "arn:aws:secretsmanager:us-west-2:123456789012:secret:repo2": json.dumps(
+                {"user2": "pass2"}
+            ),
+        }
+    )
 
     m = mock_open()
 
@@ -121,8 +171,8 @@ def test_generate_auth_multiple_repositories(tmp_path: Path) -> None:
         # Execute
         generate_apt_auth(str(auth_inputs_file))
 
-        # Verify both secrets were fetched
-        assert mock_client.get_secret_value.call_count == 2
+        # Verify both secrets were fetched in one call
+        assert mock_client.batch_get_secret_value.call_count == 1
 
         # Verify both entries were written
         handle = m()
@@ -148,9 +198,9 @@ def test_file_permissions_set_correctly(tmp_path: Path) -> None:
     auth_inputs_file.write_text(json.dumps(auth_inputs))
 
     mock_client = Mock()
-    mock_client.get_secret_value.return_value = {
-        "SecretString": json.dumps({"user": "pass"})
-    }
+    mock_client.batch_get_secret_value.side_effect = batch_get(
+        json.dumps({"user": "pass"})
+    )
 
     m = mock_open()
 
@@ -173,6 +223,323 @@ def test_file_permissions_set_correctly(tmp_path: Path) -> None:
         assert args[1] == 0o600  # rw-------
 
 
+def test_backend_for() -> None:
+    """
+    Test that the ARN service selects the backend.
+
+    Anything that is not an SSM ARN goes to Secrets Manager, which also
+    accepts secret names.
+
+    :return: None
+    """
+    assert (
+        backend_for("arn:aws:ssm:us-west-2:123456789012:parameter/apt/repo")
+        is SSMParameterBackend
+    )
+    assert (
+        backend_for("arn:aws:secretsmanager:us-west-2:123456789012:secret:repo")
+        is SecretsManagerBackend
+    )
+    assert backend_for("repo-creds") is SecretsManagerBackend
+
+
+def test_backend_must_implement_fetch() -> None:
+    """
+    Test that a backend without fetch() cannot be instantiated.
+
+    :return: None
+    """
+
+    class IncompleteBackend(CredentialBackend):
+        service = "ssm"
+
+    with pytest.raises(TypeError, match="fetch"):
+        IncompleteBackend(session=Mock())
+
+
+def test_ssm_parameters_fetched_in_batches(tmp_path: Path) -> None:
+    """
+    Test that SSM parameters are fetched 10 per GetParameters call.
+
+    :param tmp_path: Pytest temporary directory fixture
+    :return: None
+    """
+    # Setup
+    auth_inputs_file = tmp_path / "auth_inputs.json"
+    arns = [
+        f"arn:aws:ssm:us-west-2:123456789012:parameter/apt/repo{i}" for i in range(12)
+    ]
+    auth_inputs = [
+        {"machine": f"repo{i}.example.com", "authFrom": arn}
+        for i, arn in enumerate(arns)
+    ]
+    auth_inputs_file.write_text(json.dumps(auth_inputs))
+
+    def get_parameters(Names, WithDecryption):
+        return {
+            "Parameters": [
+                {
+                    "Name": arn.split(":parameter")[1],
+                    "ARN": arn,
+                    "Value": json.dumps({"user": arn.split("/")[-1]}),
+                }
+                for arn in Names
+            ],
+            "InvalidParameters": [],
+        }
+
+    mock_client = Mock()
+    mock_client.get_parameters.side_effect = get_parameters
+
+    m = mock_open()
+
+    with patch(
+        "generate_apt_auth.boto3.client", return_value=mock_client
+    ) as client, patch(
+        "generate_apt_auth.open",
+        side_effect=lambda path, *args, **kwargs: (
+            m(path, *args, **kwargs)
+            if "/etc/apt" in str(path)
+            else open(path, *args, **kwargs)
+        ),
+    ), patch(
+        "generate_apt_auth.os.chmod"
+    ):
+
+        # Execute
+        generate_apt_auth(str(auth_inputs_file))
+
+        # Verify two batches, decrypted, and no Secrets Manager calls
+        client.assert_called_once_with("ssm")
+        assert mock_client.get_parameters.call_args_list == [
+            call(Names=arns[:10], WithDecryption=True),
+            call(Names=arns[10:], WithDecryption=True),
+        ]
+        mock_client.batch_get_secret_value.assert_not_called()
+
+        handle = m()
+        assert handle.write.call_count == 12
+        handle.write.assert_any_call(
+            "machine repo11.example.com login user password repo11\n"
+        )
+
+
+def test_mixed_backends(tmp_path: Path) -> None:
+    """
+    Test that Secrets Manager and SSM references are resolved together,
+    each once, and written in input order.
+
+    :param tmp_path: Pytest temporary directory fixture
+    :return: None
+    """
+    # Setup
+    auth_inputs_file = tmp_path / "auth_inputs.json"
+    secret_arn = "arn:aws:secretsmanager:us-west-2:123456789012:secret:repo1"
+    parameter_arn = "arn:aws:ssm:us-west-2:123456789012:parameter/apt/repo2"
+    auth_inputs = [
+        {"machine": "repo1.example.com", "authFrom": secret_arn},
+        {"machine": "repo2.example.com", "authFrom": parameter_arn},
+        {"machine": "mirror1.example.com", "authFrom": secret_arn},
+    ]
+    auth_inputs_file.write_text(json.dumps(auth_inputs))
+
+    secretsmanager = Mock()
+    secretsmanager.batch_get_secret_value.side_effect = batch_get(
+        json.dumps({"user1": "pass1"})
+    )
+    ssm = Mock()
+    ssm.get_parameters.return_value = {
+        "Parameters": [
+            {
+                "Name": "/apt/repo2",
+                "ARN": parameter_arn,
+                "Value": json.dumps({"user2": "pass2"}),
+            }
+        ],
+        "InvalidParameters": [],
+    }
+    clients = {"secretsmanager": secretsmanager, "ssm": ssm}
+
+    m = mock_open()
+
+    with patch("generate_apt_auth.boto3.client", side_effect=clients.get), patch(
+        "generate_apt_auth.open",
+        side_effect=lambda path, *args, **kwargs: (
+            m(path, *args, **kwargs)
+            if "/etc/apt" in str(path)
+            else open(path, *args, **kwargs)
+        ),
+    ), patch("generate_apt_auth.os.chmod"):
+
+        # Execute
+        generate_apt_auth(str(auth_inputs_file))
+
+        # Verify each reference was fetched once
+        secretsmanager.batch_get_secret_value.assert_called_once_with(
+            SecretIdList=[secret_arn]
+        )
+        ssm.get_parameters.assert_called_once_with(
+            Names=[parameter_arn], WithDecryption=True
+        )
+
+        handle = m()
+        assert handle.write.call_args_list == [
+            call("machine repo1.example.com login user1 password pass1\n"),
+            call("machine repo2.example.com login user2 password pass2\n"),
+            call("machine mirror1.example.com login user1 password pass1\n"),
+        ]
+
+
+def test_secrets_fetched_in_batches() -> None:
+    """
+    Test that Secrets Manager secrets are fetched 20 per call and matched
+    back by name, full ARN or partial ARN.
+
+    :return: None
+    """
+    prefix = "arn:aws:secretsmanager:us-west-2:123456789012:secret:"
+    refs = [f"{prefix}repo{i}" for i in range(20)] + ["repo20"]
+    client = Mock()
+    # The response carries the full ARN, with its random suffix.
+    client.batch_get_secret_value.side_effect = [
+        {
+            "SecretValues": [
+                {
+                    "ARN": f"{ref}-AbCdEf",
+                    "Name": ref.split(":")[-1],
+                    "SecretString": ref,
+                }
+                for ref in refs[:20]
+            ],
+            "Errors": [],
+        },
+        {
+            "SecretValues": [
+                {"ARN": f"{prefix}repo20-GhIjKl", "Name": "repo20", "SecretString": "x"}
+            ],
+            "Errors": [],
+        },
+    ]
+    session = Mock()
+    session.client.return_value = client
+
+    secrets = resolve_secrets(refs, session)
+
+    assert client.batch_get_secret_value.call_args_list == [
+        call(SecretIdList=refs[:20]),
+        call(SecretIdList=refs[20:]),
+    ]
+    assert secrets == {**{ref: ref for ref in refs[:20]}, "repo20": "x"}
+
+
+def test_batch_denied_falls_back_to_one_by_one() -> None:
+    """
+    Test that an instance profile without BatchGetSecretValue still gets
+    its secrets, one GetSecretValue call each.
+
+    :return: None
+    """
+    refs = ["repo1", "repo2"]
+    client = Mock()
+    client.batch_get_secret_value.side_effect = ClientError(
+        {"Error": {"Code": "AccessDeniedException", "Message": "denied"}},
+        "BatchGetSecretValue",
+    )
+    client.get_secret_value.side_effect = lambda SecretId: {"SecretString": SecretId}
+    session = Mock()
+    session.client.return_value = client
+
+    assert resolve_secrets(refs, session) == {"repo1": "repo1", "repo2": "repo2"}
+    assert client.get_secret_value.call_args_list == [
+        call(SecretId="repo1"),
+        call(SecretId="repo2"),
+    ]
+
+
+def test_old_botocore_falls_back_to_one_by_one() -> None:
+    """
+    Test that a botocore without BatchGetSecretValue, like the distro
+    package on jammy, still gets the secrets, one GetSecretValue call each.
+
+    :return: None
+    """
+    client = Mock(spec=["get_secret_value"])
+    client.get_secret_value.side_effect = lambda SecretId: {"SecretString": SecretId}
+    session = Mock()
+    session.client.return_value = client
+
+    assert resolve_secrets(["repo1", "repo2"], session) == {
+        "repo1": "repo1",
+        "repo2": "repo2",
+    }
+    assert client.get_secret_value.call_args_list == [
+        call(SecretId="repo1"),
+        call(SecretId="repo2"),
+    ]
+
+
+def test_credential_session_imds() -> None:
+    """
+    Test that pinned credentials come from IMDS alone, with the tuned
+    timeout and attempts, and the default chain is left alone otherwise.
+
+    :return: None
+    """
+    fetcher = Mock()
+    fetcher.retrieve_iam_role_credentials.return_value = {
+        "role_name": "bootstrap",
+        "access_key": "ASIAEXAMPLE",
+        "secret_key": "secret",
+        "token": "token",
+        "expiry_time": "2099-01-01T00:00:00Z",
+    }
+
+    with patch(
+        "generate_apt_auth.InstanceMetadataFetcher", return_value=fetcher
+    ) as fetcher_class:
+        session = credential_session("imds")
+
+        fetcher_class.assert_called_once_with(
+            timeout=IMDS_TIMEOUT, num_attempts=IMDS_ATTEMPTS, base_url=IMDS_ENDPOINT
+        )
+        fetcher.retrieve_iam_role_credentials.assert_called_once()
+        credentials = session.get_credentials()
+        assert (credentials.access_key, credentials.token) == ("ASIAEXAMPLE", "token")
+        assert credential_session("chain") is None
+
+        fetcher.retrieve_iam_role_credentials.return_value = {}
+        with pytest.raises(NoCredentialsError):
+            credential_session("imds")
+
+
+def test_resolve_secrets_with_session() -> None:
+    """
+    Test that every client is created from the prefetched session.
+
+    :return: None
+    """
+    secret_arn = "arn:aws:secretsmanager:us-west-2:123456789012:secret:repo1"
+    parameter_arn = "arn:aws:ssm:us-west-2:123456789012:parameter/apt/repo2"
+    client = Mock()
+    client.batch_get_secret_value.side_effect = batch_get("s3cr3t")
+    client.get_parameters.return_value = {
+        "Parameters": [{"Name": "/apt/repo2", "ARN": parameter_arn, "Value": "v"}],
+        "InvalidParameters": [],
+    }
+    session = Mock()
+    session.client.return_value = client
+
+    with patch("generate_apt_auth.boto3.client") as default_client:
+        secrets = resolve_secrets([secret_arn, parameter_arn], session)
+
+    assert secrets == {secret_arn: "s3cr3t", parameter_arn: "v"}
+    assert sorted(c.args for c in session.client.call_args_list) == [
+        ("secretsmanager",),
+        ("ssm",),
+    ]
+    default_client.assert_not_called()
+
+
 # Unhappy Path Tests
 
 
@@ -255,7 +622,7 @@ def test_empty_auth_inputs_file(tmp_path: Path) -> None:
         generate_apt_auth(str(auth_inputs_file))
 
         # Verify no secrets were fetched
-        mock_client.get_secret_value.assert_not_called()
+        mock_client.batch_get_secret_value.assert_not_called()
 
 
 def test_secret_not_found_in_secrets_manager(tmp_path: Path) -> None:
@@ -274,14 +641,9 @@ def test_secret_not_found_in_secrets_manager(tmp_path: Path) -> None:
     ]
     auth_inputs_file.write_text(json.dumps(auth_inputs))
 
-    # Mock AWS Secrets Manager to raise ResourceNotFoundException
+    # Mock AWS Secrets Manager to report ResourceNotFoundException
     mock_client = Mock()
-    error_response = {
-        "Error": {"Code": "ResourceNotFoundException", "Message": "Secret not found"}
-    }
-    mock_client.get_secret_value.side_effect = ClientError(
-        error_response, "GetSecretValue"
-    )
+    mock_client.batch_get_secret_value.side_effect = batch_get({})
 
     m = mock_open()
 
@@ -317,7 +679,7 @@ def test_invalid_json_in_secret_value(tmp_path: Path) -> None:
 
     # Mock Secrets Manager to return invalid JSON
     mock_client = Mock()
-    mock_client.get_secret_value.return_value = {"SecretString": "{ invalid json }"}
+    mock_client.batch_get_secret_value.side_effect = batch_get("{ invalid json }")
 
     m = mock_open()
 
@@ -351,7 +713,7 @@ def test_empty_secret_value(tmp_path: Path) -> None:
 
     # Mock Secrets Manager to return empty object
     mock_client = Mock()
-    mock_client.get_secret_value.return_value = {"SecretString": "{}"}
+    mock_client.batch_get_secret_value.side_effect = batch_get("{}")
 
     m = mock_open()
 
@@ -475,9 +837,9 @@ def test_permission_error_setting_chmod(tmp_path: Path) -> None:
     auth_inputs_file.write_text(json.dumps(auth_inputs))
 
     mock_client = Mock()
-    mock_client.get_secret_value.return_value = {
-        "SecretString": json.dumps({"user": "pass"})
-    }
+    mock_client.batch_get_secret_value.side_effect = batch_get(
+        json.dumps({"user": "pass"})
+    )
 
     m = mock_open()
 
@@ -516,7 +878,8 @@ def test_aws_access_denied_error(tmp_path: Path) -> None:
     ]
     auth_inputs_file.write_text(json.dumps(auth_inputs))
 
-    # Mock AWS Secrets Manager to raise AccessDeniedException
+    # Mock AWS Secrets Manager to raise AccessDeniedException, for the batch
+    # call and for the one-by-one fallback
     mock_client = Mock()
     error_response = {
         "Error": {
@@ -524,6 +887,9 @@ def test_aws_access_denied_error(tmp_path: Path) -> None:
             "Message": "User is not authorized to perform: secretsmanager:GetSecretValue",
         }
     }
+    mock_client.batch_get_secret_value.side_effect = ClientError(
+        error_response, "BatchGetSecretValue"
+    )
     mock_client.get_secret_value.side_effect = ClientError(
         error_response, "GetSecretValue"
     )
@@ -544,3 +910,44 @@ def test_aws_access_denied_error(tmp_path: Path) -> None:
             generate_apt_auth(str(auth_inputs_file))
 
         assert exc_info.value.response["Error"]["Code"] == "AccessDeniedException"
+
+
+def test_ssm_parameter_not_found(tmp_path: Path) -> None:
+    """
+    Test handling of a missing SSM parameter.
+
+    GetParameters reports missing names instead of failing, so the backend
+    raises ClientError with ParameterNotFound, like GetParameter would.
+
+    :param tmp_path: Pytest temporary directory fixture
+    :return: None
+    """
+    # Setup
+    auth_inputs_file = tmp_path / "auth_inputs.json"
+    parameter_arn = "arn:aws:ssm:us-west-2:123456789012:parameter/apt/missing"
+    auth_inputs = [{"machine": "repo.example.com", "authFrom": parameter_arn}]
+    auth_inputs_file.write_text(json.dumps(auth_inputs))
+
+    mock_client = Mock()
+    mock_client.get_parameters.return_value = {
+        "Parameters": [],
+        "InvalidParameters": [parameter_arn],
+    }
+
+    m = mock_open()
+
+    with patch("generate_apt_auth.boto3.client", return_value=mock_client), patch(
+        "generate_apt_auth.open",
+        side_effect=lambda path, *args, **kwargs: (
+            m(path, *args, **kwargs)
+            if "/etc/apt" in str(path)
+            else open(path, *args, **kwargs)
+        ),
+    ):
+
+        # Execute & Verify
+        with pytest.raises(ClientError) as exc_info:
+            generate_apt_auth(str(auth_inputs_file))
+
+        assert exc_info.value.response["Error"]["Code"] == "ParameterNotFound"
+        assert parameter_arn in exc_info.value.response["Error"]["Message"]
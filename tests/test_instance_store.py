@@ -0,0 +1,210 @@
+"""
+Tests for files/instance_store/ih-instance-store.sh.
+
+The stubbed tests replace lsblk, mdadm, mkfs and mount with shell scripts
+that log their arguments. test_loop_devices runs the real thing against
+loop devices and needs root; the RAID0 case also needs mdadm.
+"""
+
+import os
+import shutil
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from tests.conftest import MODULE_ROOT
+
+SCRIPT = MODULE_ROOT / "files" / "instance_store" / "ih-instance-store.sh"
+
+LSBLK_OUTPUT = """\
+/dev/nvme0n1 Amazon Elastic Block Store
+/dev/nvme1n1 Amazon EC2 NVMe Instance Storage
+/dev/nvme2n1 Amazon EC2 NVMe Instance Storage
+"""
+
+
+@pytest.fixture
+def fake_disks(tmp_path: Path, fake_commands) -> Path:
+    """
+    Put stand-ins for the disk tools on PATH that log their arguments.
+
+    :param tmp_path: Pytest temporary directory fixture
+    :param fake_commands: Command stand-in factory
+    :return: Path of the call log
+    """
+    (tmp_path / "lsblk.out").write_text(LSBLK_OUTPUT)
+    return fake_commands(
+        {
+            "lsblk": f"cat {tmp_path / 'lsblk.out'}",
+            "mdadm": "",
+            "mkfs.xfs": "",
+            "mkfs.ext4": "",
+            "mount": "",
+            "mountpoint": "exit 1",
+            "blkid": "echo 1234-abcd",
+        }
+    )
+
+
+def run_script(*args: str) -> subprocess.CompletedProcess:
+    """
+    Run ih-instance-store.
+
+    :param args: Command line arguments
+    :return: Completed process with text output
+    """
+    return subprocess.run(
+        ["bash", str(SCRIPT), *args], capture_output=True, text=True, check=False
+    )
+
+
+def test_raid0_xfs(tmp_path: Path, fake_disks: Path) -> None:
+    """
+    Several instance-store disks are striped, formatted aligned to the
+    stripe without discard, mounted and added to fstab; EBS is left alone.
+
+    :param tmp_path: Pytest temporary directory fixture
+    :param fake_disks: Call log of the disk tool stand-ins
+    :return: None
+    """
+    fstab = tmp_path / "fstab"
+    mnt = tmp_path / "nvme"
+
+    result = run_script("--mount-point", str(mnt), "--fstab", str(fstab))
+
+    assert result.returncode == 0, result.stderr
+    calls = fake_disks.read_text().splitlines()
+    assert calls[2] == (
+        "mdadm --create /dev/md0 --run --force --level=0 --chunk=256"
+        " --raid-devices=2 /dev/nvme1n1 /dev/nvme2n1"
+    )
+    assert calls[3] == "mkfs.xfs -f -K -d su=256k,sw=2 /dev/md0"
+    assert calls[4] == f"mount -t xfs -o defaults,noatime /dev/md0 {mnt}"
+    assert fstab.read_text() == (
+        f"UUID=1234-abcd {mnt} xfs"
+        " defaults,noatime,nofail,x-systemd.device-timeout=10s 0 2\n"
+    )
+    steps = [line.split()[1] for line in result.stdout.splitlines() if " took " in line]
+    assert steps == ["discover", "assemble", "mkfs", "mount"]
+
+
+def test_single_device_ext4(tmp_path: Path, fake_disks: Path) -> None:
+    """
+    One disk is formatted directly, without mdadm.
+
+    :param tmp_path: Pytest temporary directory fixture
+    :param fake_disks: Call log of the disk tool stand-ins
+    :return: None
+    """
+    (tmp_path / "lsblk.out").write_text(LSBLK_OUTPUT.splitlines()[1] + "\n")
+
+    result = run_script(
+        "--mount-point",
+        str(tmp_path / "nvme"),
+        "--filesystem",
+        "ext4",
+        "--fstab",
+        str(tmp_path / "fstab"),
+    )
+
+    assert result.returncode == 0, result.stderr
+    log = fake_disks.read_text()
+    assert "mdadm" not in log
+    assert (
+        "mkfs.ext4 -F -q -m 0 -E nodiscard,lazy_itable_init=1,lazy_journal_init=1"
+        " /dev/nvme1n1"
+    ) in log
+
+
+def test_replaces_stale_fstab_entry(tmp_path: Path, fake_disks: Path) -> None:
+    """
+    Run again after a stop/start, the entry of the wiped filesystem is
+    replaced and other entries are kept.
+
+    :param tmp_path: Pytest temporary directory fixture
+    :param fake_disks: Call log of the disk tool stand-ins
+    :return: None
+    """
+    fstab = tmp_path / "fstab"
+    mnt = tmp_path / "nvme"
+    root = "LABEL=cloudimg-rootfs / ext4 discard,errors=remount-ro 0 1"
+    fstab.write_text(f"{root}\nUUID=0000-stale {mnt} xfs defaults,noatime,nofail 0 2\n")
+
+    result = run_script("--mount-point", str(mnt), "--fstab", str(fstab))
+
+    assert result.returncode == 0, result.stderr
+    assert fstab.read_text() == (
+        f"{root}\nUUID=1234-abcd {mnt} xfs"
+        " defaults,noatime,nofail,x-systemd.device-timeout=10s 0 2\n"
+    )
+
+
+@pytest.mark.parametrize("optional, returncode", [(False, 1), (True, 0)])
+def test_no_devices(
+    tmp_path: Path, fake_disks: Path, optional: bool, returncode: int
+) -> None:
+    """
+    Without instance store the script fails, unless it is optional.
+
+    :param tmp_path: Pytest temporary directory fixture
+    :param fake_disks: Call log of the disk tool stand-ins
+    :param optional: Whether --optional is passed
+    :param returncode: Expected exit code
+    :return: None
+    """
+    (tmp_path / "lsblk.out").write_text(LSBLK_OUTPUT.splitlines()[0] + "\n")
+    args = ["--mount-point", str(tmp_path / "nvme"), "--fstab", str(tmp_path / "f")]
+
+    result = run_script(*args, *(["--optional"] if optional else []))
+
+    assert result.returncode == returncode
+    assert "mkfs" not in fake_disks.read_text()
+
+
+@pytest.mark.parametrize("count", [1, 2], ids=["single", "raid0"])
+def test_loop_devices(tmp_path: Path, count: int) -> None:
+    """
+    Assemble, format and mount real loop devices.
+
+    :param tmp_path: Pytest temporary directory fixture
+    :param count: Number of loop devices
+    :return: None
+    """
+    if os.geteuid() != 0 or not shutil.which("losetup"):
+        pytest.skip("needs root and losetup")
+    if count > 1 and not shutil.which("mdadm"):
+        pytest.skip("needs mdadm")
+    devices = []
+    mnt = tmp_path / "nvme"
+    try:
+        for idx in range(count):
+            image = tmp_path / f"disk{idx}.img"
+            subprocess.run(["truncate", "-s", "64M", str(image)], check=True)
+            devices.append(
+                subprocess.run(
+                    ["losetup", "--find", "--show", str(image)],
+                    check=True,
+                    capture_output=True,
+                    text=True,
+                ).stdout.strip()
+            )
+        args = ["--mount-point", str(mnt), "--filesystem", "ext4"]
+        args += ["--raid-device", "/dev/md/ih-test", "--fstab", str(tmp_path / "f")]
+
+        result = run_script(*args, *devices)
+
+        assert result.returncode == 0, result.stderr
+        assert (
+            subprocess.run(["mountpoint", "-q", str(mnt)], check=False).returncode == 0
+        )
+        (mnt / "probe").write_text("ok")
+        assert run_script(*args, *devices).stdout.endswith("already mounted\n")
+    finally:
+        subprocess.run(["umount", str(mnt)], check=False, capture_output=True)
+        if count > 1:
+            subprocess.run(
+                ["mdadm", "--stop", "/dev/md/ih-test"], check=False, capture_output=True
+            )
+        for device in devices:
+            subprocess.run(["losetup", "-d", device], check=False)
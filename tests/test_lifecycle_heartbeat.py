@@ -0,0 +1,121 @@
+"""
+Unit tests for the lifecycle_heartbeat.py heartbeat emitter.
+"""
+
+import subprocess
+import sys
+from pathlib import Path
+from unittest.mock import Mock
+
+from botocore.exceptions import ClientError, EndpointConnectionError
+
+# Add the script directory to the path so we can import it
+SCRIPT_DIR = Path(__file__).parent.parent / "files" / "lifecycle_heartbeat"
+sys.path.insert(0, str(SCRIPT_DIR))
+
+from lifecycle_heartbeat import auto_scaling_group, heartbeat_loop
+
+
+def client_error(message: str) -> ClientError:
+    """
+    Build an Auto Scaling ValidationError.
+
+    :param message: Error message
+    :return: ClientError
+    """
+    return ClientError(
+        {"Error": {"Code": "ValidationError", "Message": message}},
+        "RecordLifecycleActionHeartbeat",
+    )
+
+
+def test_heartbeat_until_parent_exits() -> None:
+    """
+    Heartbeats are recorded every interval until the parent process is gone.
+
+    :return: None
+    """
+    parent = subprocess.Popen(["sleep", "60"])
+    client = Mock()
+    sleeps = []
+
+    def fake_sleep(seconds: float) -> None:
+        sleeps.append(seconds)
+        if len(sleeps) == 6:
+            parent.kill()
+            parent.wait()
+
+    recorded = heartbeat_loop(
+        client, "bootstrap", "my-asg", "i-0abc", 3, parent.pid, sleep=fake_sleep
+    )
+
+    assert recorded == 2
+    assert len(sleeps) == 6
+    client.record_lifecycle_action_heartbeat.assert_called_with(
+        LifecycleHookName="bootstrap",
+        AutoScalingGroupName="my-asg",
+        InstanceId="i-0abc",
+    )
+
+
+def test_heartbeat_stops_after_completion() -> None:
+    """
+    Once the lifecycle action is completed the loop ends quietly.
+
+    :return: None
+    """
+    client = Mock()
+    client.record_lifecycle_action_heartbeat.side_effect = [
+        None,
+        client_error("No active Lifecycle Action found with instance ID i-0abc"),
+    ]
+
+    recorded = heartbeat_loop(
+        client, "bootstrap", "my-asg", "i-0abc", 2, sleep=lambda _: None
+    )
+
+    assert recorded == 1
+    assert client.record_lifecycle_action_heartbeat.call_count == 2
+
+
+def test_heartbeat_errors_are_not_fatal() -> None:
+    """
+    Throttling and network errors are logged and the next heartbeat is tried.
+
+    :return: None
+    """
+    client = Mock()
+    client.record_lifecycle_action_heartbeat.side_effect = [
+        client_error("Rate exceeded"),
+        EndpointConnectionError(endpoint_url="https://autoscaling"),
+        None,
+        client_error("No active Lifecycle Action found with instance ID i-0abc"),
+    ]
+
+    recorded = heartbeat_loop(
+        client, "bootstrap", "my-asg", "i-0abc", 1, sleep=lambda _: None
+    )
+
+    assert recorded == 1
+    assert client.record_lifecycle_action_heartbeat.call_count == 4
+
+
+def test_auto_scaling_group() -> None:
+    """
+    The group name is looked up by instance ID; None outside a group.
+
+    :return: None
+    """
+    client = Mock()
+    client.describe_auto_scaling_instances.return_value = {
+        "AutoScalingInstances": [
+            {"InstanceId": "i-0abc", "AutoScalingGroupName": "my-asg"}
+        ]
+    }
+    assert auto_scaling_group(client, "i-0abc") == "my-asg"
+    client.describe_auto_scaling_instances.assert_called_once_with(
+        InstanceIds=["i-0abc"]
+    )
+
+    client.describe_auto_scaling_instances.return_value = {"AutoScalingInstances": []}
+    assert auto_scaling_group(client, "i-0abc") is None
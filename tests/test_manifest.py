@@ -1,16 +1,28 @@
 import json
 from base64 import b64decode
-from os import path as osp, remove
+from os import path as osp
 from pprint import pprint
-from shutil import rmtree
 from textwrap import dedent
 
 import pytest
-from mimeparse import parse_mime_type
-from pytest_infrahouse import terraform_apply
-from yaml import load, Loader
 
-from tests.conftest import TERRAFORM_ROOT_DIR
+from nfs_benchmark import load_profiles, merge_options
+
+
+def bootcmd_files(bootcmd: list) -> dict:
+    """
+    Decode the files bootcmd writes with ``echo '<base64>' | base64 -d``.
+
+    :param bootcmd: bootcmd entries
+    :return: File content by path
+    """
+    files = {}
+    for line in bootcmd:
+        if " | base64 -d > " in line:
+            encoded = line.split("echo '")[1].split("'")[0]
+            path = line.split(" | base64 -d > ")[1].split(" && ")[0]
+            files[path] = b64decode(encoded).decode()
+    return files
 
 
 @pytest.mark.parametrize("aws_provider_version", ["~> 6.0"])
@@ -58,41 +70,16 @@ from tests.conftest import TERRAFORM_ROOT_DIR
     ],
 )
 def test_module(
-    aws_provider_version, puppet_manifest, expected_fact, expected_runcmd, keep_after
-):
-    module_dir = osp.join(TERRAFORM_ROOT_DIR, "test_module")
-
-    # Delete .terraform directory and .terraform.lock.hcl to allow provider version changes
-    terraform_dir = osp.join(module_dir, ".terraform")
-    lock_file_path = osp.join(module_dir, ".terraform.lock.hcl")
-
-    try:
-        rmtree(terraform_dir)
-    except FileNotFoundError:
-        pass
-
-    try:
-        remove(lock_file_path)
-    except FileNotFoundError:
-        pass
-
-    # Update provider version
-    with open(f"{module_dir}/terraform.tf", "w") as fp:
-        fp.write(f"""
-            terraform {{
-                required_version = "~> 1.0"
-                required_providers {{
-                    aws = {{
-                      source  = "hashicorp/aws"
-                      version = "{aws_provider_version}"
-                    }}
-                    cloudinit = {{
-                      source  = "hashicorp/cloudinit"
-                        version = "~> 2.3"
-                    }}                    
-                  }}
-                }}
-            """)
+    aws_provider_version,
+    puppet_manifest,
+    expected_fact,
+    expected_runcmd,
+    keep_after,
+    valid_userdata,
+    terraform_workdir,
+    cached_terraform_apply,
+):
+    module_dir = terraform_workdir("test_module", aws_provider_version)
 
     with open(osp.join(module_dir, "terraform.tfvars"), "w") as fp:
         value = f'"{puppet_manifest}"' if puppet_manifest else "null"
@@ -101,19 +88,8 @@ def test_module(
                 lifecycle_hook_name = null
                 """))
 
-    with terraform_apply(
-        module_dir,
-        destroy_after=not keep_after,
-        json_output=True,
-    ) as tf_output:
-        userdata = b64decode(tf_output["userdata"]["value"]).decode()
-        assert userdata
-        yaml_userdata = (
-            parse_mime_type(userdata)[2]["boundary"]
-            .split("#cloud-config")[1]
-            .replace("--MIMEBOUNDARY--", "")
-        )
-        ud_obj = load(yaml_userdata, Loader=Loader)
+    with cached_terraform_apply(module_dir, destroy_after=not keep_after) as tf_output:
+        ud_obj = valid_userdata(tf_output["userdata"]["value"])
         found_ih_puppet_json = False
         bootstrap_script = None
         for file_def in ud_obj["write_files"]:
@@ -142,64 +118,29 @@ def test_module(
 
 
 @pytest.mark.parametrize("aws_provider_version", ["~> 6.0"])
-def test_lifecycle_hook(aws_provider_version, keep_after):
+def test_lifecycle_hook(
+    aws_provider_version,
+    keep_after,
+    valid_userdata,
+    terraform_workdir,
+    cached_terraform_apply,
+):
     """
     When lifecycle_hook_name is set, the bootstrap script must register an
     ERR trap that signals ABANDON on failure and signals CONTINUE on the
     success path, so a broken instance cannot silently join the ASG.
     """
-    module_dir = osp.join(TERRAFORM_ROOT_DIR, "test_module")
+    module_dir = terraform_workdir("test_module", aws_provider_version)
     hook_name = "bootstrap"
 
-    terraform_dir = osp.join(module_dir, ".terraform")
-    lock_file_path = osp.join(module_dir, ".terraform.lock.hcl")
-
-    try:
-        rmtree(terraform_dir)
-    except FileNotFoundError:
-        pass
-
-    try:
-        remove(lock_file_path)
-    except FileNotFoundError:
-        pass
-
-    with open(f"{module_dir}/terraform.tf", "w") as fp:
-        fp.write(f"""
-            terraform {{
-                required_version = "~> 1.0"
-                required_providers {{
-                    aws = {{
-                      source  = "hashicorp/aws"
-                      version = "{aws_provider_version}"
-                    }}
-                    cloudinit = {{
-                      source  = "hashicorp/cloudinit"
-                        version = "~> 2.3"
-                    }}
-                  }}
-                }}
-            """)
-
     with open(osp.join(module_dir, "terraform.tfvars"), "w") as fp:
         fp.write(dedent(f"""
                 puppet_manifest = null
                 lifecycle_hook_name = "{hook_name}"
                 """))
 
-    with terraform_apply(
-        module_dir,
-        destroy_after=not keep_after,
-        json_output=True,
-    ) as tf_output:
-        userdata = b64decode(tf_output["userdata"]["value"]).decode()
-        assert userdata
-        yaml_userdata = (
-            parse_mime_type(userdata)[2]["boundary"]
-            .split("#cloud-config")[1]
-            .replace("--MIMEBOUNDARY--", "")
-        )
-        ud_obj = load(yaml_userdata, Loader=Loader)
+    with cached_terraform_apply(module_dir, destroy_after=not keep_after) as tf_output:
+        ud_obj = valid_userdata(tf_output["userdata"]["value"])
 
         bootstrap_script = None
         for file_def in ud_obj["write_files"]:
@@ -227,3 +168,799 @@ def test_lifecycle_hook(aws_provider_version, keep_after):
         done_idx = bootstrap_script.index("touch /var/run/puppet-done")
         continue_idx = bootstrap_script.index(continue_line)
         assert continue_idx > done_idx
+
+
+@pytest.mark.parametrize("aws_provider_version", ["~> 6.0"])
+def test_parallel_runcmd(
+    aws_provider_version,
+    keep_after,
+    valid_userdata,
+    terraform_workdir,
+    cached_terraform_apply,
+):
+    """
+    pre_runcmd / post_runcmd accept objects with a ``parallel`` list next to
+    plain command strings. Plain strings must stay inline in the bootstrap
+    script; parallel groups must be handed to _ih_run_parallel with every
+    command single-quoted, in declaration order.
+    """
+    module_dir = terraform_workdir("test_module", aws_provider_version)
+
+    with open(osp.join(module_dir, "terraform.tfvars"), "w") as fp:
+        fp.write(dedent("""
+                puppet_manifest = null
+                lifecycle_hook_name = "bootstrap"
+                pre_runcmd = [
+                  "mkdir -p /opt/myapp",
+                  {
+                    parallel = [
+                      "docker pull myapp:latest",
+                      "echo 'warm cache'",
+                    ]
+                  },
+                ]
+                post_runcmd = [
+                  {
+                    parallel = ["systemctl restart myapp", "register-service"]
+                  },
+                  "echo done",
+                ]
+                """))
+
+    with cached_terraform_apply(module_dir, destroy_after=not keep_after) as tf_output:
+        ud_obj = valid_userdata(tf_output["userdata"]["value"])
+
+        bootstrap_script = None
+        for file_def in ud_obj["write_files"]:
+            if file_def["path"] == "/usr/local/bin/ih-bootstrap":
+                bootstrap_script = file_def["content"]
+        assert bootstrap_script is not None
+        lines = bootstrap_script.splitlines()
+
+        # Sequential entries are rendered verbatim, as before.
+        assert "mkdir -p /opt/myapp" in lines
+        assert "echo done" in lines
+
+        # Parallel groups go through the helper, with single quotes escaped.
+        assert "_ih_run_parallel() {" in lines
+        assert "'docker pull myapp:latest'" in lines
+        assert "'echo '\\''warm cache'\\'''" in lines
+        assert "'systemctl restart myapp'" in lines
+        assert "'register-service'" in lines
+        pre_idx = lines.index('_ih_run_parallel "pre_runcmd[1]" "${_ih_group[@]}"')
+        post_idx = lines.index('_ih_run_parallel "post_runcmd[0]" "${_ih_group[@]}"')
+
+        # Ordering relative to sequential steps and Puppet must be preserved.
+        assert lines.index("mkdir -p /opt/myapp") < pre_idx
+        puppet_idx = next(i for i, l in enumerate(lines) if l.startswith("ih-puppet"))
+        assert pre_idx < puppet_idx < post_idx < lines.index("echo done")
+
+        # A failed group still ends in the ABANDON trap via set -e.
+        assert "trap _ih_signal_abandon ERR" in bootstrap_script
+
+
+@pytest.mark.parametrize("aws_provider_version", ["~> 6.0"])
+def test_puppet_profiling(
+    aws_provider_version,
+    keep_after,
+    valid_userdata,
+    terraform_workdir,
+    cached_terraform_apply,
+):
+    """
+    With puppet_profiling enabled the profile summarizer is shipped and
+    ih-bootstrap turns on evaltrace before Puppet and runs the summarizer
+    right after it, without letting a summarizer failure abandon the instance,
+    then turns the settings off again.
+    """
+    module_dir = terraform_workdir("test_module", aws_provider_version)
+
+    with open(osp.join(module_dir, "terraform.tfvars"), "w") as fp:
+        fp.write(dedent("""
+                puppet_manifest = null
+                puppet_profiling = true
+                """))
+
+    with cached_terraform_apply(module_dir, destroy_after=not keep_after) as tf_output:
+        ud_obj = valid_userdata(tf_output["userdata"]["value"])
+
+        files = {f["path"]: f for f in ud_obj["write_files"]}
+        assert files["/usr/local/bin/ih-puppet-profile"]["permissions"] == "0755"
+        assert files["/usr/local/bin/ih-puppet-profile"]["content"].startswith(
+            "#!/usr/bin/env python3"
+        )
+
+        lines = files["/usr/local/bin/ih-bootstrap"]["content"].splitlines()
+        evaltrace_idx = lines.index(
+            "PATH=/opt/puppetlabs/puppet/bin:$PATH"
+            " puppet config set --section main evaltrace true"
+        )
+        puppet_idx = next(i for i, l in enumerate(lines) if l.startswith("ih-puppet"))
+        profile_idx = lines.index("/usr/local/bin/ih-puppet-profile --top 20 \\")
+        assert evaltrace_idx < puppet_idx < profile_idx
+        assert lines[profile_idx + 3].strip().startswith("|| echo")
+        assert profile_idx < lines.index("touch /var/run/puppet-done")
+
+        # evaltrace and profile are for the bootstrap run only.
+        for setting in ["evaltrace", "profile"]:
+            assert (
+                "    PATH=/opt/puppetlabs/puppet/bin:$PATH puppet config delete"
+                f" --section main {setting} >/dev/null 2>&1 || true"
+            ) in lines
+        assert "trap _ih_on_exit EXIT" in lines
+        off_idx = lines.index("_ih_puppet_profiling_off", profile_idx)
+        assert off_idx < lines.index("touch /var/run/puppet-done")
+
+
+@pytest.mark.parametrize("aws_provider_version", ["~> 6.0"])
+def test_nfs_mount_profile(
+    aws_provider_version,
+    keep_after,
+    valid_userdata,
+    terraform_workdir,
+    cached_terraform_apply,
+):
+    """
+    nfs_mount_profile fills in fs_mntops of NFS entries only, keeping the
+    caller's options and filling in a missing fs_mntops, and bootcmd writes
+    and applies the sysctl and sunrpc settings before anything is mounted.
+    """
+    module_dir = terraform_workdir("test_module", aws_provider_version)
+
+    with open(osp.join(module_dir, "terraform.tfvars"), "w") as fp:
+        fp.write(dedent("""
+                puppet_manifest = null
+                nfs_mount_profile = "efs-throughput"
+                mounts = [
+                  ["fs-a.efs.us-west-2.amazonaws.com:/", "/mnt/a", "nfs4", "defaults", "0", "0"],
+                  ["fs-b.efs.us-west-2.amazonaws.com:/", "/mnt/b", "nfs4", "soft,nconnect=4"],
+                  ["xvdh", "/opt/data", "auto", "defaults,nofail", "0", "0"],
+                  ["fs-c.efs.us-west-2.amazonaws.com:/", "/mnt/c", "nfs4"],
+                  ["fs-d.efs.us-west-2.amazonaws.com:/", "/mnt/d", "nfs4", "vers=4.0"],
+                ]
+                """))
+
+    with cached_terraform_apply(module_dir, destroy_after=not keep_after) as tf_output:
+        ud_obj = valid_userdata(tf_output["userdata"]["value"])
+
+        files = {f["path"]: f for f in ud_obj["write_files"]}
+        lines = files["/usr/local/bin/ih-bootstrap"]["content"].splitlines()
+        # cc_mounts writes the entries with noauto; ih-bootstrap mounts them.
+        fstab = ud_obj["mounts"]
+        suffix = ",noauto,x-systemd.automount"
+        assert all(m[3].endswith(suffix) for m in fstab)
+        options = [m[3].removesuffix(suffix) for m in fstab]
+
+        profile = load_profiles()["efs-throughput"]
+        assert options == [
+            merge_options("defaults", profile),
+            merge_options("soft,nconnect=4", profile),
+            "defaults,nofail",
+            merge_options("", profile),
+            merge_options("vers=4.0", profile),
+        ]
+        assert fstab[1][4:] == ["0", "0"]
+        # An entry without fs_mntops gets every profile option.
+        assert options[3] == merge_options("defaults", profile)
+        assert fstab[3][4:] == ["0", "0"]
+        # vers is nfsvers by another name: the profile's nfsvers is dropped.
+        assert "nfsvers" not in options[4]
+
+        # The settings are written and applied by bootcmd, before cc_mounts
+        # and the bootstrap; write_files would only run after bootcmd.
+        bootcmd = ud_obj["bootcmd"]
+        written = bootcmd_files(bootcmd)
+        assert "net.core.rmem_max = 16777216" in written["/etc/sysctl.d/60-ih-nfs.conf"]
+        assert (
+            written["/etc/modprobe.d/ih-nfs-sunrpc.conf"]
+            == "options sunrpc tcp_slot_table_entries=128"
+        )
+        assert not set(files) & set(written)
+        sysctl_idx = bootcmd.index("sysctl -q -p /etc/sysctl.d/60-ih-nfs.conf")
+        sunrpc_idx = bootcmd.index("sysctl -q -w sunrpc.tcp_slot_table_entries=128")
+        assert bootcmd.index("modprobe sunrpc") < sunrpc_idx
+        assert sysctl_idx < len(bootcmd) - 1
+        assert "nfs_tuning" not in "\n".join(lines)
+
+
+@pytest.mark.parametrize("aws_provider_version", ["~> 6.0"])
+def test_instance_store(
+    aws_provider_version,
+    keep_after,
+    valid_userdata,
+    terraform_workdir,
+    cached_terraform_apply,
+):
+    """
+    instance_store ships ih-instance-store with its tools and runs it in
+    ih-bootstrap before the mounts and Puppet, and again in the warm-pool
+    activate phase.
+    """
+    module_dir = terraform_workdir("test_module", aws_provider_version)
+
+    with open(osp.join(module_dir, "terraform.tfvars"), "w") as fp:
+        fp.write(dedent("""
+                puppet_manifest = null
+                instance_store = {
+                  mount_point = "/mnt/nvme"
+                  required    = false
+                }
+                warm_pool = {
+                  activate_runcmd = ["systemctl restart myapp"]
+                }
+                """))
+
+    with cached_terraform_apply(module_dir, destroy_after=not keep_after) as tf_output:
+        ud_obj = valid_userdata(tf_output["userdata"]["value"])
+
+        files = {f["path"]: f for f in ud_obj["write_files"]}
+        assert files["/usr/local/bin/ih-instance-store"]["permissions"] == "0755"
+        assert {"mdadm", "xfsprogs"} <= set(ud_obj["packages"])
+
+        lines = files["/usr/local/bin/ih-bootstrap"]["content"].splitlines()
+        store_idx = lines.index(
+            "/usr/local/bin/ih-instance-store --mount-point '/mnt/nvme'"
+            " --filesystem xfs --mount-options 'defaults,noatime' --optional"
+        )
+        assert lines[store_idx - 1] == "_ih_stage instance_store"
+        puppet_idx = next(i for i, l in enumerate(lines) if l.startswith("ih-puppet"))
+        assert store_idx < lines.index("_ih_stage gems") < puppet_idx
+
+        # A stop/start in the warm pool wipes instance store: the activate
+        # phase builds it again before activate_runcmd.
+        activate = files["/usr/local/bin/ih-activate"]["content"].splitlines()
+        activate_store_idx = activate.index(lines[store_idx])
+        assert activate[activate_store_idx - 1] == "_ih_stage instance_store"
+        assert activate_store_idx < activate.index("systemctl restart myapp")
+
+
+@pytest.mark.parametrize("aws_provider_version", ["~> 6.0"])
+def test_warm_pool(
+    aws_provider_version,
+    keep_after,
+    valid_userdata,
+    terraform_workdir,
+    cached_terraform_apply,
+):
+    """
+    With warm_pool, ih-bootstrap ends the prewarm phase with its own marker
+    and hands instances headed into service to ih-activate, which cloud-init
+    also runs on every boot and ih-activate.service runs for pools that do
+    not stop; each phase signals CONTINUE.
+    """
+    module_dir = terraform_workdir("test_module", aws_provider_version)
+
+    with open(osp.join(module_dir, "terraform.tfvars"), "w") as fp:
+        fp.write(dedent("""
+                puppet_manifest = null
+                lifecycle_hook_name = "bootstrap"
+                warm_pool = {
+                  activate_runcmd = ["systemctl restart myapp"]
+                }
+                """))
+
+    with cached_terraform_apply(module_dir, destroy_after=not keep_after) as tf_output:
+        ud_obj = valid_userdata(tf_output["userdata"]["value"])
+
+        files = {f["path"]: f for f in ud_obj["write_files"]}
+        continue_line = (
+            'ih-aws --verbose autoscaling complete "bootstrap" --result CONTINUE'
+        )
+
+        bootstrap = files["/usr/local/bin/ih-bootstrap"]["content"].splitlines()
+        assert "touch /var/run/puppet-done" not in bootstrap
+        prewarm_idx = bootstrap.index("touch /var/lib/ih-bootstrap/prewarm-done")
+        exec_idx = bootstrap.index("    exec /usr/local/bin/ih-activate")
+        assert prewarm_idx < exec_idx < bootstrap.index(continue_line)
+        # Warmed:Running and Warmed:Hibernated instances never reboot into
+        # service, so a unit waits for the move instead of the per-boot hook.
+        start_idx = bootstrap.index(
+            "    systemctl start --no-block ih-activate.service"
+        )
+        assert exec_idx < start_idx < bootstrap.index(continue_line)
+        unit = files["/etc/systemd/system/ih-activate.service"]["content"]
+        assert "ExecStart=/usr/local/bin/ih-activate --wait" in unit.splitlines()
+
+        activate = files["/usr/local/bin/ih-activate"]
+        assert activate["permissions"] == "0755"
+        lines = activate["content"].splitlines()
+        assert "trap _ih_signal_abandon ERR" in lines
+        assert (
+            '    _ih_target_state="$(/usr/local/bin/ih-lifecycle-state --wait)"'
+            in lines
+        )
+        # A reboot in a Warmed:Running pool loses the unit; the per-boot hook
+        # runs ih-activate without --wait, which starts it again.
+        restart_idx = lines.index(
+            "        systemctl start --no-block ih-activate.service"
+        )
+        assert restart_idx < lines.index(
+            '    echo "ih-activate: target lifecycle state is $_ih_target_state,'
+            ' not activating"'
+        )
+        assert (
+            lines.index("systemctl restart myapp")
+            < lines.index("touch /var/lib/ih-bootstrap/activate-done")
+            < lines.index("touch /var/run/puppet-done")
+            < lines.index(continue_line)
+        )
+
+        assert files["/var/lib/cloud/scripts/per-boot/ih-activate"]["content"] == (
+            "#!/bin/sh\nexec /usr/local/bin/ih-activate\n"
+        )
+        assert "/usr/local/bin/ih-lifecycle-state" in files
+
+
+@pytest.mark.parametrize("aws_provider_version", ["~> 6.0"])
+def test_readiness_gate(
+    aws_provider_version,
+    keep_after,
+    valid_userdata,
+    terraform_workdir,
+    cached_terraform_apply,
+):
+    """
+    With readiness_gate, background steps start and the checks gate
+    puppet-done and CONTINUE; the background job is detached, so nothing
+    waits for it, and its failures do not reach the ERR trap.
+    """
+    module_dir = terraform_workdir("test_module", aws_provider_version)
+
+    with open(osp.join(module_dir, "terraform.tfvars"), "w") as fp:
+        fp.write(dedent("""
+                puppet_manifest = null
+                lifecycle_hook_name = "bootstrap"
+                post_runcmd = ["systemctl restart myapp"]
+                readiness_gate = {
+                  checks            = ["curl -fsS http://localhost:8080/health"]
+                  timeout           = 120
+                  background_runcmd = ["/opt/myapp/bin/warm-cache"]
+                }
+                """))
+
+    with cached_terraform_apply(module_dir, destroy_after=not keep_after) as tf_output:
+        ud_obj = valid_userdata(tf_output["userdata"]["value"])
+
+        files = {f["path"]: f for f in ud_obj["write_files"]}
+        assert files["/usr/local/bin/ih-readiness-gate"]["permissions"] == "0755"
+        assert files["/usr/local/bin/ih-background-runcmd"]["permissions"] == "0755"
+
+        lines = files["/usr/local/bin/ih-bootstrap"]["content"].splitlines()
+        background = (
+            "setsid /usr/local/bin/ih-background-runcmd '/opt/myapp/bin/warm-cache'"
+            " </dev/null &"
+        )
+        gate = (
+            "/usr/local/bin/ih-readiness-gate --timeout 120 --interval 5"
+            " 'curl -fsS http://localhost:8080/health'"
+        )
+        assert (
+            lines.index("systemctl restart myapp")
+            < lines.index(background)
+            < lines.index(gate)
+            < lines.index("touch /var/run/puppet-done")
+            < lines.index(
+                'ih-aws --verbose autoscaling complete "bootstrap" --result CONTINUE'
+            )
+        )
+        # The background steps are detached, nothing waits for them.
+        assert "_ih_stage background_wait" not in lines
+
+
+@pytest.mark.parametrize("aws_provider_version", ["~> 6.0"])
+def test_lifecycle_heartbeat(
+    aws_provider_version,
+    keep_after,
+    valid_userdata,
+    terraform_workdir,
+    cached_terraform_apply,
+):
+    """
+    With lifecycle_heartbeat_interval, the bootstrap starts the heartbeat
+    emitter right after the ERR trap and stops it when it exits.
+    """
+    module_dir = terraform_workdir("test_module", aws_provider_version)
+
+    with open(osp.join(module_dir, "terraform.tfvars"), "w") as fp:
+        fp.write(dedent("""
+                puppet_manifest = null
+                lifecycle_hook_name = "bootstrap"
+                lifecycle_heartbeat_interval = 30
+                """))
+
+    with cached_terraform_apply(module_dir, destroy_after=not keep_after) as tf_output:
+        ud_obj = valid_userdata(tf_output["userdata"]["value"])
+
+        files = {f["path"]: f for f in ud_obj["write_files"]}
+        assert files["/usr/local/bin/ih-lifecycle-heartbeat"]["permissions"] == "0755"
+
+        lines = files["/usr/local/bin/ih-bootstrap"]["content"].splitlines()
+        start = (
+            '/usr/local/bin/ih-lifecycle-heartbeat --hook "bootstrap" --interval 30'
+            " --parent-pid $$ &"
+        )
+        assert (
+            lines.index("trap _ih_signal_abandon ERR")
+            < lines.index(start)
+            < lines.index('    kill "$IH_HEARTBEAT_PID" 2>/dev/null || true')
+            < lines.index("trap _ih_on_exit EXIT")
+            < lines.index("_ih_stage puppet")
+        )
+
+
+@pytest.mark.parametrize(
+    "facter_fact_ttls, expected_ttls",
+    [
+        ("null", []),
+        (
+            '{ "EC2" = "1 hour", "dmi" = "1 day" }',
+            [
+                '                { "EC2" : 1 hour },',
+                '                { "dmi" : 1 day },',
+            ],
+        ),
+        ("{}", []),
+    ],
+    ids=["default", "custom", "disabled"],
+)
+@pytest.mark.parametrize("aws_provider_version", ["~> 6.0"])
+def test_facter_fact_ttls(
+    aws_provider_version,
+    facter_fact_ttls,
+    expected_ttls,
+    keep_after,
+    valid_userdata,
+    terraform_workdir,
+    cached_terraform_apply,
+):
+    """
+    facter.conf is rendered for both facter config paths on every codename,
+    with the facts.ttls cache from facter_fact_ttls.
+    """
+    module_dir = terraform_workdir("test_module", aws_provider_version)
+
+    with open(osp.join(module_dir, "terraform.tfvars"), "w") as fp:
+        fp.write(dedent(f"""
+                puppet_manifest = null
+                facter_fact_ttls = {facter_fact_ttls}
+                """))
+
+    with cached_terraform_apply(module_dir, destroy_after=not keep_after) as tf_output:
+        ud_obj = valid_userdata(tf_output["userdata"]["value"])
+
+        files = {f["path"]: f for f in ud_obj["write_files"]}
+        for path in ("/etc/facter/facter.conf", "/etc/puppetlabs/facter/facter.conf"):
+            lines = files[path]["content"].splitlines()
+            assert '        external-dir : "/etc/puppetlabs/facter/facts.d/",' in lines
+            assert [
+                line for line in lines if line.startswith("                { ")
+            ] == (expected_ttls)
+            assert ("        ttls : [" in lines) == bool(expected_ttls)
+
+
+@pytest.mark.parametrize(
+    "apt_acquire, expected_conf",
+    [
+        ("null", None),
+        (
+            '{ retries = 10, queue_mode = "access" }',
+            [
+                'Acquire::Queue-Mode "access";',
+                'Acquire::QueueHost::Limit "16";',
+                'Acquire::Retries "10";',
+                'Acquire::Max-Pipeline-Depth "10";',
+                'Acquire::http::Pipeline-Depth "10";',
+                'Acquire::http::Timeout "15";',
+            ],
+        ),
+    ],
+    ids=["unset", "custom"],
+)
+@pytest.mark.parametrize("aws_provider_version", ["~> 6.0"])
+def test_apt_acquire(
+    aws_provider_version,
+    apt_acquire,
+    expected_conf,
+    keep_after,
+    valid_userdata,
+    terraform_workdir,
+    cached_terraform_apply,
+):
+    """
+    apt_acquire writes an apt.conf.d profile, filled in from the module
+    defaults; null writes none.
+    """
+    module_dir = terraform_workdir("test_module", aws_provider_version)
+
+    with open(osp.join(module_dir, "terraform.tfvars"), "w") as fp:
+        fp.write(dedent(f"""
+                puppet_manifest = null
+                apt_acquire = {apt_acquire}
+                """))
+
+    with cached_terraform_apply(module_dir, destroy_after=not keep_after) as tf_output:
+        ud_obj = valid_userdata(tf_output["userdata"]["value"])
+
+        files = {f["path"]: f for f in ud_obj["write_files"]}
+        if expected_conf is None:
+            assert "/etc/apt/apt.conf.d/80-ih-acquire" not in files
+        else:
+            profile = files["/etc/apt/apt.conf.d/80-ih-acquire"]
+            assert profile["permissions"] == "0644"
+            assert [
+                line
+                for line in profile["content"].splitlines()
+                if not line.startswith("//")
+            ] == expected_conf
+
+
+@pytest.mark.parametrize("aws_provider_version", ["~> 6.0"])
+def test_dpkg_unsafe_io(
+    aws_provider_version,
+    keep_after,
+    valid_userdata,
+    terraform_workdir,
+    cached_terraform_apply,
+):
+    """
+    dpkg_unsafe_io writes the dpkg config for the first boot, and
+    ih-bootstrap removes it and syncs before puppet-done, and on any exit.
+    """
+    module_dir = terraform_workdir("test_module", aws_provider_version)
+
+    with open(osp.join(module_dir, "terraform.tfvars"), "w") as fp:
+        fp.write(dedent("""
+                puppet_manifest = null
+                dpkg_unsafe_io = true
+                """))
+
+    with cached_terraform_apply(module_dir, destroy_after=not keep_after) as tf_output:
+        ud_obj = valid_userdata(tf_output["userdata"]["value"])
+
+        files = {f["path"]: f for f in ud_obj["write_files"]}
+        conf = files["/etc/dpkg/dpkg.cfg.d/ih-unsafe-io"]
+        assert conf["content"].splitlines()[-1] == "force-unsafe-io"
+
+        lines = files["/usr/local/bin/ih-bootstrap"]["content"].splitlines()
+        assert "    rm -f /etc/dpkg/dpkg.cfg.d/ih-unsafe-io" in lines
+        assert lines.index("trap _ih_on_exit EXIT") < lines.index("_ih_stage puppet")
+        sync = lines.index("_ih_stage dpkg_sync")
+        assert lines[sync + 1 : sync + 3] == [
+            "rm -f /etc/dpkg/dpkg.cfg.d/ih-unsafe-io",
+            "sync",
+        ]
+        assert (
+            lines.index("_ih_stage post_runcmd")
+            < sync
+            < lines.index("touch /var/run/puppet-done")
+        )
+
+
+@pytest.mark.parametrize("aws_provider_version", ["~> 6.0"])
+@pytest.mark.parametrize(
+    "allowlist, expected",
+    [
+        (None, None),
+        (
+            {"cloud_config_modules": ["ntp", "my_module"]},
+            ["grub_dpkg", "apt_configure", "ntp", "runcmd", "my_module"],
+        ),
+    ],
+    ids=["unset", "allowlist"],
+)
+def test_cloud_init_module_allowlist(
+    aws_provider_version,
+    allowlist,
+    expected,
+    keep_after,
+    valid_userdata,
+    terraform_workdir,
+    cached_terraform_apply,
+):
+    """
+    cloud_init_module_allowlist replaces the image's module lists with the
+    modules the userdata needs plus the allowlisted ones, in image order.
+    """
+    module_dir = terraform_workdir("test_module", aws_provider_version)
+
+    with open(osp.join(module_dir, "terraform.tfvars"), "w") as fp:
+        fp.write(dedent("""
+                puppet_manifest = null
+                cloud_init_module_allowlist = %s
+                """) % (json.dumps(allowlist) if allowlist else "null"))
+
+    with cached_terraform_apply(module_dir, destroy_after=not keep_after) as tf_output:
+        ud_obj = valid_userdata(tf_output["userdata"]["value"])
+
+        assert ud_obj.get("cloud_config_modules") == expected
+        if expected:
+            assert "scripts_user" in ud_obj["cloud_final_modules"]
+            assert "landscape" not in ud_obj["cloud_final_modules"]
+            assert ud_obj["cloud_init_modules"][:3] == [
+                "seed_random",
+                "bootcmd",
+                "write_files",
+            ]
+
+
+@pytest.mark.parametrize("aws_provider_version", ["~> 6.0"])
+@pytest.mark.parametrize(
+    "secret_files, puppet_secrets",
+    [(False, False), (True, False), (False, True)],
+    ids=["unset", "secret_files", "puppet_secrets"],
+)
+def test_secret_files(
+    aws_provider_version,
+    secret_files,
+    puppet_secrets,
+    keep_after,
+    valid_userdata,
+    terraform_workdir,
+    cached_terraform_apply,
+):
+    """
+    secret_files and puppet_secrets are resolved by materialize_secrets.py
+    alongside the APT credentials in bootcmd; userdata carries the ARNs
+    only, and ih-bootstrap fails if they were not materialized.
+    """
+    module_dir = terraform_workdir("test_module", aws_provider_version)
+    arn = "arn:aws:secretsmanager:us-west-2:123456789012:secret:db"
+    files = []
+    store = {}
+
+    with open(osp.join(module_dir, "terraform.tfvars"), "w") as fp:
+        fp.write("puppet_manifest = null\n")
+        if secret_files:
+            files = [
+                {
+                    "path": "/etc/myapp/db.conf",
+                    "content": f"password = {{{{secret:{arn}#password}}}}",
+                    "permissions": "0600",
+                }
+            ]
+            fp.write(dedent("""
+                    secret_files = [
+                      {
+                        path    = "/etc/myapp/db.conf"
+                        content = "password = {{secret:%s#password}}"
+                      }
+                    ]
+                    """) % arn)
+        if puppet_secrets:
+            store = {"profile::myapp::db_password": f"{arn}#password"}
+            fp.write(f"puppet_secrets = {json.dumps(store)}\n")
+
+    with cached_terraform_apply(module_dir, destroy_after=not keep_after) as tf_output:
+        ud_obj = valid_userdata(tf_output["userdata"]["value"])
+
+        bootcmd = ud_obj["bootcmd"]
+        materializer = [cmd for cmd in bootcmd if "materialize_secrets.py" in cmd]
+        written = {f["path"]: f for f in ud_obj["write_files"]}
+        bootstrap = written["/usr/local/bin/ih-bootstrap"]["content"]
+        assert "/etc/myapp/db.conf" not in written
+        if not (secret_files or puppet_secrets):
+            assert materializer == []
+            assert "ih-secret-files-done" not in bootstrap
+            return
+
+        definitions = next(
+            cmd for cmd in bootcmd if "/var/tmp/secret-files.json.b64" in cmd
+        )
+        assert json.loads(b64decode(definitions.split("'")[1])) == {
+            "files": files,
+            "store": store,
+        }
+        # generate_apt_auth.sh hands the definitions to materialize_secrets.py,
+        # which writes the APT auth entries too, in the background of the
+        # repo installer.
+        assert (
+            "/usr/local/bin/generate_apt_auth.sh /var/tmp/secret-files.json &"
+            in bootcmd[-1]
+        )
+        assert "[[ ! -e /var/run/ih-secret-files-done ]]" in bootstrap
+
+
+@pytest.mark.parametrize("aws_provider_version", ["~> 6.0"])
+@pytest.mark.parametrize("imds_credentials", [False, True], ids=["chain", "imds"])
+def test_imds_credentials(
+    aws_provider_version,
+    imds_credentials,
+    keep_after,
+    valid_userdata,
+    terraform_workdir,
+    cached_terraform_apply,
+):
+    """
+    imds_credentials pins the bootcmd secret resolver to IMDSv2.
+    """
+    module_dir = terraform_workdir("test_module", aws_provider_version)
+    arn = "arn:aws:secretsmanager:us-west-2:123456789012:secret:db"
+
+    with open(osp.join(module_dir, "terraform.tfvars"), "w") as fp:
+        fp.write(dedent("""
+                puppet_manifest = null
+                imds_credentials = %s
+                puppet_secrets = {
+                  "profile::myapp::db_password" = "%s#password"
+                }
+                """) % (str(imds_credentials).lower(), arn))
+
+    with cached_terraform_apply(module_dir, destroy_after=not keep_after) as tf_output:
+        ud_obj = valid_userdata(tf_output["userdata"]["value"])
+
+        resolvers = ud_obj["bootcmd"][-1]
+        env = "IH_CREDENTIAL_SOURCE=imds "
+        if imds_credentials:
+            assert f"{env}/usr/local/bin/generate_apt_auth.sh" in resolvers
+        else:
+            assert "IH_CREDENTIAL_SOURCE" not in resolvers
+
+
+@pytest.mark.parametrize("aws_provider_version", ["~> 6.0"])
+@pytest.mark.parametrize(
+    "tuning_profile", ["network-throughput", "low-latency", "many-connections"]
+)
+def test_tuning_profile(
+    aws_provider_version,
+    tuning_profile,
+    keep_after,
+    valid_userdata,
+    terraform_workdir,
+    cached_terraform_apply,
+):
+    """
+    tuning_profile renders the profile's sysctl, limits, transparent hugepage
+    and I/O scheduler settings, and bootcmd writes and applies them before
+    the repo installer and the secret resolvers run.
+    """
+    module_dir = terraform_workdir("test_module", aws_provider_version)
+    with open(
+        osp.join(
+            osp.dirname(__file__), "..", "files", "tuning_profile", "profiles.json"
+        )
+    ) as fp:
+        profile = json.load(fp)[tuning_profile]
+
+    with open(osp.join(module_dir, "terraform.tfvars"), "w") as fp:
+        fp.write(dedent("""
+                puppet_manifest = null
+                tuning_profile = "%s"
+                """) % tuning_profile)
+
+    with cached_terraform_apply(module_dir, destroy_after=not keep_after) as tf_output:
+        ud_obj = valid_userdata(tf_output["userdata"]["value"])
+
+        bootcmd = ud_obj["bootcmd"]
+        files = bootcmd_files(bootcmd)
+
+        sysctl = dict(
+            l.split(" = ") for l in files["/etc/sysctl.d/60-ih-tuning.conf"].split("\n")
+        )
+        assert sysctl == profile["sysctl"]
+        # The kernel default of fs.file-max is already far above nofile, and
+        # ephemeral ports stay clear of the services' listening ports.
+        assert "fs.file-max" not in sysctl
+        if "net.ipv4.ip_local_port_range" in sysctl:
+            low = int(sysctl["net.ipv4.ip_local_port_range"].split()[0])
+            assert low >= 10000
+        limits = files["/etc/security/limits.d/60-ih-tuning.conf"].split("\n")
+        manager = files["/etc/systemd/system.conf.d/60-ih-tuning.conf"].split("\n")
+        assert manager[0] == "[Manager]"
+        for item, value in profile["limits"].items():
+            assert f"* - {item} {value}" in limits
+            assert f"root - {item} {value}" in limits
+            assert f"DefaultLimit{item.upper()}={value}" in manager
+        tmpfiles = files["/etc/tmpfiles.d/60-ih-tuning.conf"].split("\n")
+        assert sorted(tmpfiles) == sorted(
+            f"w /sys/kernel/mm/transparent_hugepage/{k} - - - - {v}"
+            for k, v in profile["transparent_hugepage"].items()
+        )
+        assert files["/etc/udev/rules.d/60-ih-io-scheduler.rules"].endswith(
+            f'ATTR{{queue/scheduler}}="{profile["io_scheduler"]}"'
+        )
+        assert not {f["path"] for f in ud_obj["write_files"]} & set(files)
+
+        apply_idx = bootcmd.index("sysctl -q -p /etc/sysctl.d/60-ih-tuning.conf")
+        assert bootcmd.index("systemctl daemon-reload") > apply_idx
+        assert "/usr/local/bin/bootcmd" in bootcmd[-1]
+        assert apply_idx < len(bootcmd) - 1
@@ -0,0 +1,348 @@
+"""
+Unit tests for the materialize_secrets.py secret file renderer.
+
+Secrets come from a mocked boto3 client; files are written to a temporary
+directory.
+"""
+
+import json
+import stat
+import sys
+from pathlib import Path
+from unittest.mock import Mock, patch
+
+import pytest
+from botocore.exceptions import ClientError
+
+# Add the script directories to the path so we can import them
+FILES_DIR = Path(__file__).parent.parent / "files"
+sys.path.insert(0, str(FILES_DIR / "apt_auth"))
+sys.path.insert(0, str(FILES_DIR / "secret_files"))
+
+from materialize_secrets import materialize_secrets, references, render, write_atomic
+
+DB_SECRET = "arn:aws:secretsmanager:us-west-2:123456789012:secret:db"
+TOKEN_PARAMETER = "arn:aws:ssm:us-west-2:123456789012:parameter/myapp/token"
+
+
+@pytest.fixture
+def clients() -> dict:
+    """
+    Secrets Manager and SSM clients with one secret each.
+
+    :return: Mock clients by service name
+    """
+    secretsmanager = Mock()
+    secretsmanager.batch_get_secret_value.return_value = {
+        "SecretValues": [
+            {
+                "ARN": f"{DB_SECRET}-AbCdEf",
+                "Name": "db",
+                "SecretString": json.dumps({"user": "app", "password": "s3cr3t"}),
+            }
+        ],
+        "Errors": [],
+    }
+    ssm = Mock()
+    ssm.get_parameters.return_value = {
+        "Parameters": [
+            {"Name": "/myapp/token", "ARN": TOKEN_PARAMETER, "Value": "tok-123"}
+        ],
+        "InvalidParameters": [],
+    }
+    return {"secretsmanager": secretsmanager, "ssm": ssm}
+
+
+def write_inputs(tmp_path: Path, files: list, store: dict = None) -> str:
+    """
+    Write secret definitions as bootcmd does.
+
+    :param tmp_path: Pytest temporary directory fixture
+    :param files: File definitions
+    :param store: Store definitions
+    :return: Path of the JSON file
+    """
+    inputs = tmp_path / "secret-files.json"
+    inputs.write_text(json.dumps({"files": files, "store": store or {}}))
+    return str(inputs)
+
+
+def test_references_and_render() -> None:
+    """
+    Test that references are listed once and replaced, whole or by JSON key.
+
+    :return: None
+    """
+    content = (
+        f"user={{{{secret:{DB_SECRET}#user}}}}\n"
+        f"password={{{{ secret:{DB_SECRET}#password }}}}\n"
+        f"token={{{{secret:{TOKEN_PARAMETER}}}}}\n"
+    )
+    secrets = {
+        DB_SECRET: json.dumps({"user": "app", "password": "s3cr3t"}),
+        TOKEN_PARAMETER: "tok-123",
+    }
+
+    assert references(
+        {"files": [{"content": content}], "store": {"db_user": f"{DB_SECRET}#user"}}
+    ) == [DB_SECRET, TOKEN_PARAMETER]
+    assert render(content, secrets) == "user=app\npassword=s3cr3t\ntoken=tok-123\n"
+
+
+def test_materialize_secrets(tmp_path: Path, clients: dict) -> None:
+    """
+    Test that all files are rendered from one fetch per ARN, with their
+    permissions, and the marker is written last.
+
+    :param tmp_path: Pytest temporary directory fixture
+    :param clients: Mock clients by service name
+    :return: None
+    """
+    db_conf = tmp_path / "etc" / "myapp" / "db.conf"
+    token = tmp_path / "etc" / "myapp" / "token"
+    inputs = write_inputs(
+        tmp_path,
+        [
+            {
+                "path": str(db_conf),
+                "content": f"password={{{{secret:{DB_SECRET}#password}}}}\n",
+                "permissions": "0640",
+            },
+            {
+                "path": str(token),
+                "content": f"{{{{secret:{TOKEN_PARAMETER}}}}}:{{{{secret:{DB_SECRET}#user}}}}",
+                "permissions": "0600",
+            },
+        ],
+    )
+    marker = tmp_path / "done"
+
+    with patch("generate_apt_auth.boto3.client", side_effect=clients.get):
+        materialize_secrets(inputs, str(marker))
+
+    assert db_conf.read_text() == "password=s3cr3t\n"
+    assert stat.S_IMODE(db_conf.stat().st_mode) == 0o640
+    assert token.read_text() == "tok-123:app"
+    assert stat.S_IMODE(token.stat().st_mode) == 0o600
+    assert marker.exists()
+    clients["secretsmanager"].batch_get_secret_value.assert_called_once_with(
+        SecretIdList=[DB_SECRET]
+    )
+    clients["ssm"].get_parameters.assert_called_once_with(
+        Names=[TOKEN_PARAMETER], WithDecryption=True
+    )
+    assert sorted(p.name for p in db_conf.parent.iterdir()) == ["db.conf", "token"]
+
+
+def test_store_published(tmp_path: Path, clients: dict) -> None:
+    """
+    Test that store keys are published to a root-only JSON file for hiera,
+    from the same fetch as the files.
+
+    :param tmp_path: Pytest temporary directory fixture
+    :param clients: Mock clients by service name
+    :return: None
+    """
+    store = tmp_path / "run" / "ih-secrets" / "secrets.json"
+    inputs = write_inputs(
+        tmp_path,
+        [
+            {
+                "path": str(tmp_path / "db.conf"),
+                "content": f"{{{{secret:{DB_SECRET}#password}}}}",
+                "permissions": "0600",
+            }
+        ],
+        {
+            "myapp::db_password": f"{DB_SECRET}#password",
+            "myapp::token": TOKEN_PARAMETER,
+        },
+    )
+
+    with patch("generate_apt_auth.boto3.client", side_effect=clients.get):
+        materialize_secrets(inputs, str(tmp_path / "done"), str(store))
+
+    assert json.loads(store.read_text()) == {
+        "myapp::db_password": "s3cr3t",
+        "myapp::token": "tok-123",
+    }
+    assert stat.S_IMODE(store.stat().st_mode) == 0o600
+    assert stat.S_IMODE(store.parent.stat().st_mode) == 0o700
+    clients["secretsmanager"].batch_get_secret_value.assert_called_once()
+
+
+def test_apt_auth_shares_the_fetch(tmp_path: Path, clients: dict) -> None:
+    """
+    Test that an ARN that is both an authFrom and a secret reference is
+    fetched once, and the APT auth file is written with the secret files.
+
+    :param tmp_path: Pytest temporary directory fixture
+    :param clients: Mock clients by service name
+    :return: None
+    """
+    apt_auth = tmp_path / "apt-auth.json"
+    apt_auth.write_text(
+        json.dumps([{"machine": "repo.example.com", "authFrom": DB_SECRET}])
+    )
+    auth_file = tmp_path / "auth.conf.d" / "50user"
+    inputs = write_inputs(
+        tmp_path,
+        [
+            {
+                "path": str(tmp_path / "db.conf"),
+                "content": f"{{{{secret:{DB_SECRET}#password}}}}",
+                "permissions": "0600",
+            }
+        ],
+    )
+
+    with patch("generate_apt_auth.boto3.client", side_effect=clients.get):
+        materialize_secrets(
+            inputs,
+            str(tmp_path / "done"),
+            apt_auth=str(apt_auth),
+            apt_auth_file=str(auth_file),
+        )
+
+    # The first field of the JSON secret is the login, as in generate_apt_auth.
+    assert auth_file.read_text() == (
+        "machine repo.example.com login user password app\n"
+    )
+    assert stat.S_IMODE(auth_file.stat().st_mode) == 0o600
+    assert (tmp_path / "db.conf").read_text() == "s3cr3t"
+    clients["secretsmanager"].batch_get_secret_value.assert_called_once_with(
+        SecretIdList=[DB_SECRET]
+    )
+
+
+def test_unresolved_apt_auth_is_not_fatal(
+    tmp_path: Path, clients: dict, caplog
+) -> None:
+    """
+    Test that a failing authFrom is logged and skipped: the secret files
+    and the marker are written, the APT auth file is not.
+
+    :param tmp_path: Pytest temporary directory fixture
+    :param clients: Mock clients by service name
+    :param caplog: Pytest log capture fixture
+    :return: None
+    """
+    clients["ssm"].get_parameters.return_value = {
+        "Parameters": [],
+        "InvalidParameters": [TOKEN_PARAMETER],
+    }
+    apt_auth = tmp_path / "apt-auth.json"
+    apt_auth.write_text(
+        json.dumps([{"machine": "repo.example.com", "authFrom": TOKEN_PARAMETER}])
+    )
+    auth_file = tmp_path / "50user"
+    inputs = write_inputs(
+        tmp_path,
+        [
+            {
+                "path": str(tmp_path / "db.conf"),
+                "content": f"{{{{secret:{DB_SECRET}#password}}}}",
+                "permissions": "0600",
+            }
+        ],
+    )
+
+    with patch("generate_apt_auth.boto3.client", side_effect=clients.get):
+        materialize_secrets(
+            inputs,
+            str(tmp_path / "done"),
+            apt_auth=str(apt_auth),
+            apt_auth_file=str(auth_file),
+        )
+
+    assert (tmp_path / "db.conf").read_text() == "s3cr3t"
+    assert (tmp_path / "done").exists()
+    assert not auth_file.exists()
+    assert [r.name for r in caplog.records if r.levelname == "ERROR"] == [
+        "generate_apt_auth"
+    ]
+
+
+def test_unresolved_secret_writes_nothing(tmp_path: Path, clients: dict) -> None:
+    """
+    Test that no file and no marker is written when a secret is missing.
+
+    :param tmp_path: Pytest temporary directory fixture
+    :param clients: Mock clients by service name
+    :return: None
+    """
+    clients["ssm"].get_parameters.return_value = {
+        "Parameters": [],
+        "InvalidParameters": [TOKEN_PARAMETER],
+    }
+    inputs = write_inputs(
+        tmp_path,
+        [
+            {
+                "path": str(tmp_path / "db.conf"),
+                "content": f"{{{{secret:{DB_SECRET}#password}}}}",
+                "permissions": "0600",
+            },
+        ],
+        {"myapp::token": TOKEN_PARAMETER},
+    )
+
+    with patch(
+        "generate_apt_auth.boto3.client", side_effect=clients.get
+    ), pytest.raises(ClientError) as exc_info:
+        materialize_secrets(inputs, str(tmp_path / "done"), str(tmp_path / "store"))
+
+    assert exc_info.value.response["Error"]["Code"] == "ParameterNotFound"
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["secret-files.json"]
+
+
+def test_missing_json_key_writes_nothing(tmp_path: Path, clients: dict) -> None:
+    """
+    Test that a #key the secret does not have fails before any file is written.
+
+    :param tmp_path: Pytest temporary directory fixture
+    :param clients: Mock clients by service name
+    :return: None
+    """
+    inputs = write_inputs(
+        tmp_path,
+        [
+            {
+                "path": str(tmp_path / "user"),
+                "content": f"{{{{secret:{DB_SECRET}#user}}}}",
+                "permissions": "0600",
+            },
+            {
+                "path": str(tmp_path / "db.conf"),
+                "content": f"{{{{secret:{DB_SECRET}#port}}}}",
+                "permissions": "0600",
+            },
+        ],
+    )
+
+    with patch(
+        "generate_apt_auth.boto3.client", side_effect=clients.get
+    ), pytest.raises(KeyError):
+        materialize_secrets(inputs, str(tmp_path / "done"))
+
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["secret-files.json"]
+
+
+def test_write_atomic_replaces_file(tmp_path: Path) -> None:
+    """
+    Test that an existing file is replaced, not rewritten in place.
+
+    :param tmp_path: Pytest temporary directory fixture
+    :return: None
+    """
+    path = tmp_path / "db.conf"
+    path.write_text("old")
+    path.chmod(0o644)
+    old_inode = path.stat().st_ino
+
+    write_atomic(str(path), "new", "0600")
+
+    assert path.read_text() == "new"
+    assert stat.S_IMODE(path.stat().st_mode) == 0o600
+    assert path.stat().st_ino != old_inode
+    assert [p.name for p in tmp_path.iterdir()] == ["db.conf"]
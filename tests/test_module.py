@@ -1,13 +1,14 @@
 import json
-from base64 import b64decode
-from os import path as osp, remove
-from shutil import rmtree
+from hashlib import sha256
+from os import path as osp
 from textwrap import dedent
 
 import pytest
-from mimeparse import parse_mime_type
-from pytest_infrahouse import terraform_apply
-from yaml import load, Loader
+
+from tests.conftest import MODULE_ROOT
+
+# fs_mntops the module adds to the var.mounts entries ih-bootstrap mounts.
+BOOTSTRAP_MNTOPS = "noauto,x-systemd.automount"
 
 
 @pytest.mark.parametrize("aws_provider_version", ["~> 6.0"], ids=["aws-6"])
@@ -127,64 +128,43 @@ def test_module(
     expected_mount_packages,
     forbidden_mount_packages,
     keep_after,
+    valid_userdata,
+    terraform_workdir,
+    cached_terraform_apply,
 ):
-    terraform_dir = "test_data"
-    module_dir = osp.join(terraform_dir, "test_module")
-
-    # Delete .terraform directory and .terraform.lock.hcl to allow provider version changes
-    terraform_dir_path = osp.join(module_dir, ".terraform")
-    lock_file_path = osp.join(module_dir, ".terraform.lock.hcl")
-
-    try:
-        rmtree(terraform_dir_path)
-    except FileNotFoundError:
-        pass
-
-    try:
-        remove(lock_file_path)
-    except FileNotFoundError:
-        pass
-
-    # Update provider version
-    with open(f"{module_dir}/terraform.tf", "w") as fp:
-        fp.write(f"""
-            terraform {{
-                required_version = "~> 1.0"
-                required_providers {{
-                    aws = {{
-                      source  = "hashicorp/aws"
-                      version = "{aws_provider_version}"
-                    }}
-                    cloudinit = {{
-                      source  = "hashicorp/cloudinit"
-                        version = "~> 2.3"
-                    }}                    
-                  }}
-                }}
-            """)
+    module_dir = terraform_workdir("test_module", aws_provider_version)
 
     with open(osp.join(module_dir, "terraform.tfvars"), "w") as fp:
         fp.write(dedent(f"""
                 mounts = {mounts or "null"}
                 """))
 
-    with terraform_apply(
-        module_dir,
-        destroy_after=not keep_after,
-        json_output=True,
-    ) as tf_output:
-        userdata = b64decode(tf_output["userdata"]["value"]).decode()
-        assert userdata
-        yaml_userdata = (
-            parse_mime_type(userdata)[2]["boundary"]
-            .split("#cloud-config")[1]
-            .replace("--MIMEBOUNDARY--", "")
-        )
-        ud_obj = load(yaml_userdata, Loader=Loader)
+    with cached_terraform_apply(module_dir, destroy_after=not keep_after) as tf_output:
+        ud_obj = valid_userdata(tf_output["userdata"]["value"])
+        bootstrap_lines = next(
+            f["content"]
+            for f in ud_obj["write_files"]
+            if f["path"] == "/usr/local/bin/ih-bootstrap"
+        ).splitlines()
         if mounts:
-            assert ud_obj["mounts"] == expected_mounts
+            # cc_mounts writes every entry to /etc/fstab, with noauto so its
+            # unbounded `mount -a` skips them, and the bootstrap mounts them
+            # concurrently, nofail entries as optional.
+            assert ud_obj["mounts"] == [
+                [*entry[:3], f"{entry[3]},{BOOTSTRAP_MNTOPS}", *entry[4:]]
+                for entry in expected_mounts
+            ]
+            assert "mount -a" not in bootstrap_lines
+            group_idx = bootstrap_lines.index(
+                '_ih_run_parallel mounts "${_ih_group[@]}"'
+            )
+            for entry in expected_mounts:
+                kind = "optional" if "nofail" in entry[3].split(",") else "required"
+                quoted = f"'_ih_mount {kind} '\\''{entry[1]}'\\'''"
+                assert quoted in bootstrap_lines[:group_idx]
         else:
             assert "mounts" not in ud_obj
+            assert "_ih_mount() {" not in bootstrap_lines
 
         packages = ud_obj.get("packages", [])
         for pkg in expected_mount_packages:
@@ -219,3 +199,49 @@ def test_module(
         ):
             assert unit in bootcmd[0], f"{unit} missing from stop command: {bootcmd[0]}"
             assert unit in bootcmd[1], f"{unit} missing from mask command: {bootcmd[1]}"
+
+        # Secret resolution and the InfraHouse repo installer are both
+        # network-bound, so they run concurrently in a single subshell that
+        # joins them before package_update. Every helper must be written out
+        # before that entry runs.
+        join_idx, join_cmd = next(
+            (idx, cmd)
+            for idx, cmd in enumerate(bootcmd)
+            if "/usr/local/bin/generate_apt_auth.sh &" in cmd
+        )
+        assert join_cmd.startswith("(AWS_DEFAULT_REGION=")
+        assert "/usr/local/bin/bootcmd; rc=$?; wait; exit $rc)" in join_cmd
+        for helper in (
+            "base64 -d /var/tmp/apt-auth.json.b64 > /var/tmp/apt-auth.json",
+            "chmod +x /usr/local/bin/generate_apt_auth.sh",
+            "chmod +x /usr/local/bin/bootcmd",
+        ):
+            assert helper in bootcmd[:join_idx], f"{helper} must run before {join_cmd}"
+
+        # Puppet profiling is opt-in; nothing of it is rendered by default.
+        paths = [f["path"] for f in ud_obj["write_files"]]
+        assert "/usr/local/bin/ih-puppet-profile" not in paths
+
+        # Per-section hashes match the rendered sections, so pipelines can
+        # tell which part of userdata a change touches.
+        hashes = tf_output["userdata_section_hashes"]["value"]
+        bootstrap = next(
+            f["content"]
+            for f in ud_obj["write_files"]
+            if f["path"] == "/usr/local/bin/ih-bootstrap"
+        )
+        assert hashes["bootstrap_script"] == sha256(bootstrap.encode()).hexdigest()
+        with open(osp.join(MODULE_ROOT, "files", "bootcmd.sh"), "rb") as fp:
+            assert (
+                hashes["bootcmd_helpers"]["bootcmd.sh"] == sha256(fp.read()).hexdigest()
+            )
+        assert set(hashes) == {
+            "bootcmd",
+            "bootcmd_helpers",
+            "write_files",
+            "apt_sources",
+            "packages",
+            "mounts",
+            "bootstrap_script",
+            "activate_script",
+        }
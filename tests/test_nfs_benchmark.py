@@ -0,0 +1,169 @@
+"""
+Unit tests for tools/nfs_benchmark.py.
+
+exportfs, mount, sysctl and friends are replaced by shell scripts on PATH,
+so the "NFS mount" is the local scratch directory; real numbers need root
+and nfs-kernel-server.
+"""
+
+import json
+from pathlib import Path
+
+import pytest
+
+from nfs_benchmark import (
+    format_results,
+    load_profiles,
+    main,
+    measure_throughput,
+    merge_options,
+    run_benchmark,
+)
+
+
+@pytest.fixture
+def fake_nfs(fake_commands) -> Path:
+    """
+    Put stand-ins for the NFS and tuning commands on PATH.
+
+    :param fake_commands: Command stand-in factory
+    :return: Path of the call log
+    """
+    return fake_commands(
+        {
+            "exportfs": "",
+            "mount": "",
+            "umount": "",
+            "modprobe": "",
+            "tc": "",
+            "sysctl": '[ "$1" = -n ] && echo 42\nexit 0',
+        }
+    )
+
+
+@pytest.mark.parametrize(
+    "mntops, expected",
+    [
+        (
+            "defaults",
+            "_netdev,hard,nconnect=16,nfsvers=4.1,noresvport,retrans=2,"
+            "rsize=1048576,timeo=600,wsize=1048576",
+        ),
+        (
+            "soft,rsize=65536,ro",
+            "_netdev,nconnect=16,nfsvers=4.1,noresvport,retrans=2,"
+            "ro,rsize=65536,soft,timeo=600,wsize=1048576",
+        ),
+        (
+            "resvport,nconnect=4",
+            "_netdev,hard,nconnect=4,nfsvers=4.1,resvport,retrans=2,"
+            "rsize=1048576,timeo=600,wsize=1048576",
+        ),
+        (
+            "",
+            "_netdev,hard,nconnect=16,nfsvers=4.1,noresvport,retrans=2,"
+            "rsize=1048576,timeo=600,wsize=1048576",
+        ),
+        (
+            "vers=3,v4.2",
+            "_netdev,hard,nconnect=16,noresvport,retrans=2,"
+            "rsize=1048576,timeo=600,v4.2,vers=3,wsize=1048576",
+        ),
+    ],
+    ids=["defaults", "caller-wins", "opposite", "empty", "version-alias"],
+)
+def test_merge_options(mntops: str, expected: str) -> None:
+    """
+    Profile options fill in fs_mntops without overriding the caller.
+
+    :param mntops: fs_mntops from var.mounts
+    :param expected: Resulting options
+    :return: None
+    """
+    assert merge_options(mntops, load_profiles()["efs-throughput"]) == expected
+    assert merge_options(mntops, None) == mntops
+
+
+def test_profiles() -> None:
+    """
+    Every profile has the keys the module reads.
+
+    :return: None
+    """
+    profiles = load_profiles()
+
+    assert set(profiles) == {"efs-default", "efs-throughput"}
+    for profile in profiles.values():
+        assert set(profile) == {"options", "sysctl", "sunrpc"}
+        assert "_netdev" in profile["options"]
+    assert "nconnect" not in profiles["efs-default"]["options"]
+
+
+def test_measure_throughput(tmp_path: Path) -> None:
+    """
+    Streams are written, then read back, in full.
+
+    :param tmp_path: Pytest temporary directory fixture
+    :return: None
+    """
+    assert measure_throughput(str(tmp_path), 8, 4, write=True) > 0
+    assert sorted(p.stat().st_size for p in tmp_path.iterdir()) == [2 << 20] * 4
+    assert measure_throughput(str(tmp_path), 8, 4, write=False) > 0
+
+
+def test_run_benchmark(tmp_path: Path, fake_nfs: Path) -> None:
+    """
+    Each profile is mounted for writing and again for reading, with its
+    tuning applied in between and restored after; the export and the netem
+    delay are torn down.
+
+    :param tmp_path: Pytest temporary directory fixture
+    :param fake_nfs: Call log of the command stand-ins
+    :return: None
+    """
+    results = run_benchmark(
+        ["defaults", "efs-throughput"],
+        size_mb=4,
+        jobs=2,
+        delay_ms=1,
+        workdir=str(tmp_path),
+    )
+
+    assert [r.profile for r in results] == ["defaults", "efs-throughput"]
+    assert results[0].options == "defaults"
+    assert "nconnect=16" in results[1].options
+    calls = [line.split()[:2] for line in fake_nfs.read_text().splitlines()]
+    assert calls[0] == ["exportfs", "-o"]
+    assert calls[1] == ["tc", "qdisc"]
+    assert calls[-2:] == [["tc", "qdisc"], ["exportfs", "-u"]]
+    assert [c[0] for c in calls].count("mount") == 4
+    log = fake_nfs.read_text()
+    assert "sysctl -q -w sunrpc.tcp_slot_table_entries=128" in log
+    assert "sysctl -q -w sunrpc.tcp_slot_table_entries=42" in log
+
+
+def test_cli(tmp_path: Path, fake_nfs: Path, capsys) -> None:
+    """
+    --json prints one result per profile; an unknown profile exits 1.
+
+    :param tmp_path: Pytest temporary directory fixture
+    :param fake_nfs: Call log of the command stand-ins
+    :param capsys: Pytest output capture fixture
+    :return: None
+    """
+    args = ["--size-mb", "2", "--jobs", "1", "--workdir", str(tmp_path)]
+
+    assert main(args + ["--json"]) == 0
+    results = json.loads(capsys.readouterr().out)
+    assert [r["profile"] for r in results] == [
+        "defaults",
+        "efs-default",
+        "efs-throughput",
+    ]
+    assert format_results(results).splitlines()[0].split() == [
+        "profile",
+        "write",
+        "read",
+        "options",
+    ]
+    assert main(args + ["--profiles", "nope"]) == 1
@@ -0,0 +1,153 @@
+"""
+Unit tests for tools/plan_benchmark.py.
+
+terraform itself is replaced by a shell script on PATH; the real plan
+timings only make sense where terraform and the providers are installed.
+"""
+
+import json
+from pathlib import Path
+
+import pytest
+
+from plan_benchmark import (
+    MODULE_ROOT,
+    compare,
+    format_results,
+    main,
+    module_block,
+    run_benchmark,
+    write_root_module,
+)
+
+FAKE_TERRAFORM = """#!/bin/sh
+echo "$(ls *.tf | wc -l) $*" >> {calls}
+case "$1" in plan) [ -z "$FAIL_PLAN" ] || {{ echo boom >&2; exit 1; }};; esac
+"""
+
+
+@pytest.fixture
+def fake_terraform(fake_commands) -> Path:
+    """
+    Put a terraform stand-in on PATH that logs its arguments.
+
+    :param fake_commands: Command stand-in factory
+    :return: Path of the call log
+    """
+    return fake_commands({"terraform": FAKE_TERRAFORM})
+
+
+def test_module_blocks_vary_inputs() -> None:
+    """
+    Copies cycle through the optional inputs.
+
+    :return: None
+    """
+    blocks = [module_block(i, "../..") for i in range(10)]
+
+    assert 'module "userdata_0" {' in blocks[0]
+    assert 'output "userdata_9" {' in blocks[9]
+    assert "extra_repos" in blocks[0] and "extra_repos" in blocks[5]
+    assert "extra_repos" not in blocks[1]
+    assert "parallel = [" in blocks[3]
+    assert "mounts = [" in blocks[8]
+    assert "gzip_userdata" in blocks[1] and "gzip_userdata" not in blocks[2]
+    assert "puppet_profiling = true" in blocks[7]
+    assert len({b.split("environment = ")[1].split("\n")[0] for b in blocks}) == 3
+
+
+def test_write_root_module(tmp_path: Path) -> None:
+    """
+    The root module points at this module and uses the offline AWS stub.
+
+    :param tmp_path: Pytest temporary directory fixture
+    :return: None
+    """
+    workdir = tmp_path / "root"
+    write_root_module(str(workdir), 25)
+    (workdir / "stale.tf").write_text("# old")
+    write_root_module(str(workdir), 3, aws_provider_version="~> 5.0")
+
+    main_tf = (workdir / "main.tf").read_text()
+    source = main_tf.split('source      = "')[1].split('"')[0]
+    assert (workdir / source).resolve() == Path(MODULE_ROOT)
+    assert main_tf.count('module "userdata_') == 3
+    providers_tf = (workdir / "providers.tf").read_text()
+    assert 'version = "~> 5.0"' in providers_tf
+    assert "skip_requesting_account_id  = true" in providers_tf
+    assert not (workdir / "stale.tf").exists()
+
+
+def test_run_benchmark(tmp_path: Path, fake_terraform: Path) -> None:
+    """
+    Every count is initialized once and planned ``repeat`` times.
+
+    :param tmp_path: Pytest temporary directory fixture
+    :param fake_terraform: Call log of the terraform stand-in
+    :return: None
+    """
+    results = run_benchmark([1, 4], repeat=2, workdir=str(tmp_path / "root"))
+
+    assert [r.count for r in results] == [1, 4]
+    assert all(r.runs == 2 and r.seconds >= 0 and r.max_rss_mb > 0 for r in results)
+    calls = [line.split()[1] for line in fake_terraform.read_text().splitlines()]
+    assert calls == ["init", "plan", "plan", "init", "plan", "plan"]
+
+
+def test_compare() -> None:
+    """
+    Growth beyond the tolerance in time or memory is a regression.
+
+    :return: None
+    """
+    baseline = [
+        {"count": 10, "seconds": 2.0, "max_rss_mb": 200.0, "runs": 3},
+        {"count": 50, "seconds": 8.0, "max_rss_mb": 400.0, "runs": 3},
+    ]
+    results = [
+        {"count": 10, "seconds": 2.3, "max_rss_mb": 210.0, "runs": 3},
+        {"count": 50, "seconds": 10.0, "max_rss_mb": 500.0, "runs": 3},
+        {"count": 100, "seconds": 20.0, "max_rss_mb": 800.0, "runs": 3},
+    ]
+
+    assert compare(results, baseline, tolerance=0.2) == [
+        "50 modules: seconds 8.0s -> 10.0s (+25%)",
+        "50 modules: max_rss_mb 400.0 MiB -> 500.0 MiB (+25%)",
+    ]
+    assert compare(results, baseline, tolerance=0.3) == []
+
+
+def test_format_results() -> None:
+    """
+    The table shows the per-module cost.
+
+    :return: None
+    """
+    table = format_results(
+        [{"count": 50, "seconds": 8.0, "max_rss_mb": 400.0, "runs": 3}]
+    ).splitlines()
+
+    assert table[1].split() == ["50", "8.000s", "160.0", "400.0", "MiB"]
+
+
+def test_cli(tmp_path: Path, fake_terraform: Path, capsys, monkeypatch) -> None:
+    """
+    --json output works as a baseline; terraform errors exit 1.
+
+    :param tmp_path: Pytest temporary directory fixture
+    :param fake_terraform: Call log of the terraform stand-in
+    :param capsys: Pytest output capture fixture
+    :param monkeypatch: Pytest monkeypatch fixture
+    :return: None
+    """
+    args = ["run", "--counts", "2", "--repeat", "1", "--workdir", str(tmp_path / "r")]
+    assert main(args + ["--json"]) == 0
+    baseline = tmp_path / "baseline.json"
+    baseline.write_text(capsys.readouterr().out)
+    assert json.loads(baseline.read_text())[0]["count"] == 2
+
+    # Generous tolerance: the stand-in's timings are noise.
+    assert main(args + ["--baseline", str(baseline), "--tolerance", "100"]) == 0
+
+    monkeypatch.setenv("FAIL_PLAN", "1")
+    assert main(args) == 1
@@ -0,0 +1,134 @@
+"""
+Unit tests for the puppet_profile.py summarizer.
+
+The fixtures in test_data/puppet_reports are trimmed copies of the files
+``ih-puppet apply`` leaves in /opt/puppetlabs/puppet/cache/state.
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+import yaml
+
+# Add the script directory to the path so we can import it
+SCRIPT_DIR = Path(__file__).parent.parent / "files" / "puppet_profile"
+sys.path.insert(0, str(SCRIPT_DIR))
+
+from puppet_profile import format_profile, load_yaml, slowest_resources, write_profile
+
+REPORTS_DIR = Path(__file__).parent.parent / "test_data" / "puppet_reports"
+SUMMARY = REPORTS_DIR / "last_run_summary.yaml"
+REPORT = REPORTS_DIR / "last_run_report.yaml"
+
+
+def test_load_report_with_ruby_tags() -> None:
+    """
+    The report's ``!ruby/object`` tags are loaded as plain mappings.
+
+    :return: None
+    """
+    report = load_yaml(str(REPORT))
+
+    assert report["environment"] == "development"
+    assert report["resource_statuses"]["Package[nginx]"]["line"] == 12
+
+
+def test_slowest_resources() -> None:
+    """
+    Resources are ordered by evaluation time and cut to ``top``.
+
+    :return: None
+    """
+    slowest = slowest_resources(load_yaml(str(REPORT)), 3)
+
+    assert [r["resource"] for r in slowest] == [
+        "Package[nginx]",
+        "Exec[warm-cache]",
+        "Service[nginx]",
+    ]
+    assert slowest[0]["evaluation_time"] == pytest.approx(45.201338)
+    assert slowest[0]["file"] == "/opt/puppet-code/modules/profile/manifests/web.pp"
+
+
+def test_format_profile() -> None:
+    """
+    The profile has the run phases, per-type totals and slowest resources.
+
+    :return: None
+    """
+    profile = format_profile(load_yaml(str(SUMMARY)), load_yaml(str(REPORT)), 2)
+    lines = profile.splitlines()
+
+    assert "Catalog compile (config_retrieval): 3.21s" in lines
+    assert "Catalog application: 78.45s" in lines
+    assert "Total: 85.10s" in lines
+    assert "Resources: 5 total, 3 changed, 0 failed" in lines
+
+    by_type = lines[lines.index("Time by resource type:") + 1 :]
+    assert by_type[0].split() == ["45.201s", "package"]
+    # Run phases are not resource types.
+    assert not any(l.split()[-1] == "total" for l in by_type if l.startswith(" "))
+
+    top = lines[lines.index("Top 2 slowest resources:") + 1 :]
+    assert top == [
+        "     45.201s  Package[nginx] changed"
+        "  (/opt/puppet-code/modules/profile/manifests/web.pp:12)",
+        "     12.104s  Exec[warm-cache] changed"
+        "  (/opt/puppet-code/modules/profile/manifests/web.pp:30)",
+    ]
+
+
+def test_format_profile_empty_report() -> None:
+    """
+    A run without resource statuses still yields the phase times.
+
+    :return: None
+    """
+    profile = format_profile(load_yaml(str(SUMMARY)), {}, 20)
+
+    assert profile.endswith("Top 20 slowest resources:\n")
+    assert "Environment: unknown" in profile
+
+
+def test_write_profile(tmp_path: Path) -> None:
+    """
+    The profile is written to the output path.
+
+    :param tmp_path: Pytest temporary directory fixture
+    :return: None
+    """
+    output = tmp_path / "puppet-profile.log"
+
+    write_profile(str(SUMMARY), str(REPORT), str(output), 20)
+
+    assert output.read_text().startswith("Puppet run profile\n")
+    assert not (tmp_path / "puppet-profile.log.tmp").exists()
+
+
+def test_write_profile_missing_report(tmp_path: Path) -> None:
+    """
+    A missing report raises FileNotFoundError and writes nothing.
+
+    :param tmp_path: Pytest temporary directory fixture
+    :return: None
+    """
+    output = tmp_path / "puppet-profile.log"
+
+    with pytest.raises(FileNotFoundError):
+        write_profile(str(SUMMARY), str(tmp_path / "missing.yaml"), str(output), 20)
+    assert not output.exists()
+
+
+def test_write_profile_invalid_yaml(tmp_path: Path) -> None:
+    """
+    A corrupt summary raises yaml.YAMLError.
+
+    :param tmp_path: Pytest temporary directory fixture
+    :return: None
+    """
+    summary = tmp_path / "last_run_summary.yaml"
+    summary.write_text("time: [unterminated\n")
+
+    with pytest.raises(yaml.YAMLError):
+        write_profile(str(summary), str(REPORT), str(tmp_path / "out.log"), 20)
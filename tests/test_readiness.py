@@ -0,0 +1,119 @@
+"""
+Tests for files/readiness/ih-readiness-gate.sh and ih-background-runcmd.sh.
+"""
+
+import subprocess
+import time
+from pathlib import Path
+
+from tests.conftest import MODULE_ROOT
+
+GATE = MODULE_ROOT / "files" / "readiness" / "ih-readiness-gate.sh"
+BACKGROUND = MODULE_ROOT / "files" / "readiness" / "ih-background-runcmd.sh"
+
+
+def run_script(script: Path, *args: str, **env: str) -> subprocess.CompletedProcess:
+    """
+    Run one of the readiness scripts.
+
+    :param script: Script to run
+    :param args: Command line arguments
+    :param env: Extra environment variables
+    :return: Completed process with text output
+    """
+    return subprocess.run(
+        ["bash", str(script), *args],
+        capture_output=True,
+        text=True,
+        check=False,
+        env={"PATH": "/usr/bin:/bin", **env},
+    )
+
+
+def test_gate_waits_for_checks(tmp_path: Path) -> None:
+    """
+    The gate passes once every check passes; checks are polled concurrently.
+
+    :param tmp_path: Pytest temporary directory fixture
+    :return: None
+    """
+    flag = tmp_path / "ready"
+    start = time.monotonic()
+
+    result = run_script(
+        GATE,
+        "--timeout",
+        "10",
+        "--interval",
+        "1",
+        f"sleep 1 && touch {flag}",
+        f"test -f {flag}",
+        "true",
+    )
+
+    assert result.returncode == 0, result.stderr
+    assert time.monotonic() - start < 5
+    assert result.stdout.splitlines()[-1].startswith("ih-readiness-gate: ready after")
+    assert sum(" passed after " in line for line in result.stdout.splitlines()) == 3
+
+
+def test_gate_times_out() -> None:
+    """
+    A check still failing at the deadline fails the gate with its last
+    output; a hanging check is cut off at the deadline.
+
+    :return: None
+    """
+    start = time.monotonic()
+
+    result = run_script(
+        GATE, "--timeout", "2", "--interval", "1", "echo not yet; false", "sleep 60"
+    )
+
+    assert result.returncode == 1
+    assert time.monotonic() - start < 15
+    assert "not ready after 2s" in result.stderr
+    assert "    not yet" in result.stderr
+    assert "2 of 2 check(s) failed" in result.stderr
+
+
+def test_background_reports_failures(tmp_path: Path) -> None:
+    """
+    A failing step does not stop the ones after it; failures are listed in
+    the status directory and counted in the exit code.
+
+    :param tmp_path: Pytest temporary directory fixture
+    :return: None
+    """
+    out = tmp_path / "out"
+
+    result = run_script(
+        BACKGROUND,
+        f"echo one >> {out}",
+        "exit 3",
+        f"echo 'two three' >> {out}",
+        "false",
+        IH_BACKGROUND_STATUS_DIR=str(tmp_path),
+    )
+
+    assert result.returncode == 2
+    assert out.read_text() == "one\ntwo three\n"
+    assert (tmp_path / "ih-background-done").exists()
+    assert (tmp_path / "ih-background-failed").read_text() == "exit 3\nfalse\n"
+    assert "ih-background: exit 3 in " in result.stdout
+
+
+def test_background_success(tmp_path: Path) -> None:
+    """
+    Without failures no failure list is left behind, even from a previous run.
+
+    :param tmp_path: Pytest temporary directory fixture
+    :return: None
+    """
+    (tmp_path / "ih-background-failed").write_text("stale\n")
+
+    result = run_script(BACKGROUND, "true", IH_BACKGROUND_STATUS_DIR=str(tmp_path))
+
+    assert result.returncode == 0, result.stderr
+    assert (tmp_path / "ih-background-done").exists()
+    assert not (tmp_path / "ih-background-failed").exists()
@@ -1,6 +1,5 @@
 import json
-from os import path as osp, remove
-from shutil import rmtree
+from os import path as osp
 from textwrap import dedent
 from time import sleep, time
 
@@ -9,12 +8,12 @@ from infrahouse_core.aws.ec2_instance import EC2Instance
 from infrahouse_core.timeout import timeout
 from pytest_infrahouse import terraform_apply
 
-from tests.conftest import (
-    LOG,
-    TERRAFORM_ROOT_DIR,
-)
+from tests.conftest import LOG, terraform_init
 
 
+# Keep the AWS cases on one pytest-xdist worker (--dist loadgroup) so they
+# share one service_network instead of creating one per worker.
+@pytest.mark.xdist_group("aws")
 @pytest.mark.parametrize("aws_provider_version", ["~> 6.0"], ids=["aws-6"])
 @pytest.mark.parametrize("ami_vendor", ["ubuntu", "infrahouse"])
 def test_module(
@@ -24,42 +23,11 @@ def test_module(
     keep_after,
     aws_region,
     ami_vendor,
+    terraform_workdir,
 ):
     subnet_private_id = service_network["subnet_private_ids"]["value"][0]
 
-    terraform_module_dir = osp.join(TERRAFORM_ROOT_DIR, "single_instance")
-
-    # Delete .terraform directory and .terraform.lock.hcl to allow provider version changes
-    terraform_dir_path = osp.join(terraform_module_dir, ".terraform")
-    lock_file_path = osp.join(terraform_module_dir, ".terraform.lock.hcl")
-
-    try:
-        rmtree(terraform_dir_path)
-    except FileNotFoundError:
-        pass
-
-    try:
-        remove(lock_file_path)
-    except FileNotFoundError:
-        pass
-
-    # Update provider version
-    with open(f"{terraform_module_dir}/terraform.tf", "w") as fp:
-        fp.write(f"""
-            terraform {{
-                required_version = "~> 1.0"
-                required_providers {{
-                    aws = {{
-                      source  = "hashicorp/aws"
-                      version = "{aws_provider_version}"
-                    }}
-                    cloudinit = {{
-                      source  = "hashicorp/cloudinit"
-                        version = "~> 2.3"
-                    }}                    
-                  }}
-                }}
-            """)
+    terraform_module_dir = terraform_workdir("single_instance", aws_provider_version)
 
     with open(osp.join(terraform_module_dir, "terraform.tfvars"), "w") as fp:
         fp.write(dedent(f"""
@@ -72,6 +40,7 @@ def test_module(
                     role_arn        = "{test_role_arn}"
                     """))
 
+    terraform_init(terraform_module_dir)
     with terraform_apply(
         terraform_module_dir,
         json_output=True,
@@ -126,3 +95,7 @@ def test_module(
             ami_vendor,
             prov_end - prov_start,
         )
+        # Per-module wall-clock times (config-bootcmd, package install,
+        # runcmd, ...) so bootstrap changes can be compared across runs.
+        exit_code, cout, _ = instance.execute_command("cloud-init analyze blame")
+        LOG.info("cloud-init analyze blame (exit code %s):\n%s", exit_code, cout)
@@ -0,0 +1,127 @@
+"""
+Unit tests for the per-test terraform workdirs and the rendered userdata
+cache set up in conftest.py.
+"""
+
+import os
+from pathlib import Path
+
+from tests.conftest import (
+    prepare_terraform_workdir,
+    userdata_cache_key,
+    write_terraform_tf,
+)
+
+
+def make_fixture(root: Path) -> Path:
+    module = root / "module"
+    fixture = module / "test_data" / "case"
+    (fixture / "ssh_keys").mkdir(parents=True)
+    (fixture / "main.tf").write_text(
+        'module "test" {\n  source      = "../../"\n  role        = "foo"\n}\n'
+    )
+    (fixture / "user-data.tf").write_text(
+        'module "user-data" {\n  source = "./../../"\n}\n'
+        'module "remote" {\n  source = "registry.infrahouse.com/infrahouse/x/aws"\n}\n'
+    )
+    (fixture / "ssh_keys" / "key.pub").write_text("ssh-rsa AAAA")
+    (fixture / ".terraform.lock.hcl").write_text("# stale lock")
+    return fixture
+
+
+def test_module_sources_are_rebased(tmp_path: Path) -> None:
+    """
+    Local module sources still resolve to the module from the copy;
+    registry sources are left alone.
+
+    :param tmp_path: Pytest temporary directory fixture
+    :return: None
+    """
+    fixture = make_fixture(tmp_path)
+    workdir = tmp_path / "work" / "test_case" / "case"
+
+    prepare_terraform_workdir(str(fixture), str(workdir))
+
+    main_tf = (workdir / "main.tf").read_text()
+    assert 'source      = "../../../module"' in main_tf
+    assert (workdir / "../../../module").resolve() == (tmp_path / "module")
+    user_data_tf = (workdir / "user-data.tf").read_text()
+    assert 'source = "../../../module"' in user_data_tf
+    assert 'source = "registry.infrahouse.com/infrahouse/x/aws"' in user_data_tf
+    assert (workdir / "ssh_keys" / "key.pub").read_text() == "ssh-rsa AAAA"
+    assert not (workdir / ".terraform.lock.hcl").exists()
+    # The fixture itself is not touched.
+    assert '"../../"' in (fixture / "main.tf").read_text()
+
+
+def test_state_survives_refresh(tmp_path: Path) -> None:
+    """
+    Refreshing a workdir keeps state and providers from a --keep-after run
+    and drops files that are no longer in the fixture.
+
+    :param tmp_path: Pytest temporary directory fixture
+    :return: None
+    """
+    fixture = make_fixture(tmp_path)
+    workdir = tmp_path / "work" / "case"
+    prepare_terraform_workdir(str(fixture), str(workdir))
+    (workdir / "terraform.tfstate").write_text('{"serial": 7}')
+    (workdir / ".terraform" / "providers").mkdir(parents=True)
+    (workdir / "terraform.tfvars").write_text("role = 1")
+    os.remove(fixture / "user-data.tf")
+
+    prepare_terraform_workdir(str(fixture), str(workdir))
+
+    assert (workdir / "terraform.tfstate").read_text() == '{"serial": 7}'
+    assert (workdir / ".terraform" / "providers").is_dir()
+    assert not (workdir / "terraform.tfvars").exists()
+    assert not (workdir / "user-data.tf").exists()
+
+
+def test_write_terraform_tf(tmp_path: Path) -> None:
+    """
+    terraform.tf pins the requested AWS provider version.
+
+    :param tmp_path: Pytest temporary directory fixture
+    :return: None
+    """
+    write_terraform_tf(str(tmp_path), "~> 6.0")
+
+    text = (tmp_path / "terraform.tf").read_text()
+    assert 'version = "~> 6.0"' in text
+    assert 'source  = "hashicorp/cloudinit"' in text
+
+
+def test_userdata_cache_key(tmp_path: Path, monkeypatch) -> None:
+    """
+    The cache key changes with the inputs and ignores terraform's own files.
+
+    :param tmp_path: Pytest temporary directory fixture
+    :param monkeypatch: Pytest monkeypatch fixture
+    :return: None
+    """
+    workdir = prepare_terraform_workdir(
+        str(make_fixture(tmp_path)), str(tmp_path / "w")
+    )
+    write_terraform_tf(workdir, "~> 6.0")
+    tfvars = Path(workdir) / "terraform.tfvars"
+    tfvars.write_text("puppet_manifest = null\n")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-west-1")
+
+    key = userdata_cache_key(workdir)
+    (Path(workdir) / ".terraform" / "modules").mkdir(parents=True)
+    (Path(workdir) / "terraform.tfstate").write_text("{}")
+    (Path(workdir) / ".terraform.lock.hcl").write_text("# lock")
+    assert userdata_cache_key(workdir) == key
+
+    tfvars.write_text('puppet_manifest = "/tmp/site.pp"\n')
+    assert userdata_cache_key(workdir) != key
+    tfvars.write_text("puppet_manifest = null\n")
+    assert userdata_cache_key(workdir) == key
+
+    write_terraform_tf(workdir, "~> 5.0")
+    assert userdata_cache_key(workdir) != key
+    write_terraform_tf(workdir, "~> 6.0")
+
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    assert userdata_cache_key(workdir) != key
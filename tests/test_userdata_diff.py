@@ -0,0 +1,187 @@
+"""
+Unit tests for tools/userdata_diff.py.
+"""
+
+import json
+from base64 import b64encode
+from copy import deepcopy
+from pathlib import Path
+
+import pytest
+
+from tests.conftest import make_userdata
+from userdata_diff import compare_userdata, main, normalize_content
+
+HELPER = '''#!/usr/bin/env python3
+"""Resolve secrets."""
+import sys
+
+
+def main():
+    """Entry point."""
+    # exit quietly
+    return 0
+
+
+sys.exit(main())
+'''
+
+BOOTSTRAP = "#!/usr/bin/env bash\nset -euo pipefail\n# run puppet\nih-puppet apply\n"
+
+
+def embed(content: str, name: str) -> str:
+    """
+    Embed a helper the way bootcmd does.
+
+    :param content: Helper script
+    :param name: Target file name
+    :return: bootcmd entry
+    """
+    return f"echo '{b64encode(content.encode()).decode()}' > /var/tmp/{name}.b64"
+
+
+CLOUD_CONFIG = {
+    "bootcmd": [
+        "systemctl mask apt-daily.timer",
+        embed(HELPER, "generate_apt_auth.py"),
+        "base64 -d /var/tmp/generate_apt_auth.py.b64 > /usr/local/bin/generate_apt_auth.py",
+    ],
+    "write_files": [
+        {
+            "content": BOOTSTRAP,
+            "path": "/usr/local/bin/ih-bootstrap",
+            "permissions": "0755",
+        },
+        {
+            "content": '{"ih-puppet": {"debug": false}}',
+            "path": "/etc/puppetlabs/facter/facts.d/ih-puppet.json",
+            "permissions": "0644",
+        },
+    ],
+    "packages": ["puppet-code"],
+    "runcmd": ["bash /usr/local/bin/ih-bootstrap"],
+}
+
+
+@pytest.mark.parametrize(
+    "path, old, new, same",
+    [
+        ("/usr/local/bin/x.py", HELPER, HELPER.replace("# exit quietly", "# ok"), True),
+        ("/usr/local/bin/x.py", HELPER, HELPER.replace('"""Entry point."""', ""), True),
+        ("/usr/local/bin/x.py", HELPER, HELPER.replace("return 0", "return 1"), False),
+        ("/usr/local/bin/ih-bootstrap", BOOTSTRAP, BOOTSTRAP + "\n# end\n", True),
+        ("/usr/local/bin/ih-bootstrap", BOOTSTRAP, BOOTSTRAP + "reboot\n", False),
+        ("/etc/x.json", '{"a": 1, "b": 2}', '{\n  "b": 2,\n  "a": 1\n}', True),
+        ("/etc/x.yaml", "a: 1\n", "a: '1'\n", False),
+        ("/etc/motd", "hello\n", "hello  \n\n", True),
+        ("/etc/motd", "# hello\n", "hello\n", False),
+    ],
+)
+def test_normalize_content(path: str, old: str, new: str, same: bool) -> None:
+    """
+    Comments, docstrings and formatting do not count; code and data do.
+
+    :param path: File path on the instance
+    :param old: Current content
+    :param new: New content
+    :param same: Whether the two should normalize to the same value
+    :return: None
+    """
+    assert (normalize_content(old, path) == normalize_content(new, path)) is same
+
+
+def test_identical() -> None:
+    """
+    The same blob is unchanged; only gzip toggled is cosmetic.
+
+    :return: None
+    """
+    value = make_userdata(CLOUD_CONFIG)
+
+    assert compare_userdata(value, value)["classification"] == "unchanged"
+    result = compare_userdata(value, make_userdata(CLOUD_CONFIG, compress=True))
+    assert result["classification"] == "cosmetic"
+    assert set(result["sections"].values()) == {"unchanged"}
+
+
+def test_comment_in_embedded_helper_is_cosmetic() -> None:
+    """
+    A comment edited in a helper shipped through bootcmd is cosmetic.
+
+    :return: None
+    """
+    config = deepcopy(CLOUD_CONFIG)
+    config["bootcmd"][1] = embed(
+        HELPER.replace("# exit quietly", "# nothing to do"), "generate_apt_auth.py"
+    )
+    config["write_files"][0]["content"] = BOOTSTRAP.replace("# run", "# apply")
+
+    result = compare_userdata(make_userdata(CLOUD_CONFIG), make_userdata(config))
+
+    assert result["classification"] == "cosmetic"
+    assert result["sections"]["bootcmd"] == "cosmetic"
+    assert result["files"] == {"/usr/local/bin/ih-bootstrap": "cosmetic"}
+
+
+@pytest.mark.parametrize(
+    "change, section",
+    [
+        (lambda c: c["bootcmd"].append("reboot"), "bootcmd"),
+        (
+            lambda c: c["bootcmd"].__setitem__(
+                1, embed(HELPER.replace("0", "1"), "generate_apt_auth.py")
+            ),
+            "bootcmd",
+        ),
+        (
+            lambda c: c["write_files"][1].__setitem__("permissions", "0600"),
+            "write_files",
+        ),
+        (lambda c: c["write_files"].pop(), "write_files"),
+        (lambda c: c["packages"].append("nginx"), "packages"),
+        (
+            lambda c: c.__setitem__("mounts", [["a", "/b", "nfs4", "d", "0", "0"]]),
+            "mounts",
+        ),
+    ],
+    ids=["bootcmd", "helper-code", "permissions", "file-removed", "packages", "mounts"],
+)
+def test_behavior_changes(change, section: str) -> None:
+    """
+    Changes to what runs or what is installed are behavior-affecting.
+
+    :param change: Mutates the cloud-config
+    :param section: The section expected to be flagged
+    :return: None
+    """
+    config = deepcopy(CLOUD_CONFIG)
+    change(config)
+
+    result = compare_userdata(make_userdata(CLOUD_CONFIG), make_userdata(config))
+
+    assert result["classification"] == "behavior"
+    assert result["sections"][section] == "behavior"
+
+
+def test_cli(tmp_path: Path, capsys) -> None:
+    """
+    Exit 0 for cosmetic changes, 2 for behavior changes, 1 on errors.
+
+    :param tmp_path: Pytest temporary directory fixture
+    :param capsys: Pytest output capture fixture
+    :return: None
+    """
+    old = tmp_path / "old.b64"
+    old.write_text(make_userdata(CLOUD_CONFIG))
+    cosmetic = tmp_path / "cosmetic.b64"
+    cosmetic.write_text(make_userdata(CLOUD_CONFIG, compress=True))
+    config = deepcopy(CLOUD_CONFIG)
+    config["packages"].append("nginx")
+    behavior = tmp_path / "behavior.b64"
+    behavior.write_text(make_userdata(config))
+
+    assert main([str(old), str(cosmetic)]) == 0
+    assert capsys.readouterr().out.startswith("Classification: cosmetic")
+    assert main([str(old), str(behavior), "--json"]) == 2
+    assert json.loads(capsys.readouterr().out)["sections"]["packages"] == "behavior"
+    assert main([str(old), str(tmp_path / "missing.b64")]) == 1
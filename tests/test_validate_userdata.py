@@ -0,0 +1,278 @@
+"""
+Unit tests for tools/validate_userdata.py.
+
+The userdata below is built the same way the cloudinit provider renders the
+module's output: a MIME multipart message with one text/cloud-config part,
+optionally gzipped, base64 encoded.
+"""
+
+from base64 import b64encode
+from copy import deepcopy
+from pathlib import Path
+
+import pytest
+
+from tests.conftest import make_userdata
+from validate_userdata import (
+    UserdataError,
+    decode_userdata,
+    main,
+    module_errors,
+    validate_userdata,
+)
+
+CLOUD_CONFIG = {
+    "bootcmd": ["systemctl stop apt-daily.timer"],
+    "write_files": [
+        {
+            "content": "#!/usr/bin/env bash\nset -euo pipefail\nih-puppet apply\n",
+            "path": "/usr/local/bin/ih-bootstrap",
+            "permissions": "0755",
+        },
+        {"content": "foo content", "path": "/tmp/foo", "permissions": "0600"},
+    ],
+    "mounts": [["fs-1.efs.amazonaws.com:/", "/mnt", "nfs4", "defaults", "0", "0"]],
+    "apt": {
+        "sources": {
+            "foo": {
+                "source": "deb [signed-by=$KEY_FILE] https://foo.com foo main",
+                "key": "bar",
+            }
+        }
+    },
+    "packages": ["puppet-code", "infrahouse-toolkit"],
+    "runcmd": ["bash /usr/local/bin/ih-bootstrap"],
+}
+
+
+@pytest.mark.parametrize("compress", [False, True], ids=["plain", "gzip"])
+def test_valid_userdata(compress: bool) -> None:
+    """
+    The module's rendered shape decodes back and passes every rule.
+
+    :param compress: Whether the userdata is gzipped (gzip_userdata)
+    :return: None
+    """
+    value = make_userdata(CLOUD_CONFIG, compress=compress)
+
+    assert decode_userdata(value) == CLOUD_CONFIG
+    assert validate_userdata(value) == []
+
+
+def test_mounts_need_six_fields() -> None:
+    """
+    Short mounts entries are rejected even though cloud-init accepts them.
+
+    :return: None
+    """
+    config = deepcopy(CLOUD_CONFIG)
+    config["mounts"].append(["/dev/xvdf", "/data", "ext4", "defaults", "0"])
+
+    errors = module_errors(config)
+
+    assert len(errors) == 1
+    assert errors[0].startswith("mounts.1: expected 6 fields")
+
+
+@pytest.mark.parametrize(
+    "permissions, valid",
+    [("0644", True), ("01777", True), ("644", False), (420, False), ("0o644", False)],
+)
+def test_write_files_permissions(permissions, valid: bool) -> None:
+    """
+    Permissions must be a quoted octal string with a leading zero.
+
+    :param permissions: Value of write_files[].permissions
+    :param valid: Whether it should pass
+    :return: None
+    """
+    config = deepcopy(CLOUD_CONFIG)
+    config["write_files"][1]["permissions"] = permissions
+
+    assert (module_errors(config) == []) is valid
+
+
+def test_write_files_paths() -> None:
+    """
+    Relative and duplicate write_files paths are reported.
+
+    :return: None
+    """
+    config = deepcopy(CLOUD_CONFIG)
+    config["write_files"].append({"content": "x", "path": "/tmp/foo"})
+    config["write_files"].append({"content": "x", "path": "etc/bar"})
+
+    assert module_errors(config) == [
+        "write_files.2: duplicate path /tmp/foo",
+        "write_files.3: path 'etc/bar' is not absolute",
+    ]
+
+
+@pytest.mark.parametrize(
+    "source, expected",
+    [
+        (
+            {"source": "deb https://foo.com foo main", "key": "bar"},
+            "must use [signed-by=$KEY_FILE]",
+        ),
+        (
+            {
+                "source": "deb [signed-by=/usr/share/keyrings/foo.gpg] https://foo.com foo main",
+                "keyid": "A627B7760019BA51B903453D37A181B689AD619",
+            },
+            "must use [signed-by=$KEY_FILE]",
+        ),
+        (
+            {"source": "deb [signed-by=$KEY_FILE] https://foo.com foo main"},
+            "needs key or keyid",
+        ),
+    ],
+    ids=["key-unsigned", "keyid-fixed-keyring", "placeholder-without-key"],
+)
+def test_apt_key_file_placeholder(source: dict, expected: str) -> None:
+    """
+    Sources with a key use the $KEY_FILE placeholder, and only they do.
+
+    :param source: apt.sources entry
+    :param expected: Expected error fragment
+    :return: None
+    """
+    config = deepcopy(CLOUD_CONFIG)
+    config["apt"]["sources"]["foo"] = source
+
+    errors = module_errors(config)
+
+    assert len(errors) == 1
+    assert expected in errors[0]
+
+
+def test_bootstrap_script() -> None:
+    """
+    A missing or syntactically broken ih-bootstrap is reported.
+
+    :return: None
+    """
+    broken = deepcopy(CLOUD_CONFIG)
+    broken["write_files"][0]["content"] = "#!/usr/bin/env bash\nif true; then\n"
+    missing = deepcopy(CLOUD_CONFIG)
+    del missing["write_files"][0]
+
+    assert "has a syntax error" in module_errors(broken)[0]
+    assert module_errors(missing) == [
+        "write_files: /usr/local/bin/ih-bootstrap is missing"
+    ]
+
+
+def test_module_lists() -> None:
+    """
+    Explicit module lists must include the modules the emitted keys need,
+    in any stage and any spelling cloud-init accepts.
+
+    :return: None
+    """
+    trimmed = deepcopy(CLOUD_CONFIG)
+    trimmed["cloud_init_modules"] = ["bootcmd", "write-files", "mounts"]
+    trimmed["cloud_config_modules"] = ["cc_apt_configure", "runcmd"]
+    trimmed["cloud_final_modules"] = [
+        "package_update_upgrade_install",
+        ["scripts_user", "always"],
+    ]
+    assert module_errors(trimmed) == []
+
+    trimmed["cloud_final_modules"] = ["package_update_upgrade_install"]
+    trimmed["write_files"].append(
+        {"content": "", "path": "/var/lib/cloud/scripts/per-boot/ih-activate"}
+    )
+    assert module_errors(trimmed) == [
+        "cloud_init_modules/cloud_config_modules/cloud_final_modules:"
+        " module scripts_per_boot is needed for /var/lib/cloud/scripts/per-boot/"
+        " but not listed",
+        "cloud_init_modules/cloud_config_modules/cloud_final_modules:"
+        " module scripts_user is needed for runcmd but not listed",
+    ]
+
+
+def test_schema_errors() -> None:
+    """
+    Schema violations are reported with their path in the cloud-config.
+
+    :return: None
+    """
+    schema = {
+        "$schema": "http://json-schema.org/draft-04/schema#",
+        "type": "object",
+        "properties": {"packages": {"type": "array", "items": {"type": "string"}}},
+    }
+    config = deepcopy(CLOUD_CONFIG)
+    config["packages"].append(["nginx", "1.24"])
+
+    assert validate_userdata(make_userdata(CLOUD_CONFIG), schema) == []
+    assert validate_userdata(make_userdata(config), schema) == [
+        "packages.2: ['nginx', '1.24'] is not of type 'string'"
+    ]
+
+
+def test_undecodable_userdata() -> None:
+    """
+    Garbage and userdata without a cloud-config part raise UserdataError.
+
+    :return: None
+    """
+    with pytest.raises(UserdataError):
+        decode_userdata("not base64!")
+    with pytest.raises(UserdataError):
+        decode_userdata(b64encode(b"#!/bin/bash\necho hi\n").decode())
+
+
+def test_cli(tmp_path: Path, capsys) -> None:
+    """
+    The CLI prints one violation per line and exits non-zero on any.
+
+    :param tmp_path: Pytest temporary directory fixture
+    :param capsys: Pytest output capture fixture
+    :return: None
+    """
+    schema = tmp_path / "schema.json"
+    schema.write_text('{"type": "object"}')
+    good = tmp_path / "good.b64"
+    good.write_text(make_userdata(CLOUD_CONFIG))
+    config = deepcopy(CLOUD_CONFIG)
+    config["mounts"] = [["/dev/xvdf", "/data"]]
+    bad = tmp_path / "bad.b64"
+    bad.write_text(make_userdata(config))
+
+    assert main([str(good), "--schema", str(schema)]) == 0
+    assert main([str(bad), "--schema", str(schema)]) == 1
+    assert capsys.readouterr().out.startswith("mounts.0: expected 6 fields")
+    assert main([str(tmp_path / "missing.b64"), "--schema", str(schema)]) == 1
+
+
+def test_cli_without_schema(tmp_path: Path, monkeypatch) -> None:
+    """
+    Without a schema the CLI exits 2 unless --skip-schema is given.
+
+    :param tmp_path: Pytest temporary directory fixture
+    :param monkeypatch: Pytest monkeypatch fixture
+    :return: None
+    """
+    monkeypatch.setattr("validate_userdata.find_schema", lambda path=None: None)
+    good = tmp_path / "good.b64"
+    good.write_text(make_userdata(CLOUD_CONFIG))
+
+    assert main([str(good)]) == 2
+    assert main([str(good), "--skip-schema"]) == 0
+
+
+def test_cloud_config_schema_available(cloud_config_schema) -> None:
+    """
+    The userdata tests check cloud-init's schema, not only the module rules.
+
+    :param cloud_config_schema: Schema fixture, None without cloud-init
+    :return: None
+    """
+    if cloud_config_schema is None:
+        pytest.skip(
+            "cloud-init schema not found: userdata tests check module rules"
+            " only; install cloud-init or set $CLOUD_INIT_SCHEMA"
+        )
+    assert "properties" in cloud_config_schema
@@ -0,0 +1,156 @@
+"""
+Tests for files/warm_pool/ih-lifecycle-state.sh against a local IMDS stand-in.
+"""
+
+import subprocess
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Iterator, List
+
+import pytest
+
+from tests.conftest import MODULE_ROOT
+
+SCRIPT = MODULE_ROOT / "files" / "warm_pool" / "ih-lifecycle-state.sh"
+TOKEN = "test-token"
+
+
+class FakeIMDS(BaseHTTPRequestHandler):
+    """IMDSv2 stand-in serving a sequence of target lifecycle states."""
+
+    # One entry per GET; None answers 404 (item not available yet).
+    states: List = []
+    requests: List[str] = []
+
+    def do_PUT(self):  # pylint: disable=invalid-name
+        """Issue a session token."""
+        self.requests.append(f"PUT {self.path}")
+        self._reply(200, TOKEN)
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Serve the next lifecycle state to token-bearing requests."""
+        self.requests.append(f"GET {self.path}")
+        if self.headers.get("X-aws-ec2-metadata-token") != TOKEN:
+            self._reply(401, "")
+        elif self.path != "/latest/meta-data/autoscaling/target-lifecycle-state":
+            self._reply(404, "")
+        else:
+            state = self.states.pop(0) if self.states else None
+            if state is None:
+                self._reply(404, "")
+            else:
+                self._reply(200, state)
+
+    def _reply(self, code: int, body: str) -> None:
+        self.send_response(code)
+        self.end_headers()
+        self.wfile.write(body.encode())
+
+    def log_message(self, *args) -> None:  # pylint: disable=arguments-differ
+        pass
+
+
+@pytest.fixture
+def imds() -> Iterator[str]:
+    """
+    Run the IMDS stand-in on a free local port.
+
+    :return: Endpoint URL
+    """
+    FakeIMDS.states = []
+    FakeIMDS.requests = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeIMDS)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+
+def run_script(
+    endpoint: str, attempts: int = 3, *args: str
+) -> subprocess.CompletedProcess:
+    """
+    Run ih-lifecycle-state against ``endpoint``.
+
+    :param endpoint: IMDS endpoint URL
+    :param attempts: Number of polls
+    :param args: Script arguments
+    :return: Completed process with text output
+    """
+    return subprocess.run(
+        ["bash", str(SCRIPT), *args],
+        capture_output=True,
+        text=True,
+        check=False,
+        env={
+            "PATH": "/usr/bin:/bin",
+            "IH_IMDS_ENDPOINT": endpoint,
+            "IH_LIFECYCLE_STATE_ATTEMPTS": str(attempts),
+            "IH_LIFECYCLE_STATE_INTERVAL": "0",
+        },
+    )
+
+
+@pytest.mark.parametrize("state", ["Warmed:Stopped", "InService"])
+def test_state(imds: str, state: str) -> None:
+    """
+    The state is read with an IMDSv2 token.
+
+    :param imds: IMDS stand-in endpoint
+    :param state: Target lifecycle state served
+    :return: None
+    """
+    FakeIMDS.states = [state]
+
+    result = run_script(imds)
+
+    assert result.returncode == 0, result.stderr
+    assert result.stdout == f"{state}\n"
+    assert FakeIMDS.requests[0] == "PUT /latest/api/token"
+
+
+def test_polls_until_available(imds: str) -> None:
+    """
+    A state that is not published yet is polled for.
+
+    :param imds: IMDS stand-in endpoint
+    :return: None
+    """
+    FakeIMDS.states = [None, "InService"]
+
+    result = run_script(imds)
+
+    assert result.stdout == "InService\n"
+    assert len([r for r in FakeIMDS.requests if r.startswith("GET")]) == 2
+
+
+def test_gives_up(imds: str) -> None:
+    """
+    Without a state after all attempts the script fails, so the bootstrap's
+    ERR trap abandons the instance.
+
+    :param imds: IMDS stand-in endpoint
+    :return: None
+    """
+    result = run_script(imds, attempts=2)
+
+    assert result.returncode == 1
+    assert "no target lifecycle state after 2 attempts" in result.stderr
+
+
+def test_wait(imds: str) -> None:
+    """
+    With --wait, Warmed:* states and metadata errors are waited out and the
+    first other state is printed, as for a Warmed:Running or
+    Warmed:Hibernated instance moved into service.
+
+    :param imds: IMDS stand-in endpoint
+    :return: None
+    """
+    FakeIMDS.states = ["Warmed:Running", None, "Warmed:Hibernated", "InService"]
+
+    result = run_script(imds, 1, "--wait")
+
+    assert result.returncode == 0, result.stderr
+    assert result.stdout == "InService\n"
+    assert len([r for r in FakeIMDS.requests if r.startswith("GET")]) == 4
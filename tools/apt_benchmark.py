@@ -0,0 +1,468 @@
+"""
+Benchmark package download time with the apt_acquire profile on a local mirror.
+
+Serves a directory of .deb files as flat APT repositories from several
+loopback addresses, so apt sees several hosts as it does at boot (Ubuntu
+archive, security, InfraHouse). Every request is delayed to stand in for
+the round trip to a real mirror. It then times ``apt-get update`` and
+``apt-get install --download-only`` of the package set in an isolated APT
+root, once with stock settings and once per profile. The profile is
+rendered from the module's template and files/apt/acquire.json and any
+``--set`` overrides.
+
+Without ``--mirror``, the module's Ubuntu-side package set and its
+dependencies are fetched with ``apt-get download``, which needs the host's
+package lists. Run it as root, so apt can write to the scratch APT root::
+
+    sudo python3 tools/apt_benchmark.py --delay-ms 20
+    sudo python3 tools/apt_benchmark.py --mirror /var/cache/apt/archives \\
+        --packages make gcc --set pipeline_depth=1 --json
+"""
+
+import argparse
+import functools
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from dataclasses import asdict, dataclass
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, List, Optional
+
+from benchmark import (
+    Column,
+    argument_parser,
+    format_table,
+    run_cli,
+    seconds,
+    text,
+)
+
+LOG = logging.getLogger(__name__)
+
+MODULE_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+DEFAULTS_PATH = os.path.join(MODULE_ROOT, "files", "apt", "acquire.json")
+TEMPLATE_PATH = os.path.join(MODULE_ROOT, "files", "apt", "acquire.conf.tpl")
+
+# The packages the module installs from the Ubuntu archive; puppet-code and
+# infrahouse-toolkit come from the InfraHouse repository.
+DEFAULT_PACKAGES = ["make", "gcc", "ruby-rubygems", "ruby-dev", "nfs-common"]
+
+
+@dataclass
+class Result:
+    """Median timings of one profile."""
+
+    profile: str
+    runs: int
+    update_s: float
+    download_s: float
+    total_s: float
+
+
+def load_defaults(path: str = DEFAULTS_PATH) -> Dict:
+    """
+    Load the module's apt_acquire defaults.
+
+    :param path: Path to acquire.json.
+    :type path: str
+    :return: Setting values by name.
+    :rtype: dict
+    """
+    with open(path, encoding="utf-8") as fp:
+        return json.load(fp)
+
+
+def render_apt_conf(settings: Dict, path: str = TEMPLATE_PATH) -> str:
+    """
+    Render the module's apt.conf.d profile template.
+
+    Handles the interpolations files/apt/acquire.conf.tpl uses: plain
+    settings and ``max(pipeline_depth, 1)``.
+
+    :param settings: Complete apt_acquire settings.
+    :type settings: dict
+    :param path: Path to acquire.conf.tpl.
+    :type path: str
+    :return: apt.conf content.
+    :rtype: str
+    :raises KeyError: If the template uses a setting that is not given.
+    """
+    with open(path, encoding="utf-8") as fp:
+        template = fp.read()
+    template = template.replace(
+        "${max(pipeline_depth, 1)}", str(max(settings["pipeline_depth"], 1))
+    )
+    return re.sub(r"\$\{(\w+)\}", lambda m: str(settings[m.group(1)]), template)
+
+
+def _run(cmd: List[str], **kwargs) -> str:
+    LOG.debug("Running %s", " ".join(cmd))
+    return subprocess.run(
+        cmd, check=True, capture_output=True, text=True, **kwargs
+    ).stdout
+
+
+def download_packages(packages: List[str], directory: str) -> None:
+    """
+    Download packages and their dependencies with the host's apt.
+
+    :param packages: Package names.
+    :type packages: list
+    :param directory: Where to put the .deb files.
+    :type directory: str
+    :raises subprocess.CalledProcessError: If apt-cache or apt-get fail.
+    """
+    depends = _run(
+        ["apt-cache", "depends", "--recurse", "--no-recommends", "--no-suggests"]
+        + ["--no-conflicts", "--no-breaks", "--no-replaces", "--no-enhances"]
+        + packages
+    )
+    names = sorted(
+        {line for line in depends.splitlines() if line and line[0].isalnum()}
+    )
+    LOG.info("Downloading %d packages into %s", len(names), directory)
+    _run(["apt-get", "download"] + names, cwd=directory)
+
+
+def index_repository(directory: str, debs: List[str]) -> None:
+    """
+    Turn a directory into a flat APT repository holding ``debs``.
+
+    :param directory: Repository directory; the .deb files are linked in.
+    :type directory: str
+    :param debs: Paths of the .deb files.
+    :type debs: list
+    :raises subprocess.CalledProcessError: If dpkg-scanpackages fails.
+    """
+    os.makedirs(directory, exist_ok=True)
+    for deb in debs:
+        target = os.path.join(directory, os.path.basename(deb))
+        if not os.path.exists(target):
+            os.symlink(os.path.abspath(deb), target)
+    packages = _run(["dpkg-scanpackages", "--multiversion", "."], cwd=directory)
+    with open(os.path.join(directory, "Packages"), "w", encoding="utf-8") as fp:
+        fp.write(packages)
+    with gzip.open(os.path.join(directory, "Packages.gz"), "wt") as fp:
+        fp.write(packages)
+    lines = ["Origin: ih-apt-benchmark", "Label: ih-apt-benchmark", "SHA256:"]
+    for name in ("Packages", "Packages.gz"):
+        with open(os.path.join(directory, name), "rb") as fp:
+            data = fp.read()
+        lines.append(f" {hashlib.sha256(data).hexdigest()} {len(data)} {name}")
+    with open(os.path.join(directory, "Release"), "w", encoding="utf-8") as fp:
+        fp.write("\n".join(lines) + "\n")
+
+
+class _DelayedHandler(SimpleHTTPRequestHandler):
+    """Static file handler that answers every request after a delay."""
+
+    protocol_version = "HTTP/1.1"
+    delay = 0.0
+
+    def handle_one_request(self) -> None:
+        # Delay before reading the request, so pipelined requests on one
+        # connection each pay the delay as they would pay the round trip.
+        if self.delay:
+            time.sleep(self.delay)
+        super().handle_one_request()
+
+    def log_message(self, *args) -> None:  # pylint: disable=arguments-differ
+        pass
+
+
+@contextmanager
+def serve(directory: str, address: str, delay_ms: float) -> Iterator[str]:
+    """
+    Serve a directory over HTTP on a free port.
+
+    :param directory: Directory to serve.
+    :type directory: str
+    :param address: Loopback address to bind, e.g. ``127.0.0.2``.
+    :type address: str
+    :param delay_ms: Delay added to every request.
+    :type delay_ms: float
+    :return: Base URL.
+    """
+    handler = type(
+        "Handler",
+        (_DelayedHandler,),
+        {"delay": delay_ms / 1000},
+    )
+    server = ThreadingHTTPServer(
+        (address, 0), functools.partial(handler, directory=directory)
+    )
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://{address}:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def apt_config(root: str) -> str:
+    """
+    Main apt.conf that confines apt to a scratch root.
+
+    The host's sources, apt.conf.d and dpkg status are ignored, so every
+    package of the set is downloaded, as on a fresh image. It is passed in
+    ``APT_CONFIG``: apt reads apt.conf.d before ``-o`` options, so
+    ``Dir::Etc::Parts`` only takes effect from there.
+
+    :param root: Scratch directory.
+    :type root: str
+    :return: apt.conf content.
+    :rtype: str
+    """
+    options = {
+        "Dir::Etc::SourceList": os.path.join(root, "sources.list"),
+        "Dir::Etc::SourceParts": os.path.join(root, "sources.list.d"),
+        "Dir::Etc::Parts": os.path.join(root, "apt.conf.d"),
+        "Dir::Etc::Preferences": os.path.join(root, "preferences"),
+        "Dir::Etc::PreferencesParts": os.path.join(root, "preferences.d"),
+        "Dir::State": os.path.join(root, "state"),
+        "Dir::State::Lists": os.path.join(root, "lists"),
+        "Dir::State::status": os.path.join(root, "status"),
+        "Dir::Cache": os.path.join(root, "cache"),
+        "Dir::Cache::Archives": os.path.join(root, "archives"),
+        "Debug::NoLocking": "1",
+        "APT::Sandbox::User": "root",
+        "Acquire::Languages": "none",
+    }
+    return "".join(f'{key} "{value}";\n' for key, value in options.items())
+
+
+def _prepare_root(root: str, sources: List[str], conf: str) -> None:
+    for name in (
+        "sources.list.d",
+        "apt.conf.d",
+        "preferences.d",
+        "state",
+        "lists/partial",
+        "cache",
+        "archives/partial",
+    ):
+        os.makedirs(os.path.join(root, name), exist_ok=True)
+    files = {
+        "apt.conf": apt_config(root),
+        "sources.list": "".join(f"deb [trusted=yes] {url}/ ./\n" for url in sources),
+        "status": "",
+        os.path.join("apt.conf.d", "80-ih-acquire"): conf,
+    }
+    for name, content in files.items():
+        with open(os.path.join(root, name), "w", encoding="utf-8") as fp:
+            fp.write(content)
+
+
+def measure(root: str, packages: List[str]) -> Dict[str, float]:
+    """
+    Time ``apt-get update`` and the package download in a prepared root.
+
+    :param root: Scratch APT root, with the ``apt.conf`` from
+        :func:`apt_config`.
+    :type root: str
+    :param packages: Packages to download.
+    :type packages: list
+    :return: ``update_s`` and ``download_s``.
+    :rtype: dict
+    :raises subprocess.CalledProcessError: If apt-get fails.
+    """
+    env = dict(os.environ, APT_CONFIG=os.path.join(root, "apt.conf"))
+    start = time.monotonic()
+    _run(["apt-get", "update"], env=env)
+    updated = time.monotonic()
+    _run(
+        ["apt-get", "install", "--download-only", "--yes", "--no-install-recommends"]
+        + packages,
+        env=env,
+    )
+    return {"update_s": updated - start, "download_s": time.monotonic() - updated}
+
+
+def run_benchmark(
+    profiles: Dict[str, str],
+    packages: List[str],
+    mirror: str,
+    hosts: int = 3,
+    delay_ms: float = 20,
+    runs: int = 3,
+) -> List[Result]:
+    """
+    Compare apt.conf profiles on a local multi-host mirror.
+
+    The .deb files in ``mirror`` are spread round-robin over ``hosts``
+    repositories served from 127.0.0.1, 127.0.0.2 and so on. Profiles run
+    alternately so slow drift affects them alike.
+
+    :param profiles: apt.conf content by profile name; ``""`` is stock apt.
+    :type profiles: dict
+    :param packages: Packages to download.
+    :type packages: list
+    :param mirror: Directory with the .deb files of the package set.
+    :type mirror: str
+    :param hosts: Number of repository hosts.
+    :type hosts: int
+    :param delay_ms: Delay added to every HTTP request.
+    :type delay_ms: float
+    :param runs: Runs per profile.
+    :type runs: int
+    :return: One result per profile, with median timings.
+    :rtype: list
+    :raises subprocess.CalledProcessError: If apt-get or dpkg-scanpackages fail.
+    :raises ValueError: If ``mirror`` has no .deb files.
+    """
+    debs = sorted(
+        os.path.join(mirror, name)
+        for name in os.listdir(mirror)
+        if name.endswith(".deb")
+    )
+    if not debs:
+        raise ValueError(f"no .deb files in {mirror}")
+    samples: Dict[str, List[Dict[str, float]]] = {name: [] for name in profiles}
+    with tempfile.TemporaryDirectory() as tmp, ExitStack() as stack:
+        urls = []
+        for idx in range(hosts):
+            repo = os.path.join(tmp, f"repo{idx}")
+            index_repository(repo, debs[idx::hosts])
+            urls.append(
+                stack.enter_context(serve(repo, f"127.0.0.{idx + 1}", delay_ms))
+            )
+        for run in range(runs):
+            for name, conf in profiles.items():
+                root = os.path.join(tmp, f"root-{name}-{run}")
+                _prepare_root(root, urls, conf)
+                sample = measure(root, packages)
+                LOG.info(
+                    "%s run %d: update %.3fs, download %.3fs",
+                    name,
+                    run + 1,
+                    sample["update_s"],
+                    sample["download_s"],
+                )
+                samples[name].append(sample)
+                shutil.rmtree(root)
+    results = []
+    for name, values in samples.items():
+        update = statistics.median(v["update_s"] for v in values)
+        download = statistics.median(v["download_s"] for v in values)
+        results.append(Result(name, len(values), update, download, update + download))
+    return results
+
+
+def format_results(results: List[Dict]) -> str:
+    """
+    Render results as a table, relative to the first profile.
+
+    :param results: Results, as dictionaries.
+    :type results: list
+    :return: Table text.
+    :rtype: str
+    """
+    first = results[0]
+
+    def change(r: Dict) -> str:
+        return f"{r['total_s'] / first['total_s'] - 1 if first['total_s'] else 0:+.0%}"
+
+    return format_table(
+        results,
+        [
+            Column("profile", text("profile"), "<"),
+            Column("runs", text("runs")),
+            Column("update", seconds("update_s")),
+            Column("download", seconds("download_s")),
+            Column("total", seconds("total_s")),
+            Column(f"vs {first['profile']}", change),
+        ],
+    )
+
+
+def _parse_set(values: List[str]) -> Dict:
+    settings = {}
+    for value in values:
+        key, _, raw = value.partition("=")
+        settings[key] = int(raw) if raw.isdigit() else raw
+    return settings
+
+
+def _benchmark(args: argparse.Namespace) -> List[Dict]:
+    settings = {**load_defaults(), **_parse_set(args.set)}
+    profiles = {"stock": "", "apt_acquire": render_apt_conf(settings)}
+    with tempfile.TemporaryDirectory() as download_dir:
+        mirror = args.mirror
+        if mirror is None:
+            download_packages(args.packages, download_dir)
+            mirror = download_dir
+        return [
+            asdict(r)
+            for r in run_benchmark(
+                profiles,
+                args.packages,
+                mirror,
+                args.hosts,
+                args.delay_ms,
+                args.runs,
+            )
+        ]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Command line entry point.
+
+    :param argv: Arguments, defaults to ``sys.argv[1:]``.
+    :return: Process exit code.
+    :rtype: int
+    """
+    parser = argument_parser(__doc__)
+    parser.add_argument(
+        "--packages",
+        nargs="+",
+        default=DEFAULT_PACKAGES,
+        help="Packages to download. Default: %(default)s.",
+    )
+    parser.add_argument(
+        "--mirror",
+        help="Directory with the .deb files of the package set and their"
+        " dependencies. Default: download them with apt-get.",
+    )
+    parser.add_argument(
+        "--set",
+        action="append",
+        default=[],
+        metavar="KEY=VALUE",
+        help="Override an apt_acquire setting for the profile, e.g. retries=2.",
+    )
+    parser.add_argument(
+        "--hosts", type=int, default=3, help="Repository hosts. Default: %(default)s."
+    )
+    parser.add_argument(
+        "--delay-ms",
+        type=float,
+        default=20,
+        help="Delay added to every HTTP request. Default: %(default)s.",
+    )
+    parser.add_argument(
+        "--runs", type=int, default=3, help="Runs per profile. Default: %(default)s."
+    )
+    return run_cli(
+        parser,
+        argv,
+        _benchmark,
+        format_results,
+        {KeyError: lambda err: f"Unknown apt_acquire setting {err}"},
+    )
+
+
+if __name__ == "__main__":
+    sys.exit(main())
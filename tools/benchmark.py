@@ -0,0 +1,222 @@
+"""
+Command line scaffolding shared by the benchmarks in this directory.
+
+A benchmark builds its arguments on :func:`argument_parser`, hands
+:func:`run_cli` a function that measures and returns the results, and renders
+them with :func:`format_table`. :func:`run_cli` sets up logging, turns the
+expected failures into log messages and exit code 1, and prints the results
+as JSON or as the table.
+"""
+
+import argparse
+import json
+import logging
+import subprocess
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple, Type
+
+LOG = logging.getLogger(__name__)
+
+LOG_FORMAT = "%(levelname)s %(name)s:%(filename)s:%(lineno)d %(message)s"
+
+# Arguments of a failed command that make it into the error message.
+MAX_LOGGED_ARGS = 8
+
+Errors = Dict[Type[Exception], Callable[[Exception], str]]
+
+
+class Column(NamedTuple):
+    """One table column: its header, how to render a result, alignment."""
+
+    header: str
+    cell: Callable[[Dict], str]
+    align: str = ">"
+
+
+def seconds(field: str) -> Callable[[Dict], str]:
+    """
+    Cell renderer for a duration in seconds.
+
+    :param field: Result key of the duration.
+    :type field: str
+    :return: Function that renders the field of a result, e.g. ``1.234s``.
+    :rtype: callable
+    """
+    return lambda r: f"{r[field]:.3f}s"
+
+
+def text(field: str) -> Callable[[Dict], str]:
+    """
+    Cell renderer for a field as is.
+
+    :param field: Result key.
+    :type field: str
+    :return: Function that renders the field of a result.
+    :rtype: callable
+    """
+    return lambda r: str(r[field])
+
+
+def format_table(results: List[Dict], columns: List[Column]) -> str:
+    """
+    Render results as a table, one row per result.
+
+    Every column is as wide as its widest cell or header.
+
+    :param results: Results, as dictionaries.
+    :type results: list
+    :param columns: Table columns.
+    :type columns: list
+    :return: Table text.
+    :rtype: str
+    """
+    rows = [[c.header for c in columns]]
+    rows += [[c.cell(r) for c in columns] for r in results]
+    widths = [max(len(row[idx]) for row in rows) for idx in range(len(columns))]
+    return "\n".join(
+        "  ".join(
+            f"{cell:{column.align}{width}}"
+            for cell, column, width in zip(row, columns, widths)
+        ).rstrip()
+        for row in rows
+    )
+
+
+def saving(
+    results: List[Dict], key: str, field: str, baseline: str, candidate: str
+) -> Optional[Tuple[float, float]]:
+    """
+    How much one result saves over another.
+
+    :param results: Results, as dictionaries.
+    :type results: list
+    :param key: Result key that names a result, e.g. ``mode``.
+    :type key: str
+    :param field: Result key of the compared duration.
+    :type field: str
+    :param baseline: Name of the result to compare to.
+    :type baseline: str
+    :param candidate: Name of the result that saves.
+    :type candidate: str
+    :return: Seconds saved and their fraction of the baseline, or None if
+        either result is missing or the baseline took no time.
+    :rtype: tuple
+    """
+    values = {r[key]: r[field] for r in results}
+    if not values.get(baseline) or candidate not in values:
+        return None
+    saved = values[baseline] - values[candidate]
+    return saved, saved / values[baseline]
+
+
+def argument_parser(doc: str, json_flag: bool = True) -> argparse.ArgumentParser:
+    """
+    Argument parser with the options every benchmark has.
+
+    :param doc: Module docstring; its first paragraph is the description.
+    :type doc: str
+    :param json_flag: Add ``--json``. Benchmarks with subcommands add it to
+        the subcommand that prints results.
+    :type json_flag: bool
+    :return: Parser with ``--debug`` and, optionally, ``--json``.
+    :rtype: argparse.ArgumentParser
+    """
+    parser = argparse.ArgumentParser(description=doc.split("\n\n")[0].strip())
+    parser.add_argument("--debug", action="store_true", help="Verbose logging.")
+    if json_flag:
+        add_json_flag(parser)
+    return parser
+
+
+def add_json_flag(parser: argparse.ArgumentParser) -> None:
+    """
+    Add ``--json`` to a parser.
+
+    :param parser: Parser or subcommand parser.
+    :type parser: argparse.ArgumentParser
+    """
+    parser.add_argument("--json", action="store_true", help="Print JSON.")
+
+
+def print_results(
+    args: argparse.Namespace,
+    results: List[Dict],
+    format_results: Callable[[List[Dict]], str],
+) -> int:
+    """
+    Print results as JSON with ``--json``, otherwise as text.
+
+    :param args: Parsed arguments.
+    :type args: argparse.Namespace
+    :param results: Results, as dictionaries.
+    :type results: list
+    :param format_results: Renders the results as text.
+    :type format_results: callable
+    :return: Process exit code.
+    :rtype: int
+    """
+    print(json.dumps(results, indent=4) if args.json else format_results(results))
+    return 0
+
+
+def _command(cmd: Any) -> str:
+    if isinstance(cmd, str):
+        return cmd
+    args = [str(arg) for arg in cmd]
+    if len(args) > MAX_LOGGED_ARGS:
+        args = args[:MAX_LOGGED_ARGS] + ["..."]
+    return " ".join(args)
+
+
+def run_cli(
+    parser: argparse.ArgumentParser,
+    argv: Optional[List[str]],
+    run: Callable[[argparse.Namespace], Any],
+    format_results: Callable[[List[Dict]], str],
+    errors: Optional[Errors] = None,
+    report: Optional[Callable[[argparse.Namespace, Any], int]] = None,
+) -> int:
+    """
+    Parse arguments, run a benchmark and print its results.
+
+    A failed command, :class:`OSError` and :class:`ValueError` are logged
+    and exit with 1, so are the exceptions in ``errors``.
+
+    :param parser: Parser from :func:`argument_parser`.
+    :type parser: argparse.ArgumentParser
+    :param argv: Arguments, defaults to ``sys.argv[1:]``.
+    :type argv: list
+    :param run: Runs the benchmark with the parsed arguments.
+    :type run: callable
+    :param format_results: Renders the results as text.
+    :type format_results: callable
+    :param errors: Further expected exceptions and their log message.
+    :type errors: dict
+    :param report: Prints what ``run`` returned and returns the exit code.
+        Default: :func:`print_results`.
+    :type report: callable
+    :return: Process exit code.
+    :rtype: int
+    """
+    args = parser.parse_args(argv)
+    logging.basicConfig(
+        level=logging.DEBUG if args.debug else logging.INFO, format=LOG_FORMAT
+    )
+    errors = errors or {}
+    try:
+        outcome = run(args)
+        if report is None:
+            return print_results(args, outcome, format_results)
+        return report(args, outcome)
+    except subprocess.CalledProcessError as err:
+        stderr = err.stderr or ""
+        if isinstance(stderr, bytes):
+            stderr = stderr.decode(errors="replace")
+        LOG.error("%s failed:\n%s", _command(err.cmd), stderr)
+        return 1
+    except tuple(errors) as err:
+        message = next(m for t, m in errors.items() if isinstance(err, t))
+        LOG.error("%s", message(err))
+        return 1
+    except (OSError, ValueError) as err:
+        LOG.error("%s", err)
+        return 1
@@ -0,0 +1,874 @@
+"""
+Benchmark a boot of the module's userdata in a systemd container.
+
+Feeds the rendered ``userdata`` output to cloud-init through the NoCloud
+datasource, in a container that boots systemd, and reports how long each
+boot stage took, as tools/boot_report.py does for a real instance. Once
+the image is built, nothing leaves the host: the container shares the
+host's network and finds local stand-ins, served by this script, for
+
+* the APT repositories: a flat repository on 127.0.0.1 with stand-in
+  ``puppet-code``, ``puppet-agent`` and ``infrahouse-toolkit`` packages.
+  The image has the module's Ubuntu packages preinstalled, as the
+  InfraHouse AMI does, and no other sources. bootcmd finds the InfraHouse
+  repository configured, so its GPG key download is not measured.
+* Secrets Manager and SSM Parameter Store, through ``AWS_ENDPOINT_URL``:
+  ``BatchGetSecretValue``, ``GetSecretValue`` and ``GetParameters``
+  answer from ``--secrets``, a JSON object of secret ARN (or name) to
+  value.
+* the instance metadata service: IMDSv2 with an instance role, through
+  ``AWS_EC2_METADATA_SERVICE_ENDPOINT`` and ``IH_IMDS_ENDPOINT``.
+* ``ih-aws``, ``ih-puppet`` and Puppet's ``puppet`` and ``gem``: commands
+  that log their arguments to /var/log/ih-benchmark-standins.log.
+  ``ih-puppet`` takes ``--puppet-seconds`` to apply its "catalog".
+
+The image is built on first use, which needs the network. The container
+runs privileged on the host network, so run it on a development machine,
+as root or as a user who may run such containers::
+
+    terraform -chdir=test_data/test_module output -raw userdata > userdata.b64
+    sudo python3 tools/boot_benchmark.py userdata.b64 --runs 3
+    sudo python3 tools/boot_benchmark.py userdata.b64 --secrets secrets.json \\
+        --keep-logs runs --json
+
+Userdata with ``extra_repos`` needs the network for them.
+"""
+
+import argparse
+import base64
+import binascii
+import gzip
+import hashlib
+import io
+import json
+import logging
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tarfile
+import tempfile
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Type
+
+from apt_benchmark import DEFAULT_PACKAGES, serve
+from benchmark import Column, argument_parser, format_table, run_cli, seconds, text
+from boot_report import (
+    APT_AUTH_LOG,
+    CLOUD_INIT_LOG,
+    CLOUD_INIT_OUTPUT_LOG,
+    build_report,
+)
+from validate_userdata import UserdataError, decode_userdata
+
+LOG = logging.getLogger(__name__)
+
+IMAGE = "ih-boot-benchmark"
+STANDIN_LOG = "/var/log/ih-benchmark-standins.log"
+
+# Copied out of the container after every boot.
+LOG_FILES = [
+    f"/var/log/{CLOUD_INIT_LOG}",
+    f"/var/log/{CLOUD_INIT_OUTPUT_LOG}",
+    f"/var/log/{APT_AUTH_LOG}",
+    "/var/log/materialize_secrets.log",
+    STANDIN_LOG,
+]
+
+# The image's only APT source is the stand-in repository, and cloud-init
+# keeps it that way. Networking is the host's.
+DOCKERFILE = """\
+FROM ubuntu:{codename}
+ENV DEBIAN_FRONTEND=noninteractive
+RUN apt-get update \\
+    && apt-get install --yes --no-install-recommends \\
+        systemd systemd-sysv cloud-init python3-boto3 curl gpg ca-certificates \\
+        {packages} \\
+    && rm -rf /var/lib/apt/lists/* /etc/apt/sources.list.d/* \\
+    && : > /etc/apt/sources.list \\
+    && systemctl mask systemd-networkd-wait-online.service getty.target \\
+    && printf '%s\\n' 'datasource_list: [NoCloud, None]' \\
+        'network: {{config: disabled}}' 'apt: {{preserve_sources_list: true}}' \\
+        > /etc/cloud/cloud.cfg.d/99-ih-benchmark.cfg
+STOPSIGNAL SIGRTMIN+3
+CMD ["/sbin/init"]
+"""
+
+_LOG_CALL = f'echo "$(date +%s.%N) $(basename "$0") $*" >> {STANDIN_LOG}\n'
+
+ROLE = "ih-boot-benchmark"
+INSTANCE_ID = "i-0123456789abcdef0"
+ACCOUNT = "123456789012"
+
+
+@dataclass
+class Result:
+    """Timings of one boot stage over all runs."""
+
+    stage: str
+    runs: int
+    median_s: float
+    min_s: float
+    max_s: float
+
+
+def standin_packages(puppet_seconds: float = 0) -> Dict[str, Dict[str, Any]]:
+    """
+    Files and dependencies of the stand-in packages.
+
+    :param puppet_seconds: How long ``ih-puppet`` takes to "apply".
+    :type puppet_seconds: float
+    :return: ``{"depends": str, "files": {path: content}}`` by package name.
+    :rtype: dict
+    """
+    puppet = (
+        "#!/bin/sh\n"
+        + _LOG_CALL
+        + 'if [ "$1 $2" = "config print" ]; then\n'
+        + '    echo "/opt/puppetlabs/puppet/cache/state/$3"\n'
+        + "fi\n"
+    )
+    ih_puppet = (
+        "#!/bin/sh\n"
+        + _LOG_CALL
+        + f"sleep {puppet_seconds}\n"
+        + f'echo "Notice: Applied catalog in {puppet_seconds:.2f} seconds"\n'
+    )
+    return {
+        "puppet-agent": {
+            "depends": "",
+            "files": {
+                "opt/puppetlabs/puppet/bin/gem": "#!/bin/sh\n" + _LOG_CALL,
+                "opt/puppetlabs/puppet/bin/puppet": puppet,
+            },
+        },
+        "puppet-code": {
+            "depends": "puppet-agent",
+            "files": {"opt/puppet-code/README": "Stand-in, see boot_benchmark.py\n"},
+        },
+        "infrahouse-toolkit": {
+            "depends": "",
+            "files": {
+                "usr/bin/ih-aws": "#!/bin/sh\n" + _LOG_CALL,
+                "usr/bin/ih-puppet": ih_puppet,
+            },
+        },
+    }
+
+
+def _tar_gz(files: Dict[str, str]) -> bytes:
+    directories = set()
+    for path in files:
+        parent = os.path.dirname(path)
+        while parent:
+            directories.add(parent)
+            parent = os.path.dirname(parent)
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode="w:gz", format=tarfile.GNU_FORMAT) as tar:
+        for path in sorted(directories):
+            info = tarfile.TarInfo(f"./{path}")
+            info.type = tarfile.DIRTYPE
+            info.mode = 0o755
+            tar.addfile(info)
+        for path, content in sorted(files.items()):
+            data = content.encode()
+            info = tarfile.TarInfo(f"./{path}")
+            info.size = len(data)
+            info.mode = 0o755 if content.startswith("#!") else 0o644
+            tar.addfile(info, io.BytesIO(data))
+    return buf.getvalue()
+
+
+def build_deb(name: str, files: Dict[str, str], depends: str, directory: str) -> str:
+    """
+    Write a minimal binary package, without needing dpkg-deb.
+
+    :param name: Package name.
+    :type name: str
+    :param files: Content by path relative to ``/``.
+    :type files: dict
+    :param depends: ``Depends`` field, or empty.
+    :type depends: str
+    :param directory: Where to write the package.
+    :type directory: str
+    :return: The package's control fields.
+    :rtype: str
+    """
+    control = "".join(
+        [
+            f"Package: {name}\n",
+            "Version: 0.0.0\n",
+            "Architecture: all\n",
+            "Maintainer: InfraHouse <noreply@infrahouse.com>\n",
+            f"Depends: {depends}\n" if depends else "",
+            f"Description: Stand-in {name} for tools/boot_benchmark.py\n",
+        ]
+    )
+    members = [
+        ("debian-binary", b"2.0\n"),
+        ("control.tar.gz", _tar_gz({"control": control})),
+        ("data.tar.gz", _tar_gz(files)),
+    ]
+    archive = b"!<arch>\n"
+    for member, data in members:
+        archive += (
+            f"{member:<16}{0:<12}{0:<6}{0:<6}{'100644':<8}{len(data):<10}`\n".encode()
+        )
+        archive += data + (b"\n" if len(data) % 2 else b"")
+    with open(os.path.join(directory, f"{name}_0.0.0_all.deb"), "wb") as fp:
+        fp.write(archive)
+    return control
+
+
+def build_repository(directory: str, puppet_seconds: float = 0) -> None:
+    """
+    Write the stand-in packages as a flat APT repository.
+
+    :param directory: Repository directory.
+    :type directory: str
+    :param puppet_seconds: See :func:`standin_packages`.
+    :type puppet_seconds: float
+    """
+    os.makedirs(directory, exist_ok=True)
+    stanzas = []
+    for name, package in standin_packages(puppet_seconds).items():
+        control = build_deb(name, package["files"], package["depends"], directory)
+        filename = f"{name}_0.0.0_all.deb"
+        with open(os.path.join(directory, filename), "rb") as fp:
+            data = fp.read()
+        stanzas.append(
+            control
+            + f"Filename: ./{filename}\nSize: {len(data)}\n"
+            + f"SHA256: {hashlib.sha256(data).hexdigest()}\n"
+        )
+    packages = "\n".join(stanzas)
+    with open(os.path.join(directory, "Packages"), "w", encoding="utf-8") as fp:
+        fp.write(packages)
+    with gzip.open(os.path.join(directory, "Packages.gz"), "wt") as fp:
+        fp.write(packages)
+    lines = ["Origin: ih-boot-benchmark", "Label: ih-boot-benchmark", "SHA256:"]
+    for name in ("Packages", "Packages.gz"):
+        with open(os.path.join(directory, name), "rb") as fp:
+            data = fp.read()
+        lines.append(f" {hashlib.sha256(data).hexdigest()} {len(data)} {name}")
+    with open(os.path.join(directory, "Release"), "w", encoding="utf-8") as fp:
+        fp.write("\n".join(lines) + "\n")
+
+
+def aws_response(
+    target: str, body: Dict[str, Any], secrets: Dict[str, str], region: str
+) -> Tuple[int, Dict[str, Any]]:
+    """
+    Answer one AWS JSON protocol call from the stand-in secrets.
+
+    :param target: ``X-Amz-Target`` header, e.g.
+        ``secretsmanager.GetSecretValue``.
+    :type target: str
+    :param body: Request body.
+    :type body: dict
+    :param secrets: Secret string by ARN or name.
+    :type secrets: dict
+    :param region: Region for the ARNs of SSM parameters given by name.
+    :type region: str
+    :return: HTTP status and response body.
+    :rtype: tuple
+    """
+    if target == "secretsmanager.BatchGetSecretValue":
+        values = []
+        errors = []
+        for ref in body.get("SecretIdList", []):
+            if ref not in secrets:
+                errors.append(
+                    {
+                        "SecretId": ref,
+                        "ErrorCode": "ResourceNotFoundException",
+                        "Message": "Secrets Manager can't find the specified secret.",
+                    }
+                )
+                continue
+            values.append(
+                {"ARN": ref, "Name": ref.split(":")[-1], "SecretString": secrets[ref]}
+            )
+        return 200, {"SecretValues": values, "Errors": errors}
+    if target == "secretsmanager.GetSecretValue":
+        ref = body.get("SecretId", "")
+        if ref not in secrets:
+            return 400, {
+                "__type": "ResourceNotFoundException",
+                "message": "Secrets Manager can't find the specified secret.",
+            }
+        return 200, {
+            "ARN": ref,
+            "Name": ref.split(":")[-1],
+            "SecretString": secrets[ref],
+        }
+    if target == "AmazonSSM.GetParameters":
+        parameters = []
+        invalid = []
+        for ref in body.get("Names", []):
+            if ref not in secrets:
+                invalid.append(ref)
+                continue
+            if ref.startswith("arn:"):
+                arn, name = ref, "/" + ref.split(":parameter/", 1)[-1]
+            else:
+                name = ref if ref.startswith("/") else f"/{ref}"
+                arn = f"arn:aws:ssm:{region}:{ACCOUNT}:parameter{name}"
+            parameters.append(
+                {
+                    "Name": name,
+                    "ARN": arn,
+                    "Type": "SecureString",
+                    "Value": secrets[ref],
+                }
+            )
+        return 200, {"Parameters": parameters, "InvalidParameters": invalid}
+    return 400, {
+        "__type": "UnknownOperationException",
+        "message": f"{target or 'request'} has no stand-in",
+    }
+
+
+class _AWSHandler(BaseHTTPRequestHandler):
+    """Secrets Manager and SSM stand-in; see :func:`aws_response`."""
+
+    secrets: Dict[str, str] = {}
+    region = "us-east-1"
+    calls: Dict[str, int] = {}
+
+    def do_POST(self) -> None:  # pylint: disable=invalid-name
+        length = int(self.headers.get("Content-Length", 0))
+        raw = self.rfile.read(length)
+        target = self.headers.get("X-Amz-Target", "")
+        body = (
+            json.loads(raw or b"{}")
+            if "json" in self.headers.get("Content-Type", "")
+            else {}
+        )
+        self.calls[target or "other"] = self.calls.get(target or "other", 0) + 1
+        status, payload = aws_response(target, body, self.secrets, self.region)
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/x-amz-json-1.1")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args) -> None:  # pylint: disable=arguments-differ
+        pass
+
+
+def imds_paths(region: str) -> Dict[str, str]:
+    """
+    Metadata the IMDS stand-in serves.
+
+    :param region: Region of the "instance".
+    :type region: str
+    :return: Response body by path.
+    :rtype: dict
+    """
+    now = datetime.now(timezone.utc)
+    credentials = {
+        "Code": "Success",
+        "LastUpdated": now.strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "Type": "AWS-HMAC",
+        "AccessKeyId": "ASIAIHBOOTBENCHMARK0",
+        "SecretAccessKey": "ih-boot-benchmark",
+        "Token": "ih-boot-benchmark",
+        "Expiration": (now + timedelta(hours=6)).strftime("%Y-%m-%dT%H:%M:%SZ"),
+    }
+    document = {
+        "accountId": ACCOUNT,
+        "instanceId": INSTANCE_ID,
+        "region": region,
+        "availabilityZone": f"{region}a",
+    }
+    return {
+        "/latest/meta-data/instance-id": INSTANCE_ID,
+        "/latest/meta-data/placement/region": region,
+        "/latest/meta-data/placement/availability-zone": f"{region}a",
+        "/latest/meta-data/iam/security-credentials/": ROLE,
+        f"/latest/meta-data/iam/security-credentials/{ROLE}": json.dumps(credentials),
+        "/latest/dynamic/instance-identity/document": json.dumps(document),
+    }
+
+
+class _IMDSHandler(BaseHTTPRequestHandler):
+    """IMDSv2 stand-in: a token is required for every read."""
+
+    token = "ih-boot-benchmark-token"
+    paths: Dict[str, str] = {}
+
+    def _reply(self, status: int, body: str) -> None:
+        data = body.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "text/plain")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_PUT(self) -> None:  # pylint: disable=invalid-name
+        if self.path == "/latest/api/token":
+            self._reply(200, self.token)
+        else:
+            self._reply(404, "")
+
+    def do_GET(self) -> None:  # pylint: disable=invalid-name
+        if self.headers.get("X-aws-ec2-metadata-token") != self.token:
+            self._reply(401, "")
+        elif self.path in self.paths:
+            self._reply(200, self.paths[self.path])
+        else:
+            self._reply(404, "")
+
+    def log_message(self, *args) -> None:  # pylint: disable=arguments-differ
+        pass
+
+
+@contextmanager
+def serve_handler(handler: Type[BaseHTTPRequestHandler], **attributes) -> Iterator[str]:
+    """
+    Serve a request handler on a free port of 127.0.0.1.
+
+    :param handler: Handler class.
+    :type handler: type
+    :param attributes: Class attributes to set on a subclass of ``handler``.
+    :return: Base URL.
+    """
+    server = ThreadingHTTPServer(
+        ("127.0.0.1", 0), type(handler.__name__, (handler,), attributes)
+    )
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def read_userdata(path: str) -> bytes:
+    """
+    Read the module's ``userdata`` output as cloud-init gets it.
+
+    :param path: File with the base64 encoded userdata.
+    :type path: str
+    :return: Userdata, gzipped if the module gzipped it.
+    :rtype: bytes
+    :raises UserdataError: If it does not decode to a cloud-config.
+    """
+    with open(path, encoding="utf-8") as fp:
+        value = fp.read()
+    cloud_config = decode_userdata(value)
+    sources = cloud_config.get("apt", {}).get("sources") or {}
+    if sources:
+        LOG.warning(
+            "userdata adds APT sources %s; the boot needs the network for them",
+            ", ".join(sorted(sources)),
+        )
+    try:
+        return base64.b64decode(value.strip(), validate=True)
+    except (binascii.Error, ValueError) as err:
+        raise UserdataError(f"userdata is not valid base64: {err}") from err
+
+
+def system_conf(aws_url: str, imds_url: str) -> str:
+    """
+    systemd drop-in that points every service of the container at the
+    stand-ins.
+
+    :param aws_url: Base URL of the AWS stand-in.
+    :type aws_url: str
+    :param imds_url: Base URL of the IMDS stand-in.
+    :type imds_url: str
+    :return: Content of a ``system.conf.d`` file.
+    :rtype: str
+    """
+    env = {
+        "AWS_ENDPOINT_URL": aws_url,
+        "AWS_EC2_METADATA_SERVICE_ENDPOINT": imds_url,
+        "IH_IMDS_ENDPOINT": imds_url,
+    }
+    return (
+        "[Manager]\nDefaultEnvironment="
+        + " ".join(f'"{key}={value}"' for key, value in env.items())
+        + "\n"
+    )
+
+
+def _run(cmd: List[str], **kwargs) -> subprocess.CompletedProcess:
+    LOG.debug("Running %s", " ".join(cmd))
+    return subprocess.run(cmd, capture_output=True, text=True, **kwargs)
+
+
+def ensure_image(engine: str, codename: str, rebuild: bool = False) -> str:
+    """
+    Build the container image unless it exists.
+
+    :param engine: ``docker`` or ``podman``.
+    :type engine: str
+    :param codename: Ubuntu release, e.g. ``noble``.
+    :type codename: str
+    :param rebuild: Build even if the image exists.
+    :type rebuild: bool
+    :return: Image tag.
+    :rtype: str
+    :raises subprocess.CalledProcessError: If the build fails.
+    """
+    tag = f"{IMAGE}:{codename}"
+    if not rebuild and _run([engine, "image", "inspect", tag]).returncode == 0:
+        return tag
+    LOG.info("Building %s", tag)
+    dockerfile = DOCKERFILE.format(
+        codename=codename, packages=" ".join(DEFAULT_PACKAGES)
+    )
+    _run([engine, "build", "--tag", tag, "-"], input=dockerfile, check=True)
+    return tag
+
+
+def boot(
+    engine: str,
+    image: str,
+    workdir: str,
+    run: int,
+    userdata: bytes,
+    mounts: Dict[str, str],
+    timeout: float,
+) -> Dict[str, Any]:
+    """
+    Boot one container and collect its logs.
+
+    :param engine: ``docker`` or ``podman``.
+    :type engine: str
+    :param image: Image tag.
+    :type image: str
+    :param workdir: Directory for the seed and the logs of this run.
+    :type workdir: str
+    :param run: Run number, part of the instance ID.
+    :type run: int
+    :param userdata: Userdata for the NoCloud seed.
+    :type userdata: bytes
+    :param mounts: Container path by host path, mounted read-only.
+    :type mounts: dict
+    :param timeout: Seconds to wait for cloud-init.
+    :type timeout: float
+    :return: The run's boot report, see :meth:`BootReport.to_dict`, with
+        ``cloud_init_status``, cloud-init's exit code.
+    :rtype: dict
+    :raises subprocess.CalledProcessError: If the container cannot start.
+    :raises subprocess.TimeoutExpired: If cloud-init does not finish in time.
+    """
+    seed = os.path.join(workdir, "seed")
+    os.makedirs(seed)
+    with open(os.path.join(seed, "user-data"), "wb") as fp:
+        fp.write(userdata)
+    with open(os.path.join(seed, "meta-data"), "w", encoding="utf-8") as fp:
+        fp.write(f"instance-id: {IMAGE}-{run}\nlocal-hostname: {IMAGE}\n")
+    volumes = {seed: "/var/lib/cloud/seed/nocloud", **mounts}
+    name = f"{IMAGE}-{os.getpid()}-{run}"
+    cmd = [engine, "run", "--detach", "--name", name, "--privileged"]
+    cmd += ["--cgroupns=private", "--network=host"]
+    cmd += ["--tmpfs", "/run", "--tmpfs", "/run/lock"]
+    for host, container in volumes.items():
+        cmd += ["--volume", f"{host}:{container}:ro"]
+
+    start = time.time()
+    _run(cmd + [image], check=True)
+    try:
+        status = _run(
+            [engine, "exec", name, "cloud-init", "status", "--wait"], timeout=timeout
+        ).returncode
+        LOG.info("Run %d: cloud-init finished after %.1fs", run, time.time() - start)
+        logs = os.path.join(workdir, "logs")
+        os.makedirs(logs)
+        for path in LOG_FILES:
+            _run([engine, "cp", f"{name}:{path}", logs])
+        done = _run(
+            [engine, "exec", name, "date", "-r", "/var/run/puppet-done", "+%s.%N"]
+        )
+    finally:
+        _run([engine, "rm", "--force", name])
+    puppet_done = float(done.stdout) if done.returncode == 0 else None
+    if status != 0 or puppet_done is None:
+        LOG.warning(
+            "Run %d: cloud-init status %d, puppet-done %s; see %s",
+            run,
+            status,
+            "written" if puppet_done else "missing",
+            logs,
+        )
+    report = build_report(
+        logs, puppet_done_time=puppet_done, boot_epoch=start
+    ).to_dict()
+    report["cloud_init_status"] = status
+    return report
+
+
+def run_benchmark(
+    userdata: bytes,
+    engine: str = "docker",
+    codename: str = "noble",
+    runs: int = 1,
+    secrets: Optional[Dict[str, str]] = None,
+    region: str = "us-east-1",
+    puppet_seconds: float = 0,
+    delay_ms: float = 0,
+    timeout: float = 900,
+    keep_logs: Optional[str] = None,
+) -> Tuple[List[Dict[str, Any]], Dict[str, int]]:
+    """
+    Boot the userdata ``runs`` times against the stand-ins.
+
+    :param userdata: Userdata, see :func:`read_userdata`.
+    :type userdata: bytes
+    :param engine: ``docker`` or ``podman``.
+    :type engine: str
+    :param codename: Ubuntu release of the image; match ``ubuntu_codename``.
+    :type codename: str
+    :param runs: Number of boots.
+    :type runs: int
+    :param secrets: Secret string by ARN or name.
+    :type secrets: dict
+    :param region: Region the IMDS stand-in reports.
+    :type region: str
+    :param puppet_seconds: See :func:`standin_packages`.
+    :type puppet_seconds: float
+    :param delay_ms: Delay added to every request to the APT repository.
+    :type delay_ms: float
+    :param timeout: Seconds to wait for each boot.
+    :type timeout: float
+    :param keep_logs: Directory to keep each run's seed and logs in.
+    :type keep_logs: str
+    :return: Boot report per run, and AWS stand-in calls by target.
+    :rtype: tuple
+    :raises subprocess.CalledProcessError: If the image or a container fails.
+    :raises subprocess.TimeoutExpired: If a boot does not finish in time.
+    """
+    image = ensure_image(engine, codename)
+    calls: Dict[str, int] = {}
+    reports = []
+    with tempfile.TemporaryDirectory() as tmp, ExitStack() as stack:
+        repo = os.path.join(tmp, "repo")
+        build_repository(repo, puppet_seconds)
+        repo_url = stack.enter_context(serve(repo, "127.0.0.1", delay_ms))
+        aws_url = stack.enter_context(
+            serve_handler(
+                _AWSHandler, secrets=secrets or {}, region=region, calls=calls
+            )
+        )
+        imds_url = stack.enter_context(
+            serve_handler(_IMDSHandler, paths=imds_paths(region))
+        )
+        files = {
+            "50-infrahouse.list": (
+                f"deb [trusted=yes] {repo_url}/ ./\n",
+                "/etc/apt/sources.list.d/50-infrahouse.list",
+            ),
+            "ih-benchmark.conf": (
+                system_conf(aws_url, imds_url),
+                "/etc/systemd/system.conf.d/ih-benchmark.conf",
+            ),
+        }
+        mounts = {}
+        for name, (content, target) in files.items():
+            path = os.path.join(tmp, name)
+            with open(path, "w", encoding="utf-8") as fp:
+                fp.write(content)
+            mounts[path] = target
+
+        for run in range(1, runs + 1):
+            workdir = os.path.join(keep_logs or tmp, f"run-{run}")
+            if os.path.exists(workdir):
+                shutil.rmtree(workdir)
+            report = boot(engine, image, workdir, run, userdata, mounts, timeout)
+            LOG.info("Run %d: ready after %.3fs", run, report["total"])
+            reports.append(report)
+    return reports, calls
+
+
+def summarize(reports: List[Dict[str, Any]]) -> List[Result]:
+    """
+    Median, minimum and maximum of every critical path stage over the runs.
+
+    Stages are listed in the order of the first run; milestones follow as
+    ``until <name>``, and ``total`` comes last.
+
+    :param reports: Boot reports.
+    :type reports: list
+    :return: One result per stage.
+    :rtype: list
+    """
+    samples: Dict[str, List[float]] = {}
+    for report in reports:
+        stages: Dict[str, float] = {}
+        for span in report["critical_path"]:
+            stages[span["name"]] = stages.get(span["name"], 0.0) + span["duration"]
+        for name, offset in sorted(report["milestones"].items(), key=lambda i: i[1]):
+            stages[f"until {name}"] = offset
+        stages["total"] = report["total"]
+        for name, value in stages.items():
+            samples.setdefault(name, []).append(value)
+    total = samples.pop("total", [])
+    results = [
+        Result(name, len(v), statistics.median(v), min(v), max(v))
+        for name, v in samples.items()
+    ]
+    if total:
+        results.append(
+            Result(
+                "total", len(total), statistics.median(total), min(total), max(total)
+            )
+        )
+    return results
+
+
+def format_results(results: List[Dict]) -> str:
+    """
+    Render results as a table.
+
+    :param results: Results, as dictionaries.
+    :type results: list
+    :return: Table text.
+    :rtype: str
+    """
+    return format_table(
+        results,
+        [
+            Column("stage", text("stage"), "<"),
+            Column("runs", text("runs")),
+            Column("median", seconds("median_s")),
+            Column("min", seconds("min_s")),
+            Column("max", seconds("max_s")),
+        ],
+    )
+
+
+def load_secrets(path: Optional[str]) -> Dict[str, str]:
+    """
+    Load the stand-in secrets.
+
+    :param path: JSON object of ARN or name to value; values that are not
+        strings are JSON encoded, as a JSON secret is stored. None for none.
+    :type path: str
+    :return: Secret string by ARN or name.
+    :rtype: dict
+    """
+    if path is None:
+        return {}
+    with open(path, encoding="utf-8") as fp:
+        values = json.load(fp)
+    return {
+        ref: value if isinstance(value, str) else json.dumps(value)
+        for ref, value in values.items()
+    }
+
+
+def _report(args: argparse.Namespace, outcome: Tuple[List[Dict], Dict]) -> int:
+    reports, calls = outcome
+    results = [asdict(r) for r in summarize(reports)]
+    if args.json:
+        print(
+            json.dumps(
+                {"results": results, "aws_calls": calls, "runs": reports}, indent=4
+            )
+        )
+    else:
+        print(format_results(results))
+        if calls:
+            print()
+            print(
+                "AWS stand-in calls: "
+                + ", ".join(f"{target} {n}" for target, n in sorted(calls.items()))
+            )
+    return 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Command line entry point.
+
+    :param argv: Arguments, defaults to ``sys.argv[1:]``.
+    :return: Process exit code.
+    :rtype: int
+    """
+    parser = argument_parser(__doc__)
+    parser.add_argument("userdata", help="File with the module's userdata output.")
+    parser.add_argument(
+        "--engine",
+        default="docker",
+        choices=["docker", "podman"],
+        help="Container engine. Default: %(default)s.",
+    )
+    parser.add_argument(
+        "--codename",
+        default="noble",
+        help="Ubuntu release of the image; match ubuntu_codename."
+        " Default: %(default)s.",
+    )
+    parser.add_argument(
+        "--runs", type=int, default=1, help="Boots. Default: %(default)s."
+    )
+    parser.add_argument(
+        "--secrets",
+        help="JSON object of secret ARN or name to value for the AWS stand-in.",
+    )
+    parser.add_argument(
+        "--region",
+        default="us-east-1",
+        help="Region the IMDS stand-in reports. Default: %(default)s.",
+    )
+    parser.add_argument(
+        "--puppet-seconds",
+        type=float,
+        default=0,
+        help="How long the ih-puppet stand-in runs. Default: %(default)s.",
+    )
+    parser.add_argument(
+        "--delay-ms",
+        type=float,
+        default=0,
+        help="Delay added to every APT request. Default: %(default)s.",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=900,
+        help="Seconds to wait for each boot. Default: %(default)s.",
+    )
+    parser.add_argument(
+        "--keep-logs", help="Keep each run's seed and logs in this directory."
+    )
+    return run_cli(
+        parser,
+        argv,
+        lambda args: run_benchmark(
+            read_userdata(args.userdata),
+            args.engine,
+            args.codename,
+            args.runs,
+            load_secrets(args.secrets),
+            args.region,
+            args.puppet_seconds,
+            args.delay_ms,
+            args.timeout,
+            args.keep_logs,
+        ),
+        format_results,
+        {
+            subprocess.TimeoutExpired: lambda err: (
+                f"cloud-init did not finish in {err.timeout:.0f}s"
+            ),
+            UserdataError: str,
+        },
+        _report,
+    )
+
+
+if __name__ == "__main__":
+    sys.exit(main())
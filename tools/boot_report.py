@@ -0,0 +1,593 @@
+"""
+Build a boot critical-path report from cloud-init logs.
+
+Parses logs copied off an instance bootstrapped by this module and reports
+how long each boot stage took, from kernel start to lifecycle completion:
+
+* ``cloud-init.log`` - start/finish events for every cloud-init stage and
+  module (bootcmd, write_files, apt_configure, package install, runcmd, ...).
+* ``cloud-init-output.log`` - ``ih-bootstrap`` stage markers and parallel
+  command timings written by ``/usr/local/bin/ih-bootstrap``, Puppet's
+  "Applied catalog" line and cloud-init's final "finished at" line.
+* ``generate_apt_auth.log`` - APT secret resolution, which runs concurrently
+  with the InfraHouse repo setup inside bootcmd.
+* ``puppet-done`` - the completion marker; its mtime (or an explicit
+  ``--puppet-done-time``) is reported as a milestone.
+
+Usage::
+
+    scp -p instance:/var/log/cloud-init.log instance:/var/log/cloud-init-output.log \\
+        instance:/var/log/generate_apt_auth.log instance:/var/run/puppet-done run-a/
+    python tools/boot_report.py analyze run-a
+    python tools/boot_report.py analyze run-a --json > run-a.json
+    python tools/boot_report.py compare run-a.json run-b
+
+Everything works offline; nothing is fetched from the instance or AWS.
+"""
+
+import argparse
+import json
+import logging
+import os
+import re
+import sys
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+LOG = logging.getLogger(__name__)
+
+CLOUD_INIT_LOG = "cloud-init.log"
+CLOUD_INIT_OUTPUT_LOG = "cloud-init-output.log"
+APT_AUTH_LOG = "generate_apt_auth.log"
+PUPPET_DONE = "puppet-done"
+
+# 2025-04-22 18:04:09,980 - handlers.py[DEBUG]: start: init-network/config-bootcmd: ...
+EVENT_RE = re.compile(
+    r"^(?P<ts>\d{4}-\d\d-\d\d \d\d:\d\d:\d\d,\d{3}) - \S+\[\w+\]: "
+    r"(?P<kind>start|finish): (?P<name>[^:\s]+): (?P<desc>.*)$"
+)
+# Cloud-init v. 24.4.1 running 'init-local' at Tue, 22 Apr 2025 18:04:06 +0000. Up 6.28 seconds.
+BOOT_RE = re.compile(
+    r"^(?P<ts>\d{4}-\d\d-\d\d \d\d:\d\d:\d\d,\d{3}) - \S+\[\w+\]: "
+    r"Cloud-init v\. \S+ running 'init-local' at .*\. Up (?P<up>[\d.]+) seconds\."
+)
+FINISHED_RE = re.compile(
+    r"^Cloud-init v\. \S+ finished at .* Up (?P<up>[\d.]+) seconds"
+)
+STAGE_RE = re.compile(r"^ih-bootstrap: stage (?P<name>\S+) at (?P<ts>\d+[.,]\d+)$")
+COMMAND_RE = re.compile(
+    r"^ih-bootstrap: (?P<group>\S+): exit (?P<rc>\d+) in (?P<secs>[\d.]+)s: (?P<cmd>.*)$"
+)
+CATALOG_RE = re.compile(r"Applied catalog in (?P<secs>[\d.]+) seconds")
+APT_AUTH_RE = re.compile(r"^(?P<ts>\d{4}-\d\d-\d\d \d\d:\d\d:\d\d,\d{3}) ")
+
+
+@dataclass
+class Span:
+    """
+    A timed boot step.
+
+    :param name: Stage name, e.g. ``init-network/config-bootcmd``.
+    :param start: Seconds since kernel start.
+    :param duration: Wall-clock seconds.
+    :param concurrent: True if the span overlaps its siblings (it runs in the
+                       background) and therefore is not on the critical path.
+    """
+
+    name: str
+    start: float
+    duration: float
+    concurrent: bool = False
+
+    def __post_init__(self) -> None:
+        self.start = round(self.start, 3)
+        self.duration = round(self.duration, 3)
+
+    @property
+    def end(self) -> float:
+        """
+        :return: Seconds since kernel start when the span finished.
+        :rtype: float
+        """
+        return self.start + self.duration
+
+
+@dataclass
+class BootReport:
+    """
+    Per-stage timings of one boot.
+
+    :param boot_time: ISO 8601 time of kernel start (UTC).
+    :param total: Seconds from kernel start to the last milestone.
+    :param spans: Boot steps sorted by start time.
+    :param milestones: Named points in time, seconds since kernel start.
+    :param commands: Parallel ``pre_runcmd``/``post_runcmd`` command timings.
+    :param puppet_catalog: Seconds Puppet reported for applying the catalog.
+    """
+
+    boot_time: str
+    total: float
+    spans: List[Span] = field(default_factory=list)
+    milestones: Dict[str, float] = field(default_factory=dict)
+    commands: List[Dict[str, Any]] = field(default_factory=list)
+    puppet_catalog: Optional[float] = None
+
+    def critical_path(self) -> List[Span]:
+        """
+        Return the chain of steps that determines time-to-ready.
+
+        cloud-init runs its stages and modules one after another, so the
+        critical path is the sequence of innermost non-concurrent spans,
+        with uncovered time reported as ``<parent> (other)`` and the time
+        between stages as ``(idle)``.
+
+        :return: Spans in time order covering kernel start to ``total``.
+        :rtype: list[Span]
+        """
+        serial = [s for s in self.spans if not s.concurrent]
+        path: List[Span] = []
+
+        def children(parent: Optional[Span]) -> List[Span]:
+            if parent is None:
+                return [s for s in serial if "/" not in s.name]
+            prefix = parent.name + "/"
+            return [
+                s
+                for s in serial
+                if s.name.startswith(prefix) and "/" not in s.name[len(prefix) :]
+            ]
+
+        def walk(parent: Optional[Span], start: float, end: float) -> None:
+            cursor = start
+            for child in children(parent):
+                gap = child.start - cursor
+                if gap > 0.0005:
+                    name = f"{parent.name} (other)" if parent else "(idle)"
+                    path.append(Span(name, cursor, gap))
+                if children(child):
+                    walk(child, child.start, child.end)
+                else:
+                    path.append(child)
+                cursor = max(cursor, child.end)
+            if end - cursor > 0.0005:
+                name = f"{parent.name} (other)" if parent else "(idle)"
+                path.append(Span(name, cursor, end - cursor))
+
+        walk(None, 0.0, self.total)
+        return path
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        :return: JSON-serializable representation, including the critical path.
+        :rtype: dict
+        """
+        result = asdict(self)
+        result["critical_path"] = [asdict(s) for s in self.critical_path()]
+        return result
+
+
+def _parse_ts(value: str) -> float:
+    """
+    Parse a cloud-init log timestamp. Instances log in UTC.
+
+    :param value: Timestamp such as ``2025-04-22 18:04:09,980``.
+    :return: POSIX timestamp.
+    :rtype: float
+    """
+    return (
+        datetime.strptime(value, "%Y-%m-%d %H:%M:%S,%f")
+        .replace(tzinfo=timezone.utc)
+        .timestamp()
+    )
+
+
+def _read_lines(path: str) -> List[str]:
+    with open(path, "r", encoding="utf-8", errors="replace") as fp:
+        return fp.read().splitlines()
+
+
+def parse_cloud_init_log(path: str, boot: int = 0) -> Dict[str, Any]:
+    """
+    Extract stage and module spans for one boot from ``cloud-init.log``.
+
+    :param path: Path to ``cloud-init.log``.
+    :param boot: Which boot to report when the log covers several; 0 is the
+                 first (provisioning) boot, -1 the most recent.
+    :return: ``{"boot_epoch": float, "spans": [(name, start_epoch, end_epoch)]}``
+    :rtype: dict
+    :raises ValueError: If the log has no ``init-local`` start line.
+    """
+    lines = _read_lines(path)
+    boots = [idx for idx, line in enumerate(lines) if BOOT_RE.match(line)]
+    if not boots:
+        raise ValueError(f"{path}: no 'running init-local' line found")
+    first = boots[boot]
+    pos = boots.index(first)
+    last = boots[pos + 1] if pos + 1 < len(boots) else len(lines)
+
+    match = BOOT_RE.match(lines[first])
+    boot_epoch = _parse_ts(match.group("ts")) - float(match.group("up"))
+
+    started: Dict[str, float] = {}
+    spans = []
+    for line in lines[first:last]:
+        match = EVENT_RE.match(line)
+        if not match:
+            continue
+        name = match.group("name")
+        ts = _parse_ts(match.group("ts"))
+        if match.group("kind") == "start":
+            started[name] = ts
+        elif name in started:
+            spans.append((name, started.pop(name), ts))
+    LOG.debug("Found %d cloud-init events in %s", len(spans), path)
+    return {"boot_epoch": boot_epoch, "spans": spans}
+
+
+def parse_output_log(path: str) -> Dict[str, Any]:
+    """
+    Extract bootstrap stage markers and timings from ``cloud-init-output.log``.
+
+    :param path: Path to ``cloud-init-output.log``.
+    :return: ``{"stages": [(name, epoch)], "commands": [...],
+             "catalog": float|None, "finished": uptime|None}``
+    :rtype: dict
+    """
+    stages = []
+    commands = []
+    catalog = None
+    finished = None
+    for line in _read_lines(path):
+        line = line.rstrip()
+        match = STAGE_RE.match(line)
+        if match:
+            stages.append(
+                (match.group("name"), float(match.group("ts").replace(",", ".")))
+            )
+            continue
+        match = COMMAND_RE.match(line)
+        if match:
+            commands.append(
+                {
+                    "group": match.group("group"),
+                    "command": match.group("cmd"),
+                    "exit_code": int(match.group("rc")),
+                    "duration": float(match.group("secs")),
+                }
+            )
+            continue
+        match = CATALOG_RE.search(line)
+        if match:
+            catalog = float(match.group("secs"))
+            continue
+        match = FINISHED_RE.match(line)
+        if match:
+            finished = float(match.group("up"))
+    return {
+        "stages": stages,
+        "commands": commands,
+        "catalog": catalog,
+        "finished": finished,
+    }
+
+
+def parse_apt_auth_log(path: str) -> Optional[tuple]:
+    """
+    Return the first and last timestamp of ``generate_apt_auth.log``.
+
+    Logs written before the resolver started timestamping its output carry
+    no times and yield None.
+
+    :param path: Path to ``generate_apt_auth.log``.
+    :return: ``(start_epoch, end_epoch)`` or None.
+    :rtype: tuple or None
+    """
+    stamps = [
+        _parse_ts(match.group("ts"))
+        for match in map(APT_AUTH_RE.match, _read_lines(path))
+        if match
+    ]
+    if not stamps:
+        return None
+    return stamps[0], stamps[-1]
+
+
+def build_report(
+    log_dir: str,
+    boot: int = 0,
+    puppet_done_time: Optional[float] = None,
+    boot_epoch: Optional[float] = None,
+) -> BootReport:
+    """
+    Combine all logs found in ``log_dir`` into a :class:`BootReport`.
+
+    :param log_dir: Directory with logs copied from an instance. Only
+                    ``cloud-init.log`` is required.
+    :param boot: Boot index, see :func:`parse_cloud_init_log`.
+    :param puppet_done_time: POSIX time of ``/var/run/puppet-done``. Defaults
+                             to the mtime of ``log_dir/puppet-done`` if present.
+    :param boot_epoch: POSIX time to measure from instead of kernel start,
+                       e.g. a container's start: a container shares the
+                       host's uptime. The first step is then ``container``.
+    :return: The boot report.
+    :rtype: BootReport
+    """
+    ci = parse_cloud_init_log(os.path.join(log_dir, CLOUD_INIT_LOG), boot=boot)
+    zero = ci["boot_epoch"] if boot_epoch is None else boot_epoch
+    spans = []
+    if ci["spans"]:
+        first_event = min(start for _, start, _ in ci["spans"])
+        first = "kernel" if boot_epoch is None else "container"
+        spans.append(Span(first, 0.0, first_event - zero))
+    spans += [Span(name, start - zero, end - start) for name, start, end in ci["spans"]]
+    milestones: Dict[str, float] = {}
+    commands: List[Dict[str, Any]] = []
+    catalog = None
+
+    output_path = os.path.join(log_dir, CLOUD_INIT_OUTPUT_LOG)
+    if os.path.exists(output_path):
+        out = parse_output_log(output_path)
+        commands = out["commands"]
+        catalog = out["catalog"]
+        if out["finished"] is not None:
+            # Logged as uptime, which counts from the kernel's start.
+            milestones["cloud-init-finished"] = round(
+                out["finished"] + ci["boot_epoch"] - zero, 3
+            )
+        runner = next(
+            (s for s in spans if s.name.endswith("/config-scripts_user")),
+            None,
+        )
+        # Each marker starts a stage that lasts until the next one. Without
+        # a "complete" marker (failed bootstrap) the last stage runs until
+        # scripts_user finished.
+        marks = out["stages"]
+        end = None
+        for (name, start), nxt in zip(marks, marks[1:] + [None]):
+            if name == "complete":
+                milestones["bootstrap-complete"] = round(start - zero, 3)
+                continue
+            end = nxt[1] if nxt else (runner.end + zero if runner else start)
+            prefix = f"{runner.name}/" if runner else ""
+            spans.append(
+                Span(f"{prefix}ih-bootstrap/{name}", start - zero, end - start)
+            )
+        if runner and end is not None:
+            spans.append(
+                Span(
+                    f"{runner.name}/ih-bootstrap", marks[0][1] - zero, end - marks[0][1]
+                )
+            )
+
+    apt_auth_path = os.path.join(log_dir, APT_AUTH_LOG)
+    if os.path.exists(apt_auth_path):
+        window = parse_apt_auth_log(apt_auth_path)
+        bootcmd = next(
+            (s for s in spans if s.name.endswith("/config-bootcmd")),
+            None,
+        )
+        if window:
+            prefix = f"{bootcmd.name}/" if bootcmd else ""
+            spans.append(
+                Span(
+                    f"{prefix}generate_apt_auth",
+                    window[0] - zero,
+                    window[1] - window[0],
+                    concurrent=True,
+                )
+            )
+
+    if puppet_done_time is None:
+        marker = os.path.join(log_dir, PUPPET_DONE)
+        if os.path.exists(marker):
+            puppet_done_time = os.path.getmtime(marker)
+    if puppet_done_time is not None:
+        milestones["puppet-done"] = round(puppet_done_time - zero, 3)
+
+    spans.sort(key=lambda s: (s.start, -s.duration))
+    total = max([s.end for s in spans] + list(milestones.values()) + [0.0])
+    return BootReport(
+        boot_time=datetime.fromtimestamp(zero, timezone.utc).isoformat(),
+        total=round(total, 3),
+        spans=spans,
+        milestones=milestones,
+        commands=commands,
+        puppet_catalog=catalog,
+    )
+
+
+def load_report(source: str, boot: int = 0) -> Dict[str, Any]:
+    """
+    Load a report from a log directory or from a JSON report file.
+
+    :param source: Log directory or a file produced by ``analyze --json``.
+    :param boot: Boot index used when ``source`` is a log directory.
+    :return: Report as a dictionary, see :meth:`BootReport.to_dict`.
+    :rtype: dict
+    """
+    if os.path.isdir(source):
+        return build_report(source, boot=boot).to_dict()
+    with open(source, "r", encoding="utf-8") as fp:
+        return json.load(fp)
+
+
+def format_report(report: Dict[str, Any], min_duration: float = 0.05) -> str:
+    """
+    Render the critical path as a plain-text table.
+
+    :param report: Report dictionary.
+    :param min_duration: Critical path steps shorter than this many seconds
+                         are left out of the table (they stay in the JSON).
+    :return: Table text.
+    :rtype: str
+    """
+    total = report["total"] or 1.0
+    rows = [f"Boot at {report['boot_time']}, ready after {report['total']:.3f}s", ""]
+    rows.append(f"{'Stage':<58} {'Start':>9} {'Duration':>9} {'Share':>6}")
+    hidden = 0
+    for span in report["critical_path"]:
+        if span["duration"] < min_duration:
+            hidden += 1
+            continue
+        rows.append(
+            f"{span['name']:<58} {span['start']:>9.3f} {span['duration']:>9.3f}"
+            f" {100 * span['duration'] / total:>5.1f}%"
+        )
+    if hidden:
+        rows.append(f"({hidden} steps shorter than {min_duration}s not shown)")
+    concurrent = [s for s in report["spans"] if s["concurrent"]]
+    if concurrent:
+        rows += ["", "Concurrent (off the critical path):"]
+        for span in concurrent:
+            rows.append(
+                f"  {span['name']:<56} {span['start']:>9.3f} {span['duration']:>9.3f}"
+            )
+    if report["milestones"]:
+        rows += ["", "Milestones:"]
+        for name, offset in sorted(report["milestones"].items(), key=lambda i: i[1]):
+            rows.append(f"  {name:<56} {offset:>9.3f}")
+    if report["puppet_catalog"] is not None:
+        rows += ["", f"Puppet applied catalog in {report['puppet_catalog']:.2f}s"]
+    if report["commands"]:
+        rows += ["", "Parallel commands:"]
+        for cmd in report["commands"]:
+            rows.append(
+                f"  {cmd['group']:<16} exit {cmd['exit_code']:<3} "
+                f"{cmd['duration']:>9.3f}s  {cmd['command']}"
+            )
+    return "\n".join(rows)
+
+
+def compare_reports(before: Dict[str, Any], after: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Compare per-stage durations of two reports.
+
+    :param before: Baseline report.
+    :param after: Report to compare against the baseline.
+    :return: ``{"total": {...}, "stages": [{"name", "before", "after", "delta"}]}``
+             with stages sorted by the absolute change, largest first.
+    :rtype: dict
+    """
+    durations = [
+        {s["name"]: s["duration"] for s in r["spans"]} for r in (before, after)
+    ]
+    names = list(dict.fromkeys(list(durations[0]) + list(durations[1])))
+    stages = []
+    for name in names:
+        old = durations[0].get(name)
+        new = durations[1].get(name)
+        delta = (new or 0.0) - (old or 0.0)
+        stages.append({"name": name, "before": old, "after": new, "delta": delta})
+    stages.sort(key=lambda s: abs(s["delta"]), reverse=True)
+    return {
+        "total": {
+            "before": before["total"],
+            "after": after["total"],
+            "delta": after["total"] - before["total"],
+        },
+        "stages": stages,
+    }
+
+
+def format_comparison(comparison: Dict[str, Any]) -> str:
+    """
+    Render a comparison as a plain-text table.
+
+    :param comparison: Result of :func:`compare_reports`.
+    :return: Table text.
+    :rtype: str
+    """
+
+    def cell(value: Optional[float]) -> str:
+        return f"{value:>9.3f}" if value is not None else f"{'-':>9}"
+
+    total = comparison["total"]
+    rows = [
+        f"Total: {total['before']:.3f}s -> {total['after']:.3f}s ({total['delta']:+.3f}s)",
+        "",
+        f"{'Stage':<58} {'Before':>9} {'After':>9} {'Delta':>9}",
+    ]
+    for stage in comparison["stages"]:
+        rows.append(
+            f"{stage['name']:<58} {cell(stage['before'])} {cell(stage['after'])}"
+            f" {stage['delta']:>+9.3f}"
+        )
+    return "\n".join(rows)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Command line entry point.
+
+    :param argv: Arguments, defaults to ``sys.argv[1:]``.
+    :return: Process exit code.
+    :rtype: int
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--debug", action="store_true", help="Verbose logging.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    analyze = sub.add_parser("analyze", help="Report on logs from one instance.")
+    analyze.add_argument("log_dir", help="Directory with logs copied from an instance.")
+    analyze.add_argument(
+        "--boot",
+        type=int,
+        default=0,
+        help="Boot to report when cloud-init.log covers several: 0 is the first "
+        "(provisioning) boot, -1 the most recent. Default: %(default)s.",
+    )
+    analyze.add_argument(
+        "--puppet-done-time",
+        type=float,
+        default=None,
+        help="POSIX time of /var/run/puppet-done, e.g. from `stat -c %%Y`, "
+        "if the copied marker file did not keep its mtime.",
+    )
+    analyze.add_argument(
+        "--min-duration",
+        type=float,
+        default=0.05,
+        help="Hide critical path steps shorter than this many seconds from the "
+        "table. Default: %(default)s.",
+    )
+    analyze.add_argument("--json", action="store_true", help="Print JSON.")
+
+    compare = sub.add_parser("compare", help="Compare two runs.")
+    compare.add_argument("before", help="Log directory or analyze --json output.")
+    compare.add_argument("after", help="Log directory or analyze --json output.")
+    compare.add_argument("--json", action="store_true", help="Print JSON.")
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(
+        level=logging.DEBUG if args.debug else logging.INFO,
+        format="%(levelname)s %(name)s:%(filename)s:%(lineno)d %(message)s",
+    )
+
+    try:
+        if args.command == "analyze":
+            report = build_report(
+                args.log_dir, boot=args.boot, puppet_done_time=args.puppet_done_time
+            ).to_dict()
+            print(
+                json.dumps(report, indent=4)
+                if args.json
+                else format_report(report, min_duration=args.min_duration)
+            )
+        else:
+            comparison = compare_reports(
+                load_report(args.before), load_report(args.after)
+            )
+            print(
+                json.dumps(comparison, indent=4)
+                if args.json
+                else format_comparison(comparison)
+            )
+    except (OSError, ValueError) as err:
+        LOG.error("%s", err)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,217 @@
+"""
+Estimate what cloud_init_module_allowlist saves, from a default boot's logs.
+
+Reads ``cloud-init.log`` from an instance booted with the image's module
+lists, builds the trimmed lists the module would render (from
+files/cloud_init/modules.json plus ``--allow`` entries) and reports the
+time spent in every module the trimmed lists drop. The estimate covers the
+modules' own run time; the import and config handling cloud-init also
+skips for them is not in the log.
+
+To measure rather than estimate, boot one instance with and one without
+the option and compare them with ``tools/boot_report.py compare``.
+
+Usage::
+
+    scp instance:/var/log/cloud-init.log run-default/
+    python tools/cloud_init_trim.py run-default
+    python tools/cloud_init_trim.py run-default/cloud-init.log \\
+        --allow cloud_config_modules=ntp --json
+"""
+
+import argparse
+import json
+import logging
+import os
+import re
+import sys
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional
+
+from boot_report import CLOUD_INIT_LOG, parse_cloud_init_log
+
+LOG = logging.getLogger(__name__)
+
+MODULE_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+MODULES_PATH = os.path.join(MODULE_ROOT, "files", "cloud_init", "modules.json")
+
+# cloud-init.log stage names of the three module lists.
+STAGES = {
+    "init-network": "cloud_init_modules",
+    "modules-config": "cloud_config_modules",
+    "modules-final": "cloud_final_modules",
+}
+MODULE_SPAN_RE = re.compile(r"^(?P<stage>[a-z-]+)/config-(?P<module>[^/]+)$")
+
+
+@dataclass
+class Result:
+    """Time spent in one module the trimmed lists drop."""
+
+    stage: str
+    module: str
+    seconds: float
+
+
+def load_module_lists(path: str = MODULES_PATH) -> Dict[str, Dict[str, List[str]]]:
+    """
+    Load the default and kept modules per list.
+
+    :param path: Path to modules.json.
+    :type path: str
+    :return: ``{list: {"default": [...], "keep": [...]}}``.
+    :rtype: dict
+    """
+    with open(path, encoding="utf-8") as fp:
+        return json.load(fp)
+
+
+def trimmed_lists(
+    module_lists: Dict[str, Dict[str, List[str]]], allowlist: Dict[str, List[str]]
+) -> Dict[str, List[str]]:
+    """
+    Build the module lists as locals.tf renders them.
+
+    :param module_lists: Output of :func:`load_module_lists`.
+    :type module_lists: dict
+    :param allowlist: Extra modules per list, like
+        ``var.cloud_init_module_allowlist``.
+    :type allowlist: dict
+    :return: Module names per list.
+    :rtype: dict
+    """
+    result = {}
+    for name, modules in module_lists.items():
+        extra = allowlist.get(name, [])
+        wanted = modules["keep"] + extra
+        ordered = [m for m in modules["default"] if m in wanted]
+        ordered += [m for m in extra if m not in modules["default"]]
+        result[name] = list(dict.fromkeys(ordered))
+    return result
+
+
+def module_times(path: str, boot: int = 0) -> Dict[str, Dict[str, float]]:
+    """
+    Time spent per module of one boot.
+
+    :param path: Path to ``cloud-init.log``.
+    :type path: str
+    :param boot: Which boot, see :func:`boot_report.parse_cloud_init_log`.
+    :type boot: int
+    :return: Seconds per module name, per module list.
+    :rtype: dict
+    :raises ValueError: If the log has no boot in it.
+    """
+    times: Dict[str, Dict[str, float]] = {name: {} for name in STAGES.values()}
+    for name, start, end in parse_cloud_init_log(path, boot)["spans"]:
+        match = MODULE_SPAN_RE.match(name)
+        if not match or match.group("stage") not in STAGES:
+            continue
+        stage = STAGES[match.group("stage")]
+        module = match.group("module").replace("-", "_")
+        times[stage][module] = times[stage].get(module, 0.0) + end - start
+    return times
+
+
+def estimate(
+    times: Dict[str, Dict[str, float]], lists: Dict[str, List[str]]
+) -> List[Result]:
+    """
+    List the modules that ran but are not in the trimmed lists.
+
+    :param times: Output of :func:`module_times`.
+    :type times: dict
+    :param lists: Output of :func:`trimmed_lists`.
+    :type lists: dict
+    :return: Dropped modules, slowest first.
+    :rtype: list
+    """
+    results = [
+        Result(stage, module, round(seconds, 3))
+        for stage, modules in times.items()
+        for module, seconds in modules.items()
+        if module not in lists.get(stage, [])
+    ]
+    return sorted(results, key=lambda r: r.seconds, reverse=True)
+
+
+def format_results(results: List[Dict]) -> str:
+    """
+    Render results as a table with the total.
+
+    :param results: Results, as dictionaries.
+    :type results: list
+    :return: Table text.
+    :rtype: str
+    """
+    lines = [f"{'list':<22}  {'module':<32}  {'seconds':>8}"]
+    for r in results:
+        lines.append(f"{r['stage']:<22}  {r['module']:<32}  {r['seconds']:>7.3f}s")
+    total = sum(r["seconds"] for r in results)
+    lines.append(f"\ntrimming skips {len(results)} module(s), {total:.3f}s per boot")
+    return "\n".join(lines)
+
+
+def _parse_allow(values: List[str]) -> Dict[str, List[str]]:
+    allowlist: Dict[str, List[str]] = {}
+    for value in values:
+        stage, _, module = value.partition("=")
+        if stage not in STAGES.values() or not module:
+            raise ValueError(
+                f"--allow {value!r}: expected LIST=MODULE,"
+                f" LIST one of {', '.join(STAGES.values())}"
+            )
+        allowlist.setdefault(stage, []).append(module)
+    return allowlist
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Command line entry point.
+
+    :param argv: Arguments, defaults to ``sys.argv[1:]``.
+    :return: Process exit code.
+    :rtype: int
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--debug", action="store_true", help="Verbose logging.")
+    parser.add_argument(
+        "log", help=f"{CLOUD_INIT_LOG} or a directory that contains it."
+    )
+    parser.add_argument(
+        "--allow",
+        action="append",
+        default=[],
+        metavar="LIST=MODULE",
+        help="Allowlisted module, e.g. cloud_config_modules=ntp. Repeatable.",
+    )
+    parser.add_argument(
+        "--boot",
+        type=int,
+        default=0,
+        help="Boot to analyze when the log has several; -1 is the last."
+        " Default: %(default)s.",
+    )
+    parser.add_argument("--json", action="store_true", help="Print JSON.")
+    args = parser.parse_args(argv)
+    logging.basicConfig(
+        level=logging.DEBUG if args.debug else logging.INFO,
+        format="%(levelname)s %(name)s:%(filename)s:%(lineno)d %(message)s",
+    )
+
+    path = args.log
+    if os.path.isdir(path):
+        path = os.path.join(path, CLOUD_INIT_LOG)
+    try:
+        lists = trimmed_lists(load_module_lists(), _parse_allow(args.allow))
+        results = [asdict(r) for r in estimate(module_times(path, args.boot), lists)]
+    except (OSError, ValueError, IndexError) as err:
+        LOG.error("%s", err)
+        return 1
+
+    print(json.dumps(results, indent=4) if args.json else format_results(results))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
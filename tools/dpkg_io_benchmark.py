@@ -0,0 +1,285 @@
+"""
+Measure what dpkg_unsafe_io saves when unpacking the first-boot packages.
+
+Unpacks a set of .deb files into a scratch root twice per run: once with
+dpkg's default fsync of every unpacked file, once with
+``--force-unsafe-io``. The unsafe mode is also charged for the ``sync``
+that ih-bootstrap runs when it switches back to safe writes, so the
+reported saving is the net one.
+
+The scratch root must be on the filesystem under test, the root volume on
+an instance; /tmp is often a tmpfs, where fsync costs nothing. Maintainer
+scripts are stripped from copies of the packages, so nothing runs on the
+host and only the unpacking is timed. Without ``--mirror``, the module's
+package set and its dependencies are fetched with ``apt-get download``.
+Run it as root::
+
+    sudo python3 tools/dpkg_io_benchmark.py --runs 3
+    sudo python3 tools/dpkg_io_benchmark.py --mirror /var/cache/apt/archives --json
+"""
+
+import argparse
+import logging
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional
+
+from apt_benchmark import DEFAULT_PACKAGES, download_packages
+from benchmark import (
+    Column,
+    argument_parser,
+    format_table,
+    run_cli,
+    saving,
+    seconds,
+    text,
+)
+
+LOG = logging.getLogger(__name__)
+
+MAINTAINER_SCRIPTS = ("preinst", "postinst", "prerm", "postrm", "config", "triggers")
+
+
+@dataclass
+class Result:
+    """Median timings of one dpkg mode."""
+
+    mode: str
+    runs: int
+    unpack_s: float
+    sync_s: float
+    total_s: float
+
+
+def strip_maintainer_scripts(deb: str, directory: str) -> str:
+    """
+    Copy a package without its maintainer scripts and triggers.
+
+    :param deb: Path of the .deb file.
+    :type deb: str
+    :param directory: Where to write the copy.
+    :type directory: str
+    :return: Path of the copy.
+    :rtype: str
+    :raises subprocess.CalledProcessError: If dpkg-deb fails.
+    """
+    with tempfile.TemporaryDirectory(dir=directory) as tmp:
+        tree = os.path.join(tmp, "tree")
+        subprocess.run(["dpkg-deb", "-R", deb, tree], check=True, capture_output=True)
+        for name in MAINTAINER_SCRIPTS:
+            path = os.path.join(tree, "DEBIAN", name)
+            if os.path.exists(path):
+                os.remove(path)
+        target = os.path.join(directory, os.path.basename(deb))
+        subprocess.run(
+            ["dpkg-deb", "-Zgzip", "-z1", "-b", tree, target],
+            check=True,
+            capture_output=True,
+        )
+    return target
+
+
+def unpack(debs: List[str], root: str, unsafe_io: bool) -> float:
+    """
+    Time ``dpkg --unpack`` of the packages into an empty root.
+
+    :param debs: Paths of the .deb files.
+    :type debs: list
+    :param root: Scratch root; created with an empty dpkg database.
+    :type root: str
+    :param unsafe_io: Pass ``--force-unsafe-io``.
+    :type unsafe_io: bool
+    :return: Wall time in seconds.
+    :rtype: float
+    :raises subprocess.CalledProcessError: If dpkg fails.
+    """
+    admindir = os.path.join(root, "var", "lib", "dpkg")
+    for name in ("updates", "info", "triggers"):
+        os.makedirs(os.path.join(admindir, name), exist_ok=True)
+    for name in ("status", "available"):
+        open(os.path.join(admindir, name), "w", encoding="utf-8").close()
+    cmd = [
+        "dpkg",
+        f"--instdir={root}",
+        f"--admindir={admindir}",
+        "--force-not-root",
+        "--force-depends",
+        "--no-triggers",
+        "--log=/dev/null",
+    ]
+    if unsafe_io:
+        cmd.append("--force-unsafe-io")
+    cmd += ["--unpack"] + debs
+    LOG.debug("Running %s", " ".join(cmd[:8]))
+    start = time.monotonic()
+    subprocess.run(cmd, check=True, capture_output=True, text=True)
+    return time.monotonic() - start
+
+
+def time_sync() -> float:
+    """
+    Time one ``sync``.
+
+    :return: Wall time in seconds.
+    :rtype: float
+    """
+    start = time.monotonic()
+    subprocess.run(["sync"], check=True)
+    return time.monotonic() - start
+
+
+def fsync_latency(directory: str, count: int = 100) -> float:
+    """
+    Average time of a small write and fsync, as dpkg does per file.
+
+    :param directory: Directory on the filesystem under test.
+    :type directory: str
+    :param count: Number of writes.
+    :type count: int
+    :return: Seconds per fsync.
+    :rtype: float
+    """
+    with tempfile.NamedTemporaryFile(dir=directory) as fp:
+        start = time.monotonic()
+        for _ in range(count):
+            fp.write(b"\0" * 4096)
+            fp.flush()
+            os.fsync(fp.fileno())
+        return (time.monotonic() - start) / count
+
+
+def run_benchmark(debs: List[str], target_dir: str, runs: int = 3) -> List[Result]:
+    """
+    Compare unpacking with and without ``--force-unsafe-io``.
+
+    Modes alternate within a run, and every unpack starts after a ``sync``
+    so neither inherits the other's dirty pages.
+
+    :param debs: Paths of the .deb files.
+    :type debs: list
+    :param target_dir: Directory on the filesystem under test.
+    :type target_dir: str
+    :param runs: Runs per mode.
+    :type runs: int
+    :return: Results for ``safe`` and ``unsafe-io``, with median timings.
+    :rtype: list
+    :raises subprocess.CalledProcessError: If dpkg-deb or dpkg fail.
+    :raises ValueError: If there are no packages.
+    """
+    if not debs:
+        raise ValueError("no .deb files to unpack")
+    LOG.info(
+        "fsync on %s takes %.2f ms; the saving scales with it",
+        target_dir,
+        fsync_latency(target_dir) * 1000,
+    )
+    samples: Dict[str, List[Dict[str, float]]] = {"safe": [], "unsafe-io": []}
+    with tempfile.TemporaryDirectory(dir=target_dir) as tmp:
+        packages = os.path.join(tmp, "packages")
+        os.makedirs(packages)
+        debs = [strip_maintainer_scripts(deb, packages) for deb in debs]
+        for run in range(runs):
+            for mode in samples:
+                root = os.path.join(tmp, f"root-{mode}-{run}")
+                time_sync()
+                sample = {"unpack_s": unpack(debs, root, mode == "unsafe-io")}
+                # Safe mode has nothing left to flush; unsafe-io pays here.
+                sample["sync_s"] = time_sync() if mode == "unsafe-io" else 0.0
+                LOG.info(
+                    "%s run %d: unpack %.3fs, sync %.3fs",
+                    mode,
+                    run + 1,
+                    sample["unpack_s"],
+                    sample["sync_s"],
+                )
+                samples[mode].append(sample)
+                shutil.rmtree(root)
+    results = []
+    for mode, values in samples.items():
+        unpack_s = statistics.median(v["unpack_s"] for v in values)
+        sync_s = statistics.median(v["sync_s"] for v in values)
+        results.append(Result(mode, len(values), unpack_s, sync_s, unpack_s + sync_s))
+    return results
+
+
+def format_results(results: List[Dict]) -> str:
+    """
+    Render results as a table, with the net saving of unsafe-io.
+
+    :param results: Results, as dictionaries.
+    :type results: list
+    :return: Table text.
+    :rtype: str
+    """
+    table = format_table(
+        results,
+        [
+            Column("mode", text("mode"), "<"),
+            Column("runs", text("runs")),
+            Column("unpack", seconds("unpack_s")),
+            Column("sync", seconds("sync_s")),
+            Column("total", seconds("total_s")),
+        ],
+    )
+    unsafe = saving(results, "mode", "total_s", "safe", "unsafe-io")
+    if unsafe:
+        table += (
+            f"\n\nunsafe-io saves {unsafe[0]:.3f}s including the final sync"
+            f" ({unsafe[1]:.0%} of safe)"
+        )
+    return table
+
+
+def _benchmark(args: argparse.Namespace) -> List[Dict]:
+    with tempfile.TemporaryDirectory() as download_dir:
+        mirror = args.mirror
+        if mirror is None:
+            download_packages(args.packages, download_dir)
+            mirror = download_dir
+        debs = sorted(
+            os.path.join(mirror, name)
+            for name in os.listdir(mirror)
+            if name.endswith(".deb")
+        )
+        return [asdict(r) for r in run_benchmark(debs, args.target_dir, args.runs)]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Command line entry point.
+
+    :param argv: Arguments, defaults to ``sys.argv[1:]``.
+    :return: Process exit code.
+    :rtype: int
+    """
+    parser = argument_parser(__doc__)
+    parser.add_argument(
+        "--packages",
+        nargs="+",
+        default=DEFAULT_PACKAGES,
+        help="Packages to download. Default: %(default)s.",
+    )
+    parser.add_argument(
+        "--mirror",
+        help="Directory with the .deb files to unpack."
+        " Default: download the package set with apt-get.",
+    )
+    parser.add_argument(
+        "--target-dir",
+        default="/var/tmp",
+        help="Directory on the filesystem under test. Default: %(default)s.",
+    )
+    parser.add_argument(
+        "--runs", type=int, default=3, help="Runs per mode. Default: %(default)s."
+    )
+    return run_cli(parser, argv, _benchmark, format_results)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,304 @@
+"""
+Measure how much the facter.conf fact cache saves on repeated fact resolution.
+
+Renders two facter.conf files the way the module does: one with only
+``external-dir`` and one with the ``facts.ttls`` of the cached fact
+groups. The TTLs default to files/facter/fact_ttls.json, the groups that
+are safe to cache for facter_fact_ttls. It then times ``facter --config`` in three modes:
+
+* ``no-cache`` - every run resolves all facts, like Puppet runs without the
+  cache.
+* ``cache-cold`` - the first run with an empty cache, which resolves and
+  writes the cached groups (the first Puppet run on a new instance).
+* ``cache-warm`` - later runs that read the cached groups (every later
+  Puppet run on a long-lived host, until the TTLs expire).
+
+Run it on an EC2 instance with Puppet's facter. Use the same user that runs
+Puppet, because the cache directory is per user::
+
+    sudo python3 tools/facter_cache_benchmark.py --runs 5
+    sudo python3 tools/facter_cache_benchmark.py --ttls my-ttls.json --json
+"""
+
+import json
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional
+
+from benchmark import (
+    Column,
+    argument_parser,
+    format_table,
+    run_cli,
+    saving,
+    seconds,
+    text,
+)
+
+LOG = logging.getLogger(__name__)
+
+MODULE_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+TTLS_PATH = os.path.join(MODULE_ROOT, "files", "facter", "fact_ttls.json")
+
+EXTERNAL_DIR = "/etc/puppetlabs/facter/facts.d"
+ROOT_CACHE_DIR = "/opt/puppetlabs/facter/cache/cached_facts"
+USER_CACHE_DIR = "~/.puppetlabs/opt/facter/cache/cached_facts"
+
+
+@dataclass
+class Result:
+    """Fact resolution times of one mode."""
+
+    mode: str
+    runs: int
+    min_s: float
+    median_s: float
+    max_s: float
+
+
+def load_ttls(path: str = TTLS_PATH) -> Dict[str, str]:
+    """
+    Load fact group TTLs.
+
+    :param path: Path to a JSON map of fact group to duration.
+    :type path: str
+    :return: TTLs by fact group.
+    :rtype: dict
+    """
+    with open(path, encoding="utf-8") as fp:
+        return json.load(fp)
+
+
+def render_facter_conf(ttls: Dict[str, str], external_dir: str = EXTERNAL_DIR) -> str:
+    """
+    Render facter.conf as files/facter/facter.conf.tpl does.
+
+    :param ttls: TTLs by fact group; empty disables the cache.
+    :type ttls: dict
+    :param external_dir: External facts directory.
+    :type external_dir: str
+    :return: facter.conf content.
+    :rtype: str
+    """
+    lines = ["global : {", f'        external-dir : "{external_dir}/",', "}"]
+    if ttls:
+        lines += ["facts : {", "        ttls : ["]
+        lines += [
+            f'                {{ "{group}" : {ttl} }},'
+            for group, ttl in sorted(ttls.items())
+        ]
+        lines += ["        ]", "}"]
+    return "\n".join(lines) + "\n"
+
+
+def default_cache_dir() -> str:
+    """
+    Facter's cache directory for the current user.
+
+    :return: Path of the cached facts directory.
+    :rtype: str
+    """
+    return ROOT_CACHE_DIR if os.geteuid() == 0 else os.path.expanduser(USER_CACHE_DIR)
+
+
+def clear_cache(cache_dir: str) -> int:
+    """
+    Remove the cached fact groups.
+
+    :param cache_dir: Facter's cached facts directory.
+    :type cache_dir: str
+    :return: Number of files removed.
+    :rtype: int
+    """
+    if not os.path.isdir(cache_dir):
+        return 0
+    removed = 0
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        if os.path.isfile(path):
+            os.remove(path)
+            removed += 1
+    return removed
+
+
+def time_facter(facter: str, config: str, facts: List[str]) -> float:
+    """
+    Time one ``facter --config`` run.
+
+    :param facter: facter executable.
+    :type facter: str
+    :param config: Path of the facter.conf to use.
+    :type config: str
+    :param facts: Facts to resolve; all facts if empty.
+    :type facts: list
+    :return: Wall time in seconds.
+    :rtype: float
+    :raises subprocess.CalledProcessError: If facter fails.
+    """
+    cmd = [facter, "--config", config, "--json"] + facts
+    LOG.debug("Running %s", " ".join(cmd))
+    start = time.monotonic()
+    subprocess.run(cmd, check=True, capture_output=True, text=True)
+    return time.monotonic() - start
+
+
+def _result(mode: str, times: List[float]) -> Result:
+    LOG.info("%s: %s", mode, ", ".join(f"{t:.3f}s" for t in times))
+    return Result(mode, len(times), min(times), statistics.median(times), max(times))
+
+
+def run_benchmark(
+    ttls: Dict[str, str],
+    runs: int = 5,
+    facter: str = "facter",
+    cache_dir: Optional[str] = None,
+    facts: Optional[List[str]] = None,
+    external_dir: str = EXTERNAL_DIR,
+) -> List[Result]:
+    """
+    Time fact resolution without the cache, with a cold and a warm cache.
+
+    The cache is cleared before the cold run and again at the end, so the
+    host's next Puppet run starts from the state it had without the
+    benchmark's config.
+
+    :param ttls: TTLs by fact group for the cached config.
+    :type ttls: dict
+    :param runs: Timed runs for ``no-cache`` and ``cache-warm``.
+    :type runs: int
+    :param facter: facter executable.
+    :type facter: str
+    :param cache_dir: Facter's cached facts directory; see
+        :func:`default_cache_dir`.
+    :type cache_dir: str
+    :param facts: Facts to resolve; all facts by default.
+    :type facts: list
+    :param external_dir: External facts directory written into both configs.
+    :type external_dir: str
+    :return: Results for ``no-cache``, ``cache-cold`` and ``cache-warm``.
+    :rtype: list
+    :raises subprocess.CalledProcessError: If facter fails.
+    :raises ValueError: If ``ttls`` is empty.
+    """
+    if not ttls:
+        raise ValueError("no fact groups to cache")
+    cache_dir = cache_dir or default_cache_dir()
+    facts = facts or []
+    with tempfile.TemporaryDirectory() as tmp:
+        plain = os.path.join(tmp, "facter-no-cache.conf")
+        cached = os.path.join(tmp, "facter-cache.conf")
+        with open(plain, "w", encoding="utf-8") as fp:
+            fp.write(render_facter_conf({}, external_dir))
+        with open(cached, "w", encoding="utf-8") as fp:
+            fp.write(render_facter_conf(ttls, external_dir))
+
+        try:
+            clear_cache(cache_dir)
+            results = [
+                _result(
+                    "no-cache", [time_facter(facter, plain, facts) for _ in range(runs)]
+                ),
+                _result("cache-cold", [time_facter(facter, cached, facts)]),
+            ]
+            if not os.path.isdir(cache_dir) or not os.listdir(cache_dir):
+                LOG.warning(
+                    "facter wrote nothing to %s; is --cache-dir right for this user?",
+                    cache_dir,
+                )
+            results.append(
+                _result(
+                    "cache-warm",
+                    [time_facter(facter, cached, facts) for _ in range(runs)],
+                )
+            )
+        finally:
+            clear_cache(cache_dir)
+    return results
+
+
+def format_results(results: List[Dict]) -> str:
+    """
+    Render results as a table, with the warm cache speedup.
+
+    :param results: Results, as dictionaries.
+    :type results: list
+    :return: Table text.
+    :rtype: str
+    """
+    table = format_table(
+        results,
+        [
+            Column("mode", text("mode"), "<"),
+            Column("runs", text("runs")),
+            Column("min", seconds("min_s")),
+            Column("median", seconds("median_s")),
+            Column("max", seconds("max_s")),
+        ],
+    )
+    warm = saving(results, "mode", "median_s", "no-cache", "cache-warm")
+    if warm:
+        table += (
+            f"\n\ncache-warm saves {warm[0]:.3f}s per run ({warm[1]:.0%} of no-cache)"
+        )
+    return table
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Command line entry point.
+
+    :param argv: Arguments, defaults to ``sys.argv[1:]``.
+    :return: Process exit code.
+    :rtype: int
+    """
+    parser = argument_parser(__doc__)
+    parser.add_argument(
+        "--ttls",
+        default=TTLS_PATH,
+        help="JSON map of fact group to TTL. Default: the suggested TTLs.",
+    )
+    parser.add_argument(
+        "--runs", type=int, default=5, help="Timed runs per mode. Default: %(default)s."
+    )
+    parser.add_argument(
+        "--facter", default="facter", help="facter executable. Default: %(default)s."
+    )
+    parser.add_argument(
+        "--cache-dir",
+        help=f"Facter's cached facts directory. Default: {ROOT_CACHE_DIR} for root,"
+        f" {USER_CACHE_DIR} otherwise.",
+    )
+    parser.add_argument(
+        "--external-dir",
+        default=EXTERNAL_DIR,
+        help="External facts directory. Default: %(default)s.",
+    )
+    parser.add_argument(
+        "facts", nargs="*", help="Facts to resolve. Default: all facts."
+    )
+    return run_cli(
+        parser,
+        argv,
+        lambda args: [
+            asdict(r)
+            for r in run_benchmark(
+                load_ttls(args.ttls),
+                args.runs,
+                args.facter,
+                args.cache_dir,
+                args.facts,
+                args.external_dir,
+            )
+        ],
+        format_results,
+    )
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,324 @@
+"""
+Benchmark NFS throughput of the nfs_mount_profile options on a local server.
+
+Exports a scratch directory from the local NFS server, mounts it over
+127.0.0.1 once per profile and measures sequential write and read
+throughput with several concurrent streams. The options come from
+files/nfs_profile/profiles.json, the same file the module renders from, and
+are merged into the baseline fs_mntops the way the module does it. Profile
+sysctls and sunrpc settings are applied for the profile's run and restored
+afterwards.
+
+Loopback has no latency, which hides most of what nconnect and a bigger
+slot table buy on EFS; ``--delay-ms`` adds a netem delay to ``lo`` for the
+duration of the run to approximate a cross-AZ round trip.
+
+Requires root and a running nfs-kernel-server::
+
+    sudo apt-get install nfs-kernel-server
+    sudo python3 tools/nfs_benchmark.py --delay-ms 1 --size-mb 512
+    sudo python3 tools/nfs_benchmark.py --profiles defaults efs-throughput --json
+"""
+
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional
+
+from benchmark import (
+    Column,
+    argument_parser,
+    format_table,
+    run_cli,
+    text,
+)
+
+LOG = logging.getLogger(__name__)
+
+MODULE_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+PROFILES_PATH = os.path.join(MODULE_ROOT, "files", "nfs_profile", "profiles.json")
+
+# Options dropped from a profile when fs_mntops already has a conflicting
+# one. vers is an alias of nfsvers and the kernel takes v3, v4.1, ... too.
+VERSION_OPTIONS = ["nfsvers", "vers", "v2", "v3", "v4", "v4.0", "v4.1", "v4.2"]
+CONFLICTS = {
+    "hard": ["soft"],
+    "soft": ["hard"],
+    "noresvport": ["resvport"],
+    "resvport": ["noresvport"],
+    **{o: [v for v in VERSION_OPTIONS if v != o] for o in VERSION_OPTIONS},
+}
+
+BLOCK_SIZE = 1024 * 1024
+
+
+@dataclass
+class Result:
+    """Throughput of one profile."""
+
+    profile: str
+    options: str
+    write_mib_s: float
+    read_mib_s: float
+
+
+def load_profiles(path: str = PROFILES_PATH) -> Dict[str, Dict]:
+    """
+    Load the nfs_mount_profile definitions.
+
+    :param path: Path to profiles.json.
+    :type path: str
+    :return: Profiles by name.
+    :rtype: dict
+    """
+    with open(path, encoding="utf-8") as fp:
+        return json.load(fp)
+
+
+def merge_options(mntops: str, profile: Optional[Dict]) -> str:
+    """
+    Apply a profile to fs_mntops the way the module does.
+
+    Profile options fill in the string, options already present keep their
+    value, a profile option is dropped when a conflicting one is present, and a
+    bare ``defaults`` is removed. Options are sorted by name, as Terraform
+    sorts map keys.
+
+    :param mntops: fs_mntops as given in var.mounts.
+    :type mntops: str
+    :param profile: Profile definition, or None to use ``mntops`` as-is.
+    :type profile: dict
+    :return: Resulting fs_mntops.
+    :rtype: str
+    """
+    if profile is None:
+        return mntops
+    given = {o.split("=")[0]: o for o in mntops.split(",") if o}
+    options = {
+        k: k if v is None else f"{k}={v}"
+        for k, v in profile["options"].items()
+        if not any(c in given for c in CONFLICTS.get(k, []))
+    }
+    options.update(given)
+    return ",".join(v for k, v in sorted(options.items()) if k != "defaults")
+
+
+def _run(cmd: List[str]) -> str:
+    LOG.debug("Running %s", " ".join(cmd))
+    return subprocess.run(cmd, check=True, capture_output=True, text=True).stdout
+
+
+def _stream(path: str, size_mb: int, write: bool) -> None:
+    if write:
+        block = os.urandom(BLOCK_SIZE)
+        with open(path, "wb") as fp:
+            for _ in range(size_mb):
+                fp.write(block)
+            fp.flush()
+            os.fsync(fp.fileno())
+    else:
+        with open(path, "rb") as fp:
+            while fp.read(BLOCK_SIZE):
+                pass
+
+
+def measure_throughput(directory: str, size_mb: int, jobs: int, write: bool) -> float:
+    """
+    Write or read ``jobs`` files of ``size_mb / jobs`` MiB concurrently.
+
+    :param directory: Directory on the file system under test.
+    :type directory: str
+    :param size_mb: Total MiB to transfer.
+    :type size_mb: int
+    :param jobs: Number of concurrent streams.
+    :type jobs: int
+    :param write: Write the files (fsync'ed) if True, read them back if False.
+    :type write: bool
+    :return: Throughput in MiB/s.
+    :rtype: float
+    """
+    per_job = max(1, size_mb // jobs)
+    paths = [os.path.join(directory, f"stream-{i}") for i in range(jobs)]
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        for future in [pool.submit(_stream, p, per_job, write) for p in paths]:
+            future.result()
+    return per_job * jobs / max(time.monotonic() - start, 1e-6)
+
+
+def _apply_tuning(profile: Optional[Dict]) -> Dict[str, str]:
+    """Apply a profile's sysctls; return the previous values."""
+    if profile is None:
+        return {}
+    settings = dict(profile["sysctl"])
+    if profile["sunrpc"]:
+        _run(["modprobe", "sunrpc"])
+        settings.update({f"sunrpc.{k}": v for k, v in profile["sunrpc"].items()})
+    previous = {k: _run(["sysctl", "-n", k]).strip() for k in settings}
+    for key, value in settings.items():
+        _run(["sysctl", "-q", "-w", f"{key}={value}"])
+    return previous
+
+
+def _restore_tuning(previous: Dict[str, str]) -> None:
+    for key, value in previous.items():
+        _run(["sysctl", "-q", "-w", f"{key}={value}"])
+
+
+def run_benchmark(
+    profiles: List[str],
+    base_options: str = "defaults",
+    size_mb: int = 256,
+    jobs: int = 8,
+    delay_ms: float = 0,
+    workdir: Optional[str] = None,
+) -> List[Result]:
+    """
+    Measure every profile against a local NFS export.
+
+    :param profiles: Profile names; ``defaults`` means ``base_options`` alone.
+    :type profiles: list
+    :param base_options: fs_mntops the profiles are merged into.
+    :type base_options: str
+    :param size_mb: MiB written and read per profile.
+    :type size_mb: int
+    :param jobs: Concurrent streams.
+    :type jobs: int
+    :param delay_ms: netem delay added to ``lo`` during the run.
+    :type delay_ms: float
+    :param workdir: Where to create the export and mount point; a temporary
+        directory by default.
+    :type workdir: str
+    :return: One result per profile.
+    :rtype: list
+    :raises subprocess.CalledProcessError: If exportfs, mount or sysctl fail.
+    :raises KeyError: If a profile is unknown.
+    """
+    definitions = load_profiles()
+    with tempfile.TemporaryDirectory(dir=workdir) as tmp:
+        export = os.path.join(tmp, "export")
+        mountpoint = os.path.join(tmp, "mnt")
+        os.makedirs(export)
+        os.makedirs(mountpoint)
+        _run(["exportfs", "-o", "rw,no_root_squash,insecure", f"127.0.0.1:{export}"])
+        if delay_ms:
+            _run(
+                ["tc", "qdisc", "add", "dev", "lo", "root"]
+                + ["netem", "delay", f"{delay_ms}ms"]
+            )
+        results = []
+        try:
+            for name in profiles:
+                profile = None if name == "defaults" else definitions[name]
+                options = merge_options(base_options, profile)
+                previous = _apply_tuning(profile)
+                try:
+                    _run(
+                        ["mount", "-t", "nfs4", "-o", options]
+                        + [f"127.0.0.1:{export}", mountpoint]
+                    )
+                    try:
+                        written = measure_throughput(mountpoint, size_mb, jobs, True)
+                    finally:
+                        _run(["umount", mountpoint])
+                    # Remount so the reads come from the server, not the
+                    # client page cache.
+                    _run(
+                        ["mount", "-t", "nfs4", "-o", options]
+                        + [f"127.0.0.1:{export}", mountpoint]
+                    )
+                    try:
+                        read = measure_throughput(mountpoint, size_mb, jobs, False)
+                    finally:
+                        _run(["umount", mountpoint])
+                finally:
+                    _restore_tuning(previous)
+                LOG.info("%s: write %.1f MiB/s, read %.1f MiB/s", name, written, read)
+                results.append(Result(name, options, written, read))
+        finally:
+            if delay_ms:
+                _run(["tc", "qdisc", "del", "dev", "lo", "root"])
+            _run(["exportfs", "-u", f"127.0.0.1:{export}"])
+    return results
+
+
+def format_results(results: List[Dict]) -> str:
+    """
+    Render results as a table.
+
+    :param results: Results, as dictionaries.
+    :type results: list
+    :return: Table text.
+    :rtype: str
+    """
+    return format_table(
+        results,
+        [
+            Column("profile", text("profile"), "<"),
+            Column("write", lambda r: f"{r['write_mib_s']:.1f} MiB/s"),
+            Column("read", lambda r: f"{r['read_mib_s']:.1f} MiB/s"),
+            Column("options", text("options"), "<"),
+        ],
+    )
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Command line entry point.
+
+    :param argv: Arguments, defaults to ``sys.argv[1:]``.
+    :return: Process exit code.
+    :rtype: int
+    """
+    parser = argument_parser(__doc__)
+    parser.add_argument(
+        "--profiles",
+        nargs="+",
+        default=["defaults"] + sorted(load_profiles()),
+        help="Profiles to compare; 'defaults' is the baseline. Default: %(default)s.",
+    )
+    parser.add_argument(
+        "--base-options",
+        default="defaults",
+        help="fs_mntops the profiles are merged into. Default: %(default)s.",
+    )
+    parser.add_argument(
+        "--size-mb", type=int, default=256, help="MiB per run. Default: %(default)s."
+    )
+    parser.add_argument(
+        "--jobs", type=int, default=8, help="Concurrent streams. Default: %(default)s."
+    )
+    parser.add_argument(
+        "--delay-ms",
+        type=float,
+        default=0,
+        help="Round trip delay added to lo with netem. Default: %(default)s.",
+    )
+    parser.add_argument("--workdir", help="Directory for the export and mount point.")
+    return run_cli(
+        parser,
+        argv,
+        lambda args: [
+            asdict(r)
+            for r in run_benchmark(
+                args.profiles,
+                args.base_options,
+                args.size_mb,
+                args.jobs,
+                args.delay_ms,
+                args.workdir,
+            )
+        ],
+        format_results,
+        {KeyError: lambda err: f"Unknown profile {err}"},
+    )
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,413 @@
+"""
+Benchmark ``terraform plan`` for root modules with many module instances.
+
+Generates a root module with N copies of this module, each with different
+inputs (roles, environments, extra files and repos, mounts, parallel
+runcmd groups, ...), and times ``terraform plan`` on it for every N. Peak
+memory of terraform and its provider plugins is recorded next to the time.
+
+The plan runs offline. The module only reads data sources - the rendered
+``cloudinit_config`` and ``aws_region``. The AWS provider is configured with
+a fixed region, stub credentials and every account, credential and metadata
+lookup disabled, so ``aws_region`` resolves locally and no AWS API is called.
+Providers come from ``$TF_PLUGIN_CACHE_DIR`` after the first ``terraform
+init``; nothing else needs the network.
+
+Usage::
+
+    python tools/plan_benchmark.py run --counts 1 10 25 50 --json > plan-bench.json
+    python tools/plan_benchmark.py run --counts 1 10 25 50 --baseline plan-bench.json
+
+With ``--baseline``, the exit code is 1 if any count got slower or bigger
+than the baseline by more than ``--tolerance``.
+"""
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional
+
+from benchmark import (
+    Column,
+    add_json_flag,
+    argument_parser,
+    format_table,
+    print_results,
+    run_cli,
+    seconds,
+    text,
+)
+
+LOG = logging.getLogger(__name__)
+
+MODULE_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+PROVIDERS_TF = """\
+terraform {
+  required_providers {
+    aws = {
+      source  = "hashicorp/aws"
+      version = "%(aws_provider_version)s"
+    }
+    cloudinit = {
+      source  = "hashicorp/cloudinit"
+      version = "~> 2.3"
+    }
+  }
+}
+
+# Offline stub: data.aws_region resolves from this configuration alone.
+provider "aws" {
+  region                      = "us-west-2"
+  access_key                  = "benchmark"
+  secret_key                  = "benchmark"
+  skip_credentials_validation = true
+  skip_metadata_api_check     = true
+  skip_region_validation      = true
+  skip_requesting_account_id  = true
+}
+"""
+
+ENVIRONMENTS = ["development", "staging", "production"]
+
+
+@dataclass
+class Result:
+    """Plan measurements for one module count."""
+
+    count: int
+    seconds: float
+    max_rss_mb: float
+    runs: int
+
+    @property
+    def ms_per_module(self) -> float:
+        return self.seconds * 1000 / self.count
+
+
+def module_block(index: int, source: str) -> str:
+    """
+    Render one ``module`` block with inputs varied by ``index``.
+
+    Every few copies enable another optional input, so the generated root
+    module covers the same code paths a fleet of different ASGs does.
+
+    :param index: Copy number, from 0.
+    :type index: int
+    :param source: Module source path.
+    :type source: str
+    :return: HCL for the module block and its output.
+    :rtype: str
+    """
+    lines = [
+        f'module "userdata_{index}" {{',
+        f'  source      = "{source}"',
+        f'  environment = "{ENVIRONMENTS[index % len(ENVIRONMENTS)]}"',
+        f'  role        = "role_{index}"',
+        f'  packages    = ["pkg-{index}"]',
+        f'  custom_facts = {{ "asg" : "asg-{index}" }}',
+    ]
+    if index % 2:
+        lines += [
+            "  gzip_userdata       = true",
+            f'  lifecycle_hook_name = "launch-{index}"',
+            "  extra_files = [",
+            f'    {{ content : "config {index}", path : "/etc/app/{index}.conf", permissions : "0644" }},',
+            "  ]",
+        ]
+    if index % 3 == 0:
+        lines += [
+            "  pre_runcmd = [",
+            f'    "echo pre {index}",',
+            f'    {{ parallel = ["docker pull app:{index}", "echo warm {index}"] }},',
+            "  ]",
+            f'  post_runcmd = ["echo post {index}"]',
+        ]
+    if index % 4 == 0:
+        lines += [
+            "  mounts = [",
+            f'    ["fs-{index}.efs.us-west-2.amazonaws.com:/", "/mnt/efs", "nfs4", "defaults,_netdev", "0", "0"],',
+            "  ]",
+        ]
+    if index % 5 == 0:
+        lines += [
+            "  extra_repos = {",
+            f'    "repo-{index}" : {{',
+            f'      source : "deb [signed-by=$KEY_FILE] https://apt{index}.example.com/ubuntu noble main"',
+            '      keyid : "A627B7760019BA51B903453D37A181B689AD619"',
+            f'      machine : "apt{index}.example.com"',
+            f'      authFrom : "arn:aws:secretsmanager:us-west-2:123456789012:secret:apt-{index}"',
+            "      priority : 600",
+            "    }",
+            "  }",
+        ]
+    if index % 7 == 0:
+        lines.append("  puppet_profiling = true")
+    lines += [
+        "}",
+        "",
+        f'output "userdata_{index}" {{',
+        f"  value     = module.userdata_{index}.userdata",
+        "  sensitive = true",
+        "}",
+        "",
+    ]
+    return "\n".join(lines)
+
+
+def write_root_module(
+    workdir: str, count: int, aws_provider_version: str = "~> 6.0"
+) -> None:
+    """
+    Write a root module with ``count`` copies of this module to ``workdir``.
+
+    Existing ``*.tf`` files in ``workdir`` are replaced; ``.terraform`` is
+    kept so providers are installed once per benchmark.
+
+    :param workdir: Directory for the root module.
+    :type workdir: str
+    :param count: Number of module copies.
+    :type count: int
+    :param aws_provider_version: AWS provider version constraint.
+    :type aws_provider_version: str
+    """
+    os.makedirs(workdir, exist_ok=True)
+    for name in os.listdir(workdir):
+        if name.endswith(".tf"):
+            os.remove(os.path.join(workdir, name))
+    source = os.path.relpath(MODULE_ROOT, workdir)
+    if not source.startswith("."):
+        source = f"./{source}"
+    with open(os.path.join(workdir, "providers.tf"), "w", encoding="utf-8") as fp:
+        fp.write(PROVIDERS_TF % {"aws_provider_version": aws_provider_version})
+    with open(os.path.join(workdir, "main.tf"), "w", encoding="utf-8") as fp:
+        fp.write("\n".join(module_block(i, source) for i in range(count)))
+
+
+def _run(cmd: List[str], cwd: str) -> float:
+    """Run ``cmd`` and return the peak RSS in MiB of it and its children."""
+    env = dict(os.environ, TF_IN_AUTOMATION="1", CHECKPOINT_DISABLE="1")
+    proc = subprocess.Popen(  # pylint: disable=consider-using-with
+        cmd,
+        cwd=cwd,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+    )
+    stderr = proc.stderr.read()
+    _, status, rusage = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    if proc.returncode:
+        raise subprocess.CalledProcessError(proc.returncode, cmd, stderr=stderr)
+    # ru_maxrss is KiB on Linux, bytes on macOS.
+    divisor = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return rusage.ru_maxrss / divisor
+
+
+def measure(workdir: str, count: int, repeat: int) -> Result:
+    """
+    Time ``terraform plan`` on the root module in ``workdir``.
+
+    :param workdir: Initialized root module written by write_root_module().
+    :type workdir: str
+    :param count: Number of module copies in it.
+    :type count: int
+    :param repeat: Number of plans; the median time and peak memory are kept.
+    :type repeat: int
+    :return: Measurements.
+    :rtype: Result
+    :raises subprocess.CalledProcessError: If terraform fails.
+    """
+    cmd = ["terraform", "plan", "-input=false", "-lock=false", "-no-color"]
+    times = []
+    rss = []
+    for _ in range(repeat):
+        start = time.monotonic()
+        rss.append(_run(cmd, workdir))
+        times.append(time.monotonic() - start)
+    result = Result(
+        count=count,
+        seconds=round(statistics.median(times), 3),
+        max_rss_mb=round(max(rss), 1),
+        runs=repeat,
+    )
+    LOG.info(
+        "%d modules: %.3fs (%.1f ms/module), %.1f MiB",
+        count,
+        result.seconds,
+        result.ms_per_module,
+        result.max_rss_mb,
+    )
+    return result
+
+
+def run_benchmark(
+    counts: List[int],
+    repeat: int = 3,
+    workdir: Optional[str] = None,
+    aws_provider_version: str = "~> 6.0",
+) -> List[Result]:
+    """
+    Generate, initialize and plan a root module for every count.
+
+    :param counts: Module counts to measure.
+    :type counts: list
+    :param repeat: Plans per count.
+    :type repeat: int
+    :param workdir: Directory for the generated root module; a temporary
+        one is used and removed if None.
+    :type workdir: str
+    :param aws_provider_version: AWS provider version constraint.
+    :type aws_provider_version: str
+    :return: One result per count.
+    :rtype: list
+    """
+    tmpdir = None
+    if workdir is None:
+        tmpdir = workdir = tempfile.mkdtemp(prefix="plan-bench-")
+    try:
+        results = []
+        for count in counts:
+            write_root_module(workdir, count, aws_provider_version)
+            # init also installs the module copies; only the first one
+            # installs providers.
+            _run(["terraform", "init", "-input=false", "-no-color"], workdir)
+            results.append(measure(workdir, count, repeat))
+        return results
+    finally:
+        if tmpdir:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+def compare(results: List[Dict], baseline: List[Dict], tolerance: float) -> List[str]:
+    """
+    Find counts that regressed against a baseline.
+
+    :param results: Current results, as dictionaries.
+    :type results: list
+    :param baseline: Baseline results, as dictionaries.
+    :type baseline: list
+    :param tolerance: Allowed relative growth, e.g. 0.2 for 20%.
+    :type tolerance: float
+    :return: One message per regression.
+    :rtype: list
+    """
+    previous = {r["count"]: r for r in baseline}
+    regressions = []
+    for result in results:
+        base = previous.get(result["count"])
+        if base is None:
+            continue
+        for metric, unit in (("seconds", "s"), ("max_rss_mb", " MiB")):
+            if result[metric] > base[metric] * (1 + tolerance):
+                regressions.append(
+                    f"{result['count']} modules: {metric} {base[metric]}{unit}"
+                    f" -> {result[metric]}{unit}"
+                    f" (+{(result[metric] / base[metric] - 1) * 100:.0f}%)"
+                )
+    return regressions
+
+
+def format_results(results: List[Dict]) -> str:
+    """
+    Render results as a table.
+
+    :param results: Results, as dictionaries.
+    :type results: list
+    :return: Table text.
+    :rtype: str
+    """
+    return format_table(
+        results,
+        [
+            Column("modules", text("count")),
+            Column("plan", seconds("seconds")),
+            Column("ms/module", lambda r: f"{r['seconds'] * 1000 / r['count']:.1f}"),
+            Column("peak RSS", lambda r: f"{r['max_rss_mb']:.1f} MiB"),
+        ],
+    )
+
+
+def _benchmark(args: argparse.Namespace) -> Optional[List[Dict]]:
+    if args.command == "generate":
+        write_root_module(args.workdir, args.count)
+        return None
+    return [
+        asdict(r)
+        for r in run_benchmark(
+            args.counts, args.repeat, args.workdir, args.aws_provider_version
+        )
+    ]
+
+
+def _report(args: argparse.Namespace, results: Optional[List[Dict]]) -> int:
+    if results is None:
+        return 0
+    print_results(args, results, format_results)
+    if not args.baseline:
+        return 0
+    with open(args.baseline, encoding="utf-8") as fp:
+        regressions = compare(results, json.load(fp), args.tolerance)
+    for regression in regressions:
+        LOG.error("Regression: %s", regression)
+    return 1 if regressions else 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Command line entry point.
+
+    :param argv: Arguments, defaults to ``sys.argv[1:]``.
+    :return: Process exit code.
+    :rtype: int
+    """
+    parser = argument_parser(__doc__, json_flag=False)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="Measure terraform plan.")
+    run.add_argument(
+        "--counts",
+        type=int,
+        nargs="+",
+        default=[1, 10, 25, 50],
+        help="Module counts to measure. Default: %(default)s.",
+    )
+    run.add_argument(
+        "--repeat", type=int, default=3, help="Plans per count. Default: %(default)s."
+    )
+    run.add_argument(
+        "--workdir",
+        default=None,
+        help="Keep the generated root module here instead of a temporary directory.",
+    )
+    run.add_argument(
+        "--aws-provider-version",
+        default="~> 6.0",
+        help="AWS provider version constraint. Default: %(default)s.",
+    )
+    run.add_argument("--baseline", help="JSON output of an earlier run to compare to.")
+    run.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="Allowed growth over the baseline. Default: %(default)s.",
+    )
+    add_json_flag(run)
+
+    generate = sub.add_parser("generate", help="Only write the root module.")
+    generate.add_argument("workdir", help="Directory for the root module.")
+    generate.add_argument("--count", type=int, default=10)
+
+    return run_cli(parser, argv, _benchmark, format_results, report=_report)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
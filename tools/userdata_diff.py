@@ -0,0 +1,264 @@
+"""
+Classify the difference between two rendered userdata blobs.
+
+Launch templates change, and ASGs refresh every instance, whenever the
+module's ``userdata`` output changes at all. Many such changes do not alter
+what an instance does at boot: a comment edited in an embedded helper
+script, a docstring in ``generate_apt_auth.py``, gzip turned on or off. This
+tool decodes both blobs (see validate_userdata.py) and compares them
+section by section:
+
+* ``cosmetic`` - the section differs only in comments, blank lines,
+  trailing whitespace, Python docstrings or JSON/YAML formatting, including
+  inside helper scripts embedded in ``bootcmd`` as base64;
+* ``behavior`` - anything else.
+
+Usage::
+
+    python tools/userdata_diff.py old.b64 new.b64
+    python tools/userdata_diff.py old.b64 new.b64 --json
+
+Exit codes: 0 if the blobs behave the same (identical or cosmetic
+differences only), 2 if any section changed behavior, 1 on errors.
+"""
+
+import argparse
+import ast
+import base64
+import binascii
+import json
+import logging
+import re
+import sys
+from typing import Any, Dict, List, Optional
+
+import yaml
+
+from validate_userdata import UserdataError, decode_userdata
+
+LOG = logging.getLogger(__name__)
+
+UNCHANGED = "unchanged"
+COSMETIC = "cosmetic"
+BEHAVIOR = "behavior"
+
+# bootcmd entries that ship a helper: echo '<base64>' > /var/tmp/<name>.b64
+EMBEDDED_RE = re.compile(r"^echo '([A-Za-z0-9+/=]+)' > (\S+)\.b64$")
+
+
+def _normalize_python(text: str) -> str:
+    tree = ast.parse(text)
+    for node in ast.walk(tree):
+        body = getattr(node, "body", None)
+        if (
+            isinstance(body, list)
+            and body
+            and isinstance(body[0], ast.Expr)
+            and isinstance(body[0].value, ast.Constant)
+            and isinstance(body[0].value.value, str)
+        ):
+            body.pop(0)
+    return ast.dump(tree)
+
+
+def _normalize_shell(text: str) -> str:
+    lines = text.splitlines()
+    keep = lines[:1] if lines and lines[0].startswith("#!") else []
+    for line in lines[len(keep) :]:
+        stripped = line.strip()
+        if stripped and not stripped.startswith("#"):
+            keep.append(line.rstrip())
+    return "\n".join(keep)
+
+
+def normalize_content(text: str, path: str) -> str:
+    """
+    Reduce file content to what affects behavior.
+
+    The file type is taken from the path and the shebang. Python drops
+    comments and docstrings, shell drops full-line comments and blank lines,
+    JSON and YAML are compared as data. Other files are compared as-is
+    apart from trailing whitespace.
+
+    :param text: File content.
+    :type text: str
+    :param path: Where the content is written on the instance.
+    :type path: str
+    :return: Normalized content.
+    :rtype: str
+    """
+    first = text.split("\n", 1)[0]
+    try:
+        if path.endswith(".py") or (first.startswith("#!") and "python" in first):
+            return _normalize_python(text)
+        if path.endswith(".json"):
+            return json.dumps(json.loads(text), sort_keys=True)
+        if path.endswith((".yaml", ".yml")):
+            return json.dumps(yaml.safe_load(text), sort_keys=True, default=str)
+    except (SyntaxError, ValueError, yaml.YAMLError):
+        return text.rstrip()
+    if (
+        path.endswith(".sh")
+        or first.startswith("#!")
+        or path.startswith("/usr/local/bin/")
+    ):
+        return _normalize_shell(text)
+    return "\n".join(line.rstrip() for line in text.rstrip().splitlines())
+
+
+def _normalize_bootcmd(entry: Any) -> Any:
+    if isinstance(entry, str):
+        match = EMBEDDED_RE.match(entry)
+        if match:
+            try:
+                payload = base64.b64decode(match.group(1), validate=True).decode()
+            except (binascii.Error, UnicodeDecodeError):
+                return entry
+            return [
+                "embedded",
+                match.group(2),
+                normalize_content(payload, match.group(2)),
+            ]
+    return entry
+
+
+def _normalize_write_files(files: List[Dict[str, Any]]) -> Dict[str, Any]:
+    normalized = {}
+    for file_def in files:
+        entry = dict(file_def)
+        if isinstance(entry.get("content"), str) and not entry.get("encoding"):
+            entry["content"] = normalize_content(
+                entry["content"], entry.get("path", "")
+            )
+        normalized[entry.get("path", "")] = entry
+    return normalized
+
+
+def _classify(old: Any, new: Any, normalize) -> str:
+    if old == new:
+        return UNCHANGED
+    return COSMETIC if normalize(old) == normalize(new) else BEHAVIOR
+
+
+def compare_cloud_configs(old: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Classify the change between two decoded cloud-configs.
+
+    :param old: Decoded cloud-config of the current userdata.
+    :type old: dict
+    :param new: Decoded cloud-config of the new userdata.
+    :type new: dict
+    :return: ``{"classification": ..., "sections": {...}, "files": {...}}``;
+        ``files`` has the status of every ``write_files`` path that changed.
+    :rtype: dict
+    """
+    sections = {}
+    for key in sorted(set(old) | set(new)):
+        before, after = old.get(key), new.get(key)
+        if key == "bootcmd":
+            sections[key] = _classify(
+                before or [],
+                after or [],
+                lambda cmds: [_normalize_bootcmd(c) for c in cmds],
+            )
+        elif key == "write_files":
+            sections[key] = _classify(before or [], after or [], _normalize_write_files)
+        else:
+            sections[key] = UNCHANGED if before == after else BEHAVIOR
+
+    files = {}
+    old_files = {f.get("path"): f for f in old.get("write_files") or []}
+    new_files = {f.get("path"): f for f in new.get("write_files") or []}
+    for path in sorted(set(old_files) | set(new_files), key=str):
+        status = _classify(
+            [old_files[path]] if path in old_files else [],
+            [new_files[path]] if path in new_files else [],
+            _normalize_write_files,
+        )
+        if status != UNCHANGED:
+            files[path] = status
+
+    statuses = set(sections.values())
+    classification = (
+        BEHAVIOR
+        if BEHAVIOR in statuses
+        else COSMETIC if COSMETIC in statuses else UNCHANGED
+    )
+    return {"classification": classification, "sections": sections, "files": files}
+
+
+def compare_userdata(old: str, new: str) -> Dict[str, Any]:
+    """
+    Classify the change between two ``userdata`` outputs.
+
+    Differences in encoding alone (gzip, MIME boundaries) are cosmetic.
+
+    :param old: Current base64 userdata.
+    :type old: str
+    :param new: New base64 userdata.
+    :type new: str
+    :return: See compare_cloud_configs(); ``classification`` is
+        ``cosmetic`` rather than ``unchanged`` when the blobs differ only
+        in encoding.
+    :rtype: dict
+    :raises UserdataError: If either blob cannot be decoded.
+    """
+    result = compare_cloud_configs(decode_userdata(old), decode_userdata(new))
+    if result["classification"] == UNCHANGED and old.strip() != new.strip():
+        result["classification"] = COSMETIC
+    return result
+
+
+def format_result(result: Dict[str, Any]) -> str:
+    """
+    Render a comparison for humans.
+
+    :param result: Output of compare_userdata().
+    :type result: dict
+    :return: Text report.
+    :rtype: str
+    """
+    lines = [f"Classification: {result['classification']}"]
+    for section, status in result["sections"].items():
+        if status != UNCHANGED:
+            lines.append(f"  {section}: {status}")
+    for path, status in result["files"].items():
+        lines.append(f"    {path}: {status}")
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Command line entry point.
+
+    :param argv: Arguments, defaults to ``sys.argv[1:]``.
+    :return: Process exit code.
+    :rtype: int
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--debug", action="store_true", help="Verbose logging.")
+    parser.add_argument("old", help="File with the current base64 userdata.")
+    parser.add_argument("new", help="File with the new base64 userdata.")
+    parser.add_argument("--json", action="store_true", help="Print JSON.")
+    args = parser.parse_args(argv)
+    logging.basicConfig(
+        level=logging.DEBUG if args.debug else logging.INFO,
+        format="%(levelname)s %(name)s:%(filename)s:%(lineno)d %(message)s",
+    )
+
+    try:
+        with open(args.old, encoding="utf-8") as fp:
+            old = fp.read()
+        with open(args.new, encoding="utf-8") as fp:
+            new = fp.read()
+        result = compare_userdata(old, new)
+    except (OSError, UserdataError) as err:
+        LOG.error("%s", err)
+        return 1
+
+    print(json.dumps(result, indent=4) if args.json else format_result(result))
+    return 2 if result["classification"] == BEHAVIOR else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
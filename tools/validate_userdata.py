@@ -0,0 +1,346 @@
+"""
+Validate the module's rendered userdata offline.
+
+Decodes the ``userdata`` output (base64, optionally gzipped MIME multipart),
+extracts the ``#cloud-config`` part and checks it:
+
+* against cloud-init's JSON schema for cloud-config (``--schema``,
+  ``$CLOUD_INIT_SCHEMA``, or the schema shipped with a locally installed
+  cloud-init); without one the check exits 2 unless ``--skip-schema`` asks
+  for the module rules only;
+* against rules specific to this module that the schema does not enforce:
+  six-field ``mounts`` entries, octal string ``write_files`` permissions,
+  unique absolute ``write_files`` paths, the ``signed-by=$KEY_FILE``
+  placeholder on APT sources with a key, a bootstrap script that
+  ``bash -n`` accepts, and, with explicit ``cloud_*_modules`` lists, the
+  modules the emitted keys need.
+
+Usage::
+
+    terraform output -raw userdata | python tools/validate_userdata.py -
+    python tools/validate_userdata.py userdata.b64 --schema schema-cloud-config-v1.json
+    python tools/validate_userdata.py userdata.b64 --skip-schema
+
+Nothing is fetched from the network; a check takes milliseconds.
+"""
+
+import argparse
+import base64
+import binascii
+import email
+import gzip
+import json
+import logging
+import os
+import re
+import shutil
+import subprocess
+import sys
+from typing import Any, Dict, List, Optional
+
+import yaml
+
+LOG = logging.getLogger(__name__)
+
+BOOTSTRAP_SCRIPT_PATH = "/usr/local/bin/ih-bootstrap"
+MOUNT_FIELDS = 6
+PERMISSIONS_RE = re.compile(r"^0[0-7]{3,4}$")
+SIGNED_BY_RE = re.compile(r"signed-by=([^\]\s]+)")
+
+# With explicit cloud_*_modules lists, the modules that must be listed for
+# the cloud-config keys and files this module emits.
+MODULE_LISTS = ("cloud_init_modules", "cloud_config_modules", "cloud_final_modules")
+KEY_MODULES = {
+    "bootcmd": ["bootcmd"],
+    "write_files": ["write_files"],
+    "mounts": ["mounts"],
+    "ssh_keys": ["ssh"],
+    "ssh_deletekeys": ["ssh"],
+    "apt": ["apt_configure"],
+    "package_update": ["package_update_upgrade_install"],
+    "packages": ["package_update_upgrade_install"],
+    "runcmd": ["runcmd", "scripts_user"],
+}
+PER_BOOT_DIR = "/var/lib/cloud/scripts/per-boot/"
+
+# Where cloud-init keeps its schema, newest layout first.
+SCHEMA_PATHS = [
+    "/usr/lib/python3/dist-packages/cloudinit/config/schemas/schema-cloud-config-v1.json",
+    "/usr/lib/python3/dist-packages/cloudinit/config/cloud-init-schema.json",
+]
+
+
+class UserdataError(Exception):
+    """Raised when userdata cannot be decoded into a cloud-config."""
+
+
+def decode_userdata(value: str) -> Dict[str, Any]:
+    """
+    Decode the module's ``userdata`` output into the cloud-config mapping.
+
+    :param value: Base64 encoded userdata, gzipped or not.
+    :type value: str
+    :return: Parsed cloud-config.
+    :rtype: dict
+    :raises UserdataError: If the value is not base64, has no cloud-config
+        part, or the part is not a YAML mapping.
+    """
+    try:
+        raw = base64.b64decode(value.strip(), validate=True)
+    except (binascii.Error, ValueError) as err:
+        raise UserdataError(f"userdata is not valid base64: {err}") from err
+    if raw[:2] == b"\x1f\x8b":
+        raw = gzip.decompress(raw)
+
+    message = email.message_from_bytes(raw)
+    parts = message.walk() if message.is_multipart() else [message]
+    for part in parts:
+        if part.is_multipart():
+            continue
+        payload = part.get_payload(decode=True) or b""
+        text = payload.decode()
+        if part.get_content_type() == "text/cloud-config" or text.startswith(
+            "#cloud-config"
+        ):
+            try:
+                cloud_config = yaml.safe_load(text)
+            except yaml.YAMLError as err:
+                raise UserdataError(f"cloud-config is not valid YAML: {err}") from err
+            if not isinstance(cloud_config, dict):
+                raise UserdataError("cloud-config is not a mapping")
+            return cloud_config
+    raise UserdataError("userdata has no text/cloud-config part")
+
+
+def find_schema(path: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """
+    Load cloud-init's cloud-config JSON schema.
+
+    Looks at ``path``, then ``$CLOUD_INIT_SCHEMA``, then an importable
+    ``cloudinit`` package, then the system cloud-init install.
+
+    :param path: Explicit path to ``schema-cloud-config-v1.json``.
+    :type path: str
+    :return: The schema, or None if none was found.
+    :rtype: dict
+    :raises OSError: If an explicitly given schema cannot be read
+    """
+    explicit = path or os.environ.get("CLOUD_INIT_SCHEMA")
+    if explicit:
+        with open(explicit, encoding="utf-8") as fp:
+            return json.load(fp)
+    try:
+        # pylint: disable=import-outside-toplevel
+        from cloudinit.config.schema import get_schema
+
+        return get_schema()
+    except ImportError:
+        pass
+    for candidate in SCHEMA_PATHS:
+        if os.path.exists(candidate):
+            LOG.debug("Using cloud-config schema %s", candidate)
+            with open(candidate, encoding="utf-8") as fp:
+                return json.load(fp)
+    return None
+
+
+def schema_errors(cloud_config: Dict[str, Any], schema: Dict[str, Any]) -> List[str]:
+    """
+    Check a cloud-config against cloud-init's JSON schema.
+
+    :param cloud_config: Parsed cloud-config.
+    :type cloud_config: dict
+    :param schema: cloud-init's cloud-config schema.
+    :type schema: dict
+    :return: One message per violation, empty if valid.
+    :rtype: list
+    """
+    # pylint: disable=import-outside-toplevel
+    from jsonschema.validators import validator_for
+
+    validator = validator_for(schema)(schema)
+    return [
+        f"{'.'.join(str(p) for p in err.absolute_path) or '<root>'}: {err.message}"
+        for err in sorted(validator.iter_errors(cloud_config), key=str)
+    ]
+
+
+def module_errors(cloud_config: Dict[str, Any]) -> List[str]:
+    """
+    Check the rules this module relies on that the schema does not enforce.
+
+    :param cloud_config: Parsed cloud-config.
+    :type cloud_config: dict
+    :return: One message per violation, empty if valid.
+    :rtype: list
+    """
+    errors = []
+
+    for idx, entry in enumerate(cloud_config.get("mounts") or []):
+        if not isinstance(entry, list) or len(entry) != MOUNT_FIELDS:
+            errors.append(
+                f"mounts.{idx}: expected {MOUNT_FIELDS} fields"
+                " [fs_spec, fs_file, fs_vfstype, fs_mntops, fs_freq, fs_passno],"
+                f" got {entry!r}"
+            )
+        elif not all(isinstance(field, str) for field in entry):
+            errors.append(f"mounts.{idx}: all fields must be strings, got {entry!r}")
+
+    seen = set()
+    for idx, file_def in enumerate(cloud_config.get("write_files") or []):
+        path = file_def.get("path", "")
+        if not path.startswith("/"):
+            errors.append(f"write_files.{idx}: path {path!r} is not absolute")
+        if path in seen:
+            errors.append(f"write_files.{idx}: duplicate path {path}")
+        seen.add(path)
+        permissions = file_def.get("permissions")
+        if permissions is not None and not (
+            isinstance(permissions, str) and PERMISSIONS_RE.match(permissions)
+        ):
+            errors.append(
+                f"write_files.{idx}: permissions for {path} must be an octal"
+                f" string like '0644', got {permissions!r}"
+            )
+
+    sources = (cloud_config.get("apt") or {}).get("sources") or {}
+    for name, source in sources.items():
+        line = source.get("source", "")
+        has_key = "key" in source or "keyid" in source
+        signed_by = SIGNED_BY_RE.search(line)
+        if has_key and (not signed_by or signed_by.group(1) != "$KEY_FILE"):
+            errors.append(
+                f"apt.sources.{name}: a source with key/keyid must use"
+                f" [signed-by=$KEY_FILE], got {line!r}"
+            )
+        if not has_key and signed_by and signed_by.group(1) == "$KEY_FILE":
+            errors.append(
+                f"apt.sources.{name}: signed-by=$KEY_FILE needs key or keyid,"
+                " cloud-init would leave the placeholder unresolved"
+            )
+
+    if any(key in cloud_config for key in MODULE_LISTS):
+        listed = set()
+        for key in MODULE_LISTS:
+            for entry in cloud_config.get(key) or []:
+                name = entry[0] if isinstance(entry, list) else entry
+                listed.add(str(name).removeprefix("cc_").replace("-", "_"))
+        needed = {
+            module: key
+            for key, modules in KEY_MODULES.items()
+            if key in cloud_config
+            for module in modules
+        }
+        if any(
+            f.get("path", "").startswith(PER_BOOT_DIR)
+            for f in cloud_config.get("write_files") or []
+        ):
+            needed["scripts_per_boot"] = PER_BOOT_DIR
+        for module, user in sorted(needed.items()):
+            if module not in listed:
+                errors.append(
+                    f"{'/'.join(MODULE_LISTS)}: module {module} is needed for"
+                    f" {user} but not listed"
+                )
+
+    scripts = [
+        f.get("content", "")
+        for f in cloud_config.get("write_files") or []
+        if f.get("path") == BOOTSTRAP_SCRIPT_PATH
+    ]
+    if not scripts:
+        errors.append(f"write_files: {BOOTSTRAP_SCRIPT_PATH} is missing")
+    elif shutil.which("bash"):
+        result = subprocess.run(
+            ["bash", "-n"],
+            input=scripts[0],
+            capture_output=True,
+            text=True,
+            check=False,
+        )
+        if result.returncode:
+            errors.append(
+                f"write_files: {BOOTSTRAP_SCRIPT_PATH} has a syntax error:"
+                f" {result.stderr.strip()}"
+            )
+    return errors
+
+
+def validate_userdata(value: str, schema: Optional[Dict[str, Any]] = None) -> List[str]:
+    """
+    Decode and validate the module's ``userdata`` output.
+
+    :param value: Base64 encoded userdata.
+    :type value: str
+    :param schema: cloud-init's cloud-config schema; schema checks are
+        skipped when None.
+    :type schema: dict
+    :return: One message per violation, empty if valid.
+    :rtype: list
+    :raises UserdataError: If the userdata cannot be decoded.
+    """
+    cloud_config = decode_userdata(value)
+    errors = schema_errors(cloud_config, schema) if schema else []
+    return errors + module_errors(cloud_config)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Command line entry point.
+
+    :param argv: Arguments, defaults to ``sys.argv[1:]``.
+    :return: Process exit code: 0 if valid, 1 on violations or errors, 2 if
+        no schema was found and ``--skip-schema`` was not given.
+    :rtype: int
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--debug", action="store_true", help="Verbose logging.")
+    parser.add_argument(
+        "userdata", help="File with the base64 userdata output, or - for stdin."
+    )
+    parser.add_argument(
+        "--schema",
+        default=None,
+        help="Path to cloud-init's schema-cloud-config-v1.json. Default: "
+        "$CLOUD_INIT_SCHEMA or the schema of a locally installed cloud-init.",
+    )
+    parser.add_argument(
+        "--skip-schema",
+        action="store_true",
+        help="Check the module rules only when no schema is found, instead of "
+        "failing.",
+    )
+    args = parser.parse_args(argv)
+    logging.basicConfig(
+        level=logging.DEBUG if args.debug else logging.INFO,
+        format="%(levelname)s %(name)s:%(filename)s:%(lineno)d %(message)s",
+    )
+
+    try:
+        if args.userdata == "-":
+            value = sys.stdin.read()
+        else:
+            with open(args.userdata, encoding="utf-8") as fp:
+                value = fp.read()
+        schema = find_schema(args.schema)
+        if schema is None:
+            if not args.skip_schema:
+                LOG.error(
+                    "cloud-init schema not found; pass --schema, set"
+                    " $CLOUD_INIT_SCHEMA, install cloud-init, or pass"
+                    " --skip-schema to check the module rules only"
+                )
+                return 2
+            LOG.warning("cloud-init schema not found, checking module rules only")
+        errors = validate_userdata(value, schema)
+    except (OSError, ValueError, UserdataError) as err:
+        LOG.error("%s", err)
+        return 1
+
+    for error in errors:
+        print(error)
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,3 +1,66 @@
+variable "apt_acquire" {
+  description = <<-EOT
+    Tune how apt downloads packages. When set, an apt.conf.d profile is
+    written to /etc/apt/apt.conf.d/80-ih-acquire before cloud-init's
+    package_update, so every apt run at boot and after uses it.
+
+    - queue_mode: "host" opens one download queue per repository host,
+      "access" one per access method (all http:// sources share one).
+    - host_queue_limit: Most parallel connections (queues) apt opens. This
+      is the parallel downloads knob.
+    - pipeline_depth: Requests sent on one connection before the first
+      response arrives. 0 disables HTTP pipelining.
+    - retries: How often a failed download is retried, with back-off.
+    - timeout: Seconds apt waits to connect and for data on a connection.
+      apt has one timeout for both.
+
+    Unset attributes use the module defaults in files/apt/acquire.json.
+    null leaves the image's apt settings alone. Compare the profiles
+    with tools/apt_benchmark.py.
+
+    Example:
+    apt_acquire = {
+      retries = 10
+      timeout = 30
+    }
+  EOT
+  type = object({
+    queue_mode       = optional(string)
+    host_queue_limit = optional(number)
+    pipeline_depth   = optional(number)
+    retries          = optional(number)
+    timeout          = optional(number)
+  })
+  default = null
+
+  validation {
+    condition = var.apt_acquire == null ? true : contains(
+      ["host", "access"], coalesce(var.apt_acquire.queue_mode, "host")
+    )
+    error_message = "apt_acquire.queue_mode must be \"host\" or \"access\"."
+  }
+
+  validation {
+    condition = var.apt_acquire == null ? true : alltrue([
+      for v in [
+        var.apt_acquire.host_queue_limit,
+        var.apt_acquire.pipeline_depth,
+        var.apt_acquire.retries,
+        var.apt_acquire.timeout,
+      ] : v == null ? true : v >= 0 && floor(v) == v
+    ])
+    error_message = "apt_acquire numbers must be whole numbers >= 0."
+  }
+
+  validation {
+    condition = var.apt_acquire == null ? true : alltrue([
+      for v in [var.apt_acquire.host_queue_limit, var.apt_acquire.timeout] :
+      v == null ? true : v > 0
+    ])
+    error_message = "apt_acquire.host_queue_limit and apt_acquire.timeout must be positive."
+  }
+}
+
 variable "cancel_instance_refresh_on_error" {
   description = <<-EOT
     If True, ih-puppet will attempt to cancel instance refreshes on an autoscaling group
@@ -7,6 +70,36 @@ variable "cancel_instance_refresh_on_error" {
   default     = false
 }
 
+variable "cloud_init_module_allowlist" {
+  description = <<-EOT
+    Trim cloud-init's module lists to what this module uses. When set, the
+    cloud-config carries explicit cloud_init_modules, cloud_config_modules
+    and cloud_final_modules lists, so cloud-init skips the rest of the
+    image's defaults (snap, lxd, landscape, ubuntu_pro, phone_home, ...)
+    on every boot.
+
+    The lists keep the modules that act on this module's cloud-config
+    (bootcmd, write_files, mounts, ssh, apt_configure, package installs,
+    runcmd with scripts_user, scripts_per_boot for warm_pool) and those the
+    instance needs anyway: disk growth, hostname, default user, console
+    host keys and the final message. See files/cloud_init/modules.json.
+
+    Add the modules your own cloud-config or AMI relies on to the list of
+    their stage. null keeps the image's lists.
+
+    Example:
+    cloud_init_module_allowlist = {
+      cloud_config_modules = ["ntp", "timezone"]
+    }
+  EOT
+  type = object({
+    cloud_init_modules   = optional(list(string), [])
+    cloud_config_modules = optional(list(string), [])
+    cloud_final_modules  = optional(list(string), [])
+  })
+  default = null
+}
+
 variable "custom_facts" {
   description = <<-EOT
     A map of custom Puppet facts to inject into the instance.
@@ -23,6 +116,21 @@ variable "custom_facts" {
   default     = {}
 }
 
+variable "dpkg_unsafe_io" {
+  description = <<-EOT
+    Speed up first-boot package installs by letting dpkg skip its per-file
+    fsync (force-unsafe-io). The setting covers cloud-init's package
+    install and the ih-bootstrap run, including packages Puppet installs.
+    ih-bootstrap removes it and runs sync before it writes
+    /var/run/puppet-done; it is also removed if the bootstrap fails.
+
+    A crash before that point can leave unpacked files empty, but such an
+    instance never reported ready and is replaced.
+  EOT
+  type        = bool
+  default     = false
+}
+
 variable "environment" {
   description = <<-EOT
     Environment name. Passed on as a puppet fact.
@@ -81,7 +189,8 @@ variable "extra_repos" {
 
     Authentication options:
     - machine: (optional) Hostname for APT authentication (e.g., "apt.example.com")
-    - authFrom: (optional) ARN of AWS Secrets Manager secret containing credentials
+    - authFrom: (optional) ARN of an AWS Secrets Manager secret or an SSM Parameter Store
+      SecureString parameter containing credentials
 
     Note: machine and authFrom must be both set or both unset for authentication to work.
 
@@ -178,6 +287,36 @@ variable "extra_repos" {
   }
 }
 
+variable "facter_fact_ttls" {
+  description = <<-EOT
+    Facter cache TTLs per fact group, rendered into facts.ttls of
+    facter.conf. Cached groups are resolved once and reused by later Puppet
+    runs until the TTL expires, instead of being queried on every run.
+
+    Caching is off by default, because a cached fact can be as old as its
+    TTL. Cache only groups that do not change at runtime. Durations use
+    Facter's format, e.g. "30 minutes", "1 hour", "2 days". List the groups
+    with `facter --list-cache-groups`.
+
+    Example:
+    facter_fact_ttls = {
+      "EC2" = "1 hour"
+      "dmi" = "1 day"
+    }
+  EOT
+  type        = map(string)
+  default     = {}
+  nullable    = false
+
+  validation {
+    condition = alltrue([
+      for ttl in values(var.facter_fact_ttls) :
+      can(regex("^[0-9]+ ?(seconds?|minutes?|hours?|days?)$", ttl))
+    ])
+    error_message = "facter_fact_ttls values must be durations like \"30 minutes\", \"1 hour\" or \"2 days\"."
+  }
+}
+
 variable "gzip_userdata" {
   description = <<-EOT
     Whether to gzip compress the userdata.
@@ -187,6 +326,81 @@ variable "gzip_userdata" {
   default     = false
 }
 
+variable "imds_credentials" {
+  description = <<-EOT
+    Read the AWS credentials of the bootcmd secret resolver
+    (generate_apt_auth.py, or materialize_secrets.py with secret_files or
+    puppet_secrets) from the instance role over IMDSv2 only, instead of
+    walking botocore's credential chain. The credentials are fetched once,
+    with short IMDS timeouts and retries, while it reads its inputs.
+
+    Requires an instance profile. The resolver logs how long creating its
+    clients took, which includes the chain walk without this option.
+  EOT
+  type        = bool
+  default     = false
+}
+
+variable "instance_store" {
+  description = <<-EOT
+    Assemble and mount the instance-store NVMe disks at boot, before Puppet runs.
+    The bootstrap discovers the devices, stripes them into RAID0 (/dev/md0) when
+    there is more than one, creates the filesystem without a discard pass and
+    aligned to the stripe, mounts it at mount_point and adds it to /etc/fstab
+    with nofail. Each step's duration is logged.
+
+    * mount_point   - where to mount the disks.
+    * filesystem    - xfs (default) or ext4.
+    * mount_options - mount options, "defaults,noatime" by default.
+    * required      - fail the bootstrap if the instance type has no instance
+                      store (default true); set false to skip instead.
+
+    Leave null to not touch instance store.
+  EOT
+  type = object({
+    mount_point   = string
+    filesystem    = optional(string, "xfs")
+    mount_options = optional(string, "defaults,noatime")
+    required      = optional(bool, true)
+  })
+  default = null
+
+  validation {
+    condition = var.instance_store == null ? true : (
+      startswith(var.instance_store.mount_point, "/")
+      && contains(["xfs", "ext4"], var.instance_store.filesystem)
+    )
+    error_message = "instance_store.mount_point must be an absolute path and filesystem must be xfs or ext4."
+  }
+}
+
+variable "lifecycle_heartbeat_interval" {
+  description = <<-EOT
+    Seconds between lifecycle action heartbeats while the bootstrap runs.
+
+    When set together with lifecycle_hook_name, the bootstrap starts
+    /usr/local/bin/ih-lifecycle-heartbeat in the background. It calls
+    RecordLifecycleActionHeartbeat for the hook every interval and stops
+    when the bootstrap exits. The hook's heartbeat timeout then only has to
+    cover a stalled instance, not the slowest Puppet run. Keep the interval
+    well below that timeout, e.g. 30 for a 120 second timeout.
+
+    The instance profile needs autoscaling:DescribeAutoScalingInstances and
+    autoscaling:RecordLifecycleActionHeartbeat. Heartbeat errors are logged
+    and never fail the bootstrap.
+  EOT
+  type        = number
+  default     = null
+
+  validation {
+    condition = var.lifecycle_heartbeat_interval == null ? true : (
+      var.lifecycle_heartbeat_interval >= 5
+      && floor(var.lifecycle_heartbeat_interval) == var.lifecycle_heartbeat_interval
+    )
+    error_message = "lifecycle_heartbeat_interval must be a whole number of seconds, at least 5."
+  }
+}
+
 variable "lifecycle_hook_name" {
   description = <<-EOT
     Name of an ASG lifecycle hook to signal from the bootstrap script.
@@ -217,18 +431,74 @@ variable "lifecycle_hook_name" {
   }
 }
 
+variable "mount_retries" {
+  description = <<-EOT
+    How many times the bootstrap retries a var.mounts entry that failed or timed out.
+    A required entry (no nofail in fs_mntops) that still does not mount fails the
+    bootstrap; an entry with nofail is logged and skipped.
+  EOT
+  type        = number
+  default     = 2
+
+  validation {
+    condition     = var.mount_retries >= 0 && floor(var.mount_retries) == var.mount_retries
+    error_message = "mount_retries must be a non-negative whole number."
+  }
+}
+
+variable "mount_timeout" {
+  description = <<-EOT
+    Seconds one attempt to mount a var.mounts entry may take before the bootstrap
+    kills it. Entries are mounted concurrently, so a slow or unreachable NFS/EFS
+    target no longer blocks the bootstrap indefinitely.
+  EOT
+  type        = number
+  default     = 60
+
+  validation {
+    condition     = var.mount_timeout > 0
+    error_message = "mount_timeout must be greater than 0."
+  }
+}
+
 variable "mounts" {
   description = <<-EOT
     List of volumes to be mounted in the instance. One list item is a list itself with values:
     [ fs_spec, fs_file, fs_vfstype, fs_mntops, fs_freq, fs_passno ]
 
-    See cloud-init cc_mounts documentation for details.
+    See cloud-init cc_mounts documentation for details. cc_mounts writes
+    the entries to /etc/fstab. All but swap entries and entries with
+    fs_file "none" get noauto,x-systemd.automount, so ih-bootstrap mounts
+    them, concurrently, and systemd on later boots.
   EOT
   default     = []
   type        = list(list(string))
   nullable    = false
 }
 
+variable "nfs_mount_profile" {
+  description = <<-EOT
+    Tuned mount option profile applied to the nfs/nfs4 entries of var.mounts.
+    Profile options fill in fs_mntops; options already set in fs_mntops keep
+    their value, and a bare `defaults` is replaced.
+
+    * `efs-default` - the options AWS recommends for EFS: nfsvers=4.1,
+      rsize/wsize=1048576, hard, timeo=600, retrans=2, noresvport, _netdev.
+    * `efs-throughput` - `efs-default` plus nconnect=16, larger TCP buffers
+      and 128 sunrpc slot table entries (written to /etc/sysctl.d and
+      /etc/modprobe.d and applied before the mounts).
+
+    Leave null to use fs_mntops as given.
+  EOT
+  type        = string
+  default     = null
+
+  validation {
+    condition     = var.nfs_mount_profile == null ? true : contains(["efs-default", "efs-throughput"], var.nfs_mount_profile)
+    error_message = "nfs_mount_profile must be null, \"efs-default\" or \"efs-throughput\"."
+  }
+}
+
 variable "packages" {
   description = <<-EOT
     Additional packages to install when the instance bootstraps.
@@ -251,14 +521,39 @@ variable "pre_runcmd" {
     4. ih-puppet apply
     5. post_runcmd
 
+    Each entry is either a command string, run sequentially, or an object
+    with a `parallel` list of commands. The commands of a parallel group run
+    concurrently; the bootstrap waits for all of them, logs each command's
+    duration, and fails on the first non-zero exit.
+
     Example:
     pre_runcmd = [
       "mkdir -p /opt/myapp",
+      {
+        parallel = [
+          "docker pull myapp:latest",
+          "/opt/myapp/bin/warm-cache",
+        ]
+      },
       "echo 'Preparing for Puppet run' >> /var/log/cloud-init-output.log"
     ]
   EOT
-  type        = list(string)
+  type        = any
   default     = []
+  nullable    = false
+
+  validation {
+    condition = alltrue([
+      for cmd in var.pre_runcmd :
+      can(tostring(cmd)) || (
+        can([for c in cmd.parallel : tostring(c)]) && try(length(cmd.parallel), 0) > 0
+      )
+    ])
+    error_message = <<-EOT
+      pre_runcmd entries must be command strings or objects with a non-empty
+      `parallel` list of command strings.
+    EOT
+  }
 }
 
 variable "post_runcmd" {
@@ -273,14 +568,40 @@ variable "post_runcmd" {
     5. post_runcmd  <-- these commands
     6. touch /var/run/puppet-done (completion marker)
 
+    Steps that need not hold back the lifecycle CONTINUE belong in
+    readiness_gate.background_runcmd instead.
+
+    Accepts the same entries as pre_runcmd: command strings run sequentially,
+    objects with a `parallel` list run as a concurrent group.
+
     Example:
     post_runcmd = [
       "systemctl restart myapp",
+      {
+        parallel = [
+          "/opt/myapp/bin/register-service",
+          "/opt/myapp/bin/warm-cache",
+        ]
+      },
       "echo 'Cloud-init complete' >> /var/log/cloud-init-output.log"
     ]
   EOT
-  type        = list(string)
+  type        = any
   default     = []
+  nullable    = false
+
+  validation {
+    condition = alltrue([
+      for cmd in var.post_runcmd :
+      can(tostring(cmd)) || (
+        can([for c in cmd.parallel : tostring(c)]) && try(length(cmd.parallel), 0) > 0
+      )
+    ])
+    error_message = <<-EOT
+      post_runcmd entries must be command strings or objects with a non-empty
+      `parallel` list of command strings.
+    EOT
+  }
 }
 
 variable "puppet_debug_logging" {
@@ -319,12 +640,112 @@ variable "puppet_module_path" {
   default     = "{root_directory}/modules"
 }
 
+variable "puppet_profiling" {
+  description = <<-EOT
+    Profile the first-boot Puppet run.
+    When true, ih-bootstrap enables Puppet's evaltrace and profile settings
+    before running ih-puppet, then condenses last_run_summary.yaml and
+    last_run_report.yaml into /var/log/puppet-profile.log: catalog compile
+    and apply time, time per resource type and the slowest resources.
+    The settings are removed again when the bootstrap is done.
+  EOT
+  type        = bool
+  default     = false
+}
+
+variable "puppet_profiling_top_resources" {
+  description = "Number of slowest resources listed in /var/log/puppet-profile.log when puppet_profiling is enabled."
+  type        = number
+  default     = 20
+
+  validation {
+    condition     = var.puppet_profiling_top_resources > 0
+    error_message = "puppet_profiling_top_resources must be a positive number."
+  }
+}
+
 variable "puppet_root_directory" {
   description = "Path where the puppet code is hosted."
   type        = string
   default     = "/opt/puppet-code"
 }
 
+variable "puppet_secrets" {
+  description = <<-EOT
+    Secrets to hand to Puppet, as a map of hiera key to ARN, or ARN#key for
+    one field of a JSON secret. ARNs are Secrets Manager secrets or SSM
+    Parameter Store parameters.
+
+    They are resolved in bootcmd in the same pass as secret_files, so each
+    ARN is fetched once per boot. The values go to
+    /run/ih-secrets/secrets.json, readable by root only and on tmpfs, so
+    never written to disk. Puppet reads it through a hiera level with the
+    built-in json_data backend instead of fetching the secrets itself:
+
+      - name: "Boot-time secrets"
+        datadir: /run/ih-secrets
+        path: secrets.json
+        data_hash: json_data
+
+    Example:
+    puppet_secrets = {
+      "profile::myapp::db_password" = "arn:aws:secretsmanager:us-west-2:123456789012:secret:db#password"
+    }
+  EOT
+  type        = map(string)
+  default     = {}
+
+  validation {
+    condition     = alltrue([for ref in values(var.puppet_secrets) : startswith(ref, "arn:")])
+    error_message = "puppet_secrets values must be ARNs, optionally followed by #key."
+  }
+}
+
+variable "readiness_gate" {
+  description = <<-EOT
+    Signal the lifecycle CONTINUE as soon as the instance is ready, instead
+    of after every post-Puppet step.
+
+    checks are shell commands polled concurrently every `interval` seconds
+    after post_runcmd. Once all of them pass, the bootstrap writes
+    /var/run/puppet-done and signals CONTINUE. If any still fails after
+    `timeout` seconds, the bootstrap fails and signals ABANDON.
+
+    background_runcmd are non-critical steps, such as log shipping setup or
+    cache warmups. They start in order alongside the checks, detached from
+    the bootstrap, and keep running after CONTINUE and cloud-init. A failing
+    step is logged and listed in
+    /var/run/ih-background-failed, but does not ABANDON the instance.
+    /var/run/ih-background-done marks the end of the run.
+
+    With warm_pool, the gate and background steps belong to the activate
+    phase.
+
+    Example:
+    readiness_gate = {
+      checks            = ["curl -fsS http://localhost:8080/health"]
+      background_runcmd = ["/opt/myapp/bin/warm-cache"]
+    }
+  EOT
+  type = object({
+    checks            = optional(list(string), [])
+    timeout           = optional(number, 300)
+    interval          = optional(number, 5)
+    background_runcmd = optional(list(string), [])
+  })
+  default = null
+
+  validation {
+    condition = var.readiness_gate == null ? true : (
+      var.readiness_gate.timeout > 0
+      && var.readiness_gate.interval > 0
+      && floor(var.readiness_gate.timeout) == var.readiness_gate.timeout
+      && floor(var.readiness_gate.interval) == var.readiness_gate.interval
+    )
+    error_message = "readiness_gate timeout and interval must be positive whole numbers of seconds."
+  }
+}
+
 variable "role" {
   description = <<-EOT
     Puppet role. Passed on as a puppet fact.
@@ -338,6 +759,50 @@ variable "role" {
   }
 }
 
+variable "secret_files" {
+  description = <<-EOT
+    Files rendered at boot with secrets from AWS Secrets Manager or SSM
+    Parameter Store, like extra_files for content that must not be in
+    userdata. In content, {{secret:ARN}} is replaced by the secret's value
+    and {{secret:ARN#key}} by one field of a JSON secret.
+
+    All references are resolved in bootcmd in one pass. Each ARN is
+    fetched once, also if extra_repos uses it as authFrom: Secrets
+    Manager secrets 20 per BatchGetSecretValue call, or one by one with
+    GetSecretValue if the batch call is denied, SSM parameters 10 per
+    GetParameters call. Files are written only if every reference
+    resolves, each with its permissions from the start, and renamed into
+    place. ih-bootstrap fails if the files were not written. Needs boto3
+    on the AMI, like authFrom in extra_repos, and the instance profile
+    needs read access to the secrets.
+
+    - content: File content with secret references
+    - path: Absolute path of the file
+    - permissions: (optional) Octal file mode, default "0600"
+
+    Example:
+    secret_files = [
+      {
+        path    = "/etc/myapp/db.conf"
+        content = "password = {{secret:arn:aws:secretsmanager:us-west-2:123456789012:secret:db#password}}\n"
+      }
+    ]
+  EOT
+  type = list(object({
+    content     = string
+    path        = string
+    permissions = optional(string, "0600")
+  }))
+  default = []
+
+  validation {
+    condition = alltrue([
+      for f in var.secret_files : startswith(f.path, "/") && can(regex("^0?[0-7]{3}$", f.permissions))
+    ])
+    error_message = "secret_files: path must be absolute and permissions an octal mode like \"0600\"."
+  }
+}
+
 variable "ssh_host_keys" {
   description = <<-EOT
     List of instance's SSH host keys. Can be rsa, ecdsa, ed25519, etc.
@@ -354,6 +819,34 @@ variable "ssh_host_keys" {
   sensitive = true
 }
 
+variable "tuning_profile" {
+  description = <<-EOT
+    Kernel tuning profile, applied in bootcmd before any service starts and
+    kept across reboots:
+
+    * `network-throughput` - BBR with fq, 64 MiB TCP buffers, a longer
+      netdev backlog; transparent hugepages on madvise; the `none` I/O
+      scheduler.
+    * `low-latency` - socket busy polling, TCP Fast Open, a low
+      tcp_notsent_lowat; transparent hugepages off; the `kyber` I/O
+      scheduler.
+    * `many-connections` - large accept and SYN backlogs, local ports
+      10000-65535, TIME-WAIT reuse, 1048576 open files; the `mq-deadline`
+      I/O scheduler.
+
+    Written to /etc/sysctl.d, /etc/security/limits.d,
+    /etc/systemd/system.conf.d, /etc/tmpfiles.d and /etc/udev/rules.d.
+    Leave null to keep the kernel defaults.
+  EOT
+  type        = string
+  default     = null
+
+  validation {
+    condition     = var.tuning_profile == null ? true : contains(["network-throughput", "low-latency", "many-connections"], var.tuning_profile)
+    error_message = "tuning_profile must be null, \"network-throughput\", \"low-latency\" or \"many-connections\"."
+  }
+}
+
 variable "ubuntu_codename" {
   description = <<-EOT
     Ubuntu version codename to use. Determines which InfraHouse repository to configure.
@@ -375,3 +868,33 @@ variable "ubuntu_codename" {
     error_message = "ubuntu_codename must be: noble. Previous versions (jammy, focal) have expired GPG keys. Got: ${var.ubuntu_codename}"
   }
 }
+
+variable "warm_pool" {
+  description = <<-EOT
+    Split the bootstrap for ASG warm pools. Set it when the ASG has a warm pool.
+
+    The prewarm phase is the usual bootstrap (packages, mounts, gems,
+    pre_runcmd, Puppet, post_runcmd). When the instance is launched into the
+    warm pool, it writes /var/lib/ih-bootstrap/prewarm-done and signals
+    CONTINUE to lifecycle_hook_name; the ASG then stops, hibernates or keeps
+    running the instance, depending on the pool state.
+
+    The activate phase runs activate_runcmd when the instance moves from the
+    warm pool into service, detected from the target lifecycle state in
+    instance metadata: on every boot for Warmed:Stopped pools, and by the
+    ih-activate.service poller for Warmed:Running and Warmed:Hibernated
+    pools, which do not boot again. It then writes
+    /var/lib/ih-bootstrap/activate-done and /var/run/puppet-done and signals
+    CONTINUE again. An instance launched straight into service runs both
+    phases in one go.
+
+    Example:
+    warm_pool = {
+      activate_runcmd = ["systemctl restart myapp"]
+    }
+  EOT
+  type = object({
+    activate_runcmd = optional(list(string), [])
+  })
+  default = null
+}